@@ -0,0 +1 @@
+"""Нагрузочные сценарии и бенчмарки бота (запуск: python -m bench.<модуль>)."""
@@ -0,0 +1,121 @@
+"""
+Нагрузочный тест AntiSpamMiddleware синтетическим потоком апдейтов.
+
+Сценарии:
+    attacker — один пользователь шлёт поток апдейтов: считаем, сколько прошло
+               к хендлеру и сколько уведомлений о блокировке отправлено;
+    crowd    — поток от множества разных пользователей: проверяем, что
+               состояние лимитера не растёт больше max_users;
+    auto_forward — поток автоматически пересланных постов каналов от
+               служебного аккаунта 777000: все должны дойти до хендлера
+               без блокировки и уведомлений.
+
+Запуск:
+    python -m bench.antispam_flood --updates 200000 --users 1000000
+    python -m bench.antispam_flood --shm antispam_bench --processes 4
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from middlewares.spam_protection import TELEGRAM_SERVICE_USER_ID, AntiSpamMiddleware
+
+
+class _CountingBot:
+    """Заглушка Bot: только считает исходящие уведомления."""
+
+    def __init__(self) -> None:
+        self.sent = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent += 1
+
+
+async def _handler(event, data):
+    data["handled"] += 1
+
+
+# Автопересылка поста канала в чат обсуждения
+AUTO_FORWARD = SimpleNamespace(is_automatic_forward=True, sender_chat=SimpleNamespace(id=-1001, type="channel"))
+
+
+async def _flood(middleware: AntiSpamMiddleware, user_ids, total: int, event=None) -> dict:
+    counters = {"handled": 0}
+    event = event or object()
+    users = [SimpleNamespace(id=uid, full_name=f"user {uid}") for uid in user_ids]
+    started = time.perf_counter()
+    for i in range(total):
+        user = users[i % len(users)]
+        data = {"event_from_user": user, "handled": counters["handled"]}
+        await middleware(_handler, event, data)
+        counters["handled"] = data["handled"]
+    elapsed = time.perf_counter() - started
+    return {
+        "updates": total,
+        "handled": counters["handled"],
+        "notifications": middleware.bot.sent,
+        "seconds": round(elapsed, 3),
+        "updates_per_sec": round(total / elapsed),
+        "ns_per_update": round(elapsed / total * 1e9),
+    }
+
+
+def _run_scenario(name: str, args, user_ids, total: int, event=None) -> dict:
+    bot = _CountingBot()
+    middleware = AntiSpamMiddleware(bot, max_users=args.max_users, shm_name=args.shm)
+    tracemalloc.start()
+    result = asyncio.run(_flood(middleware, user_ids, total, event))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result["scenario"] = name
+    result["peak_traced_kb"] = round(peak / 1024)
+    if hasattr(middleware.state, "__len__"):
+        result["tracked_users"] = len(middleware.state)
+    return result
+
+
+def _worker(args, queue) -> None:
+    queue.put(_run_scenario("attacker", args, [42], args.updates))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=200_000, help="апдейтов в сценарии attacker")
+    parser.add_argument("--users", type=int, default=200_000, help="разных пользователей в сценарии crowd")
+    parser.add_argument("--max-users", type=int, default=10_000)
+    parser.add_argument("--shm", default=None, help="имя сегмента разделяемой памяти")
+    parser.add_argument("--processes", type=int, default=1, help="процессов-атакующих (нужен --shm)")
+    args = parser.parse_args()
+
+    results = []
+    if args.processes > 1:
+        if not args.shm:
+            parser.error("--processes > 1 имеет смысл только вместе с --shm")
+        queue = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=_worker, args=(args, queue)) for _ in range(args.processes)]
+        for proc in procs:
+            proc.start()
+        per_process = [queue.get() for _ in procs]
+        for proc in procs:
+            proc.join()
+        results.append({
+            "scenario": f"attacker x{args.processes} processes",
+            "handled_total": sum(r["handled"] for r in per_process),
+            "notifications_total": sum(r["notifications"] for r in per_process),
+            "per_process": per_process,
+        })
+    else:
+        results.append(_run_scenario("attacker", args, [42], args.updates))
+        results.append(_run_scenario("crowd", args, range(1, args.users + 1), args.users))
+        results.append(_run_scenario("auto_forward", args, [TELEGRAM_SERVICE_USER_ID], args.updates, AUTO_FORWARD))
+
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Перезапуск Chromium супервизором на «протекающем» шаблоне.
+
+Несколько воркеров непрерывно рендерят шаблон через BrowserPool. Утечку
+имитирует страница шаблона, которая остаётся открытой в служебном контексте
+браузера (как забытая вкладка) и держит --leak-mb МБ в куче JS, — память
+растёт, пока браузер не перезапустят. Супервизор с порогами --max-rss-mb и
+--max-renders опрашивает браузер каждые --interval секунд.
+
+В отчёте: рендеры и ошибки (при плановом перезапуске ошибок быть не должно —
+начатые рендеры дорабатывают в старом браузере), перезапуски по причинам,
+пиковый и итоговый RSS браузера, p50/p95 рендера. С --no-supervisor виден
+неограниченный рост памяти.
+
+Запуск:
+    python -m bench.browser_recycle --duration 60 --max-rss-mb 600
+    python -m bench.browser_recycle --duration 30 --no-supervisor
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+os.chdir(PROJECT_ROOT)
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from utils.browser_pool import BrowserPool  # noqa: E402
+from utils.browser_supervisor import BrowserSupervisor  # noqa: E402
+from utils.metrics import BROWSER_RECYCLES_TOTAL  # noqa: E402
+
+LEAKY_TEMPLATE = """<!doctype html>
+<html><body>
+<div id="card" style="width:600px;height:300px;font:40px sans-serif">BTCUSDT +5,53%</div>
+<script>
+  // ~{leak_mb} МБ, которые живут, пока открыта страница
+  window.__leak = [];
+  for (let i = 0; i < {leak_mb}; i++) {{
+    window.__leak.push(new Float64Array(131072).fill(Math.random()));
+  }}
+</script>
+</body></html>"""
+
+
+class LeakyRenderer:
+    def __init__(self, pool: BrowserPool, leak_mb: int) -> None:
+        self.pool = pool
+        self.html = LEAKY_TEMPLATE.format(leak_mb=leak_mb)
+        self._leak_contexts: Dict[Any, Any] = {}
+
+    async def render(self) -> None:
+        async with self.pool.context("bench", viewport={"width": 640, "height": 320}) as context:
+            page = await context.new_page()
+            await page.set_content(self.html)
+            await page.locator("#card").screenshot(type="png")
+            # «Забытая вкладка»: копия страницы в служебном контексте того же браузера
+            browser = context.browser
+            leak_context = self._leak_contexts.get(browser)
+            if leak_context is None:
+                leak_context = self._leak_contexts[browser] = await browser.new_context()
+            leaked = await leak_context.new_page()
+            await leaked.set_content(self.html)
+
+
+async def worker(renderer: LeakyRenderer, deadline: float, latencies: List[float], errors: Dict[str, int]) -> None:
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            await renderer.render()
+            latencies.append(time.perf_counter() - started)
+        except Exception as exc:  # noqa: BLE001
+            errors[type(exc).__name__] = errors.get(type(exc).__name__, 0) + 1
+
+
+async def main(args: argparse.Namespace) -> None:
+    logging.basicConfig(level=logging.WARNING)
+    pool = BrowserPool()
+    supervisor = BrowserSupervisor(
+        pool,
+        max_renders=args.max_renders,
+        max_rss_mb=args.max_rss_mb,
+        interval=args.interval,
+        hang_timeout=args.hang_timeout,
+        recycle_grace=args.grace,
+    )
+    renderer = LeakyRenderer(pool, args.leak_mb)
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    samples: List[dict] = []
+
+    await pool.browser("bench")
+    started = time.perf_counter()
+    deadline = started + args.duration
+    workers = [asyncio.create_task(worker(renderer, deadline, latencies, errors)) for _ in range(args.concurrency)]
+
+    while time.perf_counter() < deadline:
+        await asyncio.sleep(args.interval)
+        if args.no_supervisor:
+            # Только замер, без перезапусков
+            supervisor.max_renders = supervisor.max_rss_bytes = 0
+        sample = await supervisor.check()
+        if sample is not None:
+            samples.append({"t": round(time.perf_counter() - started, 1), **sample})
+    await asyncio.gather(*workers)
+    await pool.close()
+
+    rss = [s["rss_bytes"] for s in samples if s.get("rss_bytes")]
+    latencies.sort()
+    mb = 1024 * 1024
+    report = {
+        "duration_s": args.duration,
+        "concurrency": args.concurrency,
+        "leak_mb_per_render": args.leak_mb,
+        "supervisor": not args.no_supervisor,
+        "renders": len(latencies),
+        "errors": errors,
+        "recycles": {
+            reason: BROWSER_RECYCLES_TOTAL.value(reason=reason)
+            for reason in ("renders", "rss", "hang")
+            if BROWSER_RECYCLES_TOTAL.value(reason=reason)
+        },
+        "peak_rss_mb": round(max(rss) / mb, 1) if rss else None,
+        "last_rss_mb": round(rss[-1] / mb, 1) if rss else None,
+        "render_p50_ms": round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+        "render_p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 1) if latencies else None,
+        "rss_timeline_mb": [(s["t"], round(s["rss_bytes"] / mb)) for s in samples if s.get("rss_bytes")],
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--leak-mb", type=int, default=20, help="сколько МБ удерживает каждая забытая страница")
+    parser.add_argument("--max-rss-mb", type=int, default=800)
+    parser.add_argument("--max-renders", type=int, default=0, help="0 — без порога по числу рендеров")
+    parser.add_argument("--interval", type=float, default=1.0, help="период опроса супервизора, с")
+    parser.add_argument("--hang-timeout", type=float, default=10)
+    parser.add_argument("--grace", type=float, default=30, help="сколько ждать рендеры выведенного браузера, с")
+    parser.add_argument("--no-supervisor", action="store_true", help="только замер RSS, без перезапусков")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,314 @@
+"""
+Сквозной нагрузочный прогон бота против локальной заглушки Bot API.
+
+Поднимает bench/fake_telegram.py, запускает бота (в этом же процессе, отдельным
+процессом `python bot.py` или ждёт уже запущенного с TELEGRAM_API_URL) и
+прогоняет сценарии параллельно:
+
+- N администраторов проходят полный FSM /create_invoice (до PDF и отказа от email);
+- каждый администратор шлёт пачку команд /okx подряд;
+- посты каналов авто-пересылаются в чаты обсуждения, бот должен ответить комментарием.
+
+Задержка шага — от постановки апдейта до первого ответа бота в этот чат.
+Ошибка — таймаут или ответ не того вида (например, текст об ошибке вместо PDF).
+
+Запуск:
+    python -m bench.e2e_load --admins 10 --okx-burst 3 --channel-posts 20
+    python -m bench.e2e_load --bot-mode inprocess --admins 2
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+os.chdir(PROJECT_ROOT)
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from bench.fake_telegram import FakeTelegramServer, SentMessage  # noqa: E402
+
+BOT_TOKEN = "42:E2E-LOAD"
+ADMIN_ID_BASE = 9_000_000
+DISCUSSION_CHAT_BASE = -1_009_000_000_000
+
+
+class StepFailed(Exception):
+    pass
+
+
+class Stats:
+    def __init__(self) -> None:
+        self.latencies: Dict[str, Dict[str, List[float]]] = defaultdict(lambda: defaultdict(list))
+        self.errors: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.flows: Dict[str, int] = defaultdict(int)
+        self.flows_failed: Dict[str, int] = defaultdict(int)
+
+    def ok(self, scenario: str, step: str, latency: float) -> None:
+        self.latencies[scenario][step].append(latency)
+
+    def error(self, scenario: str, step: str) -> None:
+        self.errors[scenario][step] += 1
+
+    def report(self) -> Dict[str, dict]:
+        def pct(samples: List[float], q: float) -> Optional[float]:
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 1)
+
+        result = {}
+        for scenario in sorted(set(self.latencies) | set(self.errors) | set(self.flows)):
+            steps = {}
+            for step in list(self.latencies[scenario]) + [
+                s for s in self.errors[scenario] if s not in self.latencies[scenario]
+            ]:
+                samples = sorted(self.latencies[scenario][step])
+                errors = self.errors[scenario][step]
+                total = len(samples) + errors
+                steps[step] = {
+                    "count": total,
+                    "errors": errors,
+                    "error_rate": round(errors / total, 4) if total else 0.0,
+                    "p50_ms": pct(samples, 0.50),
+                    "p95_ms": pct(samples, 0.95),
+                    "p99_ms": pct(samples, 0.99),
+                }
+            flows = self.flows[scenario]
+            result[scenario] = {
+                "flows": flows,
+                "flows_failed": self.flows_failed[scenario],
+                "flow_error_rate": round(self.flows_failed[scenario] / flows, 4) if flows else 0.0,
+                "steps": steps,
+            }
+        return result
+
+
+class AdminClient:
+    """Администратор в личном чате с ботом."""
+
+    def __init__(self, server: FakeTelegramServer, stats: Stats, user_id: int, think_time: float, timeout: float):
+        self.server = server
+        self.stats = stats
+        self.user_id = user_id
+        self.think_time = think_time
+        self.timeout = timeout
+
+    async def _reply(self, scenario: str, step: str, started: float, expect_method: str, expect_text: str = "") -> SentMessage:
+        try:
+            reply = await self.server.next_reply(self.user_id, self.timeout)
+        except asyncio.TimeoutError:
+            self.stats.error(scenario, step)
+            raise StepFailed(f"{step}: timeout")
+        text = reply.message.get("text") or ""
+        if reply.method != expect_method or expect_text not in text:
+            self.stats.error(scenario, step)
+            raise StepFailed(f"{step}: unexpected {reply.method} {text[:80]!r}")
+        self.stats.ok(scenario, step, reply.at - started)
+        return reply
+
+    async def say(self, scenario: str, step: str, text: str, expect_method: str = "sendMessage", expect_text: str = "") -> SentMessage:
+        await asyncio.sleep(self.think_time)
+        started = time.perf_counter()
+        self.server.user_message(self.user_id, text)
+        return await self._reply(scenario, step, started, expect_method, expect_text)
+
+    async def click(self, scenario: str, step: str, message: Dict, data: str, expect_method: str = "sendMessage", expect_text: str = "") -> SentMessage:
+        await asyncio.sleep(self.think_time)
+        started = time.perf_counter()
+        self.server.user_callback(self.user_id, message, data)
+        return await self._reply(scenario, step, started, expect_method, expect_text)
+
+    async def invoice_flow(self, index: int) -> None:
+        s = "create_invoice"
+        await self.say(s, "start", "/create_invoice", expect_text="почту")
+        kb = await self.say(s, "email", f"load{self.user_id}.{index}@example.com", expect_text="продукт")
+        await self.click(s, "product", kb.message, "product:product_a", expect_text="продолжительность")
+        # Клик по duration приходит на то же сообщение с клавиатурой, что и в реальном клиенте
+        await self.click(s, "duration", kb.message, "duration:1m", expect_text="имя")
+        await self.say(s, "name", "Иван Иванов", expect_text="телефон")
+        await self.say(s, "phone", "+79000000000", expect_text="номер заказа")
+        await self.say(s, "order_number", str(1000 + index), expect_text="дату")
+        await self.say(s, "purchase_date", "19/10/2026", expect_text="стоимость")
+        confirm = await self.say(s, "cost", "149900", expect_text="Подтвердите")
+        await self.click(s, "render_pdf", confirm.message, "confirm:yes", expect_method="sendDocument")
+        email_kb = await self._reply(s, "email_prompt", time.perf_counter(), "sendMessage", "почту")
+        await self.click(s, "sendmail_no", email_kb.message, "sendmail:no", expect_text="отменена")
+
+    async def okx_burst(self, size: int) -> None:
+        s = "okx"
+        await asyncio.sleep(self.think_time)
+        started = []
+        for i in range(size):
+            started.append(time.perf_counter())
+            self.server.user_message(
+                self.user_id, f"/okx BTCUSDT Лонг 100 +{i + 1},53 +3,48 114962.0 114956.0 15.09.2025 20:21:11"
+            )
+        # Ответы сопоставляются с командами по порядку прихода
+        failures = 0
+        for t0 in started:
+            try:
+                await self._reply(s, "photo", t0, "sendPhoto")
+            except StepFailed:
+                failures += 1
+        if failures:
+            raise StepFailed(f"okx: {failures}/{size} failed")
+
+    async def run(self, invoices: int, okx_burst: int) -> None:
+        for index in range(invoices):
+            self.server.drain(self.user_id)
+            await _flow(self.stats, "create_invoice", self.invoice_flow(index))
+        if okx_burst:
+            self.server.drain(self.user_id)
+            await _flow(self.stats, "okx", self.okx_burst(okx_burst))
+
+
+async def _flow(stats: Stats, scenario: str, coro) -> None:
+    stats.flows[scenario] += 1
+    try:
+        await coro
+    except StepFailed as exc:
+        stats.flows_failed[scenario] += 1
+        logging.getLogger(__name__).warning("%s failed: %s", scenario, exc)
+
+
+async def channel_posts(server: FakeTelegramServer, stats: Stats, posts: int, chats: int, channel_id: int, timeout: float) -> None:
+    """Посты каналов раскладываются по чатам обсуждения по кругу."""
+
+    async def one(i: int) -> None:
+        chat_id = DISCUSSION_CHAT_BASE - (i % max(1, chats))
+        started = time.perf_counter()
+        server.channel_post(chat_id, channel_id, text=f"post {i}")
+        stats.flows["channel_comment"] += 1
+        try:
+            reply = await server.next_reply(chat_id, timeout)
+        except asyncio.TimeoutError:
+            stats.error("channel_comment", "comment")
+            stats.flows_failed["channel_comment"] += 1
+            return
+        stats.ok("channel_comment", "comment", reply.at - started)
+
+    # В одном чате посты идут по одному, чтобы ответ однозначно соответствовал посту
+    per_chat: Dict[int, List[int]] = defaultdict(list)
+    for i in range(posts):
+        per_chat[i % max(1, chats)].append(i)
+
+    async def chat_worker(indexes: List[int]) -> None:
+        for i in indexes:
+            await one(i)
+
+    await asyncio.gather(*(chat_worker(indexes) for indexes in per_chat.values()))
+
+
+def _channel_id() -> int:
+    from handlers.channel_comments import load_channels
+
+    channels = [ch for ch in load_channels() if (ch.get("text") or "").strip()]
+    if not channels:
+        raise SystemExit("В channels/channels.json нет канала с текстом комментария")
+    return int(channels[0]["id"])
+
+
+async def start_bot(mode: str, server: FakeTelegramServer, admin_ids: List[int]):
+    env = {
+        "TELEGRAM_BOT_TOKEN": BOT_TOKEN,
+        "TELEGRAM_API_URL": server.url,
+        "ADMINS": " ".join(map(str, admin_ids)),
+        "MAIN_ADMINS": "",
+    }
+    if mode == "inprocess":
+        os.environ.update(env)
+        import bot as bot_module
+
+        task = asyncio.create_task(bot_module.dp.start_polling(bot_module.bot, handle_signals=False))
+
+        async def stop() -> None:
+            await bot_module.dp.stop_polling()
+            await task
+
+        return stop
+
+    if mode == "subprocess":
+        log_path = PROJECT_ROOT / "temp" / "e2e_bot.log"
+        log_path.parent.mkdir(parents=True, exist_ok=True)
+        log_file = open(log_path, "wb")
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "bot.py", env={**os.environ, **env}, stdout=log_file, stderr=log_file
+        )
+
+        async def stop() -> None:
+            if process.returncode is None:
+                process.send_signal(signal.SIGINT)
+                try:
+                    await asyncio.wait_for(process.wait(), 15)
+                except asyncio.TimeoutError:
+                    process.kill()
+            log_file.close()
+
+        return stop
+
+    print(f"Запустите бота с TELEGRAM_API_URL={server.url} TELEGRAM_BOT_TOKEN={BOT_TOKEN} ADMINS=\"{env['ADMINS']}\"", file=sys.stderr)
+
+    async def stop() -> None:
+        return None
+
+    return stop
+
+
+async def main(args: argparse.Namespace) -> None:
+    logging.basicConfig(level=logging.WARNING)
+    server = await FakeTelegramServer(port=args.port, flood_rate=args.flood_rate).start()
+    admin_ids = [ADMIN_ID_BASE + i for i in range(args.admins)]
+    stop_bot = await start_bot(args.bot_mode, server, admin_ids)
+    stats = Stats()
+
+    try:
+        await asyncio.wait_for(server.polling_started.wait(), args.startup_timeout)
+        started = time.perf_counter()
+        admins = [AdminClient(server, stats, user_id, args.think_time, args.timeout) for user_id in admin_ids]
+        tasks = [admin.run(args.invoices, args.okx_burst) for admin in admins]
+        if args.channel_posts:
+            tasks.append(
+                channel_posts(server, stats, args.channel_posts, args.discussion_chats, _channel_id(), args.comment_timeout)
+            )
+        await asyncio.gather(*tasks)
+        wall_time = time.perf_counter() - started
+    finally:
+        await stop_bot()
+        await server.stop()
+
+    print(
+        json.dumps(
+            {
+                "config": vars(args),
+                "wall_time_s": round(wall_time, 2),
+                "scenarios": stats.report(),
+                "api_calls": dict(server.requests),
+            },
+            ensure_ascii=False,
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bot-mode", choices=("subprocess", "inprocess", "external"), default="subprocess")
+    parser.add_argument("--port", type=int, default=0, help="порт заглушки (0 — любой свободный)")
+    parser.add_argument("--admins", type=int, default=5, help="одновременных администраторов")
+    parser.add_argument("--invoices", type=int, default=1, help="прогонов /create_invoice на администратора")
+    parser.add_argument("--okx-burst", type=int, default=3, help="команд /okx подряд на администратора")
+    parser.add_argument("--channel-posts", type=int, default=10)
+    parser.add_argument("--discussion-chats", type=int, default=3)
+    parser.add_argument("--think-time", type=float, default=0.5, help="пауза «человека» перед действием, с")
+    parser.add_argument("--timeout", type=float, default=60, help="ожидание ответа бота, с")
+    parser.add_argument("--comment-timeout", type=float, default=120, help="ожидание комментария к посту, с")
+    parser.add_argument("--startup-timeout", type=float, default=60)
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="доля sendMessage, отвечаемых 429")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,379 @@
+"""
+Локальная заглушка Telegram Bot API для нагрузочных e2e-прогонов.
+
+Реализует ровно то, чем пользуется бот: getMe, deleteWebhook, getUpdates
+(long polling), sendMessage, sendPhoto, sendDocument, sendMediaGroup, getFile,
+скачивание файлов, answerCallbackQuery и sendChatAction. Остальные методы
+отвечают ``true``, чтобы бот не падал на служебных вызовах.
+
+Бот подключается к заглушке через TELEGRAM_API_URL. Апдейты от «пользователей»
+кладутся методами user_message()/user_callback()/channel_post(), а всё, что бот
+отправил, попадает в очередь соответствующего чата (next_reply()).
+
+Можно поднять в том же процессе (см. bench/e2e_load.py) или отдельно:
+    python -m bench.fake_telegram --port 8081
+В отдельном процессе апдейты принимаются на POST /_control/update, а
+отправленные ботом сообщения отдаются на GET /_control/sent.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {"id": 42, "is_bot": True, "first_name": "Helper", "username": "helper_bot"}
+TELEGRAM_SERVICE_USER = {"id": 777000, "is_bot": False, "first_name": "Telegram"}
+
+# Поля запроса, которые aiogram передаёт JSON-строкой
+_JSON_FIELDS = ("reply_markup", "reply_parameters", "media", "entities", "allowed_updates", "link_preview_options")
+
+
+@dataclass
+class SentMessage:
+    """Сообщение, отправленное ботом в заглушку."""
+
+    method: str
+    chat_id: int
+    message: Dict[str, Any]
+    # time.perf_counter() в момент приёма запроса
+    at: float
+
+
+class FakeTelegramServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, flood_rate: float = 0.0) -> None:
+        self.host = host
+        self.port = port
+        # Доля sendMessage, на которые отвечаем 429 (проверка обработки RetryAfter)
+        self.flood_rate = flood_rate
+
+        self.requests: Counter = Counter()
+        self.sent: List[SentMessage] = []
+        self.files: Dict[str, bytes] = {}
+        self.polling_started = asyncio.Event()
+
+        self._updates: List[Dict[str, Any]] = []
+        self._new_updates = asyncio.Event()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._file_ids = itertools.count(1)
+        self._chat_queues: Dict[int, asyncio.Queue] = {}
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    # --- Жизненный цикл ---
+
+    async def start(self) -> "FakeTelegramServer":
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_route("*", "/bot{token}/{method}", self._handle_method)
+        app.router.add_get("/file/bot{token}/{path:.+}", self._handle_file)
+        app.router.add_post("/_control/update", self._handle_control_update)
+        app.router.add_get("/_control/sent", self._handle_control_sent)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # При port=0 порт выбирает ОС
+        self.port = site._server.sockets[0].getsockname()[1]
+        logger.info("Fake Bot API listening on %s", self.url)
+        return self
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    # --- Апдейты от пользователей ---
+
+    def push_update(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        update = {"update_id": next(self._update_ids), **payload}
+        self._updates.append(update)
+        self._new_updates.set()
+        return update
+
+    def _chat(self, chat_id: int) -> Dict[str, Any]:
+        if chat_id > 0:
+            return {"id": chat_id, "type": "private", "first_name": f"user{chat_id}"}
+        return {"id": chat_id, "type": "supergroup", "title": f"chat{chat_id}"}
+
+    def user_message(self, user_id: int, text: str, chat_id: Optional[int] = None) -> Dict[str, Any]:
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": self._chat(chat_id or user_id),
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+            "text": text,
+        }
+        if text.startswith("/"):
+            command = text.split()[0]
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+        return self.push_update({"message": message})
+
+    def user_document(self, user_id: int, content: bytes, file_name: str) -> Dict[str, Any]:
+        file_id = self.add_file(content)
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": self._chat(user_id),
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+            "document": {
+                "file_id": file_id,
+                "file_unique_id": file_id,
+                "file_name": file_name,
+                "file_size": len(content),
+            },
+        }
+        return self.push_update({"message": message})
+
+    def user_callback(self, user_id: int, message: Dict[str, Any], data: str) -> Dict[str, Any]:
+        """Нажатие inline-кнопки под сообщением бота ``message``."""
+        callback = {
+            "id": str(next(self._update_ids)),
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+            "chat_instance": str(message["chat"]["id"]),
+            "message": message,
+            "data": data,
+        }
+        return self.push_update({"callback_query": callback})
+
+    def channel_post(self, discussion_chat_id: int, channel_id: int, text: str = "post") -> Dict[str, Any]:
+        """Авто-пересылка поста канала в связанный чат обсуждения."""
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": self._chat(discussion_chat_id),
+            "from": TELEGRAM_SERVICE_USER,
+            "sender_chat": {"id": channel_id, "type": "channel", "title": f"channel{channel_id}"},
+            "is_automatic_forward": True,
+            "text": text,
+        }
+        return self.push_update({"message": message})
+
+    def add_file(self, content: bytes) -> str:
+        file_id = f"file{next(self._file_ids)}"
+        self.files[file_id] = content
+        return file_id
+
+    # --- Ответы бота ---
+
+    def _chat_queue(self, chat_id: int) -> asyncio.Queue:
+        queue = self._chat_queues.get(chat_id)
+        if queue is None:
+            queue = asyncio.Queue()
+            self._chat_queues[chat_id] = queue
+        return queue
+
+    async def next_reply(self, chat_id: int, timeout: float) -> SentMessage:
+        """Ждёт следующее сообщение бота в чат. Бросает asyncio.TimeoutError."""
+        return await asyncio.wait_for(self._chat_queue(chat_id).get(), timeout)
+
+    def drain(self, chat_id: int) -> int:
+        """Отбрасывает непрочитанные ответы чата (хвосты прошлого сценария)."""
+        queue = self._chat_queue(chat_id)
+        dropped = 0
+        while not queue.empty():
+            queue.get_nowait()
+            dropped += 1
+        return dropped
+
+    def _record(self, method: str, chat_id: int, message: Dict[str, Any], at: float) -> None:
+        sent = SentMessage(method=method, chat_id=chat_id, message=message, at=at)
+        self.sent.append(sent)
+        self._chat_queue(chat_id).put_nowait(sent)
+
+    # --- HTTP ---
+
+    async def _read_params(self, request: web.Request) -> Dict[str, Any]:
+        if request.content_type == "application/json":
+            return await request.json()
+        params: Dict[str, Any] = {}
+        for key, value in (await request.post()).items():
+            if isinstance(value, web.FileField):
+                params[key] = value
+            elif key in _JSON_FIELDS:
+                params[key] = json.loads(value)
+            else:
+                params[key] = value
+        return params
+
+    async def _handle_method(self, request: web.Request) -> web.Response:
+        received_at = time.perf_counter()
+        method = request.match_info["method"]
+        self.requests[method] += 1
+        params = await self._read_params(request)
+
+        if method == "sendMessage" and self.flood_rate and random.random() < self.flood_rate:
+            return web.json_response(
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": "Too Many Requests: retry after 1",
+                    "parameters": {"retry_after": 1},
+                },
+                status=429,
+            )
+
+        handler = getattr(self, f"_api_{method}", None)
+        if handler is None:
+            return web.json_response({"ok": True, "result": True})
+        try:
+            result = await handler(params, received_at)
+        except (KeyError, ValueError) as exc:
+            return web.json_response(
+                {"ok": False, "error_code": 400, "description": f"Bad Request: {exc}"}, status=400
+            )
+        return web.json_response({"ok": True, "result": result})
+
+    async def _handle_file(self, request: web.Request) -> web.Response:
+        file_id = request.match_info["path"].rsplit("/", 1)[-1]
+        content = self.files.get(file_id)
+        if content is None:
+            raise web.HTTPNotFound()
+        return web.Response(body=content, content_type="application/octet-stream")
+
+    async def _handle_control_update(self, request: web.Request) -> web.Response:
+        return web.json_response(self.push_update(await request.json()))
+
+    async def _handle_control_sent(self, request: web.Request) -> web.Response:
+        since = int(request.query.get("since", 0))
+        items = [
+            {"method": s.method, "chat_id": s.chat_id, "message": s.message} for s in self.sent[since:]
+        ]
+        return web.json_response({"next": len(self.sent), "items": items})
+
+    # --- Методы Bot API ---
+
+    async def _api_getMe(self, params, received_at):
+        return BOT_USER
+
+    async def _api_getUpdates(self, params, received_at):
+        self.polling_started.set()
+        offset = int(params.get("offset") or 0)
+        timeout = float(params.get("timeout") or 0)
+        limit = int(params.get("limit") or 100)
+
+        # offset подтверждает все апдейты с меньшим update_id
+        self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        return self._updates[:limit]
+
+    def _bot_message(self, chat_id: int, **content: Any) -> Dict[str, Any]:
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": self._chat(chat_id),
+            "from": BOT_USER,
+            **content,
+        }
+
+    def _store_upload(self, params: Dict[str, Any], value: Any) -> Dict[str, Any]:
+        # aiogram кладёт файл отдельным полем и ссылается на него как attach://<поле>
+        if isinstance(value, str) and value.startswith("attach://"):
+            value = params[value[len("attach://") :]]
+        if isinstance(value, web.FileField):
+            content = value.file.read()
+            file_id = self.add_file(content)
+            return {"file_id": file_id, "file_unique_id": file_id, "file_name": value.filename, "file_size": len(content)}
+        # Повторная отправка по file_id или URL
+        return {"file_id": str(value), "file_unique_id": str(value)}
+
+    def _content(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        content: Dict[str, Any] = {}
+        if params.get("reply_markup"):
+            content["reply_markup"] = params["reply_markup"]
+        if params.get("caption"):
+            content["caption"] = params["caption"]
+        return content
+
+    async def _api_sendMessage(self, params, received_at):
+        chat_id = int(params["chat_id"])
+        message = self._bot_message(chat_id, text=params["text"], **self._content(params))
+        self._record("sendMessage", chat_id, message, received_at)
+        return message
+
+    async def _api_sendPhoto(self, params, received_at):
+        chat_id = int(params["chat_id"])
+        photo = self._store_upload(params, params["photo"])
+        photo.pop("file_name", None)
+        message = self._bot_message(chat_id, photo=[{**photo, "width": 1200, "height": 800}], **self._content(params))
+        self._record("sendPhoto", chat_id, message, received_at)
+        return message
+
+    async def _api_sendDocument(self, params, received_at):
+        chat_id = int(params["chat_id"])
+        message = self._bot_message(chat_id, document=self._store_upload(params, params["document"]), **self._content(params))
+        self._record("sendDocument", chat_id, message, received_at)
+        return message
+
+    async def _api_sendMediaGroup(self, params, received_at):
+        chat_id = int(params["chat_id"])
+        media_group_id = str(next(self._file_ids))
+        messages = []
+        for item in params["media"]:
+            stored = self._store_upload(params, item["media"])
+            if item["type"] == "photo":
+                stored.pop("file_name", None)
+                content = {"photo": [{**stored, "width": 1200, "height": 800}]}
+            else:
+                content = {item["type"]: stored}
+            messages.append(self._bot_message(chat_id, media_group_id=media_group_id, **content))
+        # Для ожидающих ответа альбом — одно событие
+        self._record("sendMediaGroup", chat_id, {"messages": messages}, received_at)
+        return messages
+
+    async def _api_getFile(self, params, received_at):
+        file_id = params["file_id"]
+        if file_id not in self.files:
+            raise ValueError("invalid file_id")
+        return {
+            "file_id": file_id,
+            "file_unique_id": file_id,
+            "file_size": len(self.files[file_id]),
+            "file_path": f"documents/{file_id}",
+        }
+
+    async def _api_answerCallbackQuery(self, params, received_at):
+        return True
+
+    async def _api_sendChatAction(self, params, received_at):
+        return True
+
+
+async def _serve(host: str, port: int, flood_rate: float) -> None:
+    server = await FakeTelegramServer(host, port, flood_rate).start()
+    print(f"Fake Bot API: {server.url} (TELEGRAM_API_URL={server.url})")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="доля sendMessage, отвечаемых 429")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(_serve(args.host, args.port, args.flood_rate))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,191 @@
+"""
+Рендер карточек /forex через Pillow (utils/raster_card.py) против Chromium.
+
+Golden-сравнение: каждый набор значений рендерится растровым рендером и
+сравнивается попиксельно (та же метрика, что в bench.okx_composite) с
+эталоном — свежим рендером в Chromium или, с --golden DIR, с сохранёнными
+PNG (тогда браузер не нужен). --update-golden перезаписывает эталоны в DIR
+рендерами Chromium: после правки шаблона или misc/forex_layout.py.
+
+Пропускная способность: --renders карточек при --concurrency одновременных
+рендерах каждым способом, карточек в секунду и p50/p95 одного рендера.
+
+Код выхода 1, если средняя разница больше --max-mean-diff, доля
+отличающихся пикселей больше --max-diff-pct или размер не совпал.
+
+Запуск:
+    python -m bench.forex_raster --renders 40 --concurrency 4
+    python -m bench.forex_raster --golden bench/golden/forex --update-golden
+    python -m bench.forex_raster --golden bench/golden/forex --skip-browser
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+os.chdir(PROJECT_ROOT)
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from bench.okx_composite import percentile, pixel_diff  # noqa: E402
+from misc.trade_cards import (  # noqa: E402
+    forex_raster,
+    forex_substitutions,
+    forex_template_name,
+    prepare_forex_html,
+)
+from utils.browser_pool import browser_pool  # noqa: E402
+from utils.html_to_image import html_to_image  # noqa: E402
+
+_BASE = {
+    "pair": "EURUSD",
+    "side": "buy",
+    "side_price": "1.06",
+    "ticket": "54814272772",
+    "desc": "Euro vs US Dollar",
+    "open": "1.16540",
+    "close": "1.16252",
+    "delta": "521",
+    "pct": "0.35",
+    "profit": "6108.01",
+    "open_dt": "2026.01.26 10:12:45",
+    "close_dt": "2026.01.26 10:35:23",
+    "sl": "154.335",
+    "swap": "2.10",
+    "tp": "153.536",
+    "fee": "-5.30",
+}
+
+CASES: List[Dict[str, str]] = [
+    _BASE,
+    {**_BASE, "side": "sell", "delta": "-521", "profit": "-6108.01", "pct": "-0.35"},
+    {**_BASE, "pair": "XAUUSD", "side_price": "2650.5", "desc": "Gold vs US Dollar", "open": "2650.12",
+     "close": "2712.88", "profit": "1250000.5", "sl": "2600", "tp": "2750", "swap": "-12.40", "fee": "-105.00"},
+    {**_BASE, "pair": "USDJPY", "side": "sell", "desc": "US Dollar vs Japanese Yen", "open": "153.536",
+     "close": "154.335", "delta": "-79", "pct": "-0.52", "profit": "-0.01", "ticket": "1"},
+]
+
+
+def case_values(fields: Dict[str, str]) -> Dict[str, str]:
+    return forex_substitutions({**fields, "pair": fields["pair"].upper(), "side": fields["side"]})
+
+
+async def render_browser(fields: Dict[str, str], output: Path) -> None:
+    template_name = forex_template_name(fields["side"])
+    with tempfile.TemporaryDirectory() as tmpdir:
+        temp_html = prepare_forex_html(Path(tmpdir), template_name, case_values(fields))
+        await html_to_image(
+            html_file_path=str(temp_html),
+            output_path=str(output),
+            selector="#forex_img",
+            width=1142,
+            height=564,
+            device_scale_factor=forex_raster.scale,
+        )
+
+
+async def render_raster(fields: Dict[str, str], output: Path) -> None:
+    await forex_raster.render(forex_template_name(fields["side"]), case_values(fields), output)
+
+
+async def throughput(
+    render: Callable[[Dict[str, str], Path], Awaitable[None]], out_dir: Path, renders: int, concurrency: int
+) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    samples: List[float] = []
+
+    async def one(i: int) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            await render(CASES[i % len(CASES)], out_dir / f"throughput_{i % concurrency}.png")
+            samples.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(renders)))
+    elapsed = time.perf_counter() - started
+    return {
+        "renders_per_s": round(renders / elapsed, 2),
+        "p50_ms": round(percentile(samples, 0.5), 1),
+        "p95_ms": round(percentile(samples, 0.95), 1),
+    }
+
+
+async def main(args: argparse.Namespace) -> int:
+    logging.basicConfig(level=logging.WARNING)
+    out_dir = Path(args.save_dir) if args.save_dir else Path(tempfile.mkdtemp(prefix="forex_raster_"))
+    out_dir.mkdir(parents=True, exist_ok=True)
+    golden_dir = Path(args.golden) if args.golden else None
+    use_browser = not args.skip_browser
+    if golden_dir is None and not use_browser:
+        print("--skip-browser требует --golden", file=sys.stderr)
+        return 2
+    if use_browser:
+        await browser_pool.browser("bench")
+
+    cases = []
+    failed = False
+    for i, fields in enumerate(CASES):
+        raster_png = out_dir / f"case{i}_raster.png"
+        await render_raster(fields, raster_png)
+        if golden_dir is not None:
+            golden_png = golden_dir / f"case{i}.png"
+            if args.update_golden:
+                golden_dir.mkdir(parents=True, exist_ok=True)
+                await render_browser(fields, golden_png)
+        else:
+            golden_png = out_dir / f"case{i}_browser.png"
+            await render_browser(fields, golden_png)
+        if not golden_png.exists():
+            print(f"нет эталона {golden_png}: запустите с --update-golden", file=sys.stderr)
+            return 2
+        diff = pixel_diff(
+            golden_png, raster_png, args.threshold, out_dir / f"case{i}_diff.png" if args.save_dir else None
+        )
+        ok = (
+            diff["size_browser"] == diff["size_composite"]
+            and diff["mean_abs_diff"] <= args.max_mean_diff
+            and diff["diff_pixels_pct"] <= args.max_diff_pct
+        )
+        failed |= not ok
+        cases.append({"pair": fields["pair"], "side": fields["side"], "ok": ok, **diff})
+
+    renderers = [("raster", render_raster)] + ([("browser", render_browser)] if use_browser else [])
+    results = {
+        name: await throughput(render, out_dir, args.renders, args.concurrency) for name, render in renderers
+    }
+    if use_browser:
+        await browser_pool.close()
+
+    report = {
+        "golden": str(golden_dir) if golden_dir else "chromium",
+        "concurrency": args.concurrency,
+        "throughput": results,
+        "threshold": args.threshold,
+        "cases": cases,
+        "output_dir": str(out_dir),
+    }
+    if use_browser:
+        report["speedup"] = round(results["raster"]["renders_per_s"] / results["browser"]["renders_per_s"], 1)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--renders", type=int, default=40, help="карточек каждым способом для замера пропускной способности")
+    parser.add_argument("--concurrency", type=int, default=4, help="одновременных рендеров")
+    parser.add_argument("--golden", help="каталог эталонных PNG вместо свежих рендеров Chromium")
+    parser.add_argument("--update-golden", action="store_true", help="перезаписать эталоны рендерами Chromium")
+    parser.add_argument("--skip-browser", action="store_true", help="без Chromium: только эталоны и растровый рендер")
+    parser.add_argument("--threshold", type=int, default=32, help="разница в канале, с которой пиксель считается другим")
+    parser.add_argument("--max-mean-diff", type=float, default=1.0)
+    parser.add_argument("--max-diff-pct", type=float, default=0.5)
+    parser.add_argument("--save-dir", help="куда сохранить картинки и карты отличий")
+    sys.exit(asyncio.run(main(parser.parse_args())))
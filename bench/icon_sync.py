@@ -0,0 +1,188 @@
+"""
+Синхронизация иконок OKX (utils/okx_icon_scraper.py) против локальной заглушки.
+
+Заглушка отдаёт страницы /ru/trade-swap/<pair>-swap с разметкой, как у OKX
+(picture.okui-picture.okui-picture-font > img), с задержкой --page-delay и
+иконки с ETag/Last-Modified (поддерживает 304). Сценарии:
+
+- serial — холодная синхронизация одной страницей и одной загрузкой (как старый скрапер);
+- cold — холодная синхронизация пулом страниц и параллельными загрузками;
+- incremental — повторный запуск: иконки не менялись;
+- no_manifest — иконки на диске есть, манифеста нет (как у иконок из репозитория):
+  страницы загружаются, но неизменные файлы не перезаписываются;
+- changed — у части пар сменились иконки, одна локальная иконка удалена, добавлена новая пара.
+
+Для каждого сценария: время, загруженные страницы, запросы иконок, ответы 304,
+сохранённые/неизменные/ошибочные пары.
+
+Запуск:
+    python -m bench.icon_sync
+    python -m bench.icon_sync --pairs 50 --pages 8 --page-delay 1.5
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+from collections import Counter
+from email.utils import formatdate
+from pathlib import Path
+from typing import Dict, List
+
+from aiohttp import web
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+os.chdir(PROJECT_ROOT)
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from utils.okx_icon_scraper import DEFAULT_PAIRS, MANIFEST_NAME, IconSync  # noqa: E402
+from utils.browser_pool import browser_pool  # noqa: E402
+
+PAGE_TEMPLATE = """<!doctype html>
+<html><head><link rel="stylesheet" href="/static/app.css"></head>
+<body>
+<img src="/static/banner.jpg">
+<picture class="okui-picture okui-picture-font"><img src="/cdn/{pair}.png?v={version}"></picture>
+</body></html>"""
+
+
+class IconStandIn:
+    """Локальная заглушка страниц OKX и CDN иконок."""
+
+    def __init__(self, pairs: List[str], page_delay: float, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.host = host
+        self.port = port
+        self.page_delay = page_delay
+        self.requests: Counter = Counter()
+        self.icons: Dict[str, bytes] = {}
+        self.versions: Dict[str, int] = {}
+        for pair in pairs:
+            self.add_pair(pair)
+        self._runner: web.AppRunner = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/ru/trade-swap/"
+
+    def add_pair(self, pair: str) -> None:
+        icon_path = PROJECT_ROOT / "tradehtml" / "icons" / f"{pair}.png"
+        self.icons[pair] = icon_path.read_bytes() if icon_path.exists() else hashlib.sha256(pair.encode()).digest() * 64
+        self.versions[pair] = 1
+
+    def change(self, pair: str) -> None:
+        self.icons[pair] = self.icons[pair] + b"\0"
+        self.versions[pair] += 1
+
+    async def _page(self, request: web.Request) -> web.Response:
+        self.requests["page"] += 1
+        slug = request.match_info["slug"]
+        pair = slug.removesuffix("-swap").replace("-", "").upper()
+        await asyncio.sleep(self.page_delay)
+        if pair not in self.icons:
+            return web.Response(status=404)
+        html = PAGE_TEMPLATE.format(pair=pair, version=self.versions[pair])
+        return web.Response(text=html, content_type="text/html")
+
+    async def _icon(self, request: web.Request) -> web.Response:
+        pair = request.match_info["name"].removesuffix(".png")
+        if pair not in self.icons:
+            self.requests["icon_404"] += 1
+            return web.Response(status=404)
+        content = self.icons[pair]
+        etag = f'"{hashlib.sha256(content).hexdigest()[:16]}"'
+        if request.headers.get("If-None-Match") == etag:
+            self.requests["icon_304"] += 1
+            return web.Response(status=304, headers={"ETag": etag})
+        self.requests["icon_200"] += 1
+        return web.Response(
+            body=content,
+            content_type="image/png",
+            headers={"ETag": etag, "Last-Modified": formatdate(usegmt=True)},
+        )
+
+    async def _static(self, request: web.Request) -> web.Response:
+        # Тяжёлые ресурсы страницы: скрапер должен их блокировать
+        self.requests["static"] += 1
+        return web.Response(body=b"\0" * 200_000)
+
+    async def start(self) -> "IconStandIn":
+        app = web.Application()
+        app.router.add_get("/ru/trade-swap/{slug}", self._page)
+        app.router.add_get("/cdn/{name}", self._icon)
+        app.router.add_get("/static/{name}", self._static)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        return self
+
+    async def stop(self) -> None:
+        await self._runner.cleanup()
+
+
+async def run_scenario(name: str, stand_in: IconStandIn, pairs: List[str], output_dir: str, **options) -> dict:
+    stand_in.requests.clear()
+    result = await IconSync(output_dir, base_url=stand_in.base_url, **options).run(pairs)
+    return {
+        "scenario": name,
+        "seconds": round(result.seconds, 2),
+        "pages_loaded": result.pages_loaded,
+        "icon_requests": stand_in.requests["icon_200"] + stand_in.requests["icon_304"],
+        "not_modified": stand_in.requests["icon_304"],
+        "static_requests": stand_in.requests["static"],
+        "saved": len(result.saved),
+        "unchanged": len(result.unchanged),
+        "failed": result.failed,
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    logging.basicConfig(level=logging.WARNING)
+    pairs = list(dict.fromkeys(DEFAULT_PAIRS))[: args.pairs]
+    stand_in = await IconStandIn(pairs, args.page_delay).start()
+    workdir = Path(tempfile.mkdtemp(prefix="icon_sync_"))
+    report = []
+    try:
+        options = {"pages": args.pages, "downloads": args.downloads, "wait_seconds": args.wait}
+        if not args.skip_serial:
+            serial_dir = workdir / "serial" / "icons"
+            report.append(
+                await run_scenario("serial", stand_in, pairs, str(serial_dir), pages=1, downloads=1, wait_seconds=args.wait)
+            )
+
+        output_dir = workdir / "pool" / "icons"
+        report.append(await run_scenario("cold", stand_in, pairs, str(output_dir), **options))
+        report.append(await run_scenario("incremental", stand_in, pairs, str(output_dir), **options))
+
+        (output_dir.parent / MANIFEST_NAME).unlink()
+        report.append(await run_scenario("no_manifest", stand_in, pairs, str(output_dir), **options))
+
+        for pair in pairs[: args.changed]:
+            stand_in.change(pair)
+        (output_dir / f"{pairs[-1]}.png").unlink(missing_ok=True)
+        stand_in.add_pair("NEWUSDT")
+        report.append(await run_scenario("changed", stand_in, pairs + ["NEWUSDT"], str(output_dir), **options))
+    finally:
+        await browser_pool.close()
+        await stand_in.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps({"pairs": len(pairs), "page_delay_s": args.page_delay, "results": report}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pairs", type=int, default=len(DEFAULT_PAIRS), help="сколько пар из DEFAULT_PAIRS")
+    parser.add_argument("--pages", type=int, default=4)
+    parser.add_argument("--downloads", type=int, default=8)
+    parser.add_argument("--page-delay", type=float, default=0.5, help="задержка ответа страницы заглушки, с")
+    parser.add_argument("--wait", type=float, default=20)
+    parser.add_argument("--changed", type=int, default=3, help="сколько иконок сменить перед сценарием changed")
+    parser.add_argument("--skip-serial", action="store_true", help="не замерять последовательный вариант")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,100 @@
+"""
+Спекулятивный рендер инвойса: задержка от «Подтвердить» до готового PDF.
+
+Для каждого времени раздумий (--think, секунды между экраном
+подтверждения и нажатием «Подтвердить») замеряются два сценария, как
+в handlers/create_invoice.py:
+
+- off — PDF рендерится только после подтверждения;
+- speculative — рендер запускается на экране подтверждения
+  (invoice_prerenders.start), после паузы забирается take().
+
+Печатается p50/p95 задержки подтверждение → PDF. Отправка документа в
+Telegram в замер не входит (в боте она попадает в
+invoice_confirm_to_document_seconds{speculative}).
+
+Запуск:
+    python -m bench.invoice_speculation --think 0 1 3 5 --rounds 5
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+os.chdir(PROJECT_ROOT)
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from bench.okx_composite import percentile  # noqa: E402
+from bench.render_pipeline import INVOICE_DATA  # noqa: E402
+from handlers.create_invoice import _invoice_fingerprint, invoice_prerenders  # noqa: E402
+from misc.documents import remove_invoice_files, render_invoice  # noqa: E402
+from utils.browser_pool import browser_pool  # noqa: E402
+from utils.render_jobs import RenderJob  # noqa: E402
+
+USER_ID = 1
+
+
+async def confirm_off(think: float) -> float:
+    await asyncio.sleep(think)
+    started = time.perf_counter()
+    result = await render_invoice(INVOICE_DATA, RenderJob("invoice"))
+    elapsed = time.perf_counter() - started
+    _check(result)
+    return elapsed
+
+
+async def confirm_speculative(think: float) -> float:
+    fingerprint = _invoice_fingerprint(INVOICE_DATA)
+    invoice_prerenders.start(
+        USER_ID, fingerprint, lambda job: render_invoice(INVOICE_DATA, job), remove_invoice_files
+    )
+    await asyncio.sleep(think)
+    started = time.perf_counter()
+    entry = invoice_prerenders.take(USER_ID, fingerprint)
+    result = await entry.task
+    elapsed = time.perf_counter() - started
+    _check(result)
+    return elapsed
+
+
+def _check(result) -> None:
+    remove_invoice_files(result)
+    if not result[2]:
+        raise RuntimeError("html_to_pdf_playwright вернул False")
+
+
+def summary(samples: List[float]) -> dict:
+    return {
+        "p50_ms": round(percentile(samples, 0.5) * 1000, 1),
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 1),
+    }
+
+
+async def main(args: argparse.Namespace) -> int:
+    logging.basicConfig(level=logging.WARNING)
+    # Прогрев: запуск Chromium не попадает в замер
+    await confirm_off(0)
+
+    results = {}
+    for think in args.think:
+        off = [await confirm_off(think) for _ in range(args.rounds)]
+        speculative = [await confirm_speculative(think) for _ in range(args.rounds)]
+        results[f"{think:g}s"] = {"off": summary(off), "speculative": summary(speculative)}
+    await browser_pool.close()
+
+    print(json.dumps({"rounds": args.rounds, "think_time": results}, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--think", type=float, nargs="+", default=[0, 1, 3, 5], help="паузы перед подтверждением, с")
+    parser.add_argument("--rounds", type=int, default=5, help="замеров на каждую паузу и сценарий")
+    sys.exit(asyncio.run(main(parser.parse_args())))
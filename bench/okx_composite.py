@@ -0,0 +1,167 @@
+"""
+Гибридный рендер карточки /okx против полного рендера в Chromium.
+
+Для каждого набора значений карточка рендерится двумя способами:
+
+- browser — prepare_okx_html + html_to_image (как /okx с OKX_RENDERER=browser);
+- composite — кэшированный статичный слой + текст и иконка через Pillow
+  (utils/card_compositor.py, OKX_RENDERER=composite).
+
+Попиксельное сравнение: средняя абсолютная разница по каналам RGB (0–255),
+доля пикселей, где разница в каком-либо канале больше --threshold, и
+прямоугольник, в котором есть отличия. С --save-dir рядом кладутся обе
+картинки и карта отличий. Задержка: p50/p95 обоих способов на тёплом
+браузере и время снятия слоя (один раз на шаблон).
+
+Код выхода 1, если средняя разница больше --max-mean-diff или доля
+отличающихся пикселей больше --max-diff-pct: бенчмарк годится как проверка
+после правки шаблона.
+
+Запуск:
+    python -m bench.okx_composite --iterations 10
+    python -m bench.okx_composite --save-dir temp/bench/composite
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+os.chdir(PROJECT_ROOT)
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from misc.trade_cards import (  # noqa: E402
+    OKX_SAMPLE_FIELDS,
+    _pair_icon_image,
+    okx_compositor,
+    okx_substitutions,
+    okx_template_name,
+    prepare_okx_html,
+)
+from misc.pair_icons import normalize_pair  # noqa: E402
+from utils.browser_pool import browser_pool  # noqa: E402
+from utils.html_to_image import html_to_image  # noqa: E402
+
+CASES: List[Dict[str, str]] = [
+    OKX_SAMPLE_FIELDS,
+    {**OKX_SAMPLE_FIELDS, "pair": "ETHUSDT", "profit_percentage": "-12,07", "profit_amount": "-1520,44",
+     "entry_price": "4512.37", "exit_price": "4498.02", "position_type": "Шорт", "leverage": "25"},
+    {**OKX_SAMPLE_FIELDS, "pair": "DOGEUSDT", "profit_percentage": "+1234,5", "profit_amount": "+98765,43",
+     "entry_price": "0.198765", "exit_price": "0.201234", "leverage": "5"},
+    {**OKX_SAMPLE_FIELDS, "pair": "UNKNOWNUSDT", "share_date": "31.12.2025", "share_time": "23:59:59"},
+]
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * (len(ordered) - 1) + 0.5))]
+
+
+def pixel_diff(browser_png: Path, composite_png: Path, threshold: int, save_to: Path = None) -> dict:
+    from PIL import Image, ImageChops
+
+    with Image.open(browser_png) as a, Image.open(composite_png) as b:
+        a, b = a.convert("RGB"), b.convert("RGB")
+        report = {"size_browser": a.size, "size_composite": b.size}
+        if a.size != b.size:
+            # Сравниваем общую часть, но несовпадение размера само по себе — ошибка
+            size = (min(a.width, b.width), min(a.height, b.height))
+            a, b = a.crop((0, 0) + size), b.crop((0, 0) + size)
+        diff = ImageChops.difference(a, b)
+
+    pixels = diff.width * diff.height
+    # Средняя разница по каналам из гистограмм, без копирования в Python
+    histogram = diff.histogram()
+    mean = sum(i * n for channel in range(3) for i, n in enumerate(histogram[channel * 256:(channel + 1) * 256]))
+    # Пиксель отличается, если хотя бы в одном канале разница больше порога
+    peak = ImageChops.lighter(ImageChops.lighter(*diff.split()[:2]), diff.split()[2])
+    differing = sum(peak.histogram()[threshold + 1:])
+    report.update(
+        mean_abs_diff=round(mean / (pixels * 3), 3),
+        diff_pixels_pct=round(100 * differing / pixels, 3),
+        diff_bbox=peak.point(lambda v: 255 if v > threshold else 0).getbbox(),
+    )
+    if save_to is not None:
+        peak.point(lambda v: min(255, v * 4)).save(save_to)
+    return report
+
+
+async def render_browser(fields: dict, output: Path) -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        temp_html = prepare_okx_html(Path(tmpdir), okx_template_name(fields["profit_percentage"]), fields)
+        await html_to_image(html_file_path=str(temp_html), output_path=str(output))
+
+
+async def render_composite(fields: dict, output: Path) -> None:
+    icon = _pair_icon_image(normalize_pair(fields["pair"]))
+    await okx_compositor.render(
+        okx_template_name(fields["profit_percentage"]), okx_substitutions(fields), {"pair_icon": icon}, output
+    )
+
+
+async def main(args: argparse.Namespace) -> int:
+    logging.basicConfig(level=logging.WARNING)
+    out_dir = Path(args.save_dir) if args.save_dir else Path(tempfile.mkdtemp(prefix="okx_composite_"))
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    await browser_pool.browser("bench")
+    capture = {}
+    for template_name in ("long.html", "short.html"):
+        started = time.perf_counter()
+        await okx_compositor.layer(template_name)
+        capture[template_name] = round((time.perf_counter() - started) * 1000, 1)
+
+    cases = []
+    failed = False
+    for i, fields in enumerate(CASES):
+        browser_png, composite_png = out_dir / f"case{i}_browser.png", out_dir / f"case{i}_composite.png"
+        await render_browser(fields, browser_png)
+        await render_composite(fields, composite_png)
+        diff = pixel_diff(
+            browser_png, composite_png, args.threshold, out_dir / f"case{i}_diff.png" if args.save_dir else None
+        )
+        ok = (
+            diff["size_browser"] == diff["size_composite"]
+            and diff["mean_abs_diff"] <= args.max_mean_diff
+            and diff["diff_pixels_pct"] <= args.max_diff_pct
+        )
+        failed |= not ok
+        cases.append({"pair": fields["pair"], "profit": fields["profit_percentage"], "ok": ok, **diff})
+
+    latency = {}
+    for name, render in (("browser", render_browser), ("composite", render_composite)):
+        samples = []
+        for i in range(args.iterations):
+            started = time.perf_counter()
+            await render(CASES[i % len(CASES)], out_dir / f"latency_{name}.png")
+            samples.append((time.perf_counter() - started) * 1000)
+        latency[name] = {"p50_ms": round(percentile(samples, 0.5), 1), "p95_ms": round(percentile(samples, 0.95), 1)}
+    await browser_pool.close()
+
+    report = {
+        "layer_capture_ms": capture,
+        "latency": latency,
+        "speedup_p50": round(latency["browser"]["p50_ms"] / latency["composite"]["p50_ms"], 1),
+        "threshold": args.threshold,
+        "cases": cases,
+        "output_dir": str(out_dir),
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=10, help="рендеров каждым способом для замера задержки")
+    parser.add_argument("--threshold", type=int, default=32, help="разница в канале, с которой пиксель считается другим")
+    parser.add_argument("--max-mean-diff", type=float, default=1.0)
+    parser.add_argument("--max-diff-pct", type=float, default=0.5)
+    parser.add_argument("--save-dir", help="куда сохранить картинки и карты отличий")
+    sys.exit(asyncio.run(main(parser.parse_args())))
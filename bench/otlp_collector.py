@@ -0,0 +1,62 @@
+"""
+Локальная замена OTLP-коллектора для проверки экспорта трейсов.
+
+Принимает OTLP/HTTP JSON на /v1/traces и печатает каждый полученный span
+с отступом по вложенности, чтобы было видно, куда ушло время апдейта.
+
+Запуск:
+    python -m bench.otlp_collector --port 4318
+    OTLP_ENDPOINT=http://127.0.0.1:4318/v1/traces python bot.py
+"""
+
+import argparse
+import json
+
+from aiohttp import web
+
+
+def _print_batch(payload: dict, out) -> int:
+    spans = []
+    for resource_spans in payload.get("resourceSpans", []):
+        for scope_spans in resource_spans.get("scopeSpans", []):
+            spans.extend(scope_spans.get("spans", []))
+
+    by_id = {s["spanId"]: s for s in spans}
+
+    def depth(item: dict) -> int:
+        level, parent = 0, item.get("parentSpanId")
+        while parent in by_id:
+            level, parent = level + 1, by_id[parent].get("parentSpanId")
+        return level
+
+    for item in sorted(spans, key=lambda s: int(s["startTimeUnixNano"])):
+        duration_ms = (int(item["endTimeUnixNano"]) - int(item["startTimeUnixNano"])) / 1e6
+        status = "ERR" if item.get("status", {}).get("code") == 2 else "ok "
+        print(f"{item['traceId'][:8]} {status} {'  ' * depth(item)}{item['name']:<28} {duration_ms:9.1f} ms")
+        if out is not None:
+            out.write(json.dumps(item, ensure_ascii=False) + "\n")
+    if out is not None:
+        out.flush()
+    return len(spans)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4318)
+    parser.add_argument("--output", default=None, help="дописывать полученные span'ы в JSONL-файл")
+    args = parser.parse_args()
+
+    out = open(args.output, "a", encoding="utf-8") if args.output else None
+
+    async def handle_traces(request: web.Request) -> web.Response:
+        count = _print_batch(await request.json(), out)
+        return web.json_response({"partialSuccess": {}, "accepted": count})
+
+    app = web.Application()
+    app.router.add_post("/v1/traces", handle_traces)
+    web.run_app(app, host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Пиковая память объединения загруженного PDF с титулом (/create_user_pdf).
+
+Генерирует синтетические PDF заданных размеров (--sizes, МБ): на каждой
+странице — картинка из случайных байт (--page-mb), которая не сжимается,
+как сканы в реальных загрузках. Для каждого размера в отдельном процессе
+выполняется путь после скачивания: подсчёт страниц и объединение с
+титулом. Сравниваются:
+
+- pypdf2 — прежний merge_pdfs: PdfReader по файлу + PdfWriter, документ
+  собирается в памяти и пишется в конце;
+- streaming — utils/pdf_stream.py: mmap + потоковая запись объектов.
+
+Печатаются пиковый RSS процесса (ru_maxrss), его прирост над RSS после
+импорта модулей (aiogram и PyPDF2 в боте уже загружены), время и размер
+результата.
+
+Запуск:
+    python -m bench.pdf_merge_memory --sizes 100 500
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+os.chdir(PROJECT_ROOT)
+sys.path.insert(0, str(PROJECT_ROOT))
+
+# Кусок случайных данных при генерации картинок
+_CHUNK = 1 << 20
+
+
+def generate_pdf(path: Path, size_mb: float, page_mb: float) -> int:
+    """Пишет PDF примерно size_mb мегабайт; возвращает число страниц."""
+    side = int((page_mb * 2**20) ** 0.5)
+    image_bytes = side * side
+    pages = max(1, round(size_mb / page_mb))
+    offsets = {}
+    with open(path, "wb") as out:
+        out.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+
+        def begin(object_id: int) -> None:
+            offsets[object_id] = out.tell()
+            out.write(b"%d 0 obj\n" % object_id)
+
+        # 1 — каталог, 2 — дерево страниц, далее по три объекта на страницу
+        page_ids = [3 + i * 3 for i in range(pages)]
+        begin(1)
+        out.write(b"<< /Type /Catalog /Pages 2 0 R >>\nendobj\n")
+        begin(2)
+        kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+        out.write(b"<< /Type /Pages /Kids [%s] /Count %d >>\nendobj\n" % (kids, pages))
+        content = b"q 595 0 0 842 0 0 cm /Im0 Do Q"
+        for page_id in page_ids:
+            begin(page_id)
+            out.write(
+                b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                b"/Resources << /XObject << /Im0 %d 0 R >> >> /Contents %d 0 R >>\nendobj\n"
+                % (page_id + 1, page_id + 2)
+            )
+            begin(page_id + 1)
+            out.write(
+                b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceGray "
+                b"/BitsPerComponent 8 /Length %d >>\nstream\n" % (side, side, image_bytes)
+            )
+            left = image_bytes
+            while left:
+                chunk = min(left, _CHUNK)
+                out.write(os.urandom(chunk))
+                left -= chunk
+            out.write(b"\nendstream\nendobj\n")
+            begin(page_id + 2)
+            out.write(b"<< /Length %d >>\nstream\n%s\nendstream\nendobj\n" % (len(content), content))
+
+        xref_offset = out.tell()
+        size = max(offsets) + 1
+        out.write(b"xref\n0 %d\n0000000000 65535 f \n" % size)
+        for object_id in range(1, size):
+            out.write(b"%010d 00000 n \n" % offsets[object_id])
+        out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, xref_offset))
+    return pages
+
+
+def merge_pypdf2(title: str, main: str, output: str) -> int:
+    """Прежний merge_pdfs: весь документ собирается в PdfWriter."""
+    from PyPDF2 import PdfReader, PdfWriter
+
+    writer = PdfWriter()
+    title_reader = PdfReader(title)
+    main_reader = PdfReader(main)
+    writer.add_page(title_reader.pages[0])
+    for page in main_reader.pages:
+        writer.add_page(page)
+    with open(output, "wb") as out:
+        writer.write(out)
+    return len(writer.pages)
+
+
+def merge_streaming(title: str, main: str, output: str) -> int:
+    from utils.pdf_stream import count_pages, merge_streaming as merge
+
+    # Как в хендлере: сначала проверка числа страниц, затем объединение
+    count_pages(main)
+    return merge(title, main, output)
+
+
+METHODS = {"pypdf2": merge_pypdf2, "streaming": merge_streaming}
+
+
+def child(method: str, title: str, main: str, output: str) -> None:
+    """Выполняется в отдельном процессе: ru_maxrss не смешивается между прогонами."""
+    # Модули, которые в боте уже загружены (aiogram, PyPDF2), — до замера и для обоих способов
+    import utils.pdf_stream  # noqa: F401
+
+    baseline = _max_rss_mb()
+    started = time.perf_counter()
+    pages = METHODS[method](title, main, output)
+    elapsed = time.perf_counter() - started
+    peak = _max_rss_mb()
+    print(json.dumps({
+        "pages": pages,
+        "seconds": round(elapsed, 2),
+        "peak_rss_mb": round(peak, 1),
+        "peak_over_baseline_mb": round(peak - baseline, 1),
+        "output_mb": round(os.path.getsize(output) / 2**20, 1),
+    }))
+
+
+def _max_rss_mb() -> float:
+    # На Linux ru_maxrss — в килобайтах
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_child(method: str, title: Path, main: Path, output: Path) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-m", "bench.pdf_merge_memory", "--child", method, str(title), str(main), str(output)],
+        capture_output=True, text=True, check=True,
+    )
+    output.unlink(missing_ok=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(args: argparse.Namespace) -> int:
+    if args.child:
+        child(*args.child)
+        return 0
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="pdf_merge_memory_", dir=args.workdir) as tmpdir:
+        workdir = Path(tmpdir)
+        title = workdir / "title.pdf"
+        generate_pdf(title, args.page_mb, args.page_mb)
+        for size in args.sizes:
+            source = workdir / f"upload_{size:g}mb.pdf"
+            pages = generate_pdf(source, size, args.page_mb)
+            results[f"{size:g}MB"] = {
+                "input_mb": round(source.stat().st_size / 2**20, 1),
+                "input_pages": pages,
+                **{method: run_child(method, title, source, workdir / f"merged_{method}.pdf") for method in args.methods},
+            }
+            source.unlink()
+
+    print(json.dumps({"page_mb": args.page_mb, "results": results}, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=float, nargs="+", default=[100, 500], help="размеры входных PDF, МБ")
+    parser.add_argument("--page-mb", type=float, default=1.0, help="размер картинки на странице, МБ")
+    parser.add_argument("--methods", nargs="+", choices=sorted(METHODS), default=["pypdf2", "streaming"])
+    parser.add_argument("--workdir", default=None, help="каталог для временных PDF (нужно ~3× размера)")
+    parser.add_argument("--child", nargs=4, metavar=("METHOD", "TITLE", "MAIN", "OUTPUT"), help=argparse.SUPPRESS)
+    sys.exit(main(parser.parse_args()))
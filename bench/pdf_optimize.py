@@ -0,0 +1,78 @@
+"""
+Профили оптимизации PDF (utils/pdf_optimize.py): размер против времени.
+
+Каждый входной PDF (--inputs, по умолчанию основной документ
+/create_user_pdf) копируется и оптимизируется каждым профилем --rounds
+раз. С --title дополнительно замеряется результат объединения титула с
+документом, как его отправляет /create_user_pdf. Печатаются размер до и
+после, экономия в процентах, p50 времени и счётчики (объединённые
+повторы, пересжатые потоки, обработанные картинки). С --linearize после
+профиля выполняется линеаризация через qpdf, если он установлен.
+
+Запуск:
+    python -m bench.pdf_optimize --rounds 3
+    python -m bench.pdf_optimize --inputs temp/invoice.pdf --title temp/title.pdf --linearize
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+os.chdir(PROJECT_ROOT)
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from bench.okx_composite import percentile  # noqa: E402
+from misc.constants import DEFAULT_PDF_PATH  # noqa: E402
+from utils.pdf_optimize import PROFILES, optimize_pdf  # noqa: E402
+from utils.pdf_stream import merge_streaming  # noqa: E402
+
+
+def measure(source: Path, workdir: Path, args: argparse.Namespace) -> dict:
+    results = {"bytes": source.stat().st_size}
+    for profile in args.profiles:
+        reports = []
+        for _ in range(args.rounds):
+            target = workdir / f"optimized_{profile}.pdf"
+            shutil.copyfile(source, target)
+            reports.append(optimize_pdf(target, profile, args.linearize))
+        report = reports[-1]
+        results[profile] = {
+            "bytes": report.bytes_after,
+            "saved_percent": round(100 * (1 - report.bytes_after / report.bytes_before), 1),
+            "p50_ms": round(percentile([r.seconds for r in reports], 0.5) * 1000, 1),
+            "deduplicated": report.deduplicated,
+            "recompressed": report.recompressed,
+            "images": report.images,
+            "linearized": report.linearized,
+        }
+    return results
+
+
+def main(args: argparse.Namespace) -> int:
+    report = {"rounds": args.rounds, "qpdf": shutil.which("qpdf") is not None, "inputs": {}}
+    with tempfile.TemporaryDirectory(prefix="pdf_optimize_") as tmpdir:
+        workdir = Path(tmpdir)
+        for path in map(Path, args.inputs):
+            report["inputs"][path.name] = measure(path, workdir, args)
+            if args.title:
+                merged = workdir / f"merged_{path.name}"
+                merge_streaming(args.title, path, merged)
+                report["inputs"][f"{path.name} + title"] = measure(merged, workdir, args)
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--inputs", nargs="+", default=[DEFAULT_PDF_PATH], help="PDF для оптимизации")
+    parser.add_argument("--title", default=None, help="PDF титула: замерить ещё и объединённый документ")
+    parser.add_argument("--profiles", nargs="+", choices=sorted(PROFILES), default=["dedup", "lossless", "compact"])
+    parser.add_argument("--rounds", type=int, default=3, help="прогонов на профиль")
+    parser.add_argument("--linearize", action="store_true", help="линеаризовать через qpdf после профиля")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,95 @@
+"""
+Single-flight рендеров (utils/single_flight.py): всплеск одинаковых /okx.
+
+Имитирует двойные нажатия и нескольких администраторов: --burst
+одновременных рендеров карточки /okx, из них --distinct разных наборов
+полей (остальные повторяют их), --rounds раз подряд. Каждый запрос
+готовит свой временный каталог, как хендлер. Прогон выполняется с
+объединением и без (RENDER_SINGLE_FLIGHT), печатаются время всплеска
+p50/p95, число рендеров в Chromium и присоединённых запросов
+(render_coalesced_total).
+
+Запуск:
+    python -m bench.render_dedup --burst 6 --distinct 2 --rounds 5
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+os.chdir(PROJECT_ROOT)
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import utils.html_to_image as html_to_image_module  # noqa: E402
+from bench.okx_composite import percentile  # noqa: E402
+from misc.trade_cards import OKX_SAMPLE_FIELDS, okx_template_name, prepare_okx_html  # noqa: E402
+from utils.browser_pool import browser_pool  # noqa: E402
+from utils.html_to_image import html_to_image  # noqa: E402
+from utils.metrics import BROWSER_RENDERS_TOTAL, RENDER_COALESCED_TOTAL  # noqa: E402
+
+
+async def render_card(fields: dict, out_dir: Path, index: int) -> None:
+    template_name = okx_template_name(fields["profit_percentage"])
+    with tempfile.TemporaryDirectory() as tmpdir:
+        temp_html = prepare_okx_html(Path(tmpdir), template_name, fields)
+        await html_to_image(html_file_path=str(temp_html), output_path=str(out_dir / f"card_{index}.png"))
+
+
+async def run_mode(single_flight: bool, args: argparse.Namespace, out_dir: Path) -> dict:
+    html_to_image_module.RENDER_SINGLE_FLIGHT = single_flight
+    variants = [
+        {**OKX_SAMPLE_FIELDS, "entry_price": f"{114962 + i}.0"} for i in range(args.distinct)
+    ]
+    renders_before = BROWSER_RENDERS_TOTAL.value()
+    coalesced_before = RENDER_COALESCED_TOTAL.value(renderer="image")
+    samples = []
+    for _ in range(args.rounds):
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(render_card(variants[i % args.distinct], out_dir, i) for i in range(args.burst))
+        )
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        "burst_p50_ms": round(percentile(samples, 0.5), 1),
+        "burst_p95_ms": round(percentile(samples, 0.95), 1),
+        "browser_renders": int(BROWSER_RENDERS_TOTAL.value() - renders_before),
+        "coalesced": int(RENDER_COALESCED_TOTAL.value(renderer="image") - coalesced_before),
+    }
+
+
+async def main(args: argparse.Namespace) -> int:
+    logging.basicConfig(level=logging.WARNING)
+    out_dir = Path(tempfile.mkdtemp(prefix="render_dedup_"))
+    # Прогрев: запуск Chromium и первая загрузка шрифтов не попадают в замер
+    await render_card(OKX_SAMPLE_FIELDS, out_dir, 0)
+
+    results = {
+        "single_flight": await run_mode(True, args, out_dir),
+        "baseline": await run_mode(False, args, out_dir),
+    }
+    await browser_pool.close()
+
+    report = {
+        "burst": args.burst,
+        "distinct": args.distinct,
+        "rounds": args.rounds,
+        "modes": results,
+        "speedup_p50": round(results["baseline"]["burst_p50_ms"] / results["single_flight"]["burst_p50_ms"], 2),
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--burst", type=int, default=6, help="одновременных запросов во всплеске")
+    parser.add_argument("--distinct", type=int, default=2, help="из них разных наборов полей")
+    parser.add_argument("--rounds", type=int, default=5, help="всплесков подряд")
+    sys.exit(asyncio.run(main(parser.parse_args())))
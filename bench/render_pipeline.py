@@ -0,0 +1,332 @@
+"""
+Офлайн-бенчмарк конвейера рендеринга и документов — без Telegram.
+
+Каждый кейс вызывает ту же функцию, что и бот, на фиксированном наборе данных:
+
+- image:long.html / image:short.html / image:buy-light.html / image:sell-light.html —
+  подготовка шаблона и html_to_image (как /okx и /forex);
+- pdf:invoice / pdf:title — fill_*_html + html_to_pdf_playwright;
+- prepare_okx_html, fill_pdf_html, fill_title_html, merge_pdfs — шаги без браузера;
+- soft_signal — разбор, расчёт метрик и форматирование сигнала;
+- format_price — форматтеры чисел (карточки, инвойс, сигнал).
+
+Для каждого кейса печатаются p50/p95/p99 (мс), пропускная способность (оп/с)
+и пиковый RSS процесса и его дочерних процессов (Chromium). Кейсы с браузером
+работают на общем Chromium (utils/browser_pool.py): его запуск попадает в
+прогревочные итерации, замеряется рендер на тёплом браузере. Результат можно
+сохранить как baseline и сравнивать с ним следующие прогоны: при замедлении
+p50 больше чем на --threshold скрипт завершается с кодом 1.
+
+Запуск:
+    python -m bench.render_pipeline --save-baseline
+    python -m bench.render_pipeline --baseline bench/baseline.json
+    python -m bench.render_pipeline --skip-browser --only soft_signal format_price
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+# Функции конвейера работают с относительными путями (temp/, invoice_html/, pdf_title/)
+os.chdir(PROJECT_ROOT)
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from misc.constants import DEFAULT_PDF_PATH, PDF_HTML_PATH  # noqa: E402
+from misc.soft_signal import batch_metrics, format_number, format_signals, parse_signals_text  # noqa: E402
+from misc.trade_cards import (  # noqa: E402
+    format_price_with_spaces,
+    forex_substitutions,
+    prepare_forex_html,
+    prepare_okx_html,
+)
+from misc.utils import fill_pdf_html, fill_title_html, format_cost, merge_pdfs  # noqa: E402
+from utils.browser_pool import browser_pool  # noqa: E402
+from utils.html_to_image import html_to_image  # noqa: E402
+from utils.render_pdf import html_to_pdf_playwright  # noqa: E402
+
+DEFAULT_BASELINE = PROJECT_ROOT / "bench" / "baseline.json"
+OUTPUT_DIR = PROJECT_ROOT / "temp" / "bench"
+
+OKX_FIELDS = {
+    "pair": "BTCUSDT",
+    "position_type": "Лонг",
+    "leverage": "100",
+    "profit_percentage": "+5,53",
+    "profit_amount": "15348.12",
+    "entry_price": "114962.0",
+    "exit_price": "114956.0",
+    "share_date": "15.09.2025",
+    "share_time": "20:21:11",
+}
+FOREX_DATA = {
+    "pair": "EURUSD",
+    "side": "buy",
+    "side_price": "1.06",
+    "ticket": "54814272772",
+    "desc": "Euro vs US Dollar",
+    "open": "1.16540",
+    "close": "1.16252",
+    "delta": "521",
+    "pct": "0.35",
+    "profit": "6108.01",
+    "open_dt": "2026.01.26 10:12:45",
+    "close_dt": "2026.01.26 10:35:23",
+    "sl": "154.335",
+    "swap": "2.10",
+    "tp": "153.536",
+    "fee": "-5.30",
+}
+INVOICE_DATA = {
+    "name": "Иван Иванов",
+    "phone": "+7 900 000-00-00",
+    "order_number": "4521",
+    "purchase_date": "19.10.2026",
+    "product": "product_b",
+    "duration": "1m",
+    "cost": "149900",
+    "email": "bench@example.com",
+}
+SIGNAL_TEXT = "BTCUSDT 10m\n\nShort\nPrice: 69129.8\nTP: 67741.9\nSL: 70605.5\n\n2026-03-19 15:41:32"
+PRICES = ["114962.0", "114,962.50", "-15000.50", "+15000", "0.00012", "1 234 567,89"]
+
+
+def _rss_kb() -> Dict[str, int]:
+    """Пиковый RSS (КБ в Linux) самого процесса и завершённых дочерних процессов."""
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    }
+
+
+# --- Кейсы ---
+
+
+def _image_case(template_name: str) -> Callable[[], Awaitable[None]]:
+    async def run() -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            if template_name in ("long.html", "short.html"):
+                sign = "+" if template_name == "long.html" else "-"
+                fields = {**OKX_FIELDS, "profit_percentage": sign + "5,53"}
+                temp_html = prepare_okx_html(Path(tmpdir), template_name, fields)
+                options = {}
+            else:
+                side = "buy" if template_name.startswith("buy") else "sell"
+                values = forex_substitutions({**FOREX_DATA, "side": side})
+                temp_html = prepare_forex_html(Path(tmpdir), template_name, values)
+                options = dict(selector="#forex_img", width=1142, height=564, device_scale_factor=2)
+            await html_to_image(
+                html_file_path=str(temp_html),
+                output_path=str(OUTPUT_DIR / f"{template_name}.png"),
+                **options,
+            )
+
+    return run
+
+
+async def _pdf_invoice() -> None:
+    submission_id = uuid.uuid4().hex
+    temp_html_path = fill_pdf_html(INVOICE_DATA, submission_id, PDF_HTML_PATH)
+    try:
+        ok = await html_to_pdf_playwright(
+            html_file_path=temp_html_path,
+            output_pdf_path=os.path.join(os.path.dirname(temp_html_path), "invoice.pdf"),
+            css_file_path=os.path.join(os.path.dirname(temp_html_path), "styles.css"),
+        )
+        if not ok:
+            raise RuntimeError("html_to_pdf_playwright вернул False")
+    finally:
+        shutil.rmtree(os.path.dirname(temp_html_path), ignore_errors=True)
+
+
+async def _pdf_title() -> None:
+    temp_html_path = fill_title_html("Иван Иванов")
+    try:
+        ok = await html_to_pdf_playwright(
+            html_file_path=temp_html_path,
+            output_pdf_path=str(OUTPUT_DIR / "title.pdf"),
+            landscape=True,
+        )
+        if not ok:
+            raise RuntimeError("html_to_pdf_playwright вернул False")
+    finally:
+        os.remove(temp_html_path)
+
+
+async def _prepare_okx_html() -> None:
+    # Подготовка карточки /okx без браузера: копирование ресурсов, иконка, подстановки
+    with tempfile.TemporaryDirectory() as tmpdir:
+        prepare_okx_html(Path(tmpdir), "long.html", OKX_FIELDS)
+
+
+async def _fill_pdf_html() -> None:
+    temp_html_path = fill_pdf_html(INVOICE_DATA, uuid.uuid4().hex, PDF_HTML_PATH)
+    shutil.rmtree(os.path.dirname(temp_html_path), ignore_errors=True)
+
+
+async def _fill_title_html() -> None:
+    os.remove(fill_title_html("Иван Иванов"))
+
+
+async def _merge_pdfs() -> None:
+    # Основной документ выступает и титульным: важна стоимость чтения/записи страниц
+    if not merge_pdfs(DEFAULT_PDF_PATH, DEFAULT_PDF_PATH, str(OUTPUT_DIR / "merged.pdf")):
+        raise RuntimeError("merge_pdfs вернул False")
+
+
+async def _soft_signal() -> None:
+    # Одна операция — тысяча сигналов, иначе замер тонет в накладных расходах цикла
+    for _ in range(1000):
+        batch = parse_signals_text(SIGNAL_TEXT)
+        format_signals(batch, batch_metrics(batch))
+
+
+async def _format_price() -> None:
+    for _ in range(1000):
+        for value in PRICES:
+            format_price_with_spaces(value)
+            format_cost(value)
+        format_number(69129.8)
+        format_number(-1234567.0)
+
+
+# name -> (нужен ли браузер, функция одной операции)
+CASES: Dict[str, tuple] = {
+    "image:long.html": (True, _image_case("long.html")),
+    "image:short.html": (True, _image_case("short.html")),
+    "image:buy-light.html": (True, _image_case("buy-light.html")),
+    "image:sell-light.html": (True, _image_case("sell-light.html")),
+    "pdf:invoice": (True, _pdf_invoice),
+    "pdf:title": (True, _pdf_title),
+    "prepare_okx_html": (False, _prepare_okx_html),
+    "fill_pdf_html": (False, _fill_pdf_html),
+    "fill_title_html": (False, _fill_title_html),
+    "merge_pdfs": (False, _merge_pdfs),
+    "soft_signal": (False, _soft_signal),
+    "format_price": (False, _format_price),
+}
+
+
+def _percentile(sorted_samples: List[float], q: float) -> float:
+    index = min(len(sorted_samples) - 1, int(round(q * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+async def _measure(name: str, func: Callable[[], Awaitable[None]], iterations: int, warmup: int) -> dict:
+    for _ in range(warmup):
+        await func()
+
+    samples: List[float] = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        await func()
+        samples.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+
+    samples.sort()
+    rss = _rss_kb()
+    return {
+        "case": name,
+        "iterations": iterations,
+        "p50_ms": round(_percentile(samples, 0.50) * 1000, 3),
+        "p95_ms": round(_percentile(samples, 0.95) * 1000, 3),
+        "p99_ms": round(_percentile(samples, 0.99) * 1000, 3),
+        "ops_per_sec": round(iterations / elapsed, 2),
+        "peak_rss_kb": rss["self"],
+        "children_peak_rss_kb": rss["children"],
+    }
+
+
+def compare(results: List[dict], baseline: List[dict], threshold: float) -> List[dict]:
+    """Сравнивает p50/p95 с baseline. Возвращает список регрессий."""
+    previous = {item["case"]: item for item in baseline if "error" not in item}
+    regressions = []
+    for item in results:
+        base = previous.get(item["case"])
+        if base is None or "error" in item:
+            continue
+        item["p50_vs_baseline"] = round(item["p50_ms"] / base["p50_ms"], 3) if base["p50_ms"] else None
+        item["p95_vs_baseline"] = round(item["p95_ms"] / base["p95_ms"], 3) if base["p95_ms"] else None
+        if item["p50_vs_baseline"] and item["p50_vs_baseline"] > 1 + threshold:
+            regressions.append(item)
+    return regressions
+
+
+async def main(args: argparse.Namespace) -> int:
+    # Построчные INFO-логи рендера исказили бы замер
+    logging.basicConfig(level=logging.WARNING)
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+
+    selected = args.only or list(CASES)
+    unknown = [name for name in selected if name not in CASES]
+    if unknown:
+        print(f"Неизвестные кейсы: {', '.join(unknown)}. Доступны: {', '.join(CASES)}", file=sys.stderr)
+        return 2
+
+    results = []
+    for name in selected:
+        needs_browser, func = CASES[name]
+        if needs_browser and args.skip_browser:
+            continue
+        iterations = args.browser_iterations if needs_browser else args.iterations
+        try:
+            result = await _measure(name, func, iterations, args.warmup)
+        except Exception as exc:  # noqa: BLE001
+            result = {"case": name, "error": f"{type(exc).__name__}: {exc}"}
+        results.append(result)
+        print(json.dumps(result, ensure_ascii=False), file=sys.stderr)
+
+    await browser_pool.close()
+    shutil.rmtree(OUTPUT_DIR, ignore_errors=True)
+
+    report = {
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+
+    exit_code = 0
+    baseline_path: Optional[Path] = Path(args.baseline) if args.baseline else None
+    if baseline_path and baseline_path.exists() and not args.save_baseline:
+        baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+        regressions = compare(results, baseline["results"], args.threshold)
+        report["baseline"] = str(baseline_path)
+        report["regressions"] = [item["case"] for item in regressions]
+        if regressions:
+            exit_code = 1
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    if args.save_baseline:
+        target = baseline_path or DEFAULT_BASELINE
+        target.write_text(text + "\n", encoding="utf-8")
+        print(f"Baseline сохранён: {target}", file=sys.stderr)
+    return exit_code
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=50, help="повторов для кейсов без браузера")
+    parser.add_argument("--browser-iterations", type=int, default=10, help="повторов для кейсов с Chromium")
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--only", nargs="+", metavar="CASE", help="запустить только указанные кейсы")
+    parser.add_argument("--skip-browser", action="store_true", help="пропустить кейсы, которым нужен Chromium")
+    parser.add_argument("--output", help="дополнительно записать JSON-отчёт в файл")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="файл baseline для сравнения")
+    parser.add_argument("--save-baseline", action="store_true", help="сохранить результат как baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="допустимое замедление p50 (0.2 = 20%%)")
+    sys.exit(asyncio.run(main(parser.parse_args())))
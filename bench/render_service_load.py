@@ -0,0 +1,160 @@
+"""
+Нагрузка на сервис рендеринга (render_service.py): пропускная способность,
+задержка и отказы при переполнении очереди.
+
+Запускает сервис отдельным процессом на временном Unix-сокете (с
+--concurrency и --max-queue) или, с --url, нагружает уже запущенный.
+--clients клиентов в цикле отправляют операцию --op, всего --requests
+запросов. Печатаются запросов в секунду, p50/p95/p99 задержки успешных
+ответов и число ответов по статусам (503 — очередь заполнена).
+
+forex_card рендерится Pillow (FOREX_RASTER_TEMPLATES выставляется для
+процесса сервиса); без шрифта со всеми символами карточки (fontconfig)
+сервис уходит в Chromium. okx_substitutions — только подстановки, без
+рендера: измеряет накладные расходы самого API.
+
+Запуск:
+    python -m bench.render_service_load --clients 16 --requests 400
+    python -m bench.render_service_load --op okx_substitutions --clients 64 --requests 5000
+    python -m bench.render_service_load --concurrency 2 --max-queue 4 --clients 32
+    python -m bench.render_service_load --url unix:temp/render.sock --op okx_card
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+os.chdir(PROJECT_ROOT)
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from bench.forex_raster import CASES  # noqa: E402
+from bench.okx_composite import percentile  # noqa: E402
+from misc.trade_cards import okx_fields  # noqa: E402
+
+OKX_FIELDS = okx_fields(["BTCUSDT", "Long", "50", "+5.53", "102150.5", "102263.4", "45375104"])
+
+
+def make_params(op: str, index: int, output_dir: Path) -> Dict[str, Any]:
+    output_path = str(output_dir / f"card_{index % 64}.png")
+    if op == "forex_card":
+        return {"data": CASES[index % len(CASES)], "output_path": output_path}
+    if op == "okx_card":
+        return {"fields": OKX_FIELDS, "output_path": output_path}
+    if op == "okx_substitutions":
+        return {"fields": OKX_FIELDS}
+    raise SystemExit(f"неизвестная операция для нагрузки: {op}")
+
+
+class Load:
+    def __init__(self, args: argparse.Namespace, output_dir: Path) -> None:
+        self.args = args
+        self.output_dir = output_dir
+        self.next_index = 0
+        self.latencies: List[float] = []
+        self.statuses: Counter = Counter()
+
+    async def client(self, session: aiohttp.ClientSession, base_url: str) -> None:
+        while self.next_index < self.args.requests:
+            index = self.next_index
+            self.next_index += 1
+            params = {**make_params(self.args.op, index, self.output_dir), "timeout": self.args.timeout}
+            started = time.perf_counter()
+            try:
+                async with session.post(f"{base_url}/v1/{self.args.op}", json=params) as response:
+                    await response.read()
+                    status = str(response.status)
+            except aiohttp.ClientError as exc:
+                status = type(exc).__name__
+            self.statuses[status] += 1
+            if status == "200":
+                self.latencies.append(time.perf_counter() - started)
+
+
+async def wait_health(session: aiohttp.ClientSession, base_url: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            async with session.get(f"{base_url}/health") as response:
+                if (await response.json()).get("ready"):
+                    return
+        except (aiohttp.ClientError, ValueError):
+            pass
+        if time.monotonic() > deadline:
+            raise SystemExit("сервис рендеринга не ответил на /health")
+        await asyncio.sleep(0.1)
+
+
+async def start_service(args: argparse.Namespace, socket_path: Path) -> asyncio.subprocess.Process:
+    env = {**os.environ, "FOREX_RASTER_TEMPLATES": "buy-light.html,sell-light.html"}
+    return await asyncio.create_subprocess_exec(
+        sys.executable, "render_service.py", "--socket", str(socket_path),
+        "--concurrency", str(args.concurrency), "--max-queue", str(args.max_queue), "--no-warmup",
+        env=env, stderr=asyncio.subprocess.DEVNULL,
+    )
+
+
+async def main(args: argparse.Namespace) -> int:
+    with tempfile.TemporaryDirectory(prefix="render_service_load_") as tmpdir:
+        output_dir = Path(tmpdir)
+        url = args.url or f"unix:{output_dir / 'render.sock'}"
+        service: Optional[asyncio.subprocess.Process] = None
+        if not args.url:
+            service = await start_service(args, output_dir / "render.sock")
+        if url.startswith("unix:"):
+            connector = aiohttp.UnixConnector(path=url[len("unix:"):], limit=0)
+            base_url = "http://render-service"
+        else:
+            connector = aiohttp.TCPConnector(limit=0)
+            base_url = url.rstrip("/")
+        try:
+            async with aiohttp.ClientSession(connector=connector) as session:
+                await wait_health(session, base_url, args.startup_timeout)
+                load = Load(args, output_dir)
+                started = time.perf_counter()
+                await asyncio.gather(*(load.client(session, base_url) for _ in range(args.clients)))
+                elapsed = time.perf_counter() - started
+        finally:
+            if service is not None:
+                service.terminate()
+                await service.wait()
+
+    ok = load.latencies
+    report = {
+        "op": args.op,
+        "url": args.url or "unix:<temp>",
+        "clients": args.clients,
+        "requests": args.requests,
+        "concurrency": None if args.url else args.concurrency,
+        "max_queue": None if args.url else args.max_queue,
+        "seconds": round(elapsed, 2),
+        "ok_per_second": round(len(ok) / elapsed, 1),
+        "p50_ms": round(percentile(ok, 0.5) * 1000, 1) if ok else None,
+        "p95_ms": round(percentile(ok, 0.95) * 1000, 1) if ok else None,
+        "p99_ms": round(percentile(ok, 0.99) * 1000, 1) if ok else None,
+        "statuses": dict(sorted(load.statuses.items())),
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=None, help="адрес запущенного сервиса (unix:... или http://...)")
+    parser.add_argument("--op", default="forex_card", choices=["forex_card", "okx_card", "okx_substitutions"])
+    parser.add_argument("--clients", type=int, default=16, help="одновременных клиентов")
+    parser.add_argument("--requests", type=int, default=400, help="запросов всего")
+    parser.add_argument("--concurrency", type=int, default=4, help="RENDER_SERVICE_CONCURRENCY запускаемого сервиса")
+    parser.add_argument("--max-queue", type=int, default=32, help="RENDER_SERVICE_MAX_QUEUE запускаемого сервиса")
+    parser.add_argument("--timeout", type=float, default=30.0, help="дедлайн рендера в запросе, с")
+    parser.add_argument("--startup-timeout", type=float, default=30.0, help="ожидание /health сервиса, с")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,226 @@
+"""
+Воспроизведение записанных апдейтов (UPDATES_RECORD_FILE) против заглушки Bot API.
+
+Файл пишет UpdateRecorderMiddleware: апдейты уже обезличены, а администраторы
+помечены флагом is_admin — их псевдонимы передаются боту в ADMINS. Апдейты
+подаются с исходными интервалами, ускоренными в --speed раз (--speed 0 —
+без пауз, максимально быстро). Так можно повторить реальную форму нагрузки,
+например всплеск /okx после движения рынка, и сравнить версии бота.
+
+Задержка апдейта — от постановки до первого ответа бота в тот же чат,
+если ответ пришёл раньше следующего апдейта этого чата.
+
+Запуск:
+    python -m bench.replay_updates temp/updates.jsonl --speed 10
+    python -m bench.replay_updates temp/updates.jsonl --speed 0 --bot-mode inprocess
+"""
+
+import argparse
+import asyncio
+import bisect
+import copy
+import json
+import logging
+import os
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+os.chdir(PROJECT_ROOT)
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from bench.e2e_load import start_bot  # noqa: E402
+from bench.fake_telegram import FakeTelegramServer  # noqa: E402
+from misc.constants import DEFAULT_PDF_PATH  # noqa: E402
+
+DEFAULT_FILE = os.getenv("UPDATES_RECORD_FILE", "temp/updates.jsonl")
+
+
+def load_records(path: str) -> List[dict]:
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError as exc:
+                logging.warning("Skipping line %d: %s", line_no, exc)
+    records.sort(key=lambda item: item["ts"])
+    return records
+
+
+def _event(update: dict) -> Tuple[Optional[dict], str]:
+    """Возвращает (сообщение апдейта, вид апдейта для отчёта)."""
+    message = update.get("message")
+    if message is not None:
+        text = message.get("text") or ""
+        if message.get("is_automatic_forward"):
+            return message, "auto_forward"
+        if text.startswith("/"):
+            return message, text.split(maxsplit=1)[0].split("@")[0]
+        if "document" in message:
+            return message, "document"
+        return message, "text"
+    callback = update.get("callback_query")
+    if callback is not None:
+        return callback.get("message"), "callback"
+    return None, next((key for key in update if key != "update_id"), "unknown")
+
+
+def _prepare(server: FakeTelegramServer, update: dict, stand_in_file: bytes) -> dict:
+    """Готовит записанный апдейт к повторной подаче: свежая дата, доступные файлы."""
+    update = copy.deepcopy(update)
+    update.pop("update_id", None)
+    message, _ = _event(update)
+    if message is not None and "message" in update:
+        message["date"] = int(time.time())
+        document = message.get("document")
+        if document is not None:
+            # Исходный файл недоступен: подставляем локальный PDF
+            document["file_id"] = server.add_file(stand_in_file)
+            document["file_size"] = len(stand_in_file)
+    return update
+
+
+def _chat_id(update: dict) -> Optional[int]:
+    message, _ = _event(update)
+    if message is None:
+        return None
+    return message.get("chat", {}).get("id")
+
+
+def _percentiles(samples: List[float]) -> Dict[str, Optional[float]]:
+    samples = sorted(samples)
+
+    def pct(q: float) -> Optional[float]:
+        if not samples:
+            return None
+        return round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 1)
+
+    return {"count": len(samples), "p50_ms": pct(0.50), "p95_ms": pct(0.95), "p99_ms": pct(0.99)}
+
+
+def build_report(server: FakeTelegramServer, pushed: List[Tuple[float, Optional[int], str]]) -> dict:
+    # Ответы бота по чатам в порядке времени
+    replies: Dict[int, List[float]] = defaultdict(list)
+    for sent in server.sent:
+        replies[sent.chat_id].append(sent.at)
+
+    # Следующая подача в тот же чат ограничивает окно ответа
+    next_push: Dict[int, float] = {}
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    unanswered: Dict[str, int] = defaultdict(int)
+    for at, chat_id, kind in reversed(pushed):
+        if chat_id is None:
+            continue
+        chat_replies = replies.get(chat_id, [])
+        index = bisect.bisect_left(chat_replies, at)
+        limit = next_push.get(chat_id, float("inf"))
+        if index < len(chat_replies) and chat_replies[index] < limit:
+            latencies[kind].append(chat_replies[index] - at)
+        else:
+            unanswered[kind] += 1
+        next_push[chat_id] = at
+
+    kinds = sorted(set(latencies) | set(unanswered))
+    return {kind: {**_percentiles(latencies[kind]), "unanswered": unanswered[kind]} for kind in kinds}
+
+
+async def replay(server: FakeTelegramServer, records: List[dict], speed: float) -> Tuple[list, float]:
+    """Подаёт апдейты по расписанию. Возвращает [(время подачи, чат, вид)] и макс. опоздание."""
+    stand_in_file = Path(DEFAULT_PDF_PATH).read_bytes()
+    pushed = []
+    max_lag = 0.0
+    first_ts = records[0]["ts"]
+    started = time.perf_counter()
+    for record in records:
+        if speed > 0:
+            due = started + (record["ts"] - first_ts) / speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            max_lag = max(max_lag, time.perf_counter() - due)
+        update = _prepare(server, record["update"], stand_in_file)
+        at = time.perf_counter()
+        server.push_update(update)
+        pushed.append((at, _chat_id(update), _event(update)[1]))
+        if speed <= 0:
+            # Отдаём управление, чтобы long polling забирал апдейты пачками
+            await asyncio.sleep(0)
+    return pushed, max_lag
+
+
+async def _wait_settled(server: FakeTelegramServer, quiet: float, timeout: float) -> None:
+    """Ждёт, пока бот не перестанет отвечать в течение quiet секунд."""
+    deadline = time.perf_counter() + timeout
+    seen = -1
+    while time.perf_counter() < deadline:
+        if len(server.sent) == seen:
+            return
+        seen = len(server.sent)
+        await asyncio.sleep(quiet)
+
+
+async def main(args: argparse.Namespace) -> None:
+    logging.basicConfig(level=logging.WARNING)
+    records = load_records(args.file)
+    if not records:
+        raise SystemExit(f"В {args.file} нет апдейтов")
+    admin_ids = sorted(
+        {
+            (r["update"].get("message") or r["update"].get("callback_query") or {}).get("from", {}).get("id")
+            for r in records
+            if r.get("is_admin")
+        }
+        - {None}
+    )
+
+    server = await FakeTelegramServer(port=args.port).start()
+    stop_bot = await start_bot(args.bot_mode, server, admin_ids)
+    try:
+        await asyncio.wait_for(server.polling_started.wait(), args.startup_timeout)
+        started = time.perf_counter()
+        pushed, max_lag = await replay(server, records, args.speed)
+        replay_time = time.perf_counter() - started
+        await _wait_settled(server, args.settle, args.timeout)
+        total_time = time.perf_counter() - started
+    finally:
+        await stop_bot()
+        await server.stop()
+
+    span_s = records[-1]["ts"] - records[0]["ts"]
+    print(
+        json.dumps(
+            {
+                "file": args.file,
+                "updates": len(records),
+                "admins": len(admin_ids),
+                "recorded_span_s": round(span_s, 2),
+                "speed": args.speed or "max",
+                "replay_time_s": round(replay_time, 2),
+                "total_time_s": round(total_time, 2),
+                "max_schedule_lag_ms": round(max_lag * 1000, 1),
+                "latency_by_kind": build_report(server, pushed),
+                "api_calls": dict(server.requests),
+            },
+            ensure_ascii=False,
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("file", nargs="?", default=DEFAULT_FILE)
+    parser.add_argument("--speed", type=float, default=1.0, help="ускорение относительно записи; 0 — максимально быстро")
+    parser.add_argument("--bot-mode", choices=("subprocess", "inprocess", "external"), default="subprocess")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--settle", type=float, default=3.0, help="тишина после подачи, означающая конец обработки, с")
+    parser.add_argument("--timeout", type=float, default=300, help="максимальное ожидание обработки, с")
+    parser.add_argument("--startup-timeout", type=float, default=60)
+    asyncio.run(main(parser.parse_args()))
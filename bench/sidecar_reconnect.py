@@ -0,0 +1,224 @@
+"""
+Переподключение бота к Chromium-сайдкару (render_sidecar.py) и поведение при его падении.
+
+Запускает сайдкар отдельным процессом и замеряет через BrowserPool тот же путь,
+что проходит рендер бота (connect_over_cdp -> контекст -> страница -> скриншот):
+
+- cold_launch — первый рендер без сайдкара, с запуском своего Chromium (для сравнения);
+- sidecar_start — от запуска процесса сайдкара до ответа порта CDP;
+- first_connect — первый рендер после подключения;
+- warm_render — рендеры на установленном соединении (p50/p95);
+- bot_restart — новый BrowserPool (как после перезапуска бота): подключение и рендер;
+- chromium_crash — Chromium внутри сайдкара падает (Browser.crash), сайдкар перезапускает
+  его; время до первого успешного рендера;
+- sidecar_killed — процесс сайдкара убит: время обнаружения разрыва, длительность
+  рендера, который не дождался сайдкара (ошибка после --connect-timeout), и рендера,
+  начатого во время перезапуска сайдкара (должен дождаться и пройти).
+
+Запуск:
+    python -m bench.sidecar_reconnect
+    python -m bench.sidecar_reconnect --renders 50 --connect-timeout 5
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import aiohttp
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+os.chdir(PROJECT_ROOT)
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from utils.browser_pool import BrowserPool  # noqa: E402
+
+HTML = "<html><body><div id='card' style='width:320px;height:120px;font:32px sans-serif'>BTCUSDT +5,53%</div></body></html>"
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+async def render_once(pool: BrowserPool) -> None:
+    async with pool.context("bench", viewport={"width": 400, "height": 200}) as context:
+        page = await context.new_page()
+        await page.set_content(HTML)
+        await page.locator("#card").screenshot(type="png")
+
+
+async def timed_render(pool: BrowserPool) -> float:
+    started = time.perf_counter()
+    await render_once(pool)
+    return time.perf_counter() - started
+
+
+class Sidecar:
+    def __init__(self, port: int, warmup: bool) -> None:
+        self.port = port
+        self.warmup = warmup
+        self.process: Optional[asyncio.subprocess.Process] = None
+
+    @property
+    def cdp_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def start(self, timeout: float) -> float:
+        """Запускает сайдкар и ждёт ответа порта CDP. Возвращает время старта."""
+        args = [sys.executable, "render_sidecar.py", "--port", str(self.port)]
+        if not self.warmup:
+            args.append("--no-warmup")
+        started = time.perf_counter()
+        # Своя группа процессов: при kill уходит и Chromium
+        self.process = await asyncio.create_subprocess_exec(
+            *args, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL, start_new_session=True
+        )
+        await self.wait_ready(timeout)
+        return time.perf_counter() - started
+
+    async def wait_ready(self, timeout: float) -> None:
+        deadline = time.perf_counter() + timeout
+        async with aiohttp.ClientSession() as session:
+            while time.perf_counter() < deadline:
+                if self.process is not None and self.process.returncode is not None:
+                    raise RuntimeError(f"Сайдкар завершился с кодом {self.process.returncode}")
+                try:
+                    async with session.get(f"{self.cdp_url}/json/version") as response:
+                        if response.status == 200:
+                            return
+                except aiohttp.ClientError:
+                    pass
+                await asyncio.sleep(0.05)
+        raise TimeoutError(f"Сайдкар не ответил за {timeout:.0f}с")
+
+    def kill(self) -> None:
+        if self.process is not None and self.process.returncode is None:
+            os.killpg(self.process.pid, signal.SIGKILL)
+
+    async def stop(self) -> None:
+        if self.process is None or self.process.returncode is not None:
+            return
+        os.killpg(self.process.pid, signal.SIGTERM)
+        try:
+            await asyncio.wait_for(self.process.wait(), 10)
+        except asyncio.TimeoutError:
+            self.kill()
+            await self.process.wait()
+
+
+async def _wait_disconnected(pool: BrowserPool, timeout: float) -> Optional[float]:
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if not pool._connected():
+            return time.perf_counter() - started
+        await asyncio.sleep(0.01)
+    return None
+
+
+async def _until_render_succeeds(pool: BrowserPool, timeout: float) -> Dict[str, Optional[float]]:
+    """Повторяет рендер, пока он не пройдёт. Возвращает время до успеха и число ошибок."""
+    started = time.perf_counter()
+    failures = 0
+    while time.perf_counter() - started < timeout:
+        try:
+            await render_once(pool)
+            return {"recovery_ms": _ms(time.perf_counter() - started), "failed_renders": failures}
+        except Exception:  # noqa: BLE001
+            failures += 1
+            await asyncio.sleep(0.05)
+    return {"recovery_ms": None, "failed_renders": failures}
+
+
+def _percentiles(samples: List[float]) -> Dict[str, Optional[float]]:
+    samples = sorted(samples)
+    if not samples:
+        return {"count": 0, "p50_ms": None, "p95_ms": None}
+    return {
+        "count": len(samples),
+        "p50_ms": _ms(samples[len(samples) // 2]),
+        "p95_ms": _ms(samples[min(len(samples) - 1, int(0.95 * len(samples)))]),
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    logging.basicConfig(level=logging.WARNING)
+    report: Dict[str, object] = {}
+
+    if not args.skip_cold_launch:
+        local = BrowserPool()
+        report["cold_launch_ms"] = _ms(await timed_render(local))
+        await local.close()
+
+    sidecar = Sidecar(args.port, args.sidecar_warmup)
+    pool: Optional[BrowserPool] = None
+    try:
+        report["sidecar_start_ms"] = _ms(await sidecar.start(args.startup_timeout))
+
+        pool = BrowserPool(cdp_url=sidecar.cdp_url, connect_timeout=args.connect_timeout)
+        report["first_connect_ms"] = _ms(await timed_render(pool))
+        report["warm_render"] = _percentiles([await timed_render(pool) for _ in range(args.renders)])
+
+        # Перезапуск бота: старое соединение закрыто, новое подключается к тому же Chromium
+        await pool.close()
+        pool = BrowserPool(cdp_url=sidecar.cdp_url, connect_timeout=args.connect_timeout)
+        report["bot_restart"] = {
+            "reconnect_and_render_ms": _ms(await timed_render(pool)),
+            "next_render_ms": _ms(await timed_render(pool)),
+        }
+
+        # Падение Chromium внутри живого сайдкара
+        session = await (await pool.browser("bench")).new_browser_cdp_session()
+        try:
+            await session.send("Browser.crash")
+        except Exception:  # noqa: BLE001
+            pass  # соединение рвётся вместе с браузером
+        crash = {"detect_ms": _ms(await _wait_disconnected(pool, args.startup_timeout))}
+        crash.update(await _until_render_succeeds(pool, args.startup_timeout))
+        report["chromium_crash"] = crash
+
+        # Процесс сайдкара убит целиком
+        sidecar.kill()
+        await sidecar.process.wait()
+        killed: Dict[str, object] = {"detect_ms": _ms(await _wait_disconnected(pool, args.startup_timeout))}
+        started = time.perf_counter()
+        try:
+            await render_once(pool)
+            killed["render_while_down"] = "ok"
+        except Exception as exc:  # noqa: BLE001
+            killed["render_while_down"] = type(exc).__name__
+        killed["render_while_down_ms"] = _ms(time.perf_counter() - started)
+
+        # Рендер начат до перезапуска сайдкара: дожидается его в пределах connect_timeout
+        pending = asyncio.create_task(timed_render(pool))
+        await asyncio.sleep(0.2)
+        killed["sidecar_restart_ms"] = _ms(await sidecar.start(args.startup_timeout))
+        try:
+            killed["render_during_restart_ms"] = _ms(await pending)
+        except Exception as exc:  # noqa: BLE001
+            killed["render_during_restart_ms"] = None
+            killed["render_during_restart_error"] = f"{type(exc).__name__}: {exc}"
+        killed["next_render_ms"] = _ms(await timed_render(pool))
+        report["sidecar_killed"] = killed
+    finally:
+        if pool is not None:
+            await pool.close()
+        await sidecar.stop()
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9333)
+    parser.add_argument("--renders", type=int, default=20, help="рендеров на тёплом соединении")
+    parser.add_argument("--connect-timeout", type=float, default=10, help="как BROWSER_CDP_CONNECT_TIMEOUT, с")
+    parser.add_argument("--startup-timeout", type=float, default=60)
+    parser.add_argument("--sidecar-warmup", action="store_true", help="прогревать шаблоны в сайдкаре")
+    parser.add_argument("--skip-cold-launch", action="store_true", help="не замерять запуск своего Chromium")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,122 @@
+"""
+Журнал сигналов (utils/signal_journal.py) на миллионах синтетических строк.
+
+Журнал заполняется --rows строками, равномерно распределёнными по --span-days
+дням, пачками по --batch (как пишет /soft_signal, только крупнее), затем
+замеряется задержка агрегатов /signal_stats:
+
+- rr_by_pair — средний RR и плечо по парам;
+- leverage_by_timeframe — распределение плеча по таймфреймам;
+
+для окон 7, 30 и 365 дней, по дневному своду (как в боте) и точным
+запросом по журналу (exact=True). Печатаются скорость вставки, размер
+файла и p50/p95 каждого запроса.
+
+Запуск:
+    python -m bench.signal_journal --rows 2000000
+    python -m bench.signal_journal --rows 5000000 --db temp/bench/signals.sqlite3
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from utils.signal_journal import JournalRow, SignalJournal  # noqa: E402
+
+PAIRS = [f"{base}USDT" for base in (
+    "BTC", "ETH", "SOL", "DOGE", "TON", "XRP", "ADA", "AVAX", "LINK", "DOT", "TRX", "LTC", "BCH", "NEAR", "APT",
+    "ARB", "OP", "SUI", "PEPE", "WIF",
+)]
+TIMEFRAMES = ["M5", "M10", "M15", "H1", "H4", "D1"]
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * (len(ordered) - 1) + 0.5))]
+
+
+def fill(journal: SignalJournal, rows: int, span_days: int, batch: int, seed: int) -> float:
+    rng = random.Random(seed)
+    now = int(time.time())
+    started = time.perf_counter()
+    for offset in range(0, rows, batch):
+        chunk = []
+        for _ in range(min(batch, rows - offset)):
+            price = rng.uniform(0.05, 120000)
+            sl_pct = rng.uniform(0.3, 8)
+            rr = rng.uniform(0.3, 6)
+            chunk.append(JournalRow(
+                ts=now - rng.randrange(span_days * 86400),
+                pair=rng.choice(PAIRS),
+                timeframe=rng.choice(TIMEFRAMES),
+                side=rng.choice(("long", "short")),
+                price=price,
+                tp=price * (1 + sl_pct * rr / 100),
+                sl=price * (1 - sl_pct / 100),
+                rr=rr,
+                leverage=min(int(40 / sl_pct), 100),
+            ))
+        journal.append(chunk)
+    return time.perf_counter() - started
+
+
+def measure(fn: Callable[[], object], iterations: int) -> dict:
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {"p50_ms": round(percentile(samples, 0.5), 2), "p95_ms": round(percentile(samples, 0.95), 2)}
+
+
+def main(args: argparse.Namespace) -> int:
+    db_path = Path(args.db) if args.db else Path(tempfile.mkdtemp(prefix="signal_journal_")) / "signals.sqlite3"
+    journal = SignalJournal(str(db_path))
+    existing = journal.count()
+    insert_s = fill(journal, args.rows - existing, args.span_days, args.batch, args.seed) if existing < args.rows else 0.0
+
+    queries = {}
+    for days in (7, 30, 365):
+        for exact in (False, True):
+            suffix = f"{days}d:{'exact' if exact else 'daily'}"
+            iterations = args.iterations if not exact else max(1, args.iterations // 5)
+            queries[f"rr_by_pair:{suffix}"] = measure(lambda: journal.rr_by_pair(days, exact), iterations)
+            queries[f"leverage_by_timeframe:{suffix}"] = measure(
+                lambda: journal.leverage_by_timeframe(days, exact), iterations
+            )
+
+    inserted = args.rows - existing
+    report = {
+        "rows": journal.count(),
+        "inserted": max(0, inserted),
+        "insert_rows_per_s": round(inserted / insert_s) if insert_s else None,
+        "db_size_mb": round(sum(p.stat().st_size for p in db_path.parent.glob(db_path.name + "*")) / 2**20, 1),
+        "queries": queries,
+        "db": str(db_path),
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    journal._close_connection()
+    if not args.db:
+        for path in db_path.parent.glob(db_path.name + "*"):
+            os.unlink(path)
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000, help="строк в журнале")
+    parser.add_argument("--span-days", type=int, default=730, help="за сколько дней распределены сигналы")
+    parser.add_argument("--batch", type=int, default=50_000, help="строк в одной транзакции вставки")
+    parser.add_argument("--iterations", type=int, default=20, help="повторов запроса по своду")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--db", help="файл журнала (сохраняется; повторный запуск дописывает до --rows)")
+    sys.exit(main(parser.parse_args()))
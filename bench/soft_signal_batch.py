@@ -0,0 +1,179 @@
+"""
+Пакетная обработка /soft_signal: 10 000 сигналов текстом и CSV.
+
+Кейсы:
+
+- scalar — прежний путь: разбор, расчёт метрик на float и форматирование
+  по одному сигналу (эталон, считается здесь же);
+- batch_text — сообщение из N сигналов: split_signals, разбор, метрики
+  одним проходом по массивам NumPy и форматирование;
+- batch_csv — CSV из N строк: чтение, метрики, CSV с результатами;
+- metrics_only — только расчёт метрик: цикл Python против NumPy.
+
+Часть сигналов (--invalid-pct) намеренно некорректна: стоп не с той
+стороны или нулевая цена. Тексты batch_text сверяются со scalar: код
+выхода 1 при расхождении.
+
+Запуск:
+    python -m bench.soft_signal_batch --signals 10000
+"""
+
+import argparse
+import json
+import math
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List, Optional
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from misc.soft_signal import (  # noqa: E402
+    batch_metrics,
+    calculate_metrics,
+    format_signal_message,
+    format_signals,
+    parse_signal_message,
+    parse_signals_text,
+    read_signals_csv,
+    split_signals,
+    write_results_csv,
+)
+
+PAIRS = ["BTCUSDT", "ETHUSDT", "SOLUSDT", "DOGEUSDT", "TONUSDT", "XRPUSDT"]
+
+
+def make_signals(count: int, invalid_pct: float, seed: int) -> List[dict]:
+    rng = random.Random(seed)
+    signals = []
+    for _ in range(count):
+        price = round(rng.uniform(0.05, 120000), 4)
+        is_long = rng.random() < 0.5
+        sl_move, tp_move = rng.uniform(0.001, 0.05), rng.uniform(0.002, 0.2)
+        sign = 1 if is_long else -1
+        signal = {
+            "pair": rng.choice(PAIRS),
+            "timeframe": rng.choice(["5m", "10m", "1h", "4h", "1d"]),
+            "side": "Long" if is_long else "Short",
+            "price": price,
+            "tp": round(price * (1 + sign * tp_move), 4),
+            "sl": round(price * (1 - sign * sl_move), 4),
+        }
+        if rng.random() * 100 < invalid_pct:
+            # Стоп по другую сторону от входа или нулевая цена
+            signal.update(rng.choice([{"sl": signal["tp"]}, {"price": 0}]))
+        signals.append(signal)
+    return signals
+
+
+def to_text(signals: List[dict]) -> str:
+    return "\n\n".join(
+        f"{s['pair']} {s['timeframe']}\n\n{s['side']}\nPrice: {s['price']}\nTP: {s['tp']}\nSL: {s['sl']}\n\n"
+        "2026-03-19 15:41:32"
+        for s in signals
+    )
+
+
+def to_csv(signals: List[dict]) -> bytes:
+    lines = ["pair,timeframe,side,price,tp,sl"]
+    lines += [f"{s['pair']},{s['timeframe']},{s['side']},{s['price']},{s['tp']},{s['sl']}" for s in signals]
+    return "\n".join(lines).encode()
+
+
+def scalar_metrics(price: float, tp: float, sl: float, position_type: str) -> Optional[dict]:
+    """Прежний расчёт по одному сигналу."""
+    if price <= 0 or tp <= 0 or sl <= 0:
+        return None
+    if position_type == "ЛОНГ" and (tp <= price or sl >= price):
+        return None
+    if position_type == "ШОРТ" and (tp >= price or sl <= price):
+        return None
+    sl_pct = abs(sl - price) / price * 100
+    tp_pct = abs(tp - price) / price * 100
+    if sl_pct <= 0:
+        return None
+    return {"sl_pct": sl_pct, "tp_pct": tp_pct, "rr": tp_pct / sl_pct,
+            "leverage": min(math.floor(40 / sl_pct), 100)}
+
+
+def run_scalar(text: str) -> List[Optional[str]]:
+    results = []
+    for chunk in split_signals(text):
+        data = parse_signal_message(chunk)
+        metrics = data and scalar_metrics(data["price"], data["tp"], data["sl"], data["position_type"])
+        results.append(format_signal_message(data, **metrics) if metrics else None)
+    return results
+
+
+def run_batch_text(text: str) -> List[Optional[str]]:
+    batch = parse_signals_text(text)
+    return format_signals(batch, batch_metrics(batch))
+
+
+def run_batch_csv(data: bytes, rows: int) -> bytes:
+    batch, raw_rows, fieldnames = read_signals_csv(data, rows)
+    return write_results_csv(batch, batch_metrics(batch), raw_rows, fieldnames)
+
+
+def timed(fn: Callable[[], object], repeat: int) -> tuple:
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main(args: argparse.Namespace) -> int:
+    signals = make_signals(args.signals, args.invalid_pct, args.seed)
+    text, csv_data = to_text(signals), to_csv(signals)
+
+    report = {"signals": args.signals, "cases": {}}
+
+    def record(name: str, seconds: float) -> None:
+        report["cases"][name] = {
+            "total_ms": round(seconds * 1000, 1),
+            "signals_per_s": round(args.signals / seconds),
+        }
+
+    seconds, expected = timed(lambda: run_scalar(text), args.repeat)
+    record("scalar", seconds)
+    seconds, actual = timed(lambda: run_batch_text(text), args.repeat)
+    record("batch_text", seconds)
+    seconds, _ = timed(lambda: run_batch_csv(csv_data, args.signals), args.repeat)
+    record("batch_csv", seconds)
+
+    prices = [float(s["price"]) for s in signals]
+    tps = [float(s["tp"]) for s in signals]
+    sls = [float(s["sl"]) for s in signals]
+    sides = ["ЛОНГ" if s["side"] == "Long" else "ШОРТ" for s in signals]
+    seconds, _ = timed(
+        lambda: [scalar_metrics(p, t, s, side) for p, t, s, side in zip(prices, tps, sls, sides)], args.repeat
+    )
+    record("metrics_only:python", seconds)
+    is_long = [side == "ЛОНГ" for side in sides]
+    seconds, _ = timed(lambda: calculate_metrics(prices, tps, sls, is_long), args.repeat)
+    record("metrics_only:numpy", seconds)
+
+    mismatches = sum(a != b for a, b in zip(expected, actual)) + abs(len(expected) - len(actual))
+    report.update(
+        invalid=sum(result is None for result in actual),
+        mismatches=mismatches,
+        speedup_text=round(report["cases"]["scalar"]["total_ms"] / report["cases"]["batch_text"]["total_ms"], 2),
+        speedup_metrics=round(
+            report["cases"]["metrics_only:python"]["total_ms"] / report["cases"]["metrics_only:numpy"]["total_ms"], 1
+        ),
+    )
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--signals", type=int, default=10000)
+    parser.add_argument("--invalid-pct", type=float, default=5.0, help="доля некорректных сигналов, %%")
+    parser.add_argument("--repeat", type=int, default=3, help="повторов, берётся лучший")
+    parser.add_argument("--seed", type=int, default=1)
+    sys.exit(main(parser.parse_args()))
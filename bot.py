@@ -1,5 +1,8 @@
 import os
 import logging
+
+# Отсчёт времени старта — до импорта aiogram и роутеров
+from utils import startup
 from dotenv import load_dotenv
 
 # Загружаем .env ПЕРВЫМ, до всех остальных импортов
@@ -12,10 +15,13 @@ from aiogram import Bot, Dispatcher
 from aiogram.types import Message, CallbackQuery
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.fsm.storage.memory import MemoryStorage
 
 import asyncio
-from filters.admin_only import AdminOnly, NonAdminOnly
+import signal
+from filters.admin_only import admin_registry
 from handlers import (
     create_invoice_router,
     plug_router,
@@ -23,24 +29,68 @@ from handlers import (
     create_user_pdf_router,
     channel_comments_router,
     soft_signal_router,
+    inline_router,
 )
 from middlewares.spam_protection import AntiSpamMiddleware
+from middlewares.access_context import AccessContextMiddleware
+from middlewares.metrics import CommandMetricsMiddleware, FirstUpdateMiddleware, TelegramApiMetricsMiddleware
+from middlewares.tracing import TracingMiddleware, TracingRequestMiddleware
+from middlewares.update_recorder import UpdateRecorderMiddleware
+from misc.warmup import warm_up_renderer
+from utils.browser_pool import browser_pool
+from utils.browser_supervisor import browser_supervisor
+from utils.comment_dispatcher import comment_dispatcher
+from utils.metrics import monitor_event_loop_lag, start_metrics_server
+from utils.render_client import render_service
+from utils.signal_journal import signal_journal
+from utils.tracing import tracer
 
 
 logging.basicConfig(level=logging.INFO)
+startup.mark("imports")
 
 
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 if not TELEGRAM_TOKEN:
     raise SystemExit("TELEGRAM_BOT_TOKEN не найден в .env")
 
-bot = Bot(token=TELEGRAM_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+# Свой сервер Bot API: локальный telegram-bot-api или заглушка bench/fake_telegram.py
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+# TELEGRAM_API_LOCAL=1 — сервер запущен с --local: файлы до 2 ГБ читаются прямо с диска
+session = AiohttpSession(
+    api=TelegramAPIServer.from_base(TELEGRAM_API_URL, is_local=os.getenv("TELEGRAM_API_LOCAL") == "1")
+) if TELEGRAM_API_URL else None
+
+bot = Bot(token=TELEGRAM_TOKEN, session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+# Длительность и ошибки запросов к Telegram Bot API
+bot.session.middleware(TelegramApiMetricsMiddleware())
+# Span на каждый запрос к Bot API (загрузка фото/документов видна в трейсе)
+bot.session.middleware(TracingRequestMiddleware())
 storage = MemoryStorage()
 dp = Dispatcher(storage=storage)
 
+# Время до первого обработанного апдейта (самый внешний middleware)
+dp.update.outer_middleware(FirstUpdateMiddleware())
+
+# Корневой span трассировки на каждый апдейт
+dp.update.outer_middleware(TracingMiddleware())
+
+# Права доступа (личный чат / админ) вычисляются один раз на апдейт
+dp.update.outer_middleware(AccessContextMiddleware())
+
+# Запись обезличенных апдейтов для воспроизведения (bench/replay_updates.py)
+UPDATES_RECORD_FILE = os.getenv("UPDATES_RECORD_FILE")
+if UPDATES_RECORD_FILE:
+    update_recorder = UpdateRecorderMiddleware(UPDATES_RECORD_FILE, salt=os.getenv("UPDATES_RECORD_SALT"))
+    dp.update.outer_middleware(update_recorder)
+    dp.shutdown.register(update_recorder.close)
+
 # Глобальный антиспам мидлвар для всех обновлений
 dp.update.middleware(AntiSpamMiddleware(bot))
 
+# Гистограммы задержки для основных команд
+dp.message.outer_middleware(CommandMetricsMiddleware())
+
 
 async def send_startup_message():
     """Отправляет сообщение о запуске бота всем администраторам."""
@@ -63,22 +113,73 @@ async def send_startup_message():
         except Exception as e:
             logging.error(f"Не удалось отправить сообщение администратору {admin_id}: {e}")
 
+# Ссылки на фоновые задачи: иначе незавершённую задачу может собрать сборщик мусора
+background_tasks = set()
+
+
+def start_background(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+
+async def wait_render_service():
+    """Готовность рендерера (renderer_ready) — по /health сервиса рендеринга."""
+    await render_service.wait_ready()
+    browser_pool.set_ready(True)
+    logging.info(f"Сервис рендеринга готов: {render_service.url}")
+
 # Подключаем роутеры
 dp.include_router(create_invoice_router)  # Основные команды
 dp.include_router(trade_share_router)  # Шеринг сделок /okx
 dp.include_router(create_user_pdf_router)  # Создание пользовательского PDF
 dp.include_router(channel_comments_router)  # Комментарии к постам каналов
 dp.include_router(soft_signal_router)  # Форматирование сигналов /soft_signal
+dp.include_router(inline_router)  # Inline-режим: сигналы и карточки /okx в любом чате
 dp.include_router(plug_router)  # Заглушки (подключаем последним)
 
+# Перед остановкой дожидаемся отправки комментариев из очереди
+dp.shutdown.register(comment_dispatcher.close)
+# Журнал сигналов: дожидаемся записи и закрываем базу
+dp.shutdown.register(signal_journal.close)
+# Общий Chromium закрываем последним
+dp.shutdown.register(browser_pool.close)
+if render_service is not None:
+    dp.shutdown.register(render_service.close)
+
 
 if __name__ == "__main__":
     async def main():
+        # По SIGHUP перечитываем список администраторов без перезапуска
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, admin_registry.reload)
+
+        # Эндпоинт /metrics для Prometheus-совместимого сборщика
+        metrics_port = os.getenv("METRICS_PORT")
+        if metrics_port:
+            await start_metrics_server(os.getenv("METRICS_HOST", "127.0.0.1"), int(metrics_port))
+            start_background(monitor_event_loop_lag())
+
+        # Трейсы в JSON Lines и/или в локальный OTLP-коллектор
+        tracer.configure(trace_file=os.getenv("TRACE_FILE"), otlp_endpoint=os.getenv("OTLP_ENDPOINT"))
+        if tracer.enabled:
+            start_background(tracer.run_exporter())
+
         # Очищаем все сообщения в чате  
         await bot.delete_webhook(drop_pending_updates=True)
         
         # Отправляем сообщение о запуске администраторам
         await send_startup_message()
         
+        # Память, число рендеров и зависания Chromium; плановый перезапуск браузера
+        start_background(browser_supervisor.run())
+
+        # Chromium и шаблоны прогреваются в фоне, polling не ждёт;
+        # с RENDER_SERVICE_URL рендерит и прогревается сервис, бот ждёт его готовности
+        if render_service is not None:
+            start_background(wait_render_service())
+        elif os.getenv("RENDERER_WARMUP", "1") != "0":
+            start_background(warm_up_renderer())
+
+        startup.mark("polling")
         await dp.start_polling(bot)
     asyncio.run(main())
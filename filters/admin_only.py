@@ -1,72 +1,119 @@
 import os
 import logging
-from typing import Set
+import time
+from typing import FrozenSet, Optional
 
 from aiogram.filters import BaseFilter
 from aiogram.types import TelegramObject
+from dotenv import load_dotenv
 
 
-class AdminOnly(BaseFilter):
-    """Фильтр допускает только пользователей из ADMINS.
+def parse_admin_ids(raw: str) -> FrozenSet[int]:
+    """Разбирает список ID через запятую, пробелы или переводы строк.
 
-    Переменная окружения ADMINS может содержать список ID через запятую или пробелы.
     Пример: "123456, 789012 345678".
     """
+    candidates = [p.strip() for p in (raw or "").replace("\n", " ").replace(",", " ").split(" ")]
+    ids = set()
+    for chunk in candidates:
+        if not chunk:
+            continue
+        try:
+            ids.add(int(chunk))
+        except ValueError:
+            # Игнорируем некорректные значения
+            continue
+    return frozenset(ids)
 
-    def __init__(self) -> None:
-        self._admin_ids: Set[int] = self._load_admin_ids()
 
-    def _load_admin_ids(self) -> Set[int]:
-        raw = os.getenv("ADMINS", "") or ""
-        candidates = [p.strip() for p in raw.replace("\n", " ").replace(",", " ").split(" ")]
-        ids: Set[int] = set()
-        for chunk in candidates:
-            if not chunk:
-                continue
-            try:
-                ids.add(int(chunk))
-            except ValueError:
-                # Игнорируем некорректные значения
-                continue
-        return ids
-
-    async def __call__(self, event: TelegramObject) -> bool:
-        user = getattr(event, "from_user", None)
-        if not user:
-            return False
-        if not self._admin_ids:
-            # Если ADMINS пуст — никого не пускаем
-            return False
-        return int(user.id) in self._admin_ids
+class AdminRegistry:
+    """Общий для всего бота список администраторов с горячей перезагрузкой.
 
+    Источники: переменная окружения ADMINS и (опционально) файл из ADMINS_FILE
+    с ID в том же формате. Файл перечитывается автоматически при изменении
+    mtime (проверка не чаще раза в ``check_interval`` секунд), переменные
+    окружения и .env — по вызову reload() (в bot.py он висит на SIGHUP).
+    """
 
-class NonAdminOnly(BaseFilter):
-    """Фильтр допускает только пользователей, которые НЕ входят в ADMINS."""
+    def __init__(self, check_interval: float = 5.0) -> None:
+        self.check_interval = check_interval
+        self._ids: FrozenSet[int] = frozenset()
+        self._file_mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._load()
 
-    def __init__(self) -> None:
-        # Разделяем с AdminOnly логику парсинга для согласованности
-        self._admin_ids: Set[int] = self._load_admin_ids()
-
-    def _load_admin_ids(self) -> Set[int]:
-        raw = os.getenv("ADMINS", "") or ""
-        candidates = [p.strip() for p in raw.replace("\n", " ").replace(",", " ").split(" ")]
-        ids: Set[int] = set()
-        for chunk in candidates:
-            if not chunk:
-                continue
+    @property
+    def ids(self) -> FrozenSet[int]:
+        return self._ids
+
+    def _load(self) -> None:
+        ids = set(parse_admin_ids(os.getenv("ADMINS", "")))
+        admins_file = os.getenv("ADMINS_FILE")
+        self._file_mtime = None
+        if admins_file:
             try:
-                ids.add(int(chunk))
-            except ValueError:
-                continue
-        return ids
+                self._file_mtime = os.stat(admins_file).st_mtime
+                with open(admins_file, "r", encoding="utf-8") as f:
+                    ids |= parse_admin_ids(f.read())
+            except OSError as e:
+                logging.warning(f"Не удалось прочитать ADMINS_FILE {admins_file}: {e}")
+        self._ids = frozenset(ids)
+        self._checked_at = time.monotonic()
+
+    def reload(self) -> None:
+        """Перечитывает .env, переменные окружения и ADMINS_FILE."""
+        load_dotenv(override=True)
+        self._load()
+        logging.info(f"Список администраторов перезагружен: {len(self._ids)} ID")
+
+    def refresh_if_changed(self) -> None:
+        """Дёшево проверяет mtime ADMINS_FILE и перечитывает его при изменении."""
+        admins_file = os.getenv("ADMINS_FILE")
+        if not admins_file:
+            return
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.stat(admins_file).st_mtime
+        except OSError:
+            mtime = None
+        if mtime != self._file_mtime:
+            self._load()
+            logging.info(f"ADMINS_FILE изменён, администраторов: {len(self._ids)}")
+
+    def is_admin(self, user_id: int) -> bool:
+        return int(user_id) in self._ids
+
+
+admin_registry = AdminRegistry()
 
-    async def __call__(self, event: TelegramObject) -> bool:
-        user = getattr(event, "from_user", None)
-        if not user:
-            return True  # если не знаем пользователя — считаем не админом
-        if not self._admin_ids:
-            # Если список админов пуст, все считаются не-админами
-            return True
-        return int(user.id) not in self._admin_ids
 
+def _resolve_is_admin(event: TelegramObject, is_admin: Optional[bool]) -> Optional[bool]:
+    """Берёт готовый результат из AccessContextMiddleware, иначе считает сам."""
+    if is_admin is not None:
+        return is_admin
+    user = getattr(event, "from_user", None)
+    if not user:
+        return None
+    return admin_registry.is_admin(user.id)
+
+
+class AdminOnly(BaseFilter):
+    """Фильтр допускает только пользователей из ADMINS.
+
+    Статус пользователя вычисляется один раз на апдейт в AccessContextMiddleware
+    и приходит в фильтр через data["is_admin"]. Если ADMINS пуст — никого не пускаем.
+    """
+
+    async def __call__(self, event: TelegramObject, is_admin: Optional[bool] = None) -> bool:
+        return bool(_resolve_is_admin(event, is_admin))
+
+
+class NonAdminOnly(BaseFilter):
+    """Фильтр допускает только пользователей, которые НЕ входят в ADMINS."""
 
+    async def __call__(self, event: TelegramObject, is_admin: Optional[bool] = None) -> bool:
+        # Если не знаем пользователя или список админов пуст — считаем не админом
+        return not _resolve_is_admin(event, is_admin)
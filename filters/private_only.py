@@ -1,12 +1,35 @@
+from typing import Optional
+
 from aiogram.filters import BaseFilter
 from aiogram.types import TelegramObject
 from aiogram.enums import ChatType
 
 
+def is_private_chat(chat) -> bool:
+    """Проверяет, что чат личный."""
+    if chat is None:
+        return False
+
+    chat_type = getattr(chat, "type", None)
+
+    # aiogram can return either raw string or ChatType enum
+    if isinstance(chat_type, ChatType):
+        return chat_type == ChatType.PRIVATE
+
+    return str(chat_type) == "private"
+
+
 class PrivateOnly(BaseFilter):
-    """Пропускает события только из личных чатов."""
+    """Пропускает события только из личных чатов.
+
+    Тип чата вычисляется один раз на апдейт в AccessContextMiddleware
+    и приходит в фильтр через data["is_private"].
+    """
+
+    async def __call__(self, event: TelegramObject, is_private: Optional[bool] = None) -> bool:
+        if is_private is not None:
+            return is_private
 
-    async def __call__(self, event: TelegramObject) -> bool:
         # Для Message / CallbackQuery чат можно получить по-разному,
         # поэтому аккуратно пробуем несколько вариантов.
         chat = getattr(event, "chat", None)
@@ -16,14 +39,4 @@ class PrivateOnly(BaseFilter):
             message = getattr(event, "message", None)
             chat = getattr(message, "chat", None)
 
-        if chat is None:
-            return False
-
-        chat_type = getattr(chat, "type", None)
-
-        # aiogram can return either raw string or ChatType enum
-        if isinstance(chat_type, ChatType):
-            return chat_type == ChatType.PRIVATE
-
-        return str(chat_type) == "private"
-
+        return is_private_chat(chat)
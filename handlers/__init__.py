@@ -4,6 +4,7 @@ from .trade_share import trade_share_router
 from .create_user_pdf import create_user_pdf_router
 from .channel_comments import channel_comments_router
 from .soft_signal import soft_signal_router
+from .inline_mode import inline_router
 
 __all__ = [
     "create_invoice_router",
@@ -12,4 +13,5 @@ __all__ = [
     "create_user_pdf_router",
     "channel_comments_router",
     "soft_signal_router",
+    "inline_router",
 ]
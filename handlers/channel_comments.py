@@ -6,12 +6,13 @@ from html import escape
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
-from aiogram import F, Router
+from aiogram import Bot, F, Router
 from aiogram.filters import Command
 from aiogram.types import FSInputFile, Message
 
 from filters.admin_only import AdminOnly
 from filters.private_only import PrivateOnly
+from utils.comment_dispatcher import CommentJob, comment_dispatcher
 
 logger = logging.getLogger(__name__)
 
@@ -94,7 +95,7 @@ def find_channel_by_id(
 @channel_comments_router.message(
     F.is_automatic_forward, F.sender_chat.type == "channel"
 )
-async def on_auto_forward_message(message: Message) -> None:
+async def on_auto_forward_message(message: Message, bot: Bot) -> None:
     """Handle auto-forwarded messages in the linked discussion chat.
 
     Telegram создаёт в связанном чате сервисное сообщение (auto forward) для поста канала.
@@ -130,24 +131,25 @@ async def on_auto_forward_message(message: Message) -> None:
         )
         return
 
-    try:
+    # Ответ на авто-перенаправленное сообщение — это и есть \"комментарий к посту\".
+    # Отправку выполняет очередь с учётом лимитов Telegram и RetryAfter.
+    queued = comment_dispatcher.enqueue(
+        bot,
+        CommentJob(
+            chat_id=discussion_chat_id,
+            reply_to_message_id=message.message_id,
+            text=text,
+            channel_id=channel_id,
+            posted_at=message.date.timestamp(),
+            message_thread_id=message.message_thread_id if message.is_topic_message else None,
+        ),
+    )
+    if queued:
         logger.info(
-            "Sending reply-comment in discussion chat %s to message_id=%s",
+            "Reply-comment queued for discussion chat %s to message_id=%s",
             discussion_chat_id,
             message.message_id,
         )
-        # Ответом на авто-перенаправленное сообщение — это и есть \"комментарий к посту\"
-        await message.reply(text)
-        logger.info(
-            "Reply-comment sent successfully to discussion chat %s", discussion_chat_id
-        )
-    except Exception as exc:  # noqa: BLE001
-        logger.error(
-            "Failed to send reply-comment in discussion chat %s (channel %s): %s",
-            discussion_chat_id,
-            channel_id,
-            exc,
-        )
 
 
 def _build_channels_list_text(channels: List[Dict[str, Any]]) -> str:
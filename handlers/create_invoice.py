@@ -1,8 +1,11 @@
 import os
 import re
-import uuid
+import shutil
 import logging
 import datetime
+import time
+from typing import Tuple
+
 from aiogram import Router, Bot
 from aiogram.types import Message, CallbackQuery, FSInputFile
 from aiogram.filters import Command
@@ -11,29 +14,48 @@ from aiogram.enums import ChatAction
 from aiogram.fsm.context import FSMContext
 
 from states import Form
-from misc import InvoiceKeyboards, format_cost, fill_pdf_html, PDF_HTML_PATH, PRODUCT_MAP, DURATION_MAP
+from misc import InvoiceKeyboards, format_cost, PRODUCT_MAP, DURATION_MAP, render_backend
+from misc.documents import remove_invoice_files
 from misc.utils import cleanup_files
-from utils.render_pdf import html_to_pdf_playwright
+from utils.metrics import COMMAND_DURATION_SECONDS, INVOICE_CONFIRM_SECONDS
+from utils.render_jobs import render_jobs
+from utils.speculative import SpeculativeRenders
 from utils.utils import send_email_with_attachment
-from filters.admin_only import AdminOnly, NonAdminOnly
+from utils.tracing import span
+from filters.admin_only import AdminOnly
 from filters.private_only import PrivateOnly
 
 # Создаем роутер для создания инвойсов
 create_invoice_router = Router()
+# Права проверяются один раз на роутер, а не в каждом хендлере
+create_invoice_router.message.filter(PrivateOnly(), AdminOnly())
+create_invoice_router.callback_query.filter(PrivateOnly(), AdminOnly())
 
 # Создаем экземпляр клавиатур
 keyboards = InvoiceKeyboards(PRODUCT_MAP, DURATION_MAP)
 
+# PDF начинает рендериться уже на экране подтверждения (0 — только после «Подтвердить»)
+INVOICE_SPECULATIVE_RENDER = os.getenv("INVOICE_SPECULATIVE_RENDER", "1") != "0"
+# Спекулятивные рендеры инвойсов по id пользователя
+invoice_prerenders: SpeculativeRenders[Tuple[str, str, bool]] = SpeculativeRenders("invoice")
+
 
+def _invoice_fingerprint(data: dict) -> Tuple:
+    """Отпечаток данных формы: спекулятивный PDF годится, только если они не менялись."""
+    return tuple(sorted((key, str(value)) for key, value in data.items()))
 
-@create_invoice_router.message(PrivateOnly(), AdminOnly(), Command("create_invoice"))
+
+@create_invoice_router.message(Command("create_invoice"))
 async def start(message: Message, state: FSMContext):
+    # Новый инвойс прерывает незавершённый рендер предыдущего
+    render_jobs.cancel(message.from_user.id)
+    invoice_prerenders.discard(message.from_user.id)
     await state.clear()
     await message.answer("Введите почту:", reply_markup=keyboards.cancel_kb())
     await state.set_state(Form.email)
 
 
-@create_invoice_router.message(PrivateOnly(), AdminOnly(), StateFilter(Form.email))
+@create_invoice_router.message(StateFilter(Form.email))
 async def email(message: Message, state: FSMContext):
     if not re.match(r"[^@]+@[^@]+\.[^@]+", message.text):
         await message.answer("Неверная почта, попробуйте снова.", reply_markup=keyboards.cancel_kb())
@@ -46,10 +68,12 @@ async def email(message: Message, state: FSMContext):
     await state.set_state(Form.product)
 
 
-@create_invoice_router.callback_query(PrivateOnly(), AdminOnly(), StateFilter(Form.product, Form.duration, Form.confirm))
+@create_invoice_router.callback_query(StateFilter(Form.product, Form.duration, Form.confirm))
 async def callbacks(callback: CallbackQuery, state: FSMContext, bot: Bot):
     data = callback.data
     if data == "cancel":
+        render_jobs.cancel(callback.from_user.id)
+        invoice_prerenders.discard(callback.from_user.id)
         await callback.message.answer("❌ Создание инвойса отменено.")
         await state.clear()
         await callback.answer()
@@ -69,34 +93,46 @@ async def callbacks(callback: CallbackQuery, state: FSMContext, bot: Bot):
         await state.set_state(Form.name)
     elif data.startswith("confirm:"):
         if data.endswith("no"):
+            # Если PDF уже рендерится, страница закрывается сразу, не дожидаясь рендера
+            render_jobs.cancel(callback.from_user.id)
+            invoice_prerenders.discard(callback.from_user.id)
             await callback.message.answer("Отменено.")
             await state.clear()
         else:
+            confirmed_at = time.perf_counter()
             d = await state.get_data()
-            submission_id = uuid.uuid4().hex
-            
-            # Обрабатываем order_number для имени файла
-            order_number = d.get("order_number", "")
-            padded_order_number = order_number.zfill(6) if len(order_number) < 6 else order_number
-            
+
             # Показываем chat action "отправка файла"
             await bot.send_chat_action(callback.message.chat.id, ChatAction.UPLOAD_DOCUMENT)
-            
-            # Создаем временный HTML файл с подстановками
-            temp_html_path = fill_pdf_html(d, submission_id, PDF_HTML_PATH)
-            
-            # Создаем путь для PDF файла с правильным именем в той же временной директории
-            temp_pdf_path = os.path.join(os.path.dirname(temp_html_path), f"invoice_{padded_order_number}.pdf")
-            
-            # Конвертируем HTML в PDF
-            logging.info(f"Начинаю генерацию PDF: HTML={temp_html_path}, PDF={temp_pdf_path}")
-            # CSS файл уже скопирован в временную директорию вместе с HTML
-            css_file_path = os.path.join(os.path.dirname(temp_html_path), "styles.css")
-            success = await html_to_pdf_playwright(
-                html_file_path=temp_html_path,
-                output_pdf_path=temp_pdf_path,
-                css_file_path=css_file_path
-            )
+
+            # PDF, начатый на экране подтверждения, скорее всего уже готов
+            prerender = invoice_prerenders.take(callback.from_user.id, _invoice_fingerprint(d))
+            if prerender is not None:
+                job = prerender.job
+                # «Отменить» во время ожидания прерывает и спекулятивный рендер
+                render_jobs.adopt(callback.from_user.id, job)
+                try:
+                    temp_html_path, temp_pdf_path, success = await prerender.task
+                finally:
+                    render_jobs.finish(callback.from_user.id, job)
+                # Сбой спекулятивного рендера или очищенный за это время temp/ — рендерим заново
+                if not job.cancelled and not (success and os.path.exists(temp_pdf_path)):
+                    shutil.rmtree(os.path.dirname(temp_html_path), ignore_errors=True)
+                    prerender = None
+            if prerender is None:
+                job = render_jobs.start(callback.from_user.id, "invoice")
+                try:
+                    temp_html_path, temp_pdf_path, success = await render_backend.invoice_pdf(d, job)
+                finally:
+                    render_jobs.finish(callback.from_user.id, job)
+            speculative = "off" if not INVOICE_SPECULATIVE_RENDER else "hit" if prerender is not None else "miss"
+
+            if job.cancelled:
+                # Пользователь уже получил «Отменено»; убираем только файлы этой попытки
+                logging.info(f"Генерация PDF отменена пользователем: HTML={temp_html_path}")
+                shutil.rmtree(os.path.dirname(temp_html_path), ignore_errors=True)
+                await callback.answer()
+                return
 
             # Показываем chat action "отправка файла"
             await bot.send_chat_action(callback.message.chat.id, ChatAction.UPLOAD_DOCUMENT)
@@ -105,6 +141,10 @@ async def callbacks(callback: CallbackQuery, state: FSMContext, bot: Bot):
                 logging.info(f"PDF успешно создан: {temp_pdf_path}")
                 # Отправляем PDF файл
                 await callback.message.answer_document(FSInputFile(temp_pdf_path))
+                elapsed = time.perf_counter() - confirmed_at
+                INVOICE_CONFIRM_SECONDS.observe(elapsed, speculative=speculative)
+                # Задержка команды — от «Подтвердить», а не от ответа на /create_invoice
+                COMMAND_DURATION_SECONDS.observe(elapsed, command="create_invoice")
 
                 # Сохраним пути во временное состояние для следующего шага
                 await state.update_data(temp_html_path=temp_html_path, temp_pdf_path=temp_pdf_path)
@@ -130,7 +170,7 @@ async def callbacks(callback: CallbackQuery, state: FSMContext, bot: Bot):
         pass
 
 
-@create_invoice_router.callback_query(PrivateOnly(), AdminOnly(), StateFilter(Form.send_email_confirm))
+@create_invoice_router.callback_query(StateFilter(Form.send_email_confirm))
 async def send_email_callbacks(callback: CallbackQuery, state: FSMContext, bot: Bot):
     data = callback.data
     if not data.startswith("sendmail:"):
@@ -159,11 +199,12 @@ async def send_email_callbacks(callback: CallbackQuery, state: FSMContext, bot:
 
     await bot.send_chat_action(callback.message.chat.id, ChatAction.TYPING)
 
-    ok = send_email_with_attachment(
-        file_path=temp_pdf_path,
-        body_text="Здравствуйте! Во вложении ваш счёт.",
-        recipient_email=email,
-    )
+    with span("smtp.send"):
+        ok = send_email_with_attachment(
+            file_path=temp_pdf_path,
+            body_text="Здравствуйте! Во вложении ваш счёт.",
+            recipient_email=email,
+        )
     if ok:
         await callback.message.answer("Письмо отправлено на указанную почту.")
     else:
@@ -180,7 +221,7 @@ async def send_email_callbacks(callback: CallbackQuery, state: FSMContext, bot:
         pass
 
 
-@create_invoice_router.callback_query(PrivateOnly(), AdminOnly(), StateFilter(Form.email, Form.name, Form.phone, Form.order_number, Form.purchase_date, Form.cost))
+@create_invoice_router.callback_query(StateFilter(Form.email, Form.name, Form.phone, Form.order_number, Form.purchase_date, Form.cost))
 async def cancel_callback(callback: CallbackQuery, state: FSMContext):
     """Обработчик кнопки отмены для всех состояний ввода данных"""
     if callback.data == "cancel":
@@ -189,7 +230,7 @@ async def cancel_callback(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
-@create_invoice_router.message(PrivateOnly(), AdminOnly(), StateFilter(Form.product))
+@create_invoice_router.message(StateFilter(Form.product))
 async def product_text_input(message: Message, state: FSMContext):
     title = (message.text or "").strip()
     if not title:
@@ -203,7 +244,7 @@ async def product_text_input(message: Message, state: FSMContext):
     await state.set_state(Form.duration)
 
 
-@create_invoice_router.message(PrivateOnly(), AdminOnly(), StateFilter(Form.duration))
+@create_invoice_router.message(StateFilter(Form.duration))
 async def duration_text_input(message: Message, state: FSMContext):
     title = (message.text or "").strip()
     if not title:
@@ -214,28 +255,28 @@ async def duration_text_input(message: Message, state: FSMContext):
     await state.set_state(Form.name)
 
 
-@create_invoice_router.message(PrivateOnly(), AdminOnly(), StateFilter(Form.name))
+@create_invoice_router.message(StateFilter(Form.name))
 async def name(message: Message, state: FSMContext):
     await state.update_data(name=message.text)
     await message.answer("Введите телефон:", reply_markup=keyboards.cancel_kb())
     await state.set_state(Form.phone)
 
 
-@create_invoice_router.message(PrivateOnly(), AdminOnly(), StateFilter(Form.phone))
+@create_invoice_router.message(StateFilter(Form.phone))
 async def phone(message: Message, state: FSMContext):
     await state.update_data(phone=message.text)
     await message.answer("Введите номер заказа:", reply_markup=keyboards.cancel_kb())
     await state.set_state(Form.order_number)
 
 
-@create_invoice_router.message(PrivateOnly(), AdminOnly(), StateFilter(Form.order_number))
+@create_invoice_router.message(StateFilter(Form.order_number))
 async def order(message: Message, state: FSMContext):
     await state.update_data(order_number=message.text)
     await message.answer("Введите дату покупки (ДД/ММ/ГГГГ):", reply_markup=keyboards.cancel_kb())
     await state.set_state(Form.purchase_date)
 
 
-@create_invoice_router.message(PrivateOnly(), AdminOnly(), StateFilter(Form.purchase_date))
+@create_invoice_router.message(StateFilter(Form.purchase_date))
 async def date(message: Message, state: FSMContext):
     # Валидация формата даты ДД/ММ/ГГГГ
     date_pattern = r'^\d{2}/\d{2}/\d{4}$'
@@ -256,7 +297,7 @@ async def date(message: Message, state: FSMContext):
     await state.set_state(Form.cost)
 
 
-@create_invoice_router.message(PrivateOnly(), AdminOnly(), StateFilter(Form.cost))
+@create_invoice_router.message(StateFilter(Form.cost))
 async def cost(message: Message, state: FSMContext):
     await state.update_data(cost=message.text)
     data = await state.get_data()
@@ -276,3 +317,12 @@ async def cost(message: Message, state: FSMContext):
         reply_markup=keyboards.confirm_kb()
     )
     await state.set_state(Form.confirm)
+
+    if INVOICE_SPECULATIVE_RENDER:
+        # Данные известны — рендерим PDF, пока администратор проверяет сводку
+        invoice_prerenders.start(
+            message.from_user.id,
+            _invoice_fingerprint(data),
+            lambda job: render_backend.invoice_pdf(data, job),
+            remove_invoice_files,
+        )
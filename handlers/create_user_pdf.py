@@ -1,31 +1,72 @@
+import asyncio
 import os
 import uuid
 import logging
+import datetime
+from typing import Tuple
+
 from aiogram import Router, Bot
 from aiogram.types import Message, CallbackQuery, FSInputFile
 from aiogram.filters import Command
 from aiogram.filters.state import StateFilter
 from aiogram.enums import ChatAction
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
 
 from states import UserPdfForm
-from utils.render_pdf import html_to_pdf_playwright
+from utils.metrics import COMMAND_DURATION_SECONDS
+from utils.render_jobs import RenderJob
+from utils.speculative import SpeculativeRenders
 from filters.admin_only import AdminOnly
 from filters.private_only import PrivateOnly
 from misc.keyboards import UserPdfKeyboards
 from misc.constants import DEFAULT_PDF_PATH
-from misc.utils import fill_title_html, merge_pdfs, cleanup_files
+from misc import render_backend
+from misc.documents import remove_title_files
+from misc.utils import cleanup_files
 
 # Создаем роутер для создания пользовательского PDF
 create_user_pdf_router = Router()
+# Права проверяются один раз на роутер, а не в каждом хендлере
+create_user_pdf_router.message.filter(PrivateOnly(), AdminOnly())
+create_user_pdf_router.callback_query.filter(PrivateOnly(), AdminOnly())
 
 # Создаем экземпляр клавиатур
 keyboards = UserPdfKeyboards()
 
+# Лимиты загружаемого PDF: проверяются до скачивания (размер из Telegram),
+# во время скачивания и сразу после него (число страниц), до объединения
+USER_PDF_MAX_MB = int(os.getenv("USER_PDF_MAX_MB", "500"))
+USER_PDF_MAX_PAGES = int(os.getenv("USER_PDF_MAX_PAGES", "2000"))
+
+# Титульная страница рендерится сразу после ввода имени, пока пользователь выбирает файл
+# (0 — только после выбора файла)
+USER_PDF_SPECULATIVE_RENDER = os.getenv("USER_PDF_SPECULATIVE_RENDER", "1") != "0"
+# Спекулятивные рендеры титульных страниц по id пользователя
+title_prerenders: SpeculativeRenders[Tuple[str, str, bool]] = SpeculativeRenders("title")
+
+
+def _title_fingerprint(user_name: str) -> Tuple[str, str]:
+    # В титуле есть дата создания: рендер вчерашним числом не годится
+    return user_name, datetime.date.today().isoformat()
+
+
+async def _title_pdf(user_name: str, user_id: int) -> Tuple[str, str, bool]:
+    """Титульная страница: спекулятивный рендер, если он есть и удался, иначе новый."""
+    prerender = title_prerenders.take(user_id, _title_fingerprint(user_name))
+    if prerender is not None:
+        result = await prerender.task
+        if result[2] and os.path.exists(result[1]):
+            return result
+        # Сбой рендера или очищенный за это время temp/ — рендерим заново
+        remove_title_files(result)
+    return await render_backend.title_pdf(user_name, RenderJob("title"))
+
 
-@create_user_pdf_router.message(PrivateOnly(), AdminOnly(), Command("create_user_pdf"))
+@create_user_pdf_router.message(Command("create_user_pdf"))
 async def start_create_user_pdf(message: Message, state: FSMContext):
     """Начало создания пользовательского PDF"""
+    title_prerenders.discard(message.from_user.id)
     await state.clear()
     await message.answer(
         "📝 Создание персонального PDF\n\n"
@@ -35,7 +76,7 @@ async def start_create_user_pdf(message: Message, state: FSMContext):
     await state.set_state(UserPdfForm.user_name)
 
 
-@create_user_pdf_router.message(PrivateOnly(), AdminOnly(), StateFilter(UserPdfForm.user_name))
+@create_user_pdf_router.message(StateFilter(UserPdfForm.user_name))
 async def process_user_name(message: Message, state: FSMContext):
     """Обработка введенного имени пользователя"""
     user_name = message.text.strip()
@@ -54,13 +95,23 @@ async def process_user_name(message: Message, state: FSMContext):
     )
     await state.set_state(UserPdfForm.pdf_file)
 
+    if USER_PDF_SPECULATIVE_RENDER:
+        # Имя известно — титул рендерится параллельно с выбором и загрузкой файла
+        title_prerenders.start(
+            message.from_user.id,
+            _title_fingerprint(user_name),
+            lambda job: render_backend.title_pdf(user_name, job),
+            remove_title_files,
+        )
+
 
-@create_user_pdf_router.callback_query(PrivateOnly(), AdminOnly(), StateFilter(UserPdfForm.pdf_file))
+@create_user_pdf_router.callback_query(StateFilter(UserPdfForm.pdf_file))
 async def handle_file_choice(callback: CallbackQuery, state: FSMContext, bot: Bot):
     """Обработка выбора файла"""
     data = callback.data
     
     if data == "cancel":
+        title_prerenders.discard(callback.from_user.id)
         await callback.message.answer("❌ Создание PDF отменено.")
         await state.clear()
         await callback.answer()
@@ -71,6 +122,7 @@ async def handle_file_choice(callback: CallbackQuery, state: FSMContext, bot: Bo
 
         # Используем существующий файл
         if not os.path.exists(DEFAULT_PDF_PATH):
+            title_prerenders.discard(callback.from_user.id)
             await callback.message.answer("❌ Существующий PDF файл не найден.")
             await state.clear()
             return
@@ -80,7 +132,7 @@ async def handle_file_choice(callback: CallbackQuery, state: FSMContext, bot: Bo
     
 
 
-@create_user_pdf_router.message(PrivateOnly(), AdminOnly(), StateFilter(UserPdfForm.pdf_file))
+@create_user_pdf_router.message(StateFilter(UserPdfForm.pdf_file))
 async def handle_uploaded_file(message: Message, state: FSMContext, bot: Bot):
     """Обработка загруженного файла"""
     if not message.document:
@@ -98,16 +150,37 @@ async def handle_uploaded_file(message: Message, state: FSMContext, bot: Bot):
         )
         return
     
-    # Скачиваем файл
-    file_id = message.document.file_id
-    file = await bot.get_file(file_id)
-    
+    max_bytes = USER_PDF_MAX_MB * 2**20
+    if message.document.file_size and message.document.file_size > max_bytes:
+        await message.answer(
+            f"❌ Файл больше {USER_PDF_MAX_MB} МБ. Загрузите другой PDF или используйте существующий:",
+            reply_markup=keyboards.file_choice_kb()
+        )
+        return
+
+    # PyPDF2 нужен только для загруженных файлов: не тянем его при старте бота
+    from utils.pdf_stream import PdfRejected, count_pages, download_limited
+
     # Создаем временный файл
     temp_filename = f"temp_uploaded_{uuid.uuid4().hex}.pdf"
     temp_path = f"temp/{temp_filename}"
-    
-    # Скачиваем файл
-    await bot.download_file(file.file_path, temp_path)
+
+    try:
+        file = await bot.get_file(message.document.file_id)
+        # Файл пишется на диск кусками; превышение лимита обрывает загрузку
+        await download_limited(bot, file.file_path, temp_path, max_bytes)
+        pages = await asyncio.to_thread(count_pages, temp_path)
+        if pages > USER_PDF_MAX_PAGES:
+            raise PdfRejected(f"В PDF {pages} страниц, максимум {USER_PDF_MAX_PAGES}.")
+    except (PdfRejected, TelegramBadRequest) as exc:
+        logging.warning(f"Загруженный PDF отклонён: {exc}")
+        cleanup_files([temp_path])
+        reason = exc if isinstance(exc, PdfRejected) else "Telegram не отдал файл (без локального Bot API — до 20 МБ)."
+        await message.answer(
+            f"❌ {reason}\n\nЗагрузите другой PDF или используйте существующий:",
+            reply_markup=keyboards.file_choice_kb()
+        )
+        return
     
     await state.update_data(pdf_path=temp_path, is_uploaded=True)
     
@@ -116,7 +189,12 @@ async def handle_uploaded_file(message: Message, state: FSMContext, bot: Bot):
 
 
 async def process_pdf_creation(message_or_callback, state: FSMContext, bot: Bot):
-    """Основная логика создания PDF"""
+    """Основная логика создания PDF; её время — задержка команды create_user_pdf."""
+    with COMMAND_DURATION_SECONDS.time(command="create_user_pdf"):
+        await _create_pdf(message_or_callback, state, bot)
+
+
+async def _create_pdf(message_or_callback, state: FSMContext, bot: Bot):
     data = await state.get_data()
     user_name = data.get("user_name")
     pdf_path = data.get("pdf_path")
@@ -129,8 +207,10 @@ async def process_pdf_creation(message_or_callback, state: FSMContext, bot: Bot)
     else:  # Message
         message = message_or_callback
         chat_id = message.chat.id
+    user_id = message_or_callback.from_user.id
     
     if not user_name or not pdf_path:
+        title_prerenders.discard(user_id)
         await message.answer("❌ Ошибка: не хватает данных для создания PDF.")
         await state.clear()
         return
@@ -139,17 +219,8 @@ async def process_pdf_creation(message_or_callback, state: FSMContext, bot: Bot)
     await bot.send_chat_action(chat_id, ChatAction.TYPING)
     
     try:
-        # Создаем титульную страницу
-        temp_html_path = fill_title_html(user_name)
-        title_pdf_path = f"temp/title_{uuid.uuid4().hex}.pdf"
-        
-        # Конвертируем HTML в PDF с альбомной ориентацией
-        logging.info(f"Начинаю создание титульной страницы: HTML={temp_html_path}, PDF={title_pdf_path}")
-        success = await html_to_pdf_playwright(
-            html_file_path=temp_html_path,
-            output_pdf_path=title_pdf_path,
-            landscape=True
-        )
+        # Титульная страница: обычно уже отрендерена, пока пользователь выбирал и загружал файл
+        temp_html_path, title_pdf_path, success = await _title_pdf(user_name, user_id)
         
         if not success:
             logging.error(f"Ошибка при создании титульной страницы: HTML={temp_html_path}, PDF={title_pdf_path}")
@@ -161,7 +232,8 @@ async def process_pdf_creation(message_or_callback, state: FSMContext, bot: Bot)
         
         # Объединяем PDF файлы
         final_pdf_path = f"temp/final_{uuid.uuid4().hex}.pdf"
-        merge_success = merge_pdfs(title_pdf_path, pdf_path, final_pdf_path)
+        # Вместе с оптимизацией результата (PDF_OPTIMIZE_PROFILE) — повторы ресурсов титула и документа
+        merge_success = await render_backend.merge(title_pdf_path, pdf_path, final_pdf_path)
         
         if not merge_success:
             await message.answer("❌ Ошибка при объединении PDF файлов.")
@@ -192,7 +264,7 @@ async def process_pdf_creation(message_or_callback, state: FSMContext, bot: Bot)
         await state.clear()
 
 
-@create_user_pdf_router.callback_query(PrivateOnly(), AdminOnly(), StateFilter(UserPdfForm.user_name))
+@create_user_pdf_router.callback_query(StateFilter(UserPdfForm.user_name))
 async def cancel_callback(callback: CallbackQuery, state: FSMContext):
     """Обработчик кнопки отмены"""
     if callback.data == "cancel":
@@ -0,0 +1,234 @@
+"""Inline-режим: сигнал /soft_signal и карточка /okx прямо в любом чате.
+
+Сигнал:
+    @bot BTCUSDT 10m Short Price: 69129.8 TP: 67741.9 SL: 70605.5
+    @bot BTCUSDT 10m Short 69129.8 67741.9 70605.5
+    — один результат с готовым текстом сигнала (разбор — parse_inline_signal).
+
+Карточка /okx (если задан OKX_INLINE_CHAT_ID):
+    @bot okx BTCUSDT Лонг 100 -5,53 -3,48 114962.0 114956.0 [дата время]
+    — карточка рендерится как для /okx и загружается в служебный чат
+    OKX_INLINE_CHAT_ID: inline-ответ может ссылаться только на file_id.
+    Если рендер не успел за OKX_INLINE_WAIT секунд, отвечаем кнопкой
+    «рисуется», а рендер продолжается в фоне — следующее нажатие клавиши
+    (например, пробел) получит готовую карточку из кэша.
+
+Inline-запрос приходит на каждое нажатие клавиши, поэтому:
+    - ответы кэшируются по нормализованному запросу (LRU с TTL) и на
+      стороне Telegram (cache_time: INLINE_CACHE_TIME для готовых ответов,
+      секунда для подсказок к неполному вводу); ответы персональные;
+    - запрос отвечается только после паузы INLINE_DEBOUNCE секунд: если за
+      это время пользователь допечатал строку, старый запрос пропускается;
+    - одинаковые карточки /okx рендерятся один раз, file_id переиспользуется.
+
+Доступно только администраторам; inline-режим включается в BotFather (/setinline).
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from aiogram import Bot, Router
+from aiogram.types import (
+    FSInputFile,
+    InlineQuery,
+    InlineQueryResultArticle,
+    InlineQueryResultCachedPhoto,
+    InlineQueryResultsButton,
+    InputTextMessageContent,
+)
+
+from filters.admin_only import AdminOnly
+from misc.soft_signal import SignalBatch, batch_metrics, format_signals, parse_inline_signal
+from misc import render_backend
+from misc.trade_cards import PROJECT_ROOT, okx_fields, okx_template_name
+from utils.render_jobs import RenderJob
+
+logger = logging.getLogger(__name__)
+
+# cache_time готового ответа на стороне Telegram, секунды
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", "300"))
+# Пауза перед ответом: запрос, за которым в течение паузы пришёл следующий, не отвечается
+INLINE_DEBOUNCE = float(os.getenv("INLINE_DEBOUNCE", "0.15"))
+# Время жизни ответов в кэше процесса, секунды
+INLINE_RESULT_TTL = float(os.getenv("INLINE_RESULT_TTL", "600"))
+# Служебный чат, куда загружаются карточки /okx для inline-ответов; пусто — карточки отключены
+OKX_INLINE_CHAT_ID = os.getenv("OKX_INLINE_CHAT_ID", "").strip()
+# Сколько ждать рендер карточки до ответа «рисуется», секунды
+OKX_INLINE_WAIT = float(os.getenv("OKX_INLINE_WAIT", "0.25"))
+
+_RESULT_CACHE_SIZE = 512
+# cache_time подсказок: неполный ввод меняется с каждым нажатием
+_HINT_CACHE_TIME = 1
+_OKX_PREFIX = "okx "
+
+inline_router = Router()
+inline_router.inline_query.filter(AdminOnly())
+
+_SIGNAL_HINT = InlineQueryResultsButton(
+    text="Формат: PAIR TF Long/Short Price TP SL", start_parameter="soft_signal"
+)
+_VALUES_HINT = InlineQueryResultsButton(
+    text="Некорректные Price/TP/SL", start_parameter="soft_signal"
+)
+_OKX_HINT = InlineQueryResultsButton(
+    text="Формат: okx PAIR сторона плечо % сумма вход выход", start_parameter="okx"
+)
+_OKX_DISABLED = InlineQueryResultsButton(text="Карточки /okx inline отключены", start_parameter="okx")
+_OKX_PENDING = InlineQueryResultsButton(text="⏳ Карточка рисуется — добавьте пробел", start_parameter="okx")
+_OKX_FAILED = InlineQueryResultsButton(text="Не удалось отрисовать карточку", start_parameter="okx")
+
+
+class _Answer(NamedTuple):
+    results: List[Any]
+    cache_time: int
+    button: Optional[InlineQueryResultsButton] = None
+    cacheable: bool = False  # можно ли отдавать повторно из кэша процесса
+
+
+class _TtlCache:
+    """LRU-кэш с временем жизни записей."""
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Any) -> Any:
+        item = self._items.get(key)
+        if item is None:
+            return None
+        if item[0] < time.monotonic():
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return item[1]
+
+    def put(self, key: Any, value: Any) -> None:
+        self._items[key] = (time.monotonic() + self.ttl, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+
+_answers = _TtlCache(_RESULT_CACHE_SIZE, INLINE_RESULT_TTL)
+# file_id загруженных карточек /okx по полям карточки
+_okx_photos = _TtlCache(_RESULT_CACHE_SIZE, INLINE_RESULT_TTL)
+# Идущие рендеры карточек: одинаковые запросы ждут одну задачу
+_okx_renders: Dict[Tuple[str, ...], "asyncio.Task[str]"] = {}
+# id последнего inline-запроса каждого пользователя (для debounce)
+_latest_query: Dict[int, str] = {}
+
+
+def _result_id(*parts: str) -> str:
+    return hashlib.md5("\x00".join(parts).encode()).hexdigest()
+
+
+@inline_router.inline_query()
+async def handle_inline_query(inline_query: InlineQuery, bot: Bot):
+    query = " ".join(inline_query.query.split())
+    answer = _answers.get(query)
+    if answer is None and query:
+        user_id = inline_query.from_user.id
+        _latest_query[user_id] = inline_query.id
+        await asyncio.sleep(INLINE_DEBOUNCE)
+        if _latest_query.get(user_id) != inline_query.id:
+            # Пользователь продолжает печатать — отвечать на устаревший запрос незачем
+            return
+        del _latest_query[user_id]
+        try:
+            if query.lower().startswith(_OKX_PREFIX):
+                answer = await _okx_answer(query[len(_OKX_PREFIX):], bot)
+            else:
+                answer = _signal_answer(query)
+        except Exception as exc:  # noqa: BLE001
+            logger.exception("Error in handle_inline_query: %s", exc)
+            return
+        if answer.cacheable:
+            _answers.put(query, answer)
+    elif answer is None:
+        answer = _Answer([], INLINE_CACHE_TIME, _SIGNAL_HINT)
+
+    try:
+        await inline_query.answer(
+            answer.results, cache_time=answer.cache_time, is_personal=True, button=answer.button
+        )
+    except Exception as exc:  # noqa: BLE001
+        # Запрос мог устареть (ответ дольше 10 секунд) — пользователю это уже не важно
+        logger.warning("Failed to answer inline query: %s", exc)
+
+
+def _signal_answer(query: str) -> _Answer:
+    data = parse_inline_signal(query)
+    if data is None:
+        return _Answer([], _HINT_CACHE_TIME, _SIGNAL_HINT)
+    batch = SignalBatch(signals=[data], errors=[None], labels=[query])
+    text = format_signals(batch, batch_metrics(batch))[0]
+    if text is None:
+        return _Answer([], _HINT_CACHE_TIME, _VALUES_HINT, cacheable=True)
+    lines = text.split("\n")
+    result = InlineQueryResultArticle(
+        id=_result_id("soft_signal", query),
+        title=f"{lines[0]} {data['timeframe']}",
+        description="\n".join(lines[2:5] + lines[6:8]),
+        input_message_content=InputTextMessageContent(message_text=text),
+    )
+    return _Answer([result], INLINE_CACHE_TIME, cacheable=True)
+
+
+async def _okx_answer(args: str, bot: Bot) -> _Answer:
+    if not OKX_INLINE_CHAT_ID:
+        return _Answer([], INLINE_CACHE_TIME, _OKX_DISABLED)
+    tokens = args.replace("|", " ").split()
+    fields = okx_fields(tokens)
+    if fields is None:
+        return _Answer([], _HINT_CACHE_TIME, _OKX_HINT)
+
+    # Без явных даты и времени карточка со временем «сейчас» переиспользуется в пределах минуты
+    explicit_time = len(tokens) >= 9
+    key = tuple(fields.values()) if explicit_time else tuple(fields.values())[:-1] + (fields["share_time"][:5],)
+    file_id = _okx_photos.get(key)
+    if file_id is None:
+        task = _okx_renders.get(key)
+        if task is None:
+            task = asyncio.create_task(_upload_okx_card(fields, bot))
+            _okx_renders[key] = task
+            task.add_done_callback(lambda done: _okx_render_done(key, done))
+        done, _ = await asyncio.wait({task}, timeout=OKX_INLINE_WAIT)
+        if not done:
+            return _Answer([], 0, _OKX_PENDING)
+        if task.exception() is not None:
+            return _Answer([], _HINT_CACHE_TIME, _OKX_FAILED)
+        file_id = task.result()
+
+    result = InlineQueryResultCachedPhoto(id=_result_id("okx", *key), photo_file_id=file_id)
+    # Карточка «на сейчас» не должна отдаваться из кэша с устаревшим временем
+    return _Answer([result], INLINE_CACHE_TIME if explicit_time else 60, cacheable=explicit_time)
+
+
+async def _upload_okx_card(fields: dict, bot: Bot) -> str:
+    """Рендерит карточку и загружает её в служебный чат; возвращает file_id."""
+    template_name = okx_template_name(fields["profit_percentage"])
+    output_path = PROJECT_ROOT / "temp" / f"inline_okx_{uuid.uuid4().hex}.png"
+    try:
+        image_path = await render_backend.okx_card(template_name, fields, output_path, RenderJob(template_name))
+        message = await bot.send_photo(OKX_INLINE_CHAT_ID, FSInputFile(image_path), disable_notification=True)
+    finally:
+        output_path.unlink(missing_ok=True)
+    return message.photo[-1].file_id
+
+
+def _okx_render_done(key: Tuple[str, ...], task: "asyncio.Task[str]") -> None:
+    _okx_renders.pop(key, None)
+    if task.cancelled():
+        return
+    exc = task.exception()
+    if exc is not None:
+        logger.error("Inline OKX card render failed: %s", exc)
+        return
+    _okx_photos.put(key, task.result())
@@ -18,6 +18,7 @@ async def admin_hint(message: Message):
         "/okx — сгенерировать изображение торговой сделки на OKX\n"
         "/forex — сгенерировать карточку сделки Forex\n"
         "/soft_signal — отформатировать торговый сигнал по шаблону\n"
+        "/signal_stats — средний RR по парам и плечо по таймфреймам из журнала сигналов\n"
         "/add_comment_channel — добавить канал в список для комментариев\n"
         "/rm_channel — удалить канал из списка для комментариев\n"
         "/set_comment — изменить текст комментария для канала\n"
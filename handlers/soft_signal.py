@@ -3,260 +3,128 @@
 Назначение:
     Принимает многострочное сообщение команды /soft_signal с параметрами сигнала,
     валидирует поля и возвращает красиво отформатированный текст сигнала.
+    Разбор, формулы и форматирование — в misc/soft_signal.py.
 
-Ожидаемый вход (body после команды):
-    PAIR TIMEFRAME
+Пачкой:
+    - несколько сигналов в одном сообщении (каждый с новой строки «PAIR TIMEFRAME»)
+      — готовые сигналы приходят сообщениями до 4096 символов, ошибки — отдельным
+      списком с номером и заголовком сигнала;
+    - CSV-файл с подписью /soft_signal (колонки pair, timeframe, side, price, tp, sl)
+      — в ответ CSV с колонками sl_pct, tp_pct, rr, leverage и error.
 
-    Short/Long
-    Price: <float>
-    TP: <float> (или TP1/TP2, если TP не указан)
-    SL: <float>
+Отправленные сигналы пишутся в журнал (utils/signal_journal.py); /signal_stats
+показывает по нему средний RR по парам и распределение плеча по таймфреймам.
 
-    2026-03-19 15:41:32 (необязательная строка с датой/временем)
-
-Выход:
-    Текстовое сообщение с вычисленными метриками: %SL, %TP, RR, плечо.
-
-Формулы:
-    % SL = |SL - Price| / Price × 100
-    % TP = |TP - Price| / Price × 100
-    RR = % TP / % SL (формат 1:X.XX)
-    Плечо = floor(40 / %SL), максимум 100
+Лимиты: SOFT_SIGNAL_MAX_BATCH сигналов в сообщении (по умолчанию 50),
+SOFT_SIGNAL_MAX_ROWS строк в CSV (по умолчанию 100000).
 """
 
+import io
 import logging
-import math
+import os
 import re
-from aiogram import Router
+import time
+from html import escape
+
+from aiogram import Bot, F, Router
 from aiogram.filters import Command
-from aiogram.types import Message
+from aiogram.types import BufferedInputFile, Message
 from aiogram.utils.chat_action import ChatActionMiddleware
 
 from filters.admin_only import AdminOnly
 from filters.private_only import PrivateOnly
+from misc.soft_signal import (
+    VALUES_ERROR,
+    batch_metrics,
+    format_signals,
+    journal_rows,
+    pack_messages,
+    parse_signals_text,
+    read_signals_csv,
+    write_results_csv,
+)
+from utils.signal_journal import LEVERAGE_BUCKET_LABELS, signal_journal
 
 
 logger = logging.getLogger(__name__)
 
-_TIMEFRAME_PATTERN = re.compile(r"(\d+)([mhd])", re.IGNORECASE)
-_DATE_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}")
+SOFT_SIGNAL_MAX_BATCH = int(os.getenv("SOFT_SIGNAL_MAX_BATCH", "50"))
+SOFT_SIGNAL_MAX_ROWS = int(os.getenv("SOFT_SIGNAL_MAX_ROWS", "100000"))
+# Окно /signal_stats по умолчанию, дни
+SIGNAL_STATS_DAYS = 30
+# Сколько ошибок перечислять в ответе на CSV (полный список — в файле)
+_CSV_ERRORS_SHOWN = 10
 
 soft_signal_router = Router()
+soft_signal_router.message.filter(PrivateOnly(), AdminOnly())
 soft_signal_router.message.middleware(ChatActionMiddleware())
 
-
-def _format_number(value: float) -> str:
-    """Форматирует число с пробелами между тысячами и запятой.
-    
-    Примеры:
-        73330.0 → "73 330"
-        69129.8 → "69 129,8"
-        70605.5 → "70 605,5"
-    """
-    if value < 0:
-        sign = "-"
-        value = abs(value)
-    else:
-        sign = ""
-    
-    # Проверяем, есть ли дробная часть
-    if value == int(value):
-        # Целое число — убираем дробную часть
-        formatted_integer = f"{int(value):,}".replace(",", " ")
-        return f"{sign}{formatted_integer}"
-    else:
-        # Есть дробная часть — округляем до 3 знаков и заменяем точку на запятую
-        str_value = f"{value:.3f}".rstrip("0").rstrip(".")
-        if "." in str_value:
-            integer_part, fractional_part = str_value.split(".")
-            formatted_integer = f"{int(integer_part):,}".replace(",", " ")
-            return f"{sign}{formatted_integer},{fractional_part}"
-        else:
-            formatted_integer = f"{int(str_value):,}".replace(",", " ")
-            return f"{sign}{formatted_integer}"
-
-
-def _parse_signal_message(text: str) -> dict | None:
-    """Парсит входное сообщение сигнала.
-    
-    Ожидаемый формат:
-        BTCUSDT 10m
-        
-        Short
-        Price: 69129.8
-        TP: 67741.9
-        SL: 70605.5
-        
-        2026-03-19 15:41:32
-    
-    Возвращает dict с полями: pair, timeframe, position_type, price, tp, sl
-    или None если формат неверный.
-    """
-    lines = [line.strip() for line in text.strip().split("\n") if line.strip()]
-    
-    if len(lines) < 5:
-        return None
-    
-    # Первая строка: PAIR и TIMEFRAME
-    first_line = lines[0].split()
-    if len(first_line) < 2:
-        return None
-    
-    pair = first_line[0].upper()
-    timeframe_raw = first_line[1]
-    
-    # Парсим таймфрейм: 10m → M10, 1h → H1, etc.
-    timeframe_match = _TIMEFRAME_PATTERN.fullmatch(timeframe_raw)
-    if not timeframe_match:
-        return None
-    
-    tf_value = timeframe_match.group(1)
-    tf_unit = timeframe_match.group(2).upper()
-    timeframe = f"{tf_unit}{tf_value}"
-    
-    # Вторая строка: позиция (Short/Long)
-    position_raw = lines[1].lower()
-    if position_raw not in ("short", "long"):
-        return None
-    
-    position_type = "ШОРТ" if position_raw == "short" else "ЛОНГ"
-    
-    # Остальные строки: ключ-значение
-    data = {"pair": pair, "timeframe": timeframe, "position_type": position_type}
-    
-    for line in lines[2:]:
-        # Пропускаем дату/время в конце
-        if _DATE_PATTERN.match(line):
-            continue
-        
-        if ":" not in line:
-            continue
-        
-        key, value = line.split(":", 1)
-        key = key.strip().lower()
-        value = value.strip()
-        
+_USAGE = (
+    "Неверный формат. Пример:\n"
+    "<code>/soft_signal BTCUSDT 10m\n\n"
+    "Short\n"
+    "Price: 69129.8\n"
+    "TP: 67741.9\n"
+    "SL: 70605.5\n\n"
+    "2026-03-19 15:41:32</code>"
+)
+_PARSE_HELP = (
+    "Не удалось распарсить сообщение. Проверьте формат:\n"
+    "<code>PAIR TIMEFRAME\n\n"
+    "Short/Long\n"
+    "Price: XXX\n"
+    "TP: XXX\n"
+    "SL: XXX</code>"
+)
+_VALUES_HELP = (
+    "Некорректные значения Price/TP/SL. "
+    "Проверьте, что все значения больше нуля и соблюдают логику позиции."
+)
+
+
+@soft_signal_router.message(Command("soft_signal"), F.document)
+async def handle_soft_signal_csv(message: Message, bot: Bot):
+    """CSV с историческими сигналами (подпись /soft_signal): ответ — CSV с метриками."""
+    document = message.document
+    if not (document.file_name or "").lower().endswith(".csv"):
+        await message.answer("Пришлите CSV-файл с колонками pair, timeframe, side, price, tp, sl.")
+        return
+    try:
+        buffer = io.BytesIO()
+        await bot.download(document, destination=buffer)
         try:
-            value_float = float(value)
-            if math.isnan(value_float) or math.isinf(value_float):
-                continue
-        except ValueError:
-            continue
-        
-        if key == "price":
-            data["price"] = value_float
-        elif key == "tp":
-            data["tp"] = value_float
-        elif key.startswith("tp") and "tp" not in data:
-            # Фолбэк для TP1/TP2, если TP не указан
-            data["tp"] = value_float
-        elif key == "sl":
-            data["sl"] = value_float
-    
-    # Проверяем наличие всех обязательных полей
-    required = ["pair", "timeframe", "position_type", "price", "tp", "sl"]
-    if not all(k in data for k in required):
-        return None
-    
-    return data
-
-
-def _calculate_metrics(price: float, tp: float, sl: float, position_type: str) -> dict | None:
-    """Рассчитывает метрики сделки.
-    
-    Формулы:
-        % SL = |SL - Price| / Price × 100
-        % TP = |TP - Price| / Price × 100
-        RR = % TP / % SL (формат: 1:X.XX)
-        Плечо = 40 / % SL (округление вниз, максимум 100)
-    """
-    if price <= 0 or tp <= 0 or sl <= 0:
-        return None
-    if any(math.isnan(v) or math.isinf(v) for v in (price, tp, sl)):
-        return None
-
-    if position_type == "ЛОНГ":
-        if tp <= price or sl >= price:
-            return None
-    elif position_type == "ШОРТ":
-        if tp >= price or sl <= price:
-            return None
-
-    sl_pct = abs(sl - price) / price * 100
-    tp_pct = abs(tp - price) / price * 100
-    if sl_pct <= 0:
-        return None
-    
-    # RR: отношение тейка к стопу
-    rr = tp_pct / sl_pct if sl_pct > 0 else 0
-    
-    # Плечо: 40 / %SL, округление вниз, максимум 100
-    leverage_raw = 40 / sl_pct if sl_pct > 0 else 100
-    leverage = min(math.floor(leverage_raw), 100)
-    
-    return {
-        "sl_pct": sl_pct,
-        "tp_pct": tp_pct,
-        "rr": rr,
-        "leverage": leverage,
-    }
-
-
-def _format_signal_message(data: dict, metrics: dict) -> str:
-    """Формирует итоговое сообщение сигнала."""
-    pair = data["pair"]
-    position_type = data["position_type"]
-    price = data["price"]
-    tp = data["tp"]
-    sl = data["sl"]
-    timeframe = data["timeframe"]
-    
-    sl_pct = metrics["sl_pct"]
-    tp_pct = metrics["tp_pct"]
-    rr = metrics["rr"]
-    leverage = metrics["leverage"]
-    
-    # Определяем знаки для процентов
-    # Для лонга: TP выше входа (+), SL ниже входа (−)
-    # Для шорта: TP ниже входа (+), SL выше входа (−)
-    # Но в примере оба процента положительные, просто с разными знаками
-    
-    # Формируем строки с процентами
-    sl_sign = "−" if sl_pct > 0 else ""
-    tp_sign = "+" if tp_pct > 0 else ""
-    
-    # Форматируем RR как 1:X.XX
-    rr_str = f"1:{rr:.2f}".rstrip("0").rstrip(".")
-    
-    message = (
-        f"{position_type} | ${pair}\n"
-        f"\n"
-        f"Вход: {_format_number(price)}\n"
-        f"Стоп: {_format_number(sl)}  ({sl_sign}{sl_pct:.2f}%)\n"
-        f"Тейк: {_format_number(tp)}  ({tp_sign}{tp_pct:.2f}%)\n"
-        f"\n"
-        f"RR: {rr_str}\n"
-        f"Плечо: x{leverage}\n"
-        f"Таймфрейм: {timeframe}\n"
-        f"\n"
-        f"🏷 #soft | Ростислав"
-    )
-    
-    return message
-
-
-@soft_signal_router.message(Command("soft_signal"), PrivateOnly(), AdminOnly())
+            batch, rows, fieldnames = read_signals_csv(buffer.getvalue(), SOFT_SIGNAL_MAX_ROWS)
+        except ValueError as exc:
+            await message.answer(f"Не удалось прочитать CSV: {exc}")
+            return
+
+        metrics = batch_metrics(batch)
+        report = write_results_csv(batch, metrics, rows, fieldnames)
+        failed = [(label, error) for label, error in zip(batch.labels, batch.errors) if error]
+        summary = f"Сигналов: {len(rows)}, без ошибок: {len(rows) - len(failed)}, с ошибками: {len(failed)}"
+        if failed:
+            summary += "\n\n" + "\n".join(f"{label}: {error}" for label, error in failed[:_CSV_ERRORS_SHOWN])
+            if len(failed) > _CSV_ERRORS_SHOWN:
+                summary += f"\n… и ещё {len(failed) - _CSV_ERRORS_SHOWN} (колонка error в файле)"
+        name = re.sub(r"\.csv$", "", document.file_name, flags=re.IGNORECASE)
+        await message.answer_document(BufferedInputFile(report, filename=f"{name}_metrics.csv"), caption=summary[:1024])
+    except Exception as exc:  # noqa: BLE001
+        logger.exception("Error in handle_soft_signal_csv: %s", exc)
+        await message.answer("⚠️ Произошла ошибка при обработке CSV")
+
+
+@soft_signal_router.message(Command("soft_signal"))
 async def handle_soft_signal(message: Message):
-    """Обработка команды /soft_signal.
-    
+    """Обработка команды /soft_signal: один или несколько сигналов подряд.
+
     Формат входного сообщения:
         BTCUSDT 10m
-        
+
         Short
         Price: 69129.8
         TP: 67741.9
         SL: 70605.5
-        
+
         2026-03-19 15:41:32
     """
     try:
@@ -269,46 +137,88 @@ async def handle_soft_signal(message: Message):
         ).strip()
 
         if not content:
-            await message.answer(
-                "Неверный формат. Пример:\n"
-                "<code>/soft_signal BTCUSDT 10m\n\n"
-                "Short\n"
-                "Price: 69129.8\n"
-                "TP: 67741.9\n"
-                "SL: 70605.5\n\n"
-                "2026-03-19 15:41:32</code>"
-            )
+            await message.answer(_USAGE)
             return
 
-        # Парсим входное сообщение
-        parsed = _parse_signal_message(content)
-        if not parsed:
+        batch = parse_signals_text(content)
+        if len(batch.signals) > SOFT_SIGNAL_MAX_BATCH:
             await message.answer(
-                "Не удалось распарсить сообщение. Проверьте формат:\n"
-                "<code>PAIR TIMEFRAME\n\n"
-                "Short/Long\n"
-                "Price: XXX\n"
-                "TP: XXX\n"
-                "SL: XXX</code>"
+                f"Слишком много сигналов в сообщении ({len(batch.signals)}), максимум "
+                f"{SOFT_SIGNAL_MAX_BATCH}. Большие наборы присылайте CSV-файлом с подписью /soft_signal."
             )
             return
 
-        # Рассчитываем метрики
-        metrics = _calculate_metrics(
-            parsed["price"], parsed["tp"], parsed["sl"], parsed["position_type"]
-        )
-        if not metrics:
-            await message.answer(
-                "Некорректные значения Price/TP/SL. "
-                "Проверьте, что все значения больше нуля и соблюдают логику позиции."
-            )
-            return
+        # Метрики всей пачки считаются одним векторным проходом
+        metrics = batch_metrics(batch)
+        results = format_signals(batch, metrics)
 
-        # Формируем итоговое сообщение
-        result = _format_signal_message(parsed, metrics)
+        await _journal(batch, metrics, message)
 
-        # Отправляем результат
-        await message.answer(result)
+        if len(results) == 1:
+            # Одиночный сигнал — прежние ответы без нумерации
+            if results[0] is None:
+                await message.answer(_VALUES_HELP if batch.errors[0] == VALUES_ERROR else _PARSE_HELP)
+            else:
+                await message.answer(results[0])
+            return
+
+        for chunk in pack_messages(result for result in results if result):
+            await message.answer(chunk)
+        failed = [
+            f"{i}. {escape(label)}: {error}"
+            for i, (label, error) in enumerate(zip(batch.labels, batch.errors), start=1)
+            if error
+        ]
+        if failed:
+            header = f"Ошибки в {len(failed)} из {len(results)} сигналов:"
+            for chunk in pack_messages([header] + failed, separator="\n"):
+                await message.answer(chunk)
     except Exception as exc:  # noqa: BLE001
         logger.exception("Error in handle_soft_signal: %s", exc)
         await message.answer("⚠️ Произошла ошибка при обработке сигнала")
+
+
+async def _journal(batch, metrics, message: Message) -> None:
+    """Пишет сигналы без ошибок в журнал; сбой журнала не мешает ответу."""
+    if not signal_journal.enabled:
+        return
+    try:
+        rows = journal_rows(batch, metrics, int(message.date.timestamp()))
+        await signal_journal.run(signal_journal.append, rows)
+    except Exception as exc:  # noqa: BLE001
+        logger.exception("Failed to journal signals: %s", exc)
+
+
+@soft_signal_router.message(Command("signal_stats"))
+async def handle_signal_stats(message: Message):
+    """Агрегаты журнала сигналов: /signal_stats [rr|leverage] [дней]."""
+    if not signal_journal.enabled:
+        await message.answer("Журнал сигналов отключён (SIGNAL_JOURNAL_PATH).")
+        return
+    args = (message.text or "").split()[1:]
+    days = next((int(a) for a in args if a.isdigit() and int(a) > 0), SIGNAL_STATS_DAYS)
+    kinds = [a.lower() for a in args if a.lower() in ("rr", "leverage")] or ["rr", "leverage"]
+
+    try:
+        started = time.perf_counter()
+        parts = [f"Сигналы за {days} дн."]
+        if "rr" in kinds:
+            stats = await signal_journal.run(signal_journal.rr_by_pair, days)
+            lines = [f"{'Пара':<12}{'N':>7}{'RR':>7}{'Плечо':>7}"]
+            lines += [f"{s.pair:<12}{s.count:>7}{s.avg_rr:>7.2f}{s.avg_leverage:>7.1f}" for s in stats[:30]]
+            if len(stats) > 30:
+                lines.append(f"… ещё пар: {len(stats) - 30}")
+            parts.append("Средний RR по парам:\n<pre>" + escape("\n".join(lines)) + "</pre>" if stats else "Нет сигналов.")
+        if "leverage" in kinds:
+            distribution = await signal_journal.run(signal_journal.leverage_by_timeframe, days)
+            lines = ["ТФ    " + "".join(f"{label:>7}" for label in LEVERAGE_BUCKET_LABELS)]
+            lines += [f"{tf:<6}" + "".join(f"{n:>7}" for n in counts) for tf, counts in distribution.items()]
+            parts.append(
+                "Плечо по таймфреймам:\n<pre>" + escape("\n".join(lines)) + "</pre>" if distribution else "Нет сигналов."
+            )
+        parts.append(f"<i>{(time.perf_counter() - started) * 1000:.0f} мс</i>")
+        for chunk in pack_messages(parts):
+            await message.answer(chunk)
+    except Exception as exc:  # noqa: BLE001
+        logger.exception("Error in handle_signal_stats: %s", exc)
+        await message.answer("⚠️ Не удалось прочитать журнал сигналов")
@@ -1,5 +1,18 @@
 from .spam_protection import AntiSpamMiddleware
+from .access_context import AccessContextMiddleware
+from .metrics import CommandMetricsMiddleware, FirstUpdateMiddleware, TelegramApiMetricsMiddleware
+from .tracing import TracingMiddleware, TracingRequestMiddleware
+from .update_recorder import UpdateRecorderMiddleware
 
-__all__ = ["AntiSpamMiddleware"]
+__all__ = [
+    "AntiSpamMiddleware",
+    "AccessContextMiddleware",
+    "CommandMetricsMiddleware",
+    "FirstUpdateMiddleware",
+    "TelegramApiMetricsMiddleware",
+    "TracingMiddleware",
+    "TracingRequestMiddleware",
+    "UpdateRecorderMiddleware",
+]
 
 
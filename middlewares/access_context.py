@@ -0,0 +1,30 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from filters.admin_only import admin_registry
+from filters.private_only import is_private_chat
+
+
+class AccessContextMiddleware(BaseMiddleware):
+    """Единая точка авторизации: вычисляет права один раз на апдейт.
+
+    Кладёт в data флаги ``is_private`` и ``is_admin``, которые затем читают
+    фильтры PrivateOnly / AdminOnly / NonAdminOnly во всех роутерах,
+    вместо того чтобы каждый фильтр заново разбирал апдейт и список ADMINS.
+    Регистрируется как outer-middleware на dp.update, после UserContextMiddleware.
+    """
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        admin_registry.refresh_if_changed()
+
+        user = data.get("event_from_user")
+        data["is_admin"] = bool(user) and admin_registry.is_admin(user.id)
+        data["is_private"] = is_private_chat(data.get("event_chat"))
+        return await handler(event, data)
@@ -0,0 +1,69 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import Message, TelegramObject
+
+from utils import startup
+from utils.metrics import COMMAND_DURATION_SECONDS, TELEGRAM_API_ERRORS_TOTAL, TELEGRAM_API_SECONDS
+
+# Команды, для которых собираем гистограмму задержки (остальные не плодят меток).
+# /create_invoice и /create_user_pdf — многошаговые FSM: ответ на саму команду — лишь
+# первый вопрос, поэтому их bot_command_duration_seconds{command} пишут хендлеры
+# с шага, который рендерит и отправляет документ
+TRACKED_COMMANDS = {"okx", "forex", "soft_signal"}
+
+
+def _command_name(message: Message) -> str | None:
+    text = message.text or message.caption or ""
+    if not text.startswith("/"):
+        return None
+    command = text.split(maxsplit=1)[0][1:].split("@", 1)[0].lower()
+    return command if command in TRACKED_COMMANDS else None
+
+
+class CommandMetricsMiddleware(BaseMiddleware):
+    """Замеряет полное время обработки отслеживаемых команд (outer-middleware на dp.message)."""
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        command = _command_name(event) if isinstance(event, Message) else None
+        if command is None:
+            return await handler(event, data)
+        with COMMAND_DURATION_SECONDS.time(command=command):
+            return await handler(event, data)
+
+
+class FirstUpdateMiddleware(BaseMiddleware):
+    """Фиксирует этап старта first_update после обработки первого апдейта (outer-middleware на dp.update)."""
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        try:
+            return await handler(event, data)
+        finally:
+            startup.mark("first_update")
+
+
+class TelegramApiMetricsMiddleware(BaseRequestMiddleware):
+    """Замеряет длительность и ошибки запросов к Bot API (bot.session.middleware)."""
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as exc:
+            TELEGRAM_API_ERRORS_TOTAL.inc(method=name, error=type(exc).__name__)
+            raise
+        finally:
+            TELEGRAM_API_SECONDS.observe(time.perf_counter() - started, method=name)
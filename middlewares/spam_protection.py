@@ -1,23 +1,241 @@
+import hashlib
+import logging
+import os
+import struct
+import sys
+import tempfile
 import time
-from collections import defaultdict, deque
-from typing import Callable, Dict, Any
+from collections import OrderedDict
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
 from aiogram import BaseMiddleware
-from aiogram.types import TelegramObject
 from aiogram import Bot
-import logging
+from aiogram.types import TelegramObject
 
 logger = logging.getLogger(__name__)
 
 
+# Результат проверки пользователя лимитером
+ALLOW = 0
+BLOCK_NOTIFY = 1  # пользователь только что заблокирован — нужно одно уведомление
+BLOCK_SILENT = 2  # пользователь уже заблокирован и уведомлён — молча игнорируем
+
+# Служебный аккаунт Telegram: from_user автоматически пересланных постов каналов
+TELEGRAM_SERVICE_USER_ID = 777000
+
+
+def _is_automatic_forward(event: TelegramObject) -> bool:
+    """Пост канала, автоматически пересланный Telegram в чат обсуждения.
+
+    Сообщения «от имени канала» (sender_chat) сюда не относятся: так может
+    написать любой владелец канала, и лимит для них действует.
+    """
+    # На уровне dp.update event — Update, само сообщение в Update.event
+    message = getattr(event, "event", event)
+    return bool(getattr(message, "is_automatic_forward", None))
+
+
+def _apply_limit(
+    record: List[float], now: float, capacity: float, rate: float, block_duration: float
+) -> int:
+    """Обновляет состояние пользователя по алгоритму token bucket.
+
+    record = [tokens, updated_at, blocked_until, notified] и изменяется на месте.
+    """
+    tokens, updated_at, blocked_until, notified = record
+
+    if now < blocked_until:
+        if notified:
+            return BLOCK_SILENT
+        record[3] = 1.0
+        return BLOCK_NOTIFY
+
+    if blocked_until:
+        # Блокировка закончилась — начинаем с полного ведра
+        tokens, updated_at, blocked_until = capacity, now, 0.0
+
+    tokens = min(capacity, tokens + max(0.0, now - updated_at) * rate)
+    if tokens < 1.0:
+        record[:] = [0.0, now, now + block_duration, 1.0]
+        return BLOCK_NOTIFY
+
+    record[:] = [tokens - 1.0, now, blocked_until, 0.0]
+    return ALLOW
+
+
+class InMemorySpamState:
+    """Состояние лимитера в памяти процесса с ограниченным размером.
+
+    Записи хранятся в OrderedDict в порядке последнего обращения, поэтому
+    вытеснение устаревших (старше ttl) и лишних (сверх max_users) записей
+    выполняется с начала словаря за амортизированное O(1).
+    """
+
+    def __init__(self, max_users: int = 10_000, ttl: float = 600) -> None:
+        self.max_users = max_users
+        self.ttl = ttl
+        self._records: "OrderedDict[int, List[float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def hit(self, uid: int, now: float, capacity: float, rate: float, block_duration: float) -> int:
+        record = self._records.get(uid)
+        if record is None:
+            record = [capacity, now, 0.0, 0.0]
+            self._records[uid] = record
+        else:
+            self._records.move_to_end(uid)
+
+        decision = _apply_limit(record, now, capacity, rate, block_duration)
+        self._evict(now, keep=uid)
+        return decision
+
+    def _evict(self, now: float, keep: int) -> None:
+        records = self._records
+        while records:
+            uid, record = next(iter(records.items()))
+            if uid == keep:
+                break
+            expired = now - record[1] > self.ttl and now >= record[2]
+            if not expired and len(records) <= self.max_users:
+                break
+            records.popitem(last=False)
+
+
+class SharedMemorySpamState:
+    """Состояние лимитера в разделяемой памяти для нескольких процессов бота.
+
+    Фиксированная таблица из ``slots`` записей (uid, tokens, updated_at,
+    blocked_until, notified) с открытой адресацией в пределах окна ``probe``
+    слотов. Если подходящего слота нет, вытесняется запись с самым старым
+    обращением. Доступ между процессами сериализуется через flock.
+    """
+
+    _RECORD = struct.Struct("<qdddd")
+
+    def __init__(
+        self,
+        name: str,
+        slots: int = 16_384,
+        ttl: float = 600,
+        probe: int = 8,
+        lock_path: Optional[str] = None,
+    ) -> None:
+        self.slots = slots
+        self.ttl = ttl
+        self.probe = probe
+        # flock есть только в POSIX; режиму без разделяемой памяти модуль не нужен
+        import fcntl
+
+        self._fcntl = fcntl
+        size = slots * self._RECORD.size
+        try:
+            self._shm = self._open(name, create=True, size=size)
+        except FileExistsError:
+            self._shm = self._open(name, create=False, size=0)
+            if self._shm.size < size:
+                raise ValueError(f"Сегмент разделяемой памяти {name} меньше ожидаемого")
+        lock_path = lock_path or os.path.join(tempfile.gettempdir(), f"{name}.lock")
+        self._lock_fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+
+    @staticmethod
+    def _open(name: str, create: bool, size: int) -> shared_memory.SharedMemory:
+        # Сегмент общий для независимых процессов: не даём resource_tracker
+        # удалить его при завершении первого же процесса
+        if sys.version_info >= (3, 13):
+            return shared_memory.SharedMemory(name=name, create=create, size=size, track=False)
+        shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+        # До 3.13 сегмент регистрируется и при подключении; трекер хранит имя с "/"
+        resource_tracker.unregister(f"/{shm.name}", "shared_memory")
+        return shm
+
+    def _slot_index(self, uid: int) -> int:
+        digest = hashlib.blake2b(uid.to_bytes(8, "little", signed=True), digest_size=8).digest()
+        return int.from_bytes(digest, "little") % self.slots
+
+    def hit(self, uid: int, now: float, capacity: float, rate: float, block_duration: float) -> int:
+        buf = self._shm.buf
+        size = self._RECORD.size
+        start = self._slot_index(uid)
+
+        self._fcntl.flock(self._lock_fd, self._fcntl.LOCK_EX)
+        try:
+            target = None
+            victim, victim_seen = None, float("inf")
+            for i in range(self.probe):
+                idx = (start + i) % self.slots
+                slot_uid, tokens, updated_at, blocked_until, notified = self._RECORD.unpack_from(
+                    buf, idx * size
+                )
+                if slot_uid == uid:
+                    target = idx
+                    record = [tokens, updated_at, blocked_until, notified]
+                    break
+                # Пустые и устаревшие слоты занимаем в первую очередь, иначе — самый старый
+                free = slot_uid == 0 or (now - updated_at > self.ttl and now >= blocked_until)
+                seen = -1.0 if free else updated_at
+                if seen < victim_seen:
+                    victim, victim_seen = idx, seen
+
+            if target is None:
+                target = victim
+                record = [capacity, now, 0.0, 0.0]
+
+            decision = _apply_limit(record, now, capacity, rate, block_duration)
+            self._RECORD.pack_into(buf, target * size, uid, *record)
+            return decision
+        finally:
+            self._fcntl.flock(self._lock_fd, self._fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        self._shm.close()
+        os.close(self._lock_fd)
+
+
 class AntiSpamMiddleware(BaseMiddleware):
-    def __init__(self, bot: Bot, limit=5, interval=2, block_duration=30):
+    """Антиспам на token bucket: не больше ``limit`` апдейтов за ``interval`` секунд.
+
+    При превышении лимита пользователь блокируется на ``block_duration`` секунд
+    и получает ровно одно уведомление за окно блокировки. Память ограничена:
+    состояние неактивных пользователей вытесняется по TTL.
+
+    Если задана переменная окружения ANTISPAM_SHM_NAME, состояние хранится
+    в разделяемой памяти и лимит общий для всех процессов бота.
+
+    Апдейты типов ``exempt_update_types`` лимитом не считаются: inline-запрос
+    приходит на каждое нажатие клавиши, его частоту сдерживает debounce
+    в handlers/inline_mode.py. Автопересылки постов каналов тоже не считаются:
+    все они приходят от одного служебного аккаунта 777000, и лимит
+    отбрасывал бы комментарии при одновременных постах; их поток
+    ограничивает utils/comment_dispatcher.py.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        limit=5,
+        interval=2,
+        block_duration=30,
+        max_users: int = 10_000,
+        ttl: float = 600,
+        shm_name: Optional[str] = None,
+        exempt_update_types: Tuple[str, ...] = ("inline_query",),
+    ):
         super().__init__()
         self.bot = bot
         self.limit = limit
         self.interval = interval
         self.block_duration = block_duration
-        self.user_spam_tracker: Dict[int, deque] = defaultdict(deque)
-        self.user_blocked_until: Dict[int, float] = {}
+        self.rate = limit / interval
+        self.exempt_update_types = exempt_update_types
+
+        shm_name = shm_name or os.getenv("ANTISPAM_SHM_NAME")
+        if shm_name:
+            self.state = SharedMemorySpamState(shm_name, slots=max_users, ttl=ttl)
+        else:
+            self.state = InMemorySpamState(max_users=max_users, ttl=ttl)
 
     async def __call__(
             self,
@@ -28,28 +246,34 @@ class AntiSpamMiddleware(BaseMiddleware):
         # На уровне dp.update event может быть типом Update и не содержать from_user.
         # Aiogram добавляет в data ключи event_from_user / event_chat через UserContextMiddleware.
         user = data.get("event_from_user") or getattr(event, "from_user", None)
-        if not user:
+        if (
+            not user
+            or getattr(event, "event_type", None) in self.exempt_update_types
+            or user.id == TELEGRAM_SERVICE_USER_ID
+            or _is_automatic_forward(event)
+        ):
             return await handler(event, data)
 
-        now = time.time()
-        uid = user.id
-
-        if uid in self.user_blocked_until and now < self.user_blocked_until[uid]:
-            logger.warning(f"Пользователь {user.full_name} {user.id} заблокирован за спам")
-            await self.bot.send_message(uid, "🚫 Пожалуйста, не спамьте. Подождите 30 секунд.")
-            return
-
-        timestamps = self.user_spam_tracker[uid]
-        timestamps.append(now)
-
-        while timestamps and now - timestamps[0] > self.interval:
-            timestamps.popleft()
-
-        if len(timestamps) > self.limit:
-            self.user_blocked_until[uid] = now + self.block_duration
-            self.user_spam_tracker[uid].clear()
-            logger.warning(f"🔒 Пользователь {user.full_name} временно заблокирован за спам")
-            await self.bot.send_message(uid, "🚫 Пожалуйста, не спамьте. Подождите 30 секунд.")
-            return
+        # Сообщения «от имени канала» приходят от одного общего from_user Telegram:
+        # лимит считаем по самому каналу, а не общий на всех
+        sender_chat = getattr(getattr(event, "event", event), "sender_chat", None)
+        decision = self.state.hit(
+            sender_chat.id if sender_chat else user.id, time.time(), self.limit, self.rate, self.block_duration
+        )
+        if decision == ALLOW:
+            return await handler(event, data)
 
-        return await handler(event, data)
+        if decision == BLOCK_NOTIFY and sender_chat:
+            # Каналу личное сообщение не отправить
+            logger.warning(f"🔒 Канал {sender_chat.id} временно заблокирован за спам")
+        elif decision == BLOCK_NOTIFY:
+            logger.warning(f"🔒 Пользователь {user.full_name} {user.id} временно заблокирован за спам")
+            try:
+                await self.bot.send_message(
+                    user.id,
+                    f"🚫 Пожалуйста, не спамьте. Подождите {self.block_duration} секунд.",
+                )
+            except Exception as e:
+                # Пользователь мог не начинать диалог с ботом (например, спам в чате обсуждения)
+                logger.warning(f"Не удалось уведомить пользователя {user.id} о блокировке: {e}")
+        return
@@ -0,0 +1,39 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject, Update
+
+from utils.tracing import span
+
+
+class TracingMiddleware(BaseMiddleware):
+    """Открывает корневой span на каждый апдейт (outer-middleware на dp.update)."""
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        attributes: Dict[str, Any] = {}
+        if isinstance(event, Update):
+            attributes["update.id"] = event.update_id
+            attributes["update.type"] = event.event_type
+            message = event.message
+            if message is not None and message.text and message.text.startswith("/"):
+                attributes["command"] = message.text.split(maxsplit=1)[0]
+        user = data.get("event_from_user")
+        if user is not None:
+            attributes["user.id"] = user.id
+
+        with span("update", **attributes):
+            return await handler(event, data)
+
+
+class TracingRequestMiddleware(BaseRequestMiddleware):
+    """Дочерний span на каждый запрос к Bot API (в т.ч. загрузку фото и документов)."""
+
+    async def __call__(self, make_request, bot, method):
+        with span(f"telegram.{type(method).__name__}"):
+            return await make_request(bot, method)
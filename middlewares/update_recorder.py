@@ -0,0 +1,119 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import secrets
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from misc.soft_signal import parse_inline_signal
+
+logger = logging.getLogger(__name__)
+
+# Поля с персональными данными, которые заменяются целиком
+_NAME_FIELDS = ("first_name", "last_name", "username", "title", "file_name", "phone_number", "email")
+# Поля с идентификаторами пользователей и чатов
+_ID_FIELDS = ("id", "user_id", "chat_id")
+# Идентификаторы файлов: с токеном бота по ним скачивается сам загруженный файл
+_FILE_ID_FIELDS = ("file_id", "file_unique_id")
+# Поля, которые не пишутся вовсе: геопозиция и карточка контакта
+_DROPPED_FIELDS = ("location", "venue", "vcard")
+_LETTER_RE = re.compile(r"[^\W\d_]", re.UNICODE)
+_DIGIT_RE = re.compile(r"\d")
+
+
+def mask_text(text: str) -> str:
+    """Маскирует свободный ввод: буквы -> x, цифры -> 1, разметка остаётся.
+
+    Форма ввода сохраняется, поэтому при воспроизведении проходят те же
+    проверки FSM (email, дата ДД/ММ/ГГГГ, числа), но сами данные не пишутся.
+    """
+    return _DIGIT_RE.sub("1", _LETTER_RE.sub("x", text))
+
+
+def _is_trading_query(query: str) -> bool:
+    """Inline-запрос с торговыми параметрами (карточка okx или сигнал), как текст команд."""
+    query = " ".join(query.split())
+    return query.lower().startswith("okx ") or parse_inline_signal(query) is not None
+
+
+class UpdateRecorderMiddleware(BaseMiddleware):
+    """Пишет входящие апдейты в JSON Lines для последующего воспроизведения.
+
+    Каждая строка: ``{"ts": <unix time>, "is_admin": bool, "update": {...}}``.
+    Апдейт обезличивается:
+
+    - id пользователей и чатов заменяются стабильным псевдонимом (HMAC с солью),
+      знак id сохраняется, id каналов остаются как есть — по ним ищутся настройки
+      комментариев в channels.json;
+    - имена, username, названия, имена файлов, file_id и file_unique_id
+      заменяются заглушками (при воспроизведении файл подставляется локальный);
+    - геопозиция (location, venue) и vCard контакта не пишутся, телефон
+      контакта маскируется mask_text();
+    - текст команд (/okx, /forex, /soft_signal — торговые параметры) и такие же
+      inline-запросы сохраняются, остальной текст и запросы (ответы в FSM: имя,
+      телефон, email) маскируются mask_text().
+
+    Регистрируется outer-middleware на dp.update после AccessContextMiddleware,
+    чтобы записать флаг is_admin: при воспроизведении администраторами
+    назначаются их псевдонимы.
+    """
+
+    def __init__(self, path: str, salt: Optional[str] = None) -> None:
+        self.path = path
+        self._salt = (salt or secrets.token_hex(16)).encode()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def pseudonym(self, value: int) -> int:
+        digest = hashlib.blake2b(str(abs(value)).encode(), key=self._salt, digest_size=5).digest()
+        alias = int.from_bytes(digest, "big") % 9_000_000_000 + 1_000_000_000
+        return -alias if value < 0 else alias
+
+    def _anonymize(self, node: Any, key: str = "") -> Any:
+        if isinstance(node, dict):
+            if key == "contact" and isinstance(node.get("phone_number"), str):
+                # Форма номера сохраняется для проверок при воспроизведении
+                node = {**node, "phone_number": mask_text(node["phone_number"])}
+                return {k: (v if k == "phone_number" else self._anonymize(v, k))
+                        for k, v in node.items() if k not in _DROPPED_FIELDS}
+            if node.get("type") == "channel":
+                return {k: (v if k == "id" else self._anonymize(v, k)) for k, v in node.items()}
+            return {k: self._anonymize(v, k) for k, v in node.items() if k not in _DROPPED_FIELDS}
+        if isinstance(node, list):
+            return [self._anonymize(item, key) for item in node]
+        if key in _ID_FIELDS and isinstance(node, int):
+            return self.pseudonym(node)
+        if key in _NAME_FIELDS + _FILE_ID_FIELDS and isinstance(node, str):
+            return key
+        if key in ("text", "caption") and isinstance(node, str) and not node.startswith("/"):
+            return mask_text(node)
+        if key == "query" and isinstance(node, str) and not _is_trading_query(node):
+            return mask_text(node)
+        return node
+
+    def record(self, update: Update, is_admin: bool) -> None:
+        payload = update.model_dump(mode="json", by_alias=True, exclude_none=True, exclude_defaults=True)
+        line = {"ts": round(time.time(), 3), "is_admin": is_admin, "update": self._anonymize(payload)}
+        self._file.write(json.dumps(line, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        if isinstance(event, Update):
+            try:
+                self.record(event, bool(data.get("is_admin")))
+            except (OSError, ValueError) as exc:
+                logger.warning("Failed to record update %s: %s", event.update_id, exc)
+        return await handler(event, data)
+
+    def close(self) -> None:
+        self._file.close()
@@ -0,0 +1,77 @@
+"""Рендер документов: инвойс /create_invoice и титульная страница /create_user_pdf.
+
+Заполнение шаблона и рендер в PDF одним вызовом — его используют хендлеры
+(через misc.render_backend), сервис рендеринга (render_service.py) и прогрев.
+Результат — (HTML, PDF, успех); временные файлы удаляет вызывающий
+функциями remove_*_files.
+"""
+
+import logging
+import os
+import shutil
+import uuid
+from typing import Tuple
+
+from misc.constants import PDF_HTML_PATH
+from misc.utils import cleanup_files, fill_pdf_html, fill_title_html
+from utils.render_jobs import RenderJob
+from utils.render_pdf import html_to_pdf_playwright
+
+DocumentResult = Tuple[str, str, bool]
+
+
+async def render_invoice(data: dict, job: RenderJob) -> DocumentResult:
+    """Заполняет шаблон и рендерит PDF инвойса; возвращает (HTML, PDF, успех)."""
+    submission_id = uuid.uuid4().hex
+
+    # Обрабатываем order_number для имени файла
+    order_number = data.get("order_number", "")
+    padded_order_number = order_number.zfill(6) if len(order_number) < 6 else order_number
+
+    # Создаем временный HTML файл с подстановками
+    temp_html_path = fill_pdf_html(data, submission_id, PDF_HTML_PATH)
+
+    # Создаем путь для PDF файла с правильным именем в той же временной директории
+    temp_pdf_path = os.path.join(os.path.dirname(temp_html_path), f"invoice_{padded_order_number}.pdf")
+
+    # Конвертируем HTML в PDF
+    logging.info(f"Начинаю генерацию PDF: HTML={temp_html_path}, PDF={temp_pdf_path}")
+    # CSS файл уже скопирован в временную директорию вместе с HTML
+    css_file_path = os.path.join(os.path.dirname(temp_html_path), "styles.css")
+    success = await html_to_pdf_playwright(
+        html_file_path=temp_html_path,
+        output_pdf_path=temp_pdf_path,
+        css_file_path=css_file_path,
+        job=job,
+    )
+    if success:
+        # PyPDF2 нужен только для оптимизации: не тянем его при старте бота
+        from utils.pdf_optimize import optimize_output
+
+        await optimize_output(temp_pdf_path)
+    return temp_html_path, temp_pdf_path, success
+
+
+def remove_invoice_files(result: DocumentResult) -> None:
+    if result[0]:
+        shutil.rmtree(os.path.dirname(result[0]), ignore_errors=True)
+
+
+async def render_title(user_name: str, job: RenderJob) -> DocumentResult:
+    """Заполняет шаблон титульной страницы и рендерит её в PDF; возвращает (HTML, PDF, успех)."""
+    temp_html_path = fill_title_html(user_name)
+    title_pdf_path = f"temp/title_{uuid.uuid4().hex}.pdf"
+
+    # Конвертируем HTML в PDF с альбомной ориентацией
+    logging.info(f"Начинаю создание титульной страницы: HTML={temp_html_path}, PDF={title_pdf_path}")
+    success = await html_to_pdf_playwright(
+        html_file_path=temp_html_path,
+        output_pdf_path=title_pdf_path,
+        landscape=True,
+        job=job,
+    )
+    return temp_html_path, title_pdf_path, success
+
+
+def remove_title_files(result: DocumentResult) -> None:
+    cleanup_files([path for path in result[:2] if path])
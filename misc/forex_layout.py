@@ -0,0 +1,110 @@
+"""
+Раскладка карточек /forex для рендера без браузера (utils.raster_card).
+
+Повторяет forex_html/buy-light.html и sell-light.html со style.css: те же
+размеры, отступы, шрифты и цвета. При правке шаблона или стилей
+спецификацию нужно поправить тоже и сверить с Chromium:
+python -m bench.forex_raster.
+"""
+
+from typing import Dict
+
+from utils.raster_card import Box, Card, Grid, Span, Svg, Text
+
+# Цвета CSS-классов, которые подставляются плейсхолдерами ({profit_class}, {sl_class}, ...)
+FOREX_PALETTE = {
+    "text-red": "#EC483E",
+    "text-green": "#20AC37",
+    "text-gray-8": "#4F4E53",
+    "blue": "#2386EC",
+    "red": "#E73932",
+}
+
+_TEXT_GRAY_4 = "#707072"
+_TEXT_GRAY_6 = "#474749"
+_TEXT_GRAY_7 = "#949494"
+_TEXT_GRAY_8 = "#4F4E53"
+_GRID_FONT = "Microsoft Sans Serif"
+
+
+def _grid_item(label: str, value: str, value_color: str, padding_right: float = 0) -> Box:
+    return Box(
+        [Text(label, _GRID_FONT, 42, _TEXT_GRAY_4), Text(value, _GRID_FONT, 42, value_color)],
+        justify="space-between",
+        padding=(0, padding_right, 0, 0),
+    )
+
+
+def _forex_card(side_color: str) -> Card:
+    header = Box(
+        [
+            Box(
+                [
+                    Text(
+                        "{pair} ", "Ubuntu Condensed", 49, "#000000", weight=700,
+                        spans=[Span("{side} {side_price}", side_color, family="Roboto Condensed")],
+                    ),
+                    Text("#{ticket}", "Roboto", 38, _TEXT_GRAY_6),
+                ],
+                justify="space-between",
+            ),
+            Box([Text("{desc}", "Roboto", 40, _TEXT_GRAY_7)], justify="space-between"),
+        ],
+        direction="column",
+        padding=(20, 15, 20, 15),
+        background="#F1F1F1",
+    )
+    numbers = Box(
+        [
+            Box(
+                [
+                    Text("{open} → {close}", "Roboto", 47, _TEXT_GRAY_8, margin_bottom=10),
+                    Box(
+                        [
+                            Text("∆ = {delta} ({pct}%)", "Roboto", 41, "{profit_class}"),
+                            Svg("delta_arrow_svg", "{profit_class}"),
+                        ],
+                        align="center",
+                        gap=20,
+                    ),
+                ],
+                direction="column",
+            ),
+            Text("{profit}", "Roboto Condensed", 53, "{profit_class}", weight=700),
+        ],
+        justify="space-between",
+    )
+    content = Box(
+        [
+            numbers,
+            Text("{open_dt} → {close_dt}", _GRID_FONT, 40, _TEXT_GRAY_8),
+            Grid(
+                [
+                    _grid_item("S/L:", "{sl}", "{sl_class}", padding_right=120),
+                    _grid_item("Своп:", "{swap}", _TEXT_GRAY_8),
+                    _grid_item("T/P:", "{tp}", "{tp_class}", padding_right=120),
+                    _grid_item("Комиссия:", "{fee}", _TEXT_GRAY_8),
+                ],
+                columns=2,
+                gap=20,
+            ),
+        ],
+        direction="column",
+        justify="space-between",
+        padding=(20, 15, 20, 15),
+        grow=True,
+    )
+    return Card(
+        width=1142,
+        height=564,
+        radius=20,
+        background="#F8F8F8",
+        body=Box([header, content], direction="column"),
+        palette=FOREX_PALETTE,
+    )
+
+
+FOREX_LAYOUTS: Dict[str, Card] = {
+    "buy-light.html": _forex_card("#1387F6"),
+    "sell-light.html": _forex_card("#EC483E"),
+}
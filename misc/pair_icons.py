@@ -0,0 +1,129 @@
+"""Индекс иконок торговых пар для карточек /okx.
+
+Иконки из tradehtml/icons один раз загружаются в память, иконки крупнее
+размера, в котором они рисуются на карточке (36 CSS px × device_scale_factor 6
+= 216 px), уменьшаются до него, и всё отдаётся шаблону как data: URI. Рендер
+больше не копирует папку иконок, а поиск пары — один dict-lookup.
+
+Пара ищется по нормализованному ключу, поэтому BTCUSDT, btc-usdt, BTC/USDT,
+BTCUSDT.P, BTC-USDT-SWAP и просто BTC дают одну и ту же иконку. Для
+неизвестной пары возвращается иконка BTCUSDT, как и раньше.
+
+Pillow необязателен: без него иконки отдаются без изменения размера.
+Индекс строится при старте в фоновом прогреве (misc/warmup.py) или при первом
+обращении.
+"""
+
+import base64
+import io
+import logging
+import re
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+ICONS_DIR = Path(__file__).resolve().parents[1] / "tradehtml" / "icons"
+FALLBACK_PAIR = "BTCUSDT"
+# <img width="36" height="36"> в long.html/short.html при device_scale_factor=6 в html_to_image
+ICON_DISPLAY_PX = 36
+ICON_SCALE = 6
+QUOTE_ASSETS = ("USDT", "USDC", "USD")
+
+_SEPARATORS_RE = re.compile(r"[\s\-_/:]")
+# Суффиксы бессрочных контрактов: BTCUSDT.P, BTC-USDT-SWAP, BTCUSDT_PERP
+_CONTRACT_SUFFIX_RE = re.compile(r"(\.P|SWAP|PERP)$")
+
+
+def normalize_pair(pair: str) -> str:
+    """Приводит написание пары к виду BTCUSDT."""
+    key = _SEPARATORS_RE.sub("", (pair or "").upper())
+    stripped = _CONTRACT_SUFFIX_RE.sub("", key)
+    # Суффикс контракта отрезаем только после котируемой валюты (PERPUSDT остаётся как есть)
+    return stripped if stripped.endswith(QUOTE_ASSETS) else key
+
+
+def _base_asset(pair_key: str) -> Optional[str]:
+    for quote in QUOTE_ASSETS:
+        if pair_key.endswith(quote) and len(pair_key) > len(quote):
+            return pair_key[: -len(quote)]
+    return None
+
+
+def _encode_icon(path: Path, size_px: int) -> str:
+    """data: URI иконки; растровые иконки крупнее size_px уменьшаются до size_px."""
+    data = path.read_bytes()
+    if path.suffix.lower() == ".svg":
+        # SVG масштабируется браузером без потерь
+        return f"data:image/svg+xml;base64,{base64.b64encode(data).decode()}"
+    try:
+        from PIL import Image
+    except ImportError:
+        return f"data:image/png;base64,{base64.b64encode(data).decode()}"
+
+    with Image.open(io.BytesIO(data)) as image:
+        # Размер читается из заголовка; мелкие иконки не перекодируем и не увеличиваем:
+        # увеличение только раздуло бы data: URI, браузер всё равно масштабирует при отрисовке
+        if max(image.size) > size_px:
+            image.thumbnail((size_px, size_px), Image.LANCZOS)
+            buffer = io.BytesIO()
+            image.convert("RGBA").save(buffer, format="PNG")
+            data = buffer.getvalue()
+    return f"data:image/png;base64,{base64.b64encode(data).decode()}"
+
+
+class PairIconIndex:
+    def __init__(self, icons_dir: Path = ICONS_DIR, size_px: int = ICON_DISPLAY_PX * ICON_SCALE) -> None:
+        self.icons_dir = icons_dir
+        self.size_px = size_px
+        self._icons: Dict[str, str] = {}
+        self._aliases: Dict[str, str] = {}
+        self._built = False
+        self._lock = threading.Lock()
+
+    def build(self) -> None:
+        """Загружает и масштабирует все иконки. Повторный вызов перестраивает индекс."""
+        with self._lock:
+            self._build()
+
+    def ensure_built(self) -> None:
+        if self._built:
+            return
+        with self._lock:
+            if not self._built:
+                self._build()
+
+    def _build(self) -> None:
+        icons: Dict[str, str] = {}
+        aliases: Dict[str, str] = {}
+        paths = sorted(self.icons_dir.glob("*.png")) + sorted(self.icons_dir.glob("*.svg"))
+        for path in paths:
+            key = normalize_pair(path.stem)
+            if key in icons:
+                continue
+            try:
+                icons[key] = _encode_icon(path, self.size_px)
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Skipping icon %s: %s", path.name, exc)
+                continue
+            base = _base_asset(key)
+            if base:
+                aliases.setdefault(base, key)
+        self._icons, self._aliases, self._built = icons, aliases, True
+        logger.info("Pair icon index built: %d icons, %dpx", len(icons), self.size_px)
+
+    def data_uri(self, pair: str) -> Optional[str]:
+        """data: URI иконки пары; для неизвестной пары — иконка BTCUSDT (None, если и её нет)."""
+        self.ensure_built()
+        key = normalize_pair(pair)
+        icon = self._icons.get(key) or self._icons.get(self._aliases.get(key, ""))
+        return icon or self._icons.get(FALLBACK_PAIR)
+
+    def __contains__(self, pair: str) -> bool:
+        self.ensure_built()
+        key = normalize_pair(pair)
+        return key in self._icons or key in self._aliases
+
+
+pair_icons = PairIconIndex()
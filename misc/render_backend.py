@@ -0,0 +1,101 @@
+"""Рендер для хендлеров: в процессе бота или через сервис рендеринга.
+
+Если задан RENDER_SERVICE_URL (utils.render_client.render_service), каждая
+функция — один запрос к render_service.py; иначе тот же рендер
+выполняется локально. Сигнатуры и результаты в обоих случаях одинаковы,
+поэтому хендлеры не знают, где именно рендерится документ. Сам сервис
+вызывает локальные функции напрямую (misc.documents, misc.trade_cards,
+misc.utils), а не этот модуль.
+"""
+
+import asyncio
+import logging
+from pathlib import Path
+
+from misc import documents
+from misc.trade_cards import render_forex_card, render_okx_card
+from misc.utils import merge_pdfs
+from utils.render_client import RenderServiceError, render_service
+from utils.render_jobs import RenderAborted, RenderJob
+
+logger = logging.getLogger(__name__)
+
+
+async def invoice_pdf(data: dict, job: RenderJob) -> documents.DocumentResult:
+    """PDF инвойса: (HTML, PDF, успех), как misc.documents.render_invoice."""
+    if render_service is None:
+        return await documents.render_invoice(data, job)
+    return await _remote_document("invoice", {"data": data}, job)
+
+
+async def title_pdf(user_name: str, job: RenderJob) -> documents.DocumentResult:
+    """Титульная страница /create_user_pdf: (HTML, PDF, успех)."""
+    if render_service is None:
+        return await documents.render_title(user_name, job)
+    return await _remote_document("title", {"user_name": user_name}, job)
+
+
+async def okx_card(template_name: str, fields: dict, output_path: Path, job: RenderJob) -> str:
+    """Карточка /okx в PNG по output_path; возвращает путь к файлу."""
+    if render_service is None:
+        return await render_okx_card(template_name, fields, output_path, job)
+    result = await render_service.call(
+        "okx_card", {"template": template_name, "fields": fields, "output_path": str(output_path)}, job
+    )
+    return result["path"]
+
+
+async def forex_card(template_name: str, values: dict, output_path: Path, job: RenderJob) -> str:
+    """Карточка /forex в PNG по уже посчитанным подстановкам (forex_substitutions)."""
+    if render_service is None:
+        return await render_forex_card(template_name, values, output_path, job)
+    result = await render_service.call(
+        "forex_card", {"template": template_name, "values": values, "output_path": str(output_path)}, job
+    )
+    return result["path"]
+
+
+async def merge(title_pdf_path: str, main_pdf_path: str, output_path: str) -> bool:
+    """Титул + документ, затем оптимизация результата (PDF_OPTIMIZE_PROFILE).
+
+    Объединение читает и пишет сотни мегабайт — не в потоке event loop.
+    """
+    if render_service is None:
+        return await merge_and_optimize(title_pdf_path, main_pdf_path, output_path)
+    try:
+        result = await render_service.call(
+            "merge_pdfs",
+            {
+                "title_pdf_path": title_pdf_path,
+                "main_pdf_path": main_pdf_path,
+                "output_path": output_path,
+                "optimize": True,
+            },
+            RenderJob("merge", None),
+        )
+    except RenderServiceError as exc:
+        logger.error("Render service merge failed: %s", exc)
+        return False
+    return result["ok"]
+
+
+async def merge_and_optimize(title_pdf_path: str, main_pdf_path: str, output_path: str) -> bool:
+    """Локальное объединение в отдельном потоке и оптимизация результата."""
+    if not await asyncio.to_thread(merge_pdfs, title_pdf_path, main_pdf_path, output_path):
+        return False
+    # PyPDF2 нужен только для оптимизации: не тянем его при старте бота
+    from utils.pdf_optimize import optimize_output
+
+    await optimize_output(output_path)
+    return True
+
+
+async def _remote_document(op: str, params: dict, job: RenderJob) -> documents.DocumentResult:
+    try:
+        result = await render_service.call(op, params, job)
+    except RenderAborted as exc:
+        # Как у локального рендера (html_to_pdf_playwright): сбой, дедлайн или отмена —
+        # это success=False, а не исключение; файлы за собой сервис удалил сам
+        logger.error("Render service %s failed: %s", op, exc)
+        return "", "", False
+    return result["html"], result["pdf"], result["ok"]
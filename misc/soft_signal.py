@@ -0,0 +1,422 @@
+"""Разбор, расчёт метрик и форматирование торговых сигналов /soft_signal.
+
+Сигнал (текстом):
+    PAIR TIMEFRAME
+
+    Short/Long
+    Price: <float>
+    TP: <float> (или TP1/TP2, если TP не указан)
+    SL: <float>
+
+    2026-03-19 15:41:32 (необязательная строка с датой/временем)
+
+В одном сообщении может быть несколько сигналов подряд: новый начинается со
+строки «PAIR TIMEFRAME». В inline-режиме сигнал пишется одной строкой
+(parse_inline_signal): «BTCUSDT 10m Short Price: 69129.8 TP: 67741.9 SL: 70605.5»
+или короче — «BTCUSDT 10m Short 69129.8 67741.9 70605.5». Исторические сигналы принимаются CSV-файлом с
+колонками pair, timeframe, side, price, tp, sl (остальные колонки
+сохраняются в отчёте как есть).
+
+Метрики считаются сразу для всей пачки на массивах NumPy:
+    % SL = |SL - Price| / Price × 100
+    % TP = |TP - Price| / Price × 100
+    RR = % TP / % SL (формат 1:X.XX)
+    Плечо = floor(40 / %SL), максимум 100
+
+NumPy импортируется при первом расчёте, а не при старте бота.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import math
+import re
+from typing import TYPE_CHECKING, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from utils.signal_journal import JournalRow
+
+if TYPE_CHECKING:
+    import numpy as np
+
+_TIMEFRAME_PATTERN = re.compile(r"(\d+)([mhd])", re.IGNORECASE)
+_DATE_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}")
+# Первая строка сигнала: пара и таймфрейм
+_HEADER_PATTERN = re.compile(r"^\s*[A-Za-z0-9]+\s+\d+[mhd]\s*$", re.IGNORECASE)
+# Однострочный сигнал: заголовок, сторона, затем Price/TP/SL с ключами или без
+_INLINE_PATTERN = re.compile(
+    r"^\s*(?P<header>[A-Za-z0-9]+\s+\d+[mhd])\s+(?P<side>\S+)\s+(?P<values>.+?)\s*$", re.IGNORECASE
+)
+_INLINE_VALUE_PATTERN = re.compile(r"(?:\b(price|tp\d*|sl)\s*[:=]?\s*)?(\d+(?:[.,]\d+)?)(?![\d:-])", re.IGNORECASE)
+
+CSV_COLUMNS = ("pair", "timeframe", "side", "price", "tp", "sl")
+CSV_RESULT_COLUMNS = ("sl_pct", "tp_pct", "rr", "leverage", "error")
+
+PARSE_ERROR = "не удалось распарсить сигнал"
+VALUES_ERROR = "некорректные Price/TP/SL"
+
+
+class SignalBatch(NamedTuple):
+    """Пачка сигналов: разобранные поля (None — ошибка разбора) и текст ошибки по каждому."""
+
+    signals: List[Optional[dict]]
+    errors: List[Optional[str]]
+    labels: List[str]
+
+
+def format_number(value: float) -> str:
+    """Форматирует число с пробелами между тысячами и запятой.
+
+    Примеры:
+        73330.0 → "73 330"
+        69129.8 → "69 129,8"
+        70605.5 → "70 605,5"
+    """
+    if value < 0:
+        sign = "-"
+        value = abs(value)
+    else:
+        sign = ""
+
+    # Проверяем, есть ли дробная часть
+    if value == int(value):
+        # Целое число — убираем дробную часть
+        formatted_integer = f"{int(value):,}".replace(",", " ")
+        return f"{sign}{formatted_integer}"
+    else:
+        # Есть дробная часть — округляем до 3 знаков и заменяем точку на запятую
+        str_value = f"{value:.3f}".rstrip("0").rstrip(".")
+        if "." in str_value:
+            integer_part, fractional_part = str_value.split(".")
+            formatted_integer = f"{int(integer_part):,}".replace(",", " ")
+            return f"{sign}{formatted_integer},{fractional_part}"
+        else:
+            formatted_integer = f"{int(str_value):,}".replace(",", " ")
+            return f"{sign}{formatted_integer}"
+
+
+def _parse_timeframe(value: str) -> Optional[str]:
+    # 10m → M10, 1h → H1, ...
+    match = _TIMEFRAME_PATTERN.fullmatch(value.strip())
+    if not match:
+        return None
+    return f"{match.group(2).upper()}{match.group(1)}"
+
+
+def _parse_position(value: str) -> Optional[str]:
+    position_raw = value.strip().lower()
+    if position_raw not in ("short", "long"):
+        return None
+    return "ШОРТ" if position_raw == "short" else "ЛОНГ"
+
+
+def parse_signal_message(text: str) -> dict | None:
+    """Парсит один сигнал.
+
+    Возвращает dict с полями: pair, timeframe, position_type, price, tp, sl
+    или None если формат неверный.
+    """
+    lines = [line.strip() for line in text.strip().split("\n") if line.strip()]
+
+    if len(lines) < 5:
+        return None
+
+    # Первая строка: PAIR и TIMEFRAME
+    first_line = lines[0].split()
+    if len(first_line) < 2:
+        return None
+
+    timeframe = _parse_timeframe(first_line[1])
+    if timeframe is None:
+        return None
+
+    # Вторая строка: позиция (Short/Long)
+    position_type = _parse_position(lines[1])
+    if position_type is None:
+        return None
+
+    # Остальные строки: ключ-значение
+    data = {"pair": first_line[0].upper(), "timeframe": timeframe, "position_type": position_type}
+
+    for line in lines[2:]:
+        # Пропускаем дату/время в конце
+        if _DATE_PATTERN.match(line):
+            continue
+
+        if ":" not in line:
+            continue
+
+        key, value = line.split(":", 1)
+        key = key.strip().lower()
+        value = value.strip()
+
+        try:
+            value_float = float(value)
+            if math.isnan(value_float) or math.isinf(value_float):
+                continue
+        except ValueError:
+            continue
+
+        if key == "price":
+            data["price"] = value_float
+        elif key == "tp":
+            data["tp"] = value_float
+        elif key.startswith("tp") and "tp" not in data:
+            # Фолбэк для TP1/TP2, если TP не указан
+            data["tp"] = value_float
+        elif key == "sl":
+            data["sl"] = value_float
+
+    # Проверяем наличие всех обязательных полей
+    required = ["pair", "timeframe", "position_type", "price", "tp", "sl"]
+    if not all(k in data for k in required):
+        return None
+
+    return data
+
+
+def split_signals(text: str) -> List[str]:
+    """Делит сообщение на сигналы: каждый начинается со строки «PAIR TIMEFRAME».
+
+    Текст до первого заголовка считается отдельным (заведомо ошибочным) сигналом,
+    чтобы опечатка в заголовке не склеивала два сигнала молча.
+    """
+    chunks: List[List[str]] = []
+    for line in text.strip().split("\n"):
+        if _HEADER_PATTERN.match(line) or not chunks:
+            chunks.append([])
+        chunks[-1].append(line)
+    return ["\n".join(chunk).strip() for chunk in chunks if "\n".join(chunk).strip()]
+
+
+def parse_signals_text(text: str) -> SignalBatch:
+    chunks = split_signals(text)
+    signals = [parse_signal_message(chunk) for chunk in chunks]
+    return SignalBatch(
+        signals=signals,
+        errors=[None if signal else PARSE_ERROR for signal in signals],
+        labels=[chunk.split("\n", 1)[0].strip() for chunk in chunks],
+    )
+
+
+def parse_inline_signal(query: str) -> dict | None:
+    """Парсит однострочный сигнал inline-запроса; None, если он ещё не дописан.
+
+    Значения с ключами (Price:/TP:/SL:, двоеточие или «=» необязательны) берутся
+    по ключам, без ключей — по порядку Price, TP, SL. Дата/время в конце
+    пропускаются. Дальше строка собирается в многострочный сигнал и разбирается
+    parse_signal_message, поэтому правила те же, что у /soft_signal.
+    """
+    match = _INLINE_PATTERN.match(query)
+    if not match:
+        return None
+    values: Dict[str, str] = {}
+    positional: List[str] = []
+    for key, number in _INLINE_VALUE_PATTERN.findall(match["values"]):
+        if key:
+            values.setdefault(key.lower(), number.replace(",", "."))
+        else:
+            positional.append(number.replace(",", "."))
+    for key in ("price", "tp", "sl"):
+        if key not in values and positional:
+            values[key] = positional.pop(0)
+    lines = [match["header"], match["side"]] + [f"{key}: {value}" for key, value in values.items()]
+    return parse_signal_message("\n".join(lines))
+
+
+def _csv_float(value: str) -> Optional[float]:
+    try:
+        number = float((value or "").strip().replace(",", "."))
+    except ValueError:
+        return None
+    return number if math.isfinite(number) else None
+
+
+def read_signals_csv(data: bytes, max_rows: int) -> Tuple[SignalBatch, List[dict], List[str]]:
+    """Разбирает CSV сигналов; возвращает пачку, исходные строки и исходные колонки.
+
+    Разделитель (запятая или точка с запятой) определяется по заголовку. Ошибка
+    формата файла целиком — ValueError с текстом для пользователя.
+    """
+    text = data.decode("utf-8-sig", errors="replace")
+    header = text.split("\n", 1)[0]
+    delimiter = ";" if header.count(";") > header.count(",") else ","
+    reader = csv.DictReader(io.StringIO(text), delimiter=delimiter)
+    fieldnames = [name.strip() for name in reader.fieldnames or []]
+    missing = [column for column in CSV_COLUMNS if column not in {name.lower() for name in fieldnames}]
+    if missing:
+        raise ValueError(f"в CSV нет колонок: {', '.join(missing)}")
+    reader.fieldnames = fieldnames
+
+    rows: List[dict] = []
+    signals: List[Optional[dict]] = []
+    errors: List[Optional[str]] = []
+    labels: List[str] = []
+    for row in reader:
+        if len(rows) >= max_rows:
+            raise ValueError(f"в CSV больше {max_rows} строк")
+        rows.append(row)
+        values = {key.lower(): (value or "") for key, value in row.items() if key}
+        # Номер строки в файле: заголовок — первая
+        labels.append(f"строка {len(rows) + 1}")
+        timeframe = _parse_timeframe(values["timeframe"])
+        position_type = _parse_position(values["side"])
+        numbers = {key: _csv_float(values[key]) for key in ("price", "tp", "sl")}
+        bad = [key for key, number in numbers.items() if number is None]
+        if timeframe is None:
+            bad.insert(0, "timeframe")
+        if position_type is None:
+            bad.insert(0, "side")
+        if not values["pair"].strip():
+            bad.insert(0, "pair")
+        if bad:
+            signals.append(None)
+            errors.append(f"{PARSE_ERROR} ({', '.join(bad)})")
+            continue
+        signals.append({
+            "pair": values["pair"].strip().upper(),
+            "timeframe": timeframe,
+            "position_type": position_type,
+            **numbers,
+        })
+        errors.append(None)
+    return SignalBatch(signals, errors, labels), rows, fieldnames
+
+
+def calculate_metrics(
+    price: Sequence[float], tp: Sequence[float], sl: Sequence[float], is_long: Sequence[bool]
+) -> Dict[str, np.ndarray]:
+    """Метрики для массивов сигналов; valid — маска сигналов с корректными Price/TP/SL.
+
+    Для невалидных сигналов значения метрик не определены (NaN/inf) и не используются.
+    """
+    import numpy as np
+
+    price = np.asarray(price, dtype=np.float64)
+    tp = np.asarray(tp, dtype=np.float64)
+    sl = np.asarray(sl, dtype=np.float64)
+    is_long = np.asarray(is_long, dtype=bool)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        valid = np.isfinite(price) & np.isfinite(tp) & np.isfinite(sl)
+        valid &= (price > 0) & (tp > 0) & (sl > 0)
+        # Лонг: тейк выше входа, стоп ниже; шорт — наоборот
+        valid &= np.where(is_long, (tp > price) & (sl < price), (tp < price) & (sl > price))
+
+        sl_pct = np.abs(sl - price) / price * 100
+        tp_pct = np.abs(tp - price) / price * 100
+        valid &= sl_pct > 0
+        # RR: отношение тейка к стопу
+        rr = tp_pct / sl_pct
+        # Плечо: 40 / %SL, округление вниз, максимум 100
+        leverage = np.minimum(np.floor(40 / sl_pct), 100)
+
+    return {"sl_pct": sl_pct, "tp_pct": tp_pct, "rr": rr, "leverage": leverage, "valid": valid}
+
+
+def batch_metrics(batch: SignalBatch) -> Dict[str, np.ndarray]:
+    """Метрики пачки; ошибки значений дописываются в batch.errors."""
+    import numpy as np
+
+    parsed = [signal or {} for signal in batch.signals]
+    nan = float("nan")
+    metrics = calculate_metrics(
+        [signal.get("price", nan) for signal in parsed],
+        [signal.get("tp", nan) for signal in parsed],
+        [signal.get("sl", nan) for signal in parsed],
+        [signal.get("position_type") == "ЛОНГ" for signal in parsed],
+    )
+    for i in np.flatnonzero(~metrics["valid"]).tolist():
+        if batch.errors[i] is None:
+            batch.errors[i] = VALUES_ERROR
+    return metrics
+
+
+def format_signal_message(data: dict, sl_pct: float, tp_pct: float, rr: float, leverage: int) -> str:
+    """Формирует итоговое сообщение сигнала."""
+    # Оба процента положительные, знак показывает сторону: стоп — «−», тейк — «+»
+    sl_sign = "−" if sl_pct > 0 else ""
+    tp_sign = "+" if tp_pct > 0 else ""
+
+    # Форматируем RR как 1:X.XX
+    rr_str = f"1:{rr:.2f}".rstrip("0").rstrip(".")
+
+    return (
+        f"{data['position_type']} | ${data['pair']}\n"
+        f"\n"
+        f"Вход: {format_number(data['price'])}\n"
+        f"Стоп: {format_number(data['sl'])}  ({sl_sign}{sl_pct:.2f}%)\n"
+        f"Тейк: {format_number(data['tp'])}  ({tp_sign}{tp_pct:.2f}%)\n"
+        f"\n"
+        f"RR: {rr_str}\n"
+        f"Плечо: x{leverage}\n"
+        f"Таймфрейм: {data['timeframe']}\n"
+        f"\n"
+        f"🏷 #soft | Ростислав"
+    )
+
+
+def format_signals(batch: SignalBatch, metrics: Dict[str, np.ndarray]) -> List[Optional[str]]:
+    """Тексты сигналов за один проход (None — у сигнала ошибка)."""
+    # tolist() один раз: дальше работаем с обычными float без обращений к массивам
+    columns = zip(
+        batch.signals,
+        metrics["valid"].tolist(),
+        metrics["sl_pct"].tolist(),
+        metrics["tp_pct"].tolist(),
+        metrics["rr"].tolist(),
+        metrics["leverage"].tolist(),
+    )
+    return [
+        format_signal_message(signal, sl_pct, tp_pct, rr, int(leverage)) if signal and valid else None
+        for signal, valid, sl_pct, tp_pct, rr, leverage in columns
+    ]
+
+
+def journal_rows(batch: SignalBatch, metrics: Dict[str, np.ndarray], ts: int) -> List[JournalRow]:
+    """Строки для utils.signal_journal по сигналам без ошибок."""
+    rr = metrics["rr"].tolist()
+    leverage = metrics["leverage"].tolist()
+    return [
+        JournalRow(
+            ts, signal["pair"], signal["timeframe"], "long" if signal["position_type"] == "ЛОНГ" else "short",
+            signal["price"], signal["tp"], signal["sl"], rr[i], int(leverage[i]),
+        )
+        for i, signal in enumerate(batch.signals)
+        if batch.errors[i] is None
+    ]
+
+
+def pack_messages(blocks: Iterable[str], limit: int = 4096, separator: str = "\n\n") -> List[str]:
+    """Склеивает блоки текста в сообщения не длиннее limit (блок не разрывается)."""
+    messages: List[str] = []
+    for block in blocks:
+        block = block[:limit]
+        if messages and len(messages[-1]) + len(separator) + len(block) <= limit:
+            messages[-1] += separator + block
+        else:
+            messages.append(block)
+    return messages
+
+
+def write_results_csv(
+    batch: SignalBatch, metrics: Dict[str, np.ndarray], rows: List[dict], fieldnames: List[str]
+) -> bytes:
+    """Исходные строки CSV с добавленными метриками и ошибкой."""
+    import numpy as np
+
+    out = io.StringIO()
+    columns = fieldnames + [c for c in CSV_RESULT_COLUMNS if c not in fieldnames]
+    writer = csv.DictWriter(out, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+    sl_pct = np.round(metrics["sl_pct"], 2).tolist()
+    tp_pct = np.round(metrics["tp_pct"], 2).tolist()
+    rr = np.round(metrics["rr"], 2).tolist()
+    leverage = metrics["leverage"].tolist()
+    for i, row in enumerate(rows):
+        error = batch.errors[i]
+        result = {"error": error or ""}
+        if error is None:
+            result.update(sl_pct=sl_pct[i], tp_pct=tp_pct[i], rr=rr[i], leverage=int(leverage[i]))
+        writer.writerow({**row, **result})
+    return out.getvalue().encode("utf-8")
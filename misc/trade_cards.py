@@ -0,0 +1,383 @@
+"""Подготовка HTML карточек сделок (/okx и /forex) к рендерингу.
+
+Функции копируют шаблон и его ресурсы во временную директорию и выполняют
+подстановки. Рендеринг в изображение остаётся за utils.html_to_image;
+карточку /okx render_okx_card может собрать и без браузера — из
+кэшированного статичного слоя (utils.card_compositor, OKX_RENDERER=composite),
+карточку /forex render_forex_card — нарисовать целиком через Pillow по
+спецификации из misc.forex_layout (FOREX_RASTER_TEMPLATES).
+"""
+
+import base64
+import io
+import logging
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from misc.forex_layout import FOREX_LAYOUTS
+from misc.pair_icons import normalize_pair, pair_icons
+from utils.card_compositor import CardCompositor
+from utils.html_to_image import html_to_image
+from utils.raster_card import RasterRenderer
+from utils.raster_text import FontSet, RasterUnsupported, parse_font_faces
+from utils.render_jobs import RenderJob
+from utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+OKX_TEMPLATE_DIR = PROJECT_ROOT / "tradehtml"
+FOREX_TEMPLATE_DIR = PROJECT_ROOT / "forex_html"
+
+# browser — карточка /okx целиком рендерится в Chromium; composite — текст и иконка
+# рисуются поверх кэшированного статичного слоя (Chromium нужен один раз на шаблон)
+OKX_RENDERER = os.getenv("OKX_RENDERER", "browser").strip().lower()
+
+# Шаблоны /forex, которые рисуются через Pillow без браузера (через запятую,
+# например "buy-light.html,sell-light.html"); остальные — в Chromium
+FOREX_RASTER_TEMPLATES = {
+    name.strip() for name in os.getenv("FOREX_RASTER_TEMPLATES", "").split(",") if name.strip()
+}
+
+# Образцовые значения: ими снимается статичный слой и прогревается рендер
+OKX_SAMPLE_FIELDS = {
+    "pair": "BTCUSDT",
+    "position_type": "Лонг",
+    "leverage": "100",
+    "profit_percentage": "+5,53",
+    "profit_amount": "+3,48",
+    "entry_price": "114962.0",
+    "exit_price": "114956.0",
+    "share_date": "01.01.2025",
+    "share_time": "00:00:00",
+}
+
+# Ключи /forex, значения которых форматируются как числа с пробелами между тысячами
+FOREX_NUMERIC_KEYS = [
+    "side_price",
+    "open",
+    "close",
+    "pct",
+    "profit",
+    "sl",
+    "swap",
+    "tp",
+    "fee",
+]
+
+_DELTA_DOWN_SVG = (
+    '<svg width="26" height="17" viewBox="0 0 26 17" fill="none" '
+    'xmlns="http://www.w3.org/2000/svg">'
+    '<path d="M23.7676 1.76782L12.7676 12.7678L1.76758 1.76782" '
+    'stroke-width="5" />'
+    "</svg>"
+)
+_DELTA_UP_SVG = (
+    '<svg width="26" height="17" viewBox="0 0 26 17" fill="none" '
+    'xmlns="http://www.w3.org/2000/svg">'
+    '<path d="M1.76758 14.5356L12.7676 3.53564L23.7676 14.5356" '
+    'stroke-width="5" />'
+    "</svg>"
+)
+
+
+def format_price_with_spaces(value: str) -> str:
+    """Форматирует строковое число: добавляет пробелы между тысячами, сохраняет дробную часть и знак.
+
+    Примеры:
+      "114962.0" -> "114 962.0"
+      "114962"   -> "114 962"
+      "114,962.50" -> "114 962.50"
+      "114962,50" -> "114 962,50" (сохраняем исходный разделитель дробной части)
+      "+15000" -> "+15 000"
+      "-15000.50" -> "-15 000.50"
+    """
+    if not value:
+        return value
+
+    original_value = str(value)
+    s = original_value.strip()
+
+    if not s:
+        return original_value
+
+    # Сохраняем знак в начале
+    sign = ""
+    if s.startswith(("+", "-")):
+        sign = s[0]
+        s = s[1:]
+
+    if not s:
+        return original_value
+
+    allowed_chars = set("0123456789., ")
+    if any(ch not in allowed_chars for ch in s):
+        return original_value
+    if not any(ch.isdigit() for ch in s):
+        return original_value
+
+    # Определяем разделитель дробной части: "." приоритетно, иначе "," если нет точки
+    decimal_sep = "." if "." in s else ("," if "," in s else None)
+
+    if decimal_sep:
+        integer_part, fractional_part = s.split(decimal_sep, 1)
+    else:
+        integer_part, fractional_part = s, None
+
+    # Убираем все нецифровые символы из целой части (запятые, пробелы и т.д.)
+    integer_digits = "".join(ch for ch in integer_part if ch.isdigit()) or "0"
+
+    # Группируем по тысячам пробелами
+    rev = integer_digits[::-1]
+    grouped_rev = " ".join(rev[i : i + 3] for i in range(0, len(rev), 3))
+    grouped = grouped_rev[::-1]
+
+    return f"{sign}{grouped}{decimal_sep + fractional_part if fractional_part is not None else ''}"
+
+
+# Порядок аргументов /okx; дата и время шеринга необязательны
+OKX_ARG_KEYS = (
+    "pair",
+    "position_type",
+    "leverage",
+    "profit_percentage",
+    "profit_amount",
+    "entry_price",
+    "exit_price",
+    "share_date",
+    "share_time",
+)
+
+
+def okx_fields(tokens: List[str], now: Optional[datetime] = None) -> Optional[dict]:
+    """Поля карточки /okx из аргументов команды или None, если их меньше 7.
+
+    Без даты/времени (8-й и 9-й аргументы) подставляется текущее локальное время.
+    """
+    if len(tokens) < 7:
+        return None
+    fields = dict(zip(OKX_ARG_KEYS, tokens))
+    if len(tokens) < 9:
+        now = now or datetime.now()
+        fields["share_date"] = now.strftime("%d.%m.%Y")
+        fields["share_time"] = now.strftime("%H:%M:%S")
+    return fields
+
+
+def okx_template_name(profit_percentage: str) -> str:
+    """Выбор шаблона по знаку процента прибыли: "+" -> long, "-" -> short."""
+    profit_sign = (profit_percentage or "").strip()
+    return (
+        "long.html"
+        if profit_sign.startswith("+")
+        else "short.html"
+        if profit_sign.startswith("-")
+        else "long.html"
+    )
+
+
+def prepare_okx_html(tmpdir_path: Path, template_name: str, fields: dict) -> Path:
+    """Копирует шаблон OKX с ресурсами в tmpdir_path и подставляет значения.
+
+    fields: pair, position_type, leverage, profit_percentage, profit_amount,
+    entry_price, exit_price, share_date, share_time.
+    """
+    template_path = OKX_TEMPLATE_DIR / template_name
+
+    with span("assets.stage", template=template_name):
+        # Скопируем всю папку assets рядом, чтобы относительные пути работали
+        assets_src = template_path.parent / "assets"
+        assets_dst = tmpdir_path / "assets"
+        if assets_src.exists():
+            shutil.copytree(assets_src, assets_dst)
+
+        # Скопируем локальные шрифты и файл подключения шрифтов, чтобы @font-face работал по file://
+        fonts_src = template_path.parent / "fonts"
+        fonts_dst = tmpdir_path / "fonts"
+        if fonts_src.exists():
+            shutil.copytree(fonts_src, fonts_dst)
+
+        fonts_css_src = template_path.parent / "fonts.css"
+        fonts_css_dst = tmpdir_path / "fonts.css"
+        if fonts_css_src.exists():
+            shutil.copyfile(fonts_css_src, fonts_css_dst)
+
+        # Копия HTML
+        temp_html = tmpdir_path / template_name
+        shutil.copyfile(template_path, temp_html)
+
+    with span("template.fill", template=template_name):
+        # Подстановки в HTML
+        html_text = temp_html.read_text(encoding="utf-8")
+        # Иконка монеты из индекса (data: URI нужного размера), fallback — BTCUSDT
+        pair_icon_src = pair_icons.data_uri(fields["pair"]) or "./icons/BTCUSDT.png"
+        for key, value in okx_substitutions(fields).items():
+            html_text = html_text.replace("{" + key + "}", value)
+        html_text = html_text.replace("{pair_icon_src}", pair_icon_src)
+        temp_html.write_text(html_text, encoding="utf-8")
+
+    return temp_html
+
+
+def okx_substitutions(fields: dict) -> Dict[str, str]:
+    """Значения текстовых плейсхолдеров карточки /okx (цены — с пробелами между тысячами)."""
+    return {
+        "pair": fields["pair"],
+        "position_type": fields["position_type"],
+        "leverage": fields["leverage"],
+        "profit_percentage": fields["profit_percentage"],
+        "profit_amount": format_price_with_spaces(fields["profit_amount"]),
+        "entry_price": format_price_with_spaces(fields["entry_price"]),
+        "exit_price": format_price_with_spaces(fields["exit_price"]),
+        "share_date": fields["share_date"],
+        "share_time": fields["share_time"],
+    }
+
+
+okx_compositor = CardCompositor(
+    OKX_TEMPLATE_DIR,
+    lambda tmpdir, template_name: prepare_okx_html(tmpdir, template_name, OKX_SAMPLE_FIELDS),
+    width=1200,
+)
+
+
+@lru_cache(maxsize=256)
+def _pair_icon_image(pair_key: str):
+    from PIL import Image
+
+    data_uri = pair_icons.data_uri(pair_key)
+    if not data_uri or not data_uri.startswith("data:image/png;base64,"):
+        # SVG Pillow не растеризует
+        raise RasterUnsupported(f"no raster icon for {pair_key}")
+    with Image.open(io.BytesIO(base64.b64decode(data_uri.split(",", 1)[1]))) as image:
+        return image.convert("RGBA")
+
+
+async def render_okx_card(
+    template_name: str,
+    fields: dict,
+    output_path: Path,
+    job: Optional[RenderJob] = None,
+) -> str:
+    """Рендерит карточку /okx в PNG способом из OKX_RENDERER; возвращает путь к файлу."""
+    job = job or RenderJob(template_name)
+    if OKX_RENDERER == "composite":
+        try:
+            icon = _pair_icon_image(normalize_pair(fields["pair"]))
+            return await okx_compositor.render(
+                template_name, okx_substitutions(fields), {"pair_icon": icon}, output_path, job
+            )
+        except RasterUnsupported as exc:
+            logger.warning("Composite render of %s is not possible, using Chromium: %s", template_name, exc)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        temp_html = prepare_okx_html(Path(tmpdir), template_name, fields)
+        return await html_to_image(
+            html_file_path=str(temp_html),
+            output_path=str(output_path),
+            job=job,
+        )
+
+
+def forex_template_name(side: str) -> str:
+    return "buy-light.html" if side == "buy" else "sell-light.html"
+
+
+def forex_substitutions(data: dict) -> dict:
+    """Считает значения плейсхолдеров карточки /forex из разобранных key=value.
+
+    data должен содержать нормализованные pair (верхний регистр) и side (buy/sell).
+    """
+    formatted_values = {
+        key: format_price_with_spaces(data[key]) for key in FOREX_NUMERIC_KEYS
+    }
+    profit_raw = data["profit"].strip()
+    profit_is_negative = profit_raw.startswith("-")
+    delta_is_negative = data["delta"].strip().startswith("-")
+
+    # Порядок ключей совпадает с порядком подстановок в шаблон
+    return {
+        "pair": data["pair"],
+        "side": data["side"],
+        "side_price": formatted_values["side_price"],
+        "ticket": data["ticket"],
+        "desc": data["desc"],
+        "open": formatted_values["open"],
+        "close": formatted_values["close"],
+        "delta": data["delta"],
+        "delta_arrow_svg": _DELTA_DOWN_SVG if delta_is_negative else _DELTA_UP_SVG,
+        "pct": formatted_values["pct"],
+        "profit": formatted_values["profit"],
+        "profit_class": "red" if "-" in profit_raw else "blue",
+        "open_dt": data["open_dt"],
+        "close_dt": data["close_dt"],
+        "sl": formatted_values["sl"],
+        "swap": formatted_values["swap"],
+        "tp": formatted_values["tp"],
+        "fee": formatted_values["fee"],
+        "sl_class": "text-red" if profit_is_negative else "text-gray-8",
+        "tp_class": "text-gray-8" if profit_is_negative else "text-green",
+    }
+
+
+def prepare_forex_html(tmpdir_path: Path, template_name: str, values: dict) -> Path:
+    """Копирует шаблон /forex со шрифтами в tmpdir_path и подставляет значения."""
+    template_dir = FOREX_TEMPLATE_DIR
+    template_path = template_dir / template_name
+
+    with span("assets.stage", template=template_name):
+        fonts_src = template_dir / "fonts"
+        fonts_dst = tmpdir_path / "fonts"
+        if fonts_src.exists():
+            shutil.copytree(fonts_src, fonts_dst)
+
+        style_src = template_dir / "style.css"
+        style_dst = tmpdir_path / "style.css"
+        if style_src.exists():
+            shutil.copyfile(style_src, style_dst)
+
+        temp_html = tmpdir_path / template_name
+        shutil.copyfile(template_path, temp_html)
+
+    with span("template.fill", template=template_name):
+        html_text = temp_html.read_text(encoding="utf-8")
+        for key, value in values.items():
+            html_text = html_text.replace("{" + key + "}", value)
+        temp_html.write_text(html_text, encoding="utf-8")
+
+    return temp_html
+
+
+forex_raster = RasterRenderer(FOREX_LAYOUTS, FontSet(parse_font_faces(FOREX_TEMPLATE_DIR / "style.css")), scale=2)
+
+
+async def render_forex_card(
+    template_name: str,
+    values: dict,
+    output_path: Path,
+    job: Optional[RenderJob] = None,
+) -> str:
+    """Рендерит карточку /forex в PNG (Pillow для FOREX_RASTER_TEMPLATES, иначе Chromium)."""
+    job = job or RenderJob(template_name)
+    if template_name in FOREX_RASTER_TEMPLATES:
+        try:
+            return await forex_raster.render(template_name, values, output_path, job)
+        except RasterUnsupported as exc:
+            logger.warning("Raster render of %s is not possible, using Chromium: %s", template_name, exc)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        temp_html = prepare_forex_html(Path(tmpdir), template_name, values)
+        return await html_to_image(
+            html_file_path=str(temp_html),
+            output_path=str(output_path),
+            selector="#forex_img",
+            width=1142,
+            height=564,
+            device_scale_factor=forex_raster.scale,
+            job=job,
+        )
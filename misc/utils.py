@@ -5,8 +5,9 @@ import shutil
 import os
 import uuid
 import logging
-import PyPDF2
 import stat
+from utils.metrics import PDF_MERGE_SECONDS
+from utils.tracing import span
 from .constants import PRODUCT_MAP, DURATION_MAP, TITLE_HTML_PATH
 
 
@@ -55,8 +56,9 @@ def fill_pdf_html(data: dict, submission_id: str, pdf_html_path: str) -> str:
         "{{generation_time}}": html_lib.escape(datetime.datetime.now().strftime("%d/%m/%Y | %H:%M"))
     }
 
-    for placeholder, value in replacements.items():
-        html_text = html_text.replace(placeholder, value)
+    with span("template.fill", template=os.path.basename(pdf_html_path)):
+        for placeholder, value in replacements.items():
+            html_text = html_text.replace(placeholder, value)
     
     # Создаем уникальную директорию для этого PDF в temp/
     temp_dir = f"temp/invoice_{submission_id}"
@@ -64,43 +66,44 @@ def fill_pdf_html(data: dict, submission_id: str, pdf_html_path: str) -> str:
     
     # Копируем все ресурсы из invoice_html/ в temp директорию
     source_dir = "invoice_html"
-    if os.path.exists(source_dir):
-        for item in os.listdir(source_dir):
-            source_path = os.path.join(source_dir, item)
-            dest_path = os.path.join(temp_dir, item)
+    with span("assets.stage", source="invoice_html"):
+        if os.path.exists(source_dir):
+            for item in os.listdir(source_dir):
+                source_path = os.path.join(source_dir, item)
+                dest_path = os.path.join(temp_dir, item)
             
-            if os.path.isdir(source_path):
-                # Копируем директории (fonts, assets)
-                if os.path.exists(dest_path):
-                    shutil.rmtree(dest_path)
-                shutil.copytree(source_path, dest_path)
-            else:
-                # Копируем файлы (styles.css, pdf.html)
-                shutil.copy2(source_path, dest_path)
+                if os.path.isdir(source_path):
+                    # Копируем директории (fonts, assets)
+                    if os.path.exists(dest_path):
+                        shutil.rmtree(dest_path)
+                    shutil.copytree(source_path, dest_path)
+                else:
+                    # Копируем файлы (styles.css, pdf.html)
+                    shutil.copy2(source_path, dest_path)
         
-        # Исправляем права доступа и владельца для всех скопированных файлов
-        try:
-            import pwd
-            import grp
-            app_uid = pwd.getpwnam('app').pw_uid
-            app_gid = grp.getgrnam('app').gr_gid
+            # Исправляем права доступа и владельца для всех скопированных файлов
+            try:
+                import pwd
+                import grp
+                app_uid = pwd.getpwnam('app').pw_uid
+                app_gid = grp.getgrnam('app').gr_gid
             
-            for root, dirs, files in os.walk(temp_dir):
-                for d in dirs:
-                    dir_path = os.path.join(root, d)
-                    os.chmod(dir_path, stat.S_IRWXU | stat.S_IRGRP | stat.S_IXGRP | stat.S_IROTH | stat.S_IXOTH)
-                    os.chown(dir_path, app_uid, app_gid)
-                for f in files:
-                    file_path = os.path.join(root, f)
-                    os.chmod(file_path, stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IROTH)
-                    os.chown(file_path, app_uid, app_gid)
-        except (ImportError, KeyError):
-            # Fallback: только права доступа
-            for root, dirs, files in os.walk(temp_dir):
-                for d in dirs:
-                    os.chmod(os.path.join(root, d), stat.S_IRWXU | stat.S_IRGRP | stat.S_IXGRP | stat.S_IROTH | stat.S_IXOTH)
-                for f in files:
-                    os.chmod(os.path.join(root, f), stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IROTH)
+                for root, dirs, files in os.walk(temp_dir):
+                    for d in dirs:
+                        dir_path = os.path.join(root, d)
+                        os.chmod(dir_path, stat.S_IRWXU | stat.S_IRGRP | stat.S_IXGRP | stat.S_IROTH | stat.S_IXOTH)
+                        os.chown(dir_path, app_uid, app_gid)
+                    for f in files:
+                        file_path = os.path.join(root, f)
+                        os.chmod(file_path, stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IROTH)
+                        os.chown(file_path, app_uid, app_gid)
+            except (ImportError, KeyError):
+                # Fallback: только права доступа
+                for root, dirs, files in os.walk(temp_dir):
+                    for d in dirs:
+                        os.chmod(os.path.join(root, d), stat.S_IRWXU | stat.S_IRGRP | stat.S_IXGRP | stat.S_IROTH | stat.S_IXOTH)
+                    for f in files:
+                        os.chmod(os.path.join(root, f), stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IROTH)
     
     # Создаем временный HTML файл в temp директории
     temp_html_path = os.path.join(temp_dir, f"temp_invoice_{submission_id}.html")
@@ -123,8 +126,9 @@ def fill_title_html(user_name: str) -> str:
         "{{creation_date}}": datetime.datetime.now().strftime("%d.%m.%Y")
     }
 
-    for placeholder, value in replacements.items():
-        html_text = html_text.replace(placeholder, value)
+    with span("template.fill", template=os.path.basename(TITLE_HTML_PATH)):
+        for placeholder, value in replacements.items():
+            html_text = html_text.replace(placeholder, value)
     
     # Создаем временный HTML файл
     temp_html_path = f"temp/temp_title_{uuid.uuid4().hex}.html"
@@ -135,26 +139,18 @@ def fill_title_html(user_name: str) -> str:
 
 
 def merge_pdfs(title_pdf_path: str, main_pdf_path: str, output_path: str) -> bool:
-    """Объединяет титульную страницу с основным PDF"""
-    
+    """Объединяет титульную страницу с основным PDF.
+
+    Страницы копируются потоково (utils/pdf_stream.py): документ читается
+    через mmap, объекты пишутся в результат по одному, поэтому память не
+    растёт с размером документа.
+    """
+    # PyPDF2 нужен только при объединении: не тянем его при старте бота
+    from utils.pdf_stream import merge_streaming
+
     try:
-        with open(title_pdf_path, 'rb') as title_file, open(main_pdf_path, 'rb') as main_file:
-            title_reader = PyPDF2.PdfReader(title_file)
-            main_reader = PyPDF2.PdfReader(main_file)
-            writer = PyPDF2.PdfWriter()
-
-            # Добавляем титульную страницу
-            if title_reader.pages:
-                writer.add_page(title_reader.pages[0])
-
-            # Добавляем все страницы основного PDF
-            for page in main_reader.pages:
-                writer.add_page(page)
-
-            # Сохраняем объединенный PDF
-            with open(output_path, 'wb') as output_file:
-                writer.write(output_file)
-        
+        with span("pdf.merge"), PDF_MERGE_SECONDS.time():
+            merge_streaming(title_pdf_path, main_pdf_path, output_path)
         return True
     except Exception as e:
         logging.error(f"Ошибка при объединении PDF: {e}")
@@ -0,0 +1,127 @@
+"""Фоновый прогрев рендерера при старте бота.
+
+Строит индекс иконок пар, запускает общий Chromium и делает по одному рендеру каждого шаблона
+(карточки /okx и /forex, инвойс, титульная страница), чтобы шрифты, стили
+и кэши шейдеров были готовы к первому пользовательскому запросу.
+Polling при этом стартует сразу и не ждёт прогрева.
+"""
+
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+from misc.constants import PDF_HTML_PATH
+from misc.pair_icons import pair_icons
+from misc.trade_cards import OKX_SAMPLE_FIELDS, forex_substitutions, render_forex_card, render_okx_card
+from misc.utils import fill_pdf_html, fill_title_html
+from utils.browser_pool import browser_pool
+from utils.render_jobs import RenderJob
+from utils.render_pdf import html_to_pdf_playwright
+
+logger = logging.getLogger(__name__)
+
+_FOREX_SAMPLE = {
+    "pair": "EURUSD",
+    "side": "buy",
+    "side_price": "1.06",
+    "ticket": "1",
+    "desc": "Euro vs US Dollar",
+    "open": "1.16540",
+    "close": "1.16252",
+    "delta": "521",
+    "pct": "0.35",
+    "profit": "6108.01",
+    "open_dt": "2025.01.01 00:00:00",
+    "close_dt": "2025.01.01 00:00:00",
+    "sl": "154.335",
+    "swap": "2.10",
+    "tp": "153.536",
+    "fee": "-5.30",
+}
+_INVOICE_SAMPLE = {
+    "name": "Warmup",
+    "phone": "0",
+    "order_number": "1",
+    "purchase_date": "01/01/2025",
+    "product": "product_a",
+    "duration": "1m",
+    "cost": "1000",
+}
+
+
+async def _warm_okx(tmpdir: Path, template_name: str, profit_percentage: str) -> None:
+    fields = {**OKX_SAMPLE_FIELDS, "profit_percentage": profit_percentage}
+    # Тот же путь, что у /okx: при OKX_RENDERER=composite здесь снимается статичный слой
+    await render_okx_card(template_name, fields, tmpdir / f"{template_name}.png", RenderJob(template_name))
+
+
+async def _warm_forex(tmpdir: Path, template_name: str, side: str) -> None:
+    values = forex_substitutions({**_FOREX_SAMPLE, "side": side})
+    # Тот же путь, что у /forex: шаблоны из FOREX_RASTER_TEMPLATES рисуются без браузера
+    await render_forex_card(template_name, values, tmpdir / f"{template_name}.png", RenderJob(template_name))
+
+
+async def _warm_invoice(tmpdir: Path) -> None:
+    temp_html_path = fill_pdf_html(_INVOICE_SAMPLE, f"warmup_{uuid.uuid4().hex}", PDF_HTML_PATH)
+    try:
+        ok = await html_to_pdf_playwright(
+            html_file_path=temp_html_path,
+            output_pdf_path=str(tmpdir / "invoice.pdf"),
+            css_file_path=os.path.join(os.path.dirname(temp_html_path), "styles.css"),
+            job=RenderJob("invoice"),
+        )
+        if not ok:
+            raise RuntimeError("html_to_pdf_playwright вернул False")
+    finally:
+        shutil.rmtree(os.path.dirname(temp_html_path), ignore_errors=True)
+
+
+async def _warm_title(tmpdir: Path) -> None:
+    temp_html_path = fill_title_html("Warmup")
+    try:
+        ok = await html_to_pdf_playwright(
+            html_file_path=temp_html_path,
+            output_pdf_path=str(tmpdir / "title.pdf"),
+            landscape=True,
+            job=RenderJob("title"),
+        )
+        if not ok:
+            raise RuntimeError("html_to_pdf_playwright вернул False")
+    finally:
+        os.remove(temp_html_path)
+
+
+async def warm_up_renderer() -> None:
+    """Запускает Chromium и прогревает все шаблоны; затем выставляет флаг готовности."""
+    started = time.perf_counter()
+    # Индекс иконок не зависит от браузера: строим его первым и вне event loop
+    await asyncio.to_thread(pair_icons.ensure_built)
+    try:
+        await browser_pool.browser("warmup")
+    except Exception as exc:  # noqa: BLE001
+        logger.error("Renderer warm-up failed, Chromium is not available: %s", exc)
+        return
+
+    steps = [
+        ("long.html", lambda d: _warm_okx(d, "long.html", "+5,53")),
+        ("short.html", lambda d: _warm_okx(d, "short.html", "-5,53")),
+        ("buy-light.html", lambda d: _warm_forex(d, "buy-light.html", "buy")),
+        ("sell-light.html", lambda d: _warm_forex(d, "sell-light.html", "sell")),
+        ("invoice", _warm_invoice),
+        ("title", _warm_title),
+    ]
+    # По одному рендеру за раз: прогрев не должен отнимать CPU у первых запросов
+    for name, warm in steps:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            try:
+                await warm(Path(tmpdir))
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Warm-up render of %s failed: %s", name, exc)
+
+    browser_pool.set_ready(True)
+    logger.info("Renderer warmed up in %.2fs", time.perf_counter() - started)
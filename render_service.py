@@ -0,0 +1,371 @@
+"""
+Сервис рендеринга: шаблоны и рендер документов и карточек по JSON API.
+
+Тот же код, что у бота (misc.utils, misc.trade_cards, misc.documents,
+utils.html_to_image, utils.render_pdf), в отдельном процессе с одним
+прогретым Chromium. Бот с RENDER_SERVICE_URL и другие инструменты
+(python -m utils.render_client) — его тонкие клиенты.
+
+API: POST /v1/<операция> с JSON-параметрами, ответ — JSON.
+
+  fill_pdf_html        {data}                          -> {html}
+  fill_title_html      {user_name}                     -> {html}
+  okx_fields           {tokens}                        -> {fields}
+  okx_substitutions    {fields}                        -> {values}
+  forex_substitutions  {data}                          -> {values}
+  html_to_image        {html_path, output_path, selector?, width?, height?, device_scale_factor?} -> {path}
+  html_to_pdf          {html_path, output_path, css_path?, landscape?} -> {ok}
+  merge_pdfs           {title_pdf_path, main_pdf_path, output_path, optimize?} -> {ok}
+  invoice              {data}                          -> {html, pdf, ok}
+  title                {user_name}                     -> {html, pdf, ok}
+  okx_card             {fields, output_path, template?}                 -> {path}
+  forex_card           {values, template, output_path} | {data, output_path} -> {path}
+
+Во всех запросах необязателен timeout — дедлайн рендера в секундах
+(по умолчанию RENDER_TIMEOUT). Ошибки: 400 bad_request, 404 unknown_op,
+503 busy (с Retry-After), 504 timeout, 500 failed. GET /health — готовность
+и загрузка, GET /metrics — метрики процесса.
+
+Рендеры (всё, что запускает Chromium, Pillow или читает PDF) выполняются
+не больше RENDER_SERVICE_CONCURRENCY одновременно; ещё до
+RENDER_SERVICE_MAX_QUEUE ждут слота, остальным сразу отвечается 503.
+Обрыв соединения клиентом отменяет его рендер.
+
+Файлы передаются путями: клиенты должны видеть те же temp/ и /tmp, что и
+сервис, поэтому сервис слушает только Unix-сокет или localhost и не
+должен быть доступен снаружи.
+
+Запуск:
+    python render_service.py --socket temp/render.sock
+    python render_service.py --port 8090
+    RENDER_SERVICE_URL=unix:temp/render.sock python bot.py
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import stat
+import uuid
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, NamedTuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from aiohttp import web  # noqa: E402
+
+from misc import documents  # noqa: E402
+from misc.constants import PDF_HTML_PATH  # noqa: E402
+from misc.render_backend import merge_and_optimize  # noqa: E402
+from misc.trade_cards import (  # noqa: E402
+    forex_substitutions,
+    forex_template_name,
+    okx_fields,
+    okx_substitutions,
+    okx_template_name,
+    render_forex_card,
+    render_okx_card,
+)
+from misc.utils import fill_pdf_html, fill_title_html, merge_pdfs  # noqa: E402
+from misc.warmup import warm_up_renderer  # noqa: E402
+from utils.browser_pool import browser_pool  # noqa: E402
+from utils.browser_supervisor import browser_supervisor  # noqa: E402
+from utils.html_to_image import html_to_image  # noqa: E402
+from utils.metrics import (  # noqa: E402
+    REGISTRY,
+    RENDER_SERVICE_QUEUE_DEPTH,
+    RENDER_SERVICE_REQUESTS_TOTAL,
+    RENDER_SERVICE_SECONDS,
+)
+from utils.render_jobs import RENDER_TIMEOUT, RenderCancelled, RenderJob, RenderTimeout  # noqa: E402
+from utils.render_pdf import html_to_pdf_playwright  # noqa: E402
+
+logger = logging.getLogger("render_service")
+
+RENDER_SERVICE_CONCURRENCY = int(os.getenv("RENDER_SERVICE_CONCURRENCY", "4"))
+RENDER_SERVICE_MAX_QUEUE = int(os.getenv("RENDER_SERVICE_MAX_QUEUE", "32"))
+
+
+class ServiceBusy(Exception):
+    pass
+
+
+class ConcurrencyLimit:
+    """Не больше concurrency рендеров сразу и не больше max_queue ожидающих."""
+
+    def __init__(self, concurrency: int, max_queue: int) -> None:
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.active = 0
+        self.queued = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        if self._semaphore.locked() and self.queued >= self.max_queue:
+            raise ServiceBusy()
+        self.queued += 1
+        RENDER_SERVICE_QUEUE_DEPTH.set(self.queued)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+            RENDER_SERVICE_QUEUE_DEPTH.set(self.queued)
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+
+class Operation(NamedTuple):
+    run: Callable[[Dict[str, Any], RenderJob], Awaitable[Dict[str, Any]]]
+    # Рендер или тяжёлая работа с файлами — под ConcurrencyLimit
+    heavy: bool
+
+
+async def _fill_pdf_html(params: Dict[str, Any], job: RenderJob) -> Dict[str, Any]:
+    return {"html": fill_pdf_html(params["data"], uuid.uuid4().hex, PDF_HTML_PATH)}
+
+
+async def _fill_title_html(params: Dict[str, Any], job: RenderJob) -> Dict[str, Any]:
+    return {"html": fill_title_html(params["user_name"])}
+
+
+async def _okx_fields(params: Dict[str, Any], job: RenderJob) -> Dict[str, Any]:
+    fields = okx_fields([str(token) for token in params["tokens"]])
+    if fields is None:
+        raise ValueError("at least 7 tokens are required")
+    return {"fields": fields}
+
+
+async def _okx_substitutions(params: Dict[str, Any], job: RenderJob) -> Dict[str, Any]:
+    return {"values": okx_substitutions(params["fields"])}
+
+
+def _forex_values(data: Dict[str, Any]) -> Dict[str, Any]:
+    # Нормализация как в /forex
+    return forex_substitutions({**data, "pair": data["pair"].strip().upper(), "side": data["side"].strip().lower()})
+
+
+async def _forex_substitutions(params: Dict[str, Any], job: RenderJob) -> Dict[str, Any]:
+    return {"values": _forex_values(params["data"])}
+
+
+async def _html_to_image(params: Dict[str, Any], job: RenderJob) -> Dict[str, Any]:
+    options = {
+        key: params[key] for key in ("selector", "width", "height", "device_scale_factor") if key in params
+    }
+    path = await html_to_image(
+        html_file_path=params["html_path"], output_path=params["output_path"], job=job, **options
+    )
+    return {"path": path}
+
+
+async def _html_to_pdf(params: Dict[str, Any], job: RenderJob) -> Dict[str, Any]:
+    ok = await html_to_pdf_playwright(
+        html_file_path=params["html_path"],
+        output_pdf_path=params["output_path"],
+        css_file_path=params.get("css_path"),
+        landscape=bool(params.get("landscape", False)),
+        job=job,
+    )
+    return {"ok": ok}
+
+
+async def _merge_pdfs(params: Dict[str, Any], job: RenderJob) -> Dict[str, Any]:
+    paths = params["title_pdf_path"], params["main_pdf_path"], params["output_path"]
+    if params.get("optimize"):
+        # Как у бота без сервиса: результат сразу оптимизируется (PDF_OPTIMIZE_PROFILE)
+        return {"ok": await merge_and_optimize(*paths)}
+    return {"ok": await asyncio.to_thread(merge_pdfs, *paths)}
+
+
+def _document(
+    render: Callable[[Any, RenderJob], Awaitable[documents.DocumentResult]],
+    key: str,
+    cleanup: Callable[[documents.DocumentResult], None],
+) -> Callable[[Dict[str, Any], RenderJob], Awaitable[Dict[str, Any]]]:
+    """Операция документа: при обрыве соединения рендер отменяется, его файлы удаляются."""
+
+    async def run(params: Dict[str, Any], job: RenderJob) -> Dict[str, Any]:
+        task = asyncio.ensure_future(render(params[key], job))
+        try:
+            html_path, pdf_path, ok = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # Клиент ушёл: рендер прерывается, файлы удаляются, когда он завершится
+            job.cancel()
+            task.add_done_callback(lambda done: _cleanup_result(done, cleanup))
+            raise
+        return {"html": html_path, "pdf": pdf_path, "ok": ok}
+
+    return run
+
+
+def _cleanup_result(task: asyncio.Future, cleanup: Callable[[documents.DocumentResult], None]) -> None:
+    if not task.cancelled() and task.exception() is None:
+        cleanup(task.result())
+
+
+async def _okx_card(params: Dict[str, Any], job: RenderJob) -> Dict[str, Any]:
+    fields = params["fields"]
+    template_name = params.get("template") or okx_template_name(fields["profit_percentage"])
+    path = await render_okx_card(template_name, fields, Path(params["output_path"]), job)
+    return {"path": path}
+
+
+async def _forex_card(params: Dict[str, Any], job: RenderJob) -> Dict[str, Any]:
+    if "values" in params:
+        values, template_name = params["values"], params["template"]
+    else:
+        values = _forex_values(params["data"])
+        template_name = params.get("template") or forex_template_name(values["side"])
+    path = await render_forex_card(template_name, values, Path(params["output_path"]), job)
+    return {"path": path}
+
+
+OPERATIONS: Dict[str, Operation] = {
+    "fill_pdf_html": Operation(_fill_pdf_html, heavy=False),
+    "fill_title_html": Operation(_fill_title_html, heavy=False),
+    "okx_fields": Operation(_okx_fields, heavy=False),
+    "okx_substitutions": Operation(_okx_substitutions, heavy=False),
+    "forex_substitutions": Operation(_forex_substitutions, heavy=False),
+    "html_to_image": Operation(_html_to_image, heavy=True),
+    "html_to_pdf": Operation(_html_to_pdf, heavy=True),
+    "merge_pdfs": Operation(_merge_pdfs, heavy=True),
+    "invoice": Operation(_document(documents.render_invoice, "data", documents.remove_invoice_files), heavy=True),
+    "title": Operation(_document(documents.render_title, "user_name", documents.remove_title_files), heavy=True),
+    "okx_card": Operation(_okx_card, heavy=True),
+    "forex_card": Operation(_forex_card, heavy=True),
+}
+
+
+def _error(status: int, error: str, message: str = "", **headers: str) -> web.Response:
+    return web.json_response({"error": error, "message": message}, status=status, headers=headers or None)
+
+
+def create_app(limit: ConcurrencyLimit, warmup: bool) -> web.Application:
+    async def handle_operation(request: web.Request) -> web.Response:
+        name = request.match_info["op"]
+        operation = OPERATIONS.get(name)
+        if operation is None:
+            return _error(404, "unknown_op", name)
+        started = asyncio.get_running_loop().time()
+        response = await _run(request, name, operation)
+        RENDER_SERVICE_REQUESTS_TOTAL.inc(op=name, status=str(response.status))
+        RENDER_SERVICE_SECONDS.observe(asyncio.get_running_loop().time() - started, op=name)
+        return response
+
+    async def _run(request: web.Request, name: str, operation: Operation) -> web.Response:
+        try:
+            params = await request.json()
+        except ValueError as exc:
+            return _error(400, "bad_request", f"invalid JSON: {exc}")
+        if not isinstance(params, dict):
+            return _error(400, "bad_request", "parameters must be a JSON object")
+        timeout = params.pop("timeout", RENDER_TIMEOUT)
+        job = RenderJob(str(params.get("template") or name), timeout)
+        try:
+            if operation.heavy:
+                async with limit.slot():
+                    result = await operation.run(params, job)
+            else:
+                result = await operation.run(params, job)
+        except ServiceBusy:
+            return _error(503, "busy", "render queue is full", **{"Retry-After": "1"})
+        except RenderTimeout as exc:
+            return _error(504, "timeout", str(exc))
+        except RenderCancelled as exc:
+            return _error(409, "cancelled", str(exc))
+        except (KeyError, TypeError, ValueError) as exc:
+            return _error(400, "bad_request", f"{type(exc).__name__}: {exc}")
+        except Exception as exc:  # noqa: BLE001
+            logger.exception("Operation %s failed", name)
+            return _error(500, "failed", str(exc))
+        return web.json_response(result)
+
+    async def handle_health(_request: web.Request) -> web.Response:
+        return web.json_response({
+            "ready": browser_pool.ready or not warmup,
+            "active": limit.active,
+            "queued": limit.queued,
+            "concurrency": limit.concurrency,
+            "max_queue": limit.max_queue,
+        })
+
+    async def handle_metrics(_request: web.Request) -> web.Response:
+        body = await asyncio.get_running_loop().run_in_executor(None, REGISTRY.render)
+        return web.Response(
+            body=body.encode("utf-8"),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    app = web.Application(client_max_size=1 << 20)
+    app.router.add_post("/v1/{op}", handle_operation)
+    app.router.add_get("/health", handle_health)
+    app.router.add_get("/metrics", handle_metrics)
+    return app
+
+
+def _log_warmup_failure(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Renderer warm-up failed", exc_info=task.exception())
+
+
+async def run(args: argparse.Namespace) -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    limit = ConcurrencyLimit(args.concurrency, args.max_queue)
+    # handler_cancellation: обрыв соединения клиентом отменяет его рендер
+    runner = web.AppRunner(create_app(limit, not args.no_warmup), access_log=None, handler_cancellation=True)
+    await runner.setup()
+    if args.socket:
+        socket_path = Path(args.socket)
+        # Сокет от прошлого запуска мешает bind
+        socket_path.unlink(missing_ok=True)
+        await web.UnixSite(runner, str(socket_path)).start()
+        os.chmod(socket_path, stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IWGRP)
+        logger.info("Render service listening on unix:%s", socket_path)
+    else:
+        await web.TCPSite(runner, args.host, args.port).start()
+        logger.info("Render service listening on http://%s:%d", args.host, args.port)
+
+    # Память, число рендеров и зависания Chromium (BROWSER_MAX_RSS_MB — под лимит контейнера сервиса)
+    supervisor = asyncio.create_task(browser_supervisor.run())
+    # Ссылка на задачу прогрева: иначе её может собрать сборщик мусора
+    warmup = None
+    if not args.no_warmup:
+        warmup = asyncio.create_task(warm_up_renderer())
+        warmup.add_done_callback(_log_warmup_failure)
+
+    try:
+        await stop.wait()
+    finally:
+        supervisor.cancel()
+        if warmup is not None:
+            warmup.cancel()
+        await runner.cleanup()
+        await browser_pool.close()
+        if args.socket:
+            Path(args.socket).unlink(missing_ok=True)
+    logger.info("Render service stopped")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", default=os.getenv("RENDER_SERVICE_SOCKET"), help="путь Unix-сокета")
+    parser.add_argument("--host", default=os.getenv("RENDER_SERVICE_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("RENDER_SERVICE_PORT", "8090")))
+    parser.add_argument("--concurrency", type=int, default=RENDER_SERVICE_CONCURRENCY, help="рендеров одновременно")
+    parser.add_argument("--max-queue", type=int, default=RENDER_SERVICE_MAX_QUEUE, help="ожидающих слота рендеров")
+    parser.add_argument("--no-warmup", action="store_true", help="не прогревать шаблоны после запуска")
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,89 @@
+"""
+Сайдкар рендеринга: долгоживущий Chromium, к которому бот подключается по CDP.
+
+Сайдкар запускает Chromium с открытым портом отладки, прогревает на нём все
+шаблоны (тем же путём, что и бот, — через connect_over_cdp) и держит браузер
+запущенным. Если Chromium упал, он перезапускается и прогревается заново.
+Бот с BROWSER_CDP_URL=http://<host>:<port> при деплое и перезапуске не платит
+за холодный старт браузера; несколько процессов бота могут делить один
+сайдкар.
+
+Страницы открываются по file://, поэтому сайдкар должен видеть те же пути,
+что и бот: temp/, шаблоны и системный каталог временных файлов.
+Порт отладки даёт полный контроль над браузером — не публикуйте его наружу.
+
+Запуск:
+    python render_sidecar.py --port 9222
+    BROWSER_CDP_URL=http://127.0.0.1:9222 python bot.py
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import signal
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from misc.warmup import warm_up_renderer  # noqa: E402
+from utils.browser_pool import LAUNCH_ARGS, browser_pool  # noqa: E402
+
+logger = logging.getLogger("render_sidecar")
+
+# Пауза перед перезапуском упавшего Chromium, чтобы не крутиться в цикле падений
+RELAUNCH_DELAY = 1.0
+
+
+async def run(host: str, port: int, warmup: bool) -> None:
+    from playwright.async_api import async_playwright
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    # Прогрев идёт через CDP, как у бота
+    connect_host = "127.0.0.1" if host in ("0.0.0.0", "") else host
+    browser_pool.cdp_url = f"http://{connect_host}:{port}"
+
+    playwright = await async_playwright().start()
+    try:
+        while not stop.is_set():
+            browser = await playwright.chromium.launch(
+                headless=True,
+                args=LAUNCH_ARGS + [f"--remote-debugging-address={host}", f"--remote-debugging-port={port}"],
+            )
+            disconnected = asyncio.Event()
+            browser.on("disconnected", lambda _browser: disconnected.set())
+            logger.info("Chromium is listening for CDP on %s:%d", host, port)
+
+            if warmup:
+                await warm_up_renderer()
+                # Соединение прогрева больше не нужно, Chromium продолжает работать
+                await browser_pool.close()
+
+            waiters = [asyncio.create_task(stop.wait()), asyncio.create_task(disconnected.wait())]
+            await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+            for waiter in waiters:
+                waiter.cancel()
+
+            if stop.is_set():
+                await browser.close()
+                break
+            logger.warning("Chromium exited, relaunching in %.0fs", RELAUNCH_DELAY)
+            await asyncio.sleep(RELAUNCH_DELAY)
+    finally:
+        await playwright.stop()
+    logger.info("Render sidecar stopped")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.getenv("RENDER_SIDECAR_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("RENDER_SIDECAR_PORT", "9222")))
+    parser.add_argument("--no-warmup", action="store_true", help="не прогревать шаблоны после запуска Chromium")
+    args = parser.parse_args()
+    asyncio.run(run(args.host, args.port, not args.no_warmup))
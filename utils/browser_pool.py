@@ -0,0 +1,301 @@
+"""
+Общий Chromium на процесс бота.
+
+Раньше каждый рендер (/okx, /forex, инвойс, титульная страница) запускал
+и закрывал свой Chromium — сотни миллисекунд и холодные кэши шрифтов на
+каждый запрос. Теперь браузер запускается один раз (лениво или фоновым
+прогревом при старте), а каждый рендер получает изолированный контекст.
+Если браузер упал, следующий рендер запустит его заново.
+
+Плановый перезапуск (recycle) не обрывает рендеры: текущий браузер выводится
+из оборота, новые рендеры идут в свежий Chromium, а старый закрывается, когда
+в нём не останется открытых контекстов. Когда перезапускать, решает
+utils/browser_supervisor.py.
+
+Playwright импортируется только при первом запуске браузера, чтобы не
+замедлять старт бота.
+
+Если задан BROWSER_CDP_URL, браузер не запускается, а берётся у сайдкара
+(render_sidecar.py) через connect_over_cdp: прогретый Chromium переживает
+перезапуски бота и может быть общим для нескольких процессов. Когда сайдкар
+недоступен (перезапускается), подключение повторяется до
+BROWSER_CDP_CONNECT_TIMEOUT секунд, после чего рендер завершается ошибкой.
+
+Пример:
+    from utils.browser_pool import browser_pool
+    async with browser_pool.context("image", viewport={"width": 1200, "height": 800}) as context:
+        page = await context.new_page()
+"""
+
+import asyncio
+import ipaddress
+import logging
+import os
+import socket
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from utils import startup
+from utils.metrics import (
+    BROWSER_CDP_CONNECTS_TOTAL,
+    BROWSER_EVENTS_TOTAL,
+    BROWSER_GENERATION_RENDERS,
+    BROWSER_IN_FLIGHT,
+    BROWSER_LAUNCHES_TOTAL,
+    BROWSER_RECYCLES_TOTAL,
+    BROWSER_RENDERS_TOTAL,
+    RENDER_PHASE_SECONDS,
+    RENDERER_READY,
+)
+from utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+LAUNCH_ARGS = [
+    "--disable-web-security",
+    "--disable-features=VizDisplayCompositor",
+    "--no-sandbox",
+    "--disable-setuid-sandbox",
+]
+
+BROWSER_CDP_URL = os.getenv("BROWSER_CDP_URL") or None
+BROWSER_CDP_CONNECT_TIMEOUT = float(os.getenv("BROWSER_CDP_CONNECT_TIMEOUT", "10"))
+# Пауза между попытками подключения к сайдкару и таймаут одной попытки
+CDP_RETRY_INTERVAL = 0.5
+CDP_ATTEMPT_TIMEOUT_MS = 5000
+
+
+async def _resolve_cdp_url(url: str) -> str:
+    """Подставляет IP вместо имени хоста: Chromium отвечает на CDP только на IP или localhost."""
+    parts = urlsplit(url)
+    host = parts.hostname
+    if not host or host == "localhost":
+        return url
+    try:
+        ipaddress.ip_address(host)
+        return url
+    except ValueError:
+        pass
+    infos = await asyncio.get_running_loop().getaddrinfo(host, parts.port, family=socket.AF_INET, type=socket.SOCK_STREAM)
+    address = infos[0][4][0]
+    netloc = f"{address}:{parts.port}" if parts.port else address
+    return parts._replace(netloc=netloc).geturl()
+
+
+class BrowserPool:
+    def __init__(self, cdp_url: Optional[str] = None, connect_timeout: float = BROWSER_CDP_CONNECT_TIMEOUT) -> None:
+        self.cdp_url = cdp_url
+        self.connect_timeout = connect_timeout
+        self._playwright: Any = None
+        self._browser: Any = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._connect_failed_at: Optional[float] = None
+        # Открытые контексты по браузерам и браузеры, ожидающие закрытия после recycle()
+        self._in_flight: Dict[Any, int] = {}
+        self._retiring: Dict[Any, float] = {}
+        self._cdp_session: Any = None
+        self._cdp_session_browser: Any = None
+        # Рендеры, обслуженные текущим браузером
+        self.renders = 0
+        self.ready = False
+
+    def _connected(self) -> bool:
+        return self._browser is not None and self._browser.is_connected()
+
+    @property
+    def connected(self) -> bool:
+        return self._connected()
+
+    @property
+    def shared(self) -> bool:
+        """Браузер принадлежит сайдкару и может обслуживать другие процессы."""
+        return bool(self.cdp_url)
+
+    async def browser(self, renderer: str = "pool") -> Any:
+        """Возвращает запущенный браузер, при необходимости запуская его."""
+        if self._connected():
+            return self._browser
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        requested = time.monotonic()
+        async with self._lock:
+            if self._connected():
+                return self._browser
+            # Пока мы ждали, сайдкар уже не ответил за полный таймаут — не ждём ещё раз
+            if self._connect_failed_at is not None and self._connect_failed_at >= requested:
+                raise RuntimeError(f"Chromium sidecar {self.cdp_url} is unavailable")
+
+            from playwright.async_api import async_playwright
+
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+            if self.cdp_url:
+                self._browser = await self._connect(renderer)
+            else:
+                with span("browser.launch"), RENDER_PHASE_SECONDS.time(renderer=renderer, phase="launch"):
+                    self._browser = await self._playwright.chromium.launch(headless=True, args=LAUNCH_ARGS)
+                BROWSER_LAUNCHES_TOTAL.inc(renderer=renderer)
+                logger.info("Chromium launched (%s)", renderer)
+            self._browser.on("disconnected", self._on_disconnected)
+            self.renders = 0
+            BROWSER_GENERATION_RENDERS.set(0)
+            return self._browser
+
+    async def _connect(self, renderer: str) -> Any:
+        """Подключается к сайдкару, повторяя попытки до connect_timeout секунд."""
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            try:
+                with span("browser.connect"), RENDER_PHASE_SECONDS.time(renderer=renderer, phase="connect"):
+                    # Адрес резолвим на каждой попытке: после перезапуска контейнера IP мог смениться
+                    endpoint = await _resolve_cdp_url(self.cdp_url)
+                    browser = await self._playwright.chromium.connect_over_cdp(endpoint, timeout=CDP_ATTEMPT_TIMEOUT_MS)
+            except Exception as exc:  # noqa: BLE001
+                BROWSER_CDP_CONNECTS_TOTAL.inc(result="error")
+                if time.monotonic() + CDP_RETRY_INTERVAL >= deadline:
+                    self._connect_failed_at = time.monotonic()
+                    raise RuntimeError(f"Chromium sidecar {self.cdp_url} is unavailable: {exc}") from exc
+                logger.debug("Chromium sidecar is unavailable, retrying: %s", exc)
+                await asyncio.sleep(CDP_RETRY_INTERVAL)
+                continue
+            BROWSER_CDP_CONNECTS_TOTAL.inc(result="ok")
+            self._connect_failed_at = None
+            logger.info("Connected to Chromium sidecar %s (%s)", self.cdp_url, renderer)
+            # Сайдкар прогревает шаблоны сам: после переподключения браузер снова готов
+            if startup.is_marked("renderer_ready"):
+                self.set_ready(True)
+            return browser
+
+    def _on_disconnected(self, browser: Any) -> None:
+        if browser is not self._browser:
+            self._retiring.pop(browser, None)
+            return
+        BROWSER_EVENTS_TOTAL.inc(event="crash")
+        if self.cdp_url:
+            logger.warning("Chromium sidecar disconnected, reconnecting on the next render")
+        else:
+            logger.warning("Chromium disconnected, it will be relaunched on the next render")
+        self._browser = None
+        self.set_ready(False)
+
+    def set_ready(self, ready: bool) -> None:
+        self.ready = ready
+        RENDERER_READY.set(1 if ready else 0)
+        if ready:
+            startup.mark("renderer_ready")
+
+    @staticmethod
+    def _on_page(page: Any) -> None:
+        page.on("crash", lambda _page: BROWSER_EVENTS_TOTAL.inc(event="page_crash"))
+
+    @asynccontextmanager
+    async def context(self, renderer: str, **options: Any) -> AsyncIterator[Any]:
+        """Изолированный контекст браузера на один рендер; закрывается на выходе."""
+        # Рендер, начатый на прогретом браузере, — «быстрый»
+        fast = self.ready
+        browser = await self.browser(renderer)
+        self._in_flight[browser] = self._in_flight.get(browser, 0) + 1
+        BROWSER_IN_FLIGHT.inc()
+        try:
+            with RENDER_PHASE_SECONDS.time(renderer=renderer, phase="context"):
+                context = await browser.new_context(**options)
+            context.on("page", self._on_page)
+            try:
+                yield context
+            finally:
+                try:
+                    await context.close()
+                except Exception as exc:  # noqa: BLE001
+                    logger.debug("Failed to close browser context: %s", exc)
+        finally:
+            BROWSER_IN_FLIGHT.dec()
+            BROWSER_RENDERS_TOTAL.inc()
+            remaining = self._in_flight.get(browser, 1) - 1
+            if browser is self._browser:
+                self._in_flight[browser] = remaining
+                self.renders += 1
+                BROWSER_GENERATION_RENDERS.set(self.renders)
+            elif remaining > 0:
+                if browser in self._in_flight:
+                    self._in_flight[browser] = remaining
+            else:
+                # Последний рендер выведенного (или упавшего) браузера
+                self._in_flight.pop(browser, None)
+                if browser in self._retiring:
+                    await self._close_browser(browser)
+        if fast:
+            startup.mark("first_fast_render")
+
+    async def _close_browser(self, browser: Any) -> None:
+        self._retiring.pop(browser, None)
+        self._in_flight.pop(browser, None)
+        if self._cdp_session_browser is browser:
+            self._cdp_session = self._cdp_session_browser = None
+        try:
+            await browser.close()
+        except Exception as exc:  # noqa: BLE001
+            logger.debug("Failed to close Chromium: %s", exc)
+
+    async def recycle(self, reason: str, force: bool = False) -> bool:
+        """Выводит текущий браузер из оборота и сразу запускает новый.
+
+        Старый браузер закрывается, когда завершатся начатые в нём рендеры
+        (force=True — немедленно, для зависшего браузера). Браузер сайдкара
+        общий для нескольких процессов, поэтому его не перезапускаем.
+        """
+        old = self._browser
+        if old is None or self.shared:
+            return False
+        self._browser = None
+        self._retiring[old] = time.monotonic()
+        BROWSER_RECYCLES_TOTAL.inc(reason=reason)
+        logger.warning(
+            "Recycling Chromium (%s) after %d renders, %d in flight",
+            reason, self.renders, self._in_flight.get(old, 0),
+        )
+        if force or self._in_flight.get(old, 0) <= 0:
+            await self._close_browser(old)
+        # Новый браузер запускаем сразу, чтобы следующий рендер не ждал запуска
+        await self.browser("recycle")
+        return True
+
+    async def reap(self, grace: float) -> None:
+        """Закрывает выведенные браузеры, рендеры в которых не завершились за grace секунд."""
+        now = time.monotonic()
+        for browser, since in list(self._retiring.items()):
+            if now - since >= grace:
+                BROWSER_EVENTS_TOTAL.inc(event="recycle_timeout")
+                logger.warning("Closing retired Chromium with %d renders still open", self._in_flight.get(browser, 0))
+                await self._close_browser(browser)
+
+    async def process_info(self, timeout: float) -> Optional[List[dict]]:
+        """Процессы текущего браузера (SystemInfo.getProcessInfo): type, id (pid), cpuTime.
+
+        Если браузер не отвечает за timeout секунд, поднимается asyncio.TimeoutError.
+        """
+        browser = self._browser
+        if browser is None or not browser.is_connected():
+            return None
+        if self._cdp_session_browser is not browser:
+            self._cdp_session = await asyncio.wait_for(browser.new_browser_cdp_session(), timeout)
+            self._cdp_session_browser = browser
+        result = await asyncio.wait_for(self._cdp_session.send("SystemInfo.getProcessInfo"), timeout)
+        return result.get("processInfo", [])
+
+    async def close(self) -> None:
+        """Закрывает браузер; подключение к сайдкару только разрывается, его Chromium продолжает работать."""
+        self.set_ready(False)
+        browser, self._browser = self._browser, None
+        for retired in list(self._retiring):
+            await self._close_browser(retired)
+        if browser is not None:
+            await self._close_browser(browser)
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+
+browser_pool = BrowserPool(cdp_url=BROWSER_CDP_URL)
@@ -0,0 +1,116 @@
+"""
+Надзор за общим Chromium: память, число рендеров, зависания.
+
+Раз в BROWSER_SUPERVISOR_INTERVAL секунд супервизор спрашивает у браузера
+список его процессов (CDP SystemInfo.getProcessInfo), читает их RSS из /proc
+и публикует browser_rss_bytes{process_type}. Браузер планово перезапускается
+(BrowserPool.recycle — без обрыва начатых рендеров), если:
+
+- он обслужил BROWSER_MAX_RENDERS рендеров;
+- суммарный RSS его процессов превысил BROWSER_MAX_RSS_MB;
+- он не ответил за BROWSER_HANG_TIMEOUT секунд (перезапуск немедленный).
+
+Выведенный браузер, в котором рендеры не завершились за BROWSER_RECYCLE_GRACE
+секунд, закрывается принудительно. Нулевое значение порога отключает проверку.
+Браузер сайдкара (BROWSER_CDP_URL) общий, его супервизор только измеряет.
+"""
+
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from typing import Dict, Optional
+
+from utils.browser_pool import BrowserPool, browser_pool
+from utils.metrics import BROWSER_EVENTS_TOTAL, BROWSER_RSS_BYTES
+
+logger = logging.getLogger(__name__)
+
+BROWSER_MAX_RENDERS = int(os.getenv("BROWSER_MAX_RENDERS", "1000"))
+# Лимит контейнера — 2G, браузеру оставляем запас под сам бот
+BROWSER_MAX_RSS_MB = int(os.getenv("BROWSER_MAX_RSS_MB", "1200"))
+BROWSER_SUPERVISOR_INTERVAL = float(os.getenv("BROWSER_SUPERVISOR_INTERVAL", "30"))
+BROWSER_HANG_TIMEOUT = float(os.getenv("BROWSER_HANG_TIMEOUT", "10"))
+BROWSER_RECYCLE_GRACE = float(os.getenv("BROWSER_RECYCLE_GRACE", "120"))
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def read_rss_bytes(pid: int) -> Optional[int]:
+    """RSS процесса из /proc; None, если процесс не виден (другой контейнер) или уже завершился."""
+    try:
+        with open(f"/proc/{pid}/statm", "r") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class BrowserSupervisor:
+    def __init__(
+        self,
+        pool: BrowserPool = browser_pool,
+        max_renders: int = BROWSER_MAX_RENDERS,
+        max_rss_mb: int = BROWSER_MAX_RSS_MB,
+        interval: float = BROWSER_SUPERVISOR_INTERVAL,
+        hang_timeout: float = BROWSER_HANG_TIMEOUT,
+        recycle_grace: float = BROWSER_RECYCLE_GRACE,
+    ) -> None:
+        self.pool = pool
+        self.max_renders = max_renders
+        self.max_rss_bytes = max_rss_mb * 1024 * 1024
+        self.interval = interval
+        self.hang_timeout = hang_timeout
+        self.recycle_grace = recycle_grace
+        self._seen_types: set = set()
+
+    def _publish(self, rss_by_type: Dict[str, int]) -> None:
+        # Типы, пропавшие с прошлого замера, обнуляем, чтобы gauge не застывал
+        for process_type in self._seen_types | set(rss_by_type):
+            BROWSER_RSS_BYTES.set(rss_by_type.get(process_type, 0), process_type=process_type)
+        self._seen_types |= set(rss_by_type)
+
+    async def check(self) -> Optional[dict]:
+        """Один проход надзора. Возвращает замер или None, если браузер не запущен."""
+        await self.pool.reap(self.recycle_grace)
+        if not self.pool.connected:
+            self._publish({})
+            return None
+
+        renders = self.pool.renders
+        try:
+            processes = await self.pool.process_info(self.hang_timeout)
+        except asyncio.TimeoutError:
+            BROWSER_EVENTS_TOTAL.inc(event="hang")
+            logger.error("Chromium did not answer in %.1fs", self.hang_timeout)
+            await self.pool.recycle("hang", force=True)
+            return {"renders": renders, "rss_bytes": None, "recycled": "hang"}
+        if processes is None:
+            return None
+
+        rss_by_type: Dict[str, int] = defaultdict(int)
+        for process in processes:
+            rss = read_rss_bytes(process["id"])
+            if rss is not None:
+                rss_by_type[process["type"].lower()] += rss
+        self._publish(rss_by_type)
+        total = sum(rss_by_type.values())
+
+        reason = None
+        if self.max_renders and renders >= self.max_renders:
+            reason = "renders"
+        elif self.max_rss_bytes and total >= self.max_rss_bytes:
+            reason = "rss"
+        recycled = reason if reason and await self.pool.recycle(reason) else None
+        return {"renders": renders, "rss_bytes": total, "by_type": dict(rss_by_type), "recycled": recycled}
+
+    async def run(self) -> None:
+        """Фоновая задача надзора."""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.check()
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Browser supervisor check failed: %s", exc)
+
+
+browser_supervisor = BrowserSupervisor()
@@ -0,0 +1,401 @@
+"""
+Гибридный рендер карточек: статичный слой из Chromium + текст через Pillow.
+
+Почти вся карточка (фон, логотипы, QR-код, подписи) от запроса к запросу не
+меняется. Элементы с переменным содержимым размечены в шаблоне атрибутом
+data-slot. Для каждой пары (шаблон, масштаб) Chromium один раз рендерит
+карточку на образцовых значениях тем же путём, что и html_to_image, но:
+
+- перед скриншотом снимает геометрию слотов — для каждого текстового узла
+  базовую линию, начало/конец строки, шрифт, кегль, цвет, letter-spacing и
+  правую рамку (разделители тегов), для картинок — прямоугольник;
+- затем делает текст и картинки слотов прозрачными и сохраняет скриншот —
+  это статичный слой.
+
+Дальше каждый запрос — это копия слоя, на которую в пуле потоков рисуются
+текст (теми же шрифтами из @font-face шаблона) и иконка: браузер не нужен.
+Положение узлов внутри слота пересчитывается по ширине нового текста с
+выравниванием из CSS; по словам переносятся только узлы, которые переносились
+и в образцовом рендере (дата шеринга, у неё max-width). Символы, которых нет в основном шрифте (например, ₮ в
+Okx Sans), рисуются следующим шрифтом из font-family, в котором они есть, —
+как делает Chromium; системные семейства ищутся через fc-match.
+
+Если шаблон не поддерживается (нет data-slot, неизвестный шрифт, иконка не
+растровая), выбрасывается RasterUnsupported — вызывающий код рендерит
+карточку целиком в Chromium.
+"""
+
+import asyncio
+import logging
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.html_to_image import html_to_image
+from utils.raster_text import (
+    FontSet,
+    RasterUnsupported,
+    draw_runs,
+    parse_color,
+    parse_font_faces,
+    split_families,
+    text_width,
+)
+from utils.render_jobs import RenderJob
+from utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Снимок геометрии слотов. Исходный шаблон (с плейсхолдерами) разбирается
+# DOMParser'ом: структура та же, что у отрендеренной страницы, поэтому
+# текстовые узлы слотов сопоставляются по порядку.
+_CAPTURE_JS = """
+({selector, raw}) => {
+  const card = document.querySelector(selector);
+  const cardRect = card.getBoundingClientRect();
+  const dpr = window.devicePixelRatio;
+  const k = (cardRect.width / card.offsetWidth) * dpr;
+  const px = (v) => parseFloat(v) || 0;
+  const X = (v) => (v - cardRect.left) * dpr;
+  const Y = (v) => (v - cardRect.top) * dpr;
+  const textNodes = (root) => {
+    const walker = root.ownerDocument.createTreeWalker(root, NodeFilter.SHOW_TEXT);
+    const nodes = [];
+    for (let node = walker.nextNode(); node; node = walker.nextNode()) {
+      if (node.textContent.trim()) nodes.push(node);
+    }
+    return nodes;
+  };
+  const rawSlots = new DOMParser().parseFromString(raw, "text/html").querySelectorAll("[data-slot]");
+  const slots = [];
+  card.querySelectorAll("[data-slot]").forEach((el, i) => {
+    const style = getComputedStyle(el);
+    const r = el.getBoundingClientRect();
+    const slot = {
+      name: el.dataset.slot,
+      kind: el.tagName === "IMG" ? "image" : "text",
+      rect: [X(r.left), Y(r.top), r.width * dpr, r.height * dpr],
+      align: style.textAlign,
+      max_width: style.maxWidth === "none" ? null : px(style.maxWidth) * k,
+      line_height: style.lineHeight === "normal" ? null : px(style.lineHeight) * k,
+      content_right: X(r.right) - (px(style.paddingRight) + px(style.borderRightWidth)) * k,
+      segments: [],
+    };
+    const nodes = textNodes(el);
+    const raws = rawSlots[i] ? textNodes(rawSlots[i]) : [];
+    if (slot.kind === "text" && raws.length !== nodes.length) {
+      slot.error = `text nodes: ${nodes.length} rendered, ${raws.length} in template`;
+    }
+    nodes.forEach((node, j) => {
+      if (!raws[j]) return;
+      const parent = node.parentElement;
+      const ps = getComputedStyle(parent);
+      const range = document.createRange();
+      range.selectNodeContents(node);
+      const rects = [...range.getClientRects()].filter((rc) => rc.width > 0);
+      // Нулевой inline-block перед текстом стоит на базовой линии первой строки
+      const marker = document.createElement("span");
+      marker.style.cssText = "display:inline-block;width:0;height:0;margin:0;padding:0;border:0";
+      parent.insertBefore(marker, node);
+      const baseline = marker.getBoundingClientRect().bottom;
+      marker.remove();
+      // Пробел в конце узла значим, только если за ним в той же строке идёт элемент
+      let text = raws[j].textContent.replace(/\\s+/g, " ").trimStart();
+      if (!(node.nextSibling && node.nextSibling.nodeType === Node.ELEMENT_NODE)) text = text.trimEnd();
+      const lastInParent = textNodes(parent).pop() === node;
+      const pr = parent.getBoundingClientRect();
+      const border = px(ps.borderRightWidth) * k;
+      slot.segments.push({
+        text,
+        family: ps.fontFamily,
+        weight: parseInt(ps.fontWeight, 10) || 400,
+        size: px(ps.fontSize) * k,
+        color: ps.color,
+        letter_spacing: ps.letterSpacing === "normal" ? 0 : px(ps.letterSpacing) * k,
+        baseline: Y(baseline),
+        left: rects.length ? X(rects[0].left) : X(pr.left),
+        right: rects.length ? X(rects[rects.length - 1].right) : X(pr.left),
+        lines: new Set(rects.map((rc) => Math.round(rc.top))).size,
+        border: lastInParent && border > 0 && ps.borderRightStyle !== "none"
+          ? {width: border, color: ps.borderRightColor, left: X(pr.right) - border, top: Y(pr.top), bottom: Y(pr.bottom)}
+          : null,
+      });
+    });
+    slots.push(slot);
+  });
+  return {width: cardRect.width * dpr, height: cardRect.height * dpr, slots};
+}
+"""
+
+# Статичный слой: всё содержимое слотов прозрачное, раскладка не меняется
+_HIDE_SLOTS_CSS = """
+[data-slot], [data-slot] * {
+  color: transparent !important;
+  -webkit-text-fill-color: transparent !important;
+  text-shadow: none !important;
+  border-color: transparent !important;
+}
+img[data-slot] { visibility: hidden !important; }
+"""
+
+@dataclass
+class Segment:
+    text: str
+    families: List[str]
+    weight: int
+    size: float
+    color: Tuple[int, int, int, int]
+    letter_spacing: float
+    baseline: float
+    left: float
+    right: float
+    lines: int
+    border: Optional[dict] = None
+
+
+@dataclass
+class Slot:
+    name: str
+    kind: str
+    rect: Tuple[float, float, float, float]
+    align: str
+    max_width: Optional[float]
+    line_height: Optional[float]
+    content_right: float
+    segments: List[Segment] = field(default_factory=list)
+
+
+@dataclass
+class CardLayer:
+    template: str
+    scale: float
+    image: Any  # PIL.Image.Image: RGB, если карточка непрозрачна, иначе RGBA
+    slots: List[Slot]
+    fonts: FontSet
+
+
+def _wrap(words: List[str], fonts: FontSet, seg: Segment, max_width: float) -> List[str]:
+    lines: List[str] = []
+    for word in words:
+        candidate = f"{lines[-1]} {word}" if lines else word
+        runs = fonts.runs(candidate, seg.families, seg.weight, seg.size)
+        if lines and text_width(runs, seg.letter_spacing) > max_width:
+            lines.append(word)
+        elif lines:
+            lines[-1] = candidate
+        else:
+            lines.append(word)
+    return lines
+
+
+def _fill(text: str, values: Dict[str, str]) -> str:
+    for key, value in values.items():
+        text = text.replace("{" + key + "}", value)
+    return text
+
+
+def _draw_text_slot(draw, fonts: FontSet, slot: Slot, values: Dict[str, str]) -> None:
+    segments = slot.segments
+    if not segments:
+        return
+    if len(segments) == 1 and slot.max_width and slot.line_height and segments[0].lines > 1:
+        # Многострочный узел с max-width (дата шеринга): перенос по словам
+        seg = segments[0]
+        fill = seg.color
+        for i, line in enumerate(_wrap(_fill(seg.text, values).split(" "), fonts, seg, slot.max_width)):
+            runs = fonts.runs(line, seg.families, seg.weight, seg.size)
+            width = text_width(runs, seg.letter_spacing)
+            x = slot.content_right - width if slot.align in ("right", "end") else seg.left
+            draw_runs(draw, x, seg.baseline + i * slot.line_height, runs, fill, seg.letter_spacing)
+        return
+
+    texts = [_fill(seg.text, values) for seg in segments]
+    runs = [fonts.runs(t, seg.families, seg.weight, seg.size) for t, seg in zip(texts, segments)]
+    widths = [text_width(r, seg.letter_spacing) for r, seg in zip(runs, segments)]
+    # Промежутки между узлами (padding, рамки, margin) — как в образцовом рендере
+    gaps = [nxt.left - cur.right for cur, nxt in zip(segments, segments[1:])]
+    total = sum(widths) + sum(gaps)
+    if slot.align in ("right", "end"):
+        x = segments[-1].right - total
+    elif slot.align == "center":
+        x = (segments[0].left + segments[-1].right - total) / 2
+    else:
+        x = segments[0].left
+
+    for i, seg in enumerate(segments):
+        end = draw_runs(draw, x, seg.baseline, runs[i], seg.color, seg.letter_spacing)
+        if seg.border:
+            border_x = end + (seg.border["left"] - seg.right)
+            draw.rectangle(
+                (border_x, seg.border["top"], border_x + seg.border["width"] - 1, seg.border["bottom"] - 1),
+                fill=parse_color(seg.border["color"]),
+            )
+        x = end + (gaps[i] if i < len(gaps) else 0)
+
+
+def composite(layer: CardLayer, values: Dict[str, str], images: Dict[str, Any], output_path: Path) -> str:
+    """Собирает карточку из слоя (синхронно, для пула потоков) и сохраняет PNG."""
+    from PIL import Image, ImageDraw
+
+    fonts = layer.fonts
+    card = layer.image.copy()
+    draw = ImageDraw.Draw(card, "RGBA")
+    for slot in layer.slots:
+        if slot.kind == "image":
+            icon = images.get(slot.name)
+            if icon is None:
+                continue
+            x, y, w, h = slot.rect
+            size = (max(1, round(w)), max(1, round(h)))
+            icon = icon.convert("RGBA")
+            if icon.size != size:
+                icon = icon.resize(size, Image.LANCZOS)
+            if card.mode == "RGBA":
+                card.alpha_composite(icon, (round(x), round(y)))
+            else:
+                card.paste(icon, (round(x), round(y)), icon)
+        else:
+            _draw_text_slot(draw, fonts, slot, values)
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    # Быстрое сжатие: PNG из Chromium тоже не оптимизирован, а время здесь — основная задержка
+    card.save(output_path, format="PNG", compress_level=1)
+    return str(output_path)
+
+
+def _parse_layout(layout: dict) -> List[Slot]:
+    slots: List[Slot] = []
+    for raw in layout["slots"]:
+        if raw.get("error"):
+            raise RasterUnsupported(f"slot {raw['name']}: {raw['error']}")
+        slot = Slot(
+            name=raw["name"],
+            kind=raw["kind"],
+            rect=tuple(raw["rect"]),
+            align=raw["align"],
+            max_width=raw["max_width"],
+            line_height=raw["line_height"],
+            content_right=raw["content_right"],
+        )
+        for seg in raw["segments"] if slot.kind == "text" else []:
+            slot.segments.append(
+                Segment(
+                    text=seg["text"],
+                    families=split_families(seg["family"]),
+                    weight=seg["weight"],
+                    size=seg["size"],
+                    color=parse_color(seg["color"]),
+                    letter_spacing=seg["letter_spacing"],
+                    baseline=seg["baseline"],
+                    left=seg["left"],
+                    right=seg["right"],
+                    lines=seg["lines"],
+                    border=seg["border"],
+                )
+            )
+        slots.append(slot)
+    if not slots:
+        raise RasterUnsupported("template has no data-slot elements")
+    return slots
+
+
+class CardCompositor:
+    """Кэш статичных слоёв по (шаблон, масштаб) и сборка карточек из них.
+
+    prepare_sample(tmpdir, template_name) готовит HTML карточки с образцовыми
+    значениями (ресурсы рядом), render_kwargs — параметры html_to_image, с
+    которыми карточка рендерится целиком.
+    """
+
+    def __init__(
+        self,
+        template_dir: Path,
+        prepare_sample: Callable[[Path, str], Path],
+        fonts_css: str = "fonts.css",
+        **render_kwargs: Any,
+    ) -> None:
+        self.template_dir = template_dir
+        self.prepare_sample = prepare_sample
+        self.fonts_css = fonts_css
+        self.render_kwargs = render_kwargs
+        self.selector = render_kwargs.get("selector", 'div[id="dept_img_trade"]')
+        self.scale = float(render_kwargs.get("device_scale_factor", 6))
+        self._layers: Dict[Tuple[str, float], CardLayer] = {}
+        self._unsupported: Dict[Tuple[str, float], str] = {}
+        self._locks: Dict[Tuple[str, float], asyncio.Lock] = {}
+
+    def invalidate(self) -> None:
+        """Сбрасывает слои (после правки шаблона или ресурсов)."""
+        self._layers.clear()
+        self._unsupported.clear()
+
+    async def layer(self, template_name: str, job: Optional[RenderJob] = None) -> CardLayer:
+        """Слой шаблона; при первом обращении снимается в Chromium (один раз на ключ)."""
+        key = (template_name, self.scale)
+        layer = self._layers.get(key)
+        if layer is not None:
+            return layer
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            if key in self._unsupported:
+                # Не снимаем слой заново на каждый запрос: шаблон от этого не изменится
+                raise RasterUnsupported(self._unsupported[key])
+            layer = self._layers.get(key)
+            if layer is None:
+                try:
+                    layer = self._layers[key] = await self._capture(template_name, job)
+                except RasterUnsupported as exc:
+                    self._unsupported[key] = str(exc)
+                    raise
+        return layer
+
+    async def _capture(self, template_name: str, job: Optional[RenderJob]) -> CardLayer:
+        from PIL import Image
+
+        raw_html = (self.template_dir / template_name).read_text(encoding="utf-8")
+        layout: Dict[str, Any] = {}
+
+        async def snapshot(page) -> None:
+            layout.update(await page.evaluate(_CAPTURE_JS, {"selector": self.selector, "raw": raw_html}))
+            await page.add_style_tag(content=_HIDE_SLOTS_CSS)
+
+        with span("composite.capture", template=template_name), tempfile.TemporaryDirectory() as tmpdir:
+            temp_html = self.prepare_sample(Path(tmpdir), template_name)
+            png_path = Path(tmpdir) / "layer.png"
+            await html_to_image(
+                html_file_path=str(temp_html),
+                output_path=str(png_path),
+                job=job or RenderJob(template_name),
+                before_screenshot=snapshot,
+                **self.render_kwargs,
+            )
+            with Image.open(png_path) as image:
+                image = image.convert("RGBA")
+            if image.getextrema()[3] == (255, 255):
+                # Непрозрачная карточка: без альфа-канала PNG кодируется на четверть быстрее
+                image = image.convert("RGB")
+
+        slots = _parse_layout(layout)
+        faces = parse_font_faces(self.template_dir / self.fonts_css)
+        logger.info(
+            "Captured static layer of %s at x%g: %dx%d, %d slots",
+            template_name, self.scale, image.width, image.height, len(slots),
+        )
+        return CardLayer(template_name, self.scale, image, slots, FontSet(faces))
+
+    async def render(
+        self,
+        template_name: str,
+        values: Dict[str, str],
+        images: Dict[str, Any],
+        output_path: Path,
+        job: Optional[RenderJob] = None,
+    ) -> str:
+        """Карточка из кэшированного слоя; текст и картинки рисуются в пуле потоков."""
+        job = job or RenderJob(template_name)
+        layer = await self.layer(template_name, job)
+        # Отдельный guard: вложенный в guard html_to_image он бы не отличил отмену от дедлайна
+        async with job.guard():
+            with span("composite.draw", template=template_name):
+                return await asyncio.to_thread(composite, layer, values, images, Path(output_path))
@@ -0,0 +1,255 @@
+"""
+Очередь отправки комментариев под постами каналов.
+
+Когда несколько каналов публикуют посты одновременно, ответы на авто-пересланные
+сообщения нужно отправлять с учётом лимитов Telegram:
+
+- не больше ~20 сообщений в минуту в одну группу (per-chat token bucket);
+- не больше ~30 сообщений в секунду на бота в целом (глобальный token bucket);
+- при ``RetryAfter`` ждём ровно столько, сколько попросил Telegram, и повторяем.
+
+Для каждого чата обсуждения работает отдельный воркер, поэтому комментарии
+в одном чате уходят строго в порядке поступления постов, а медленный чат
+не задерживает остальные. Для каждого отправленного комментария замеряется
+задержка «пост → комментарий»: наш комментарий должен оказаться первым.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+from aiogram.types import ReplyParameters
+
+from utils.metrics import (
+    CHANNEL_COMMENT_DELAY_SECONDS,
+    CHANNEL_COMMENT_QUEUE_DEPTH,
+    CHANNEL_COMMENTS_TOTAL,
+)
+from utils.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CommentJob:
+    """Комментарий, который нужно отправить ответом на пост в чате обсуждения."""
+
+    chat_id: int
+    reply_to_message_id: int
+    text: str
+    channel_id: int
+    # Unix-время публикации поста (message.date авто-пересланного сообщения)
+    posted_at: float
+    message_thread_id: Optional[int] = None
+    attempts: int = 0
+
+
+class CommentDispatcher:
+    """Диспетчер комментариев с rate limit, ретраями и порядком доставки по чатам."""
+
+    def __init__(
+        self,
+        per_chat_rate: float = 20 / 60,
+        per_chat_burst: float = 3,
+        global_rate: float = 25,
+        global_burst: float = 30,
+        max_retries: int = 5,
+        max_queue_size: int = 100,
+        worker_idle_timeout: float = 60,
+    ) -> None:
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.max_retries = max_retries
+        self.max_queue_size = max_queue_size
+        self.worker_idle_timeout = worker_idle_timeout
+
+        self._global_bucket = TokenBucket(global_rate, global_burst)
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._queues: Dict[int, asyncio.Queue] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self._closed = False
+
+        # Последние задержки «пост → комментарий» в секундах
+        self.delays: Deque[float] = deque(maxlen=1000)
+        self.sent_count = 0
+        self.failed_count = 0
+        self.dropped_count = 0
+
+    def enqueue(self, bot: Bot, job: CommentJob) -> bool:
+        """Ставит комментарий в очередь чата. Возвращает False, если очередь переполнена."""
+        if self._closed:
+            logger.warning("Comment dispatcher is closed, dropping comment for chat %s", job.chat_id)
+            self.dropped_count += 1
+            CHANNEL_COMMENTS_TOTAL.inc(result="dropped")
+            return False
+
+        queue = self._queues.get(job.chat_id)
+        if queue is None:
+            queue = asyncio.Queue(maxsize=self.max_queue_size)
+            self._queues[job.chat_id] = queue
+
+        try:
+            queue.put_nowait(job)
+        except asyncio.QueueFull:
+            logger.error(
+                "Comment queue for chat %s is full (%d), dropping comment for message_id=%s",
+                job.chat_id,
+                self.max_queue_size,
+                job.reply_to_message_id,
+            )
+            self.dropped_count += 1
+            CHANNEL_COMMENTS_TOTAL.inc(result="dropped")
+            return False
+
+        CHANNEL_COMMENT_QUEUE_DEPTH.inc()
+        worker = self._workers.get(job.chat_id)
+        if worker is None or worker.done():
+            self._workers[job.chat_id] = asyncio.create_task(
+                self._chat_worker(bot, job.chat_id, queue),
+                name=f"comment-worker-{job.chat_id}",
+            )
+        return True
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def _chat_worker(self, bot: Bot, chat_id: int, queue: asyncio.Queue) -> None:
+        """Последовательно отправляет комментарии одного чата, пока очередь не опустеет."""
+        while True:
+            try:
+                job = await asyncio.wait_for(queue.get(), timeout=self.worker_idle_timeout)
+            except asyncio.TimeoutError:
+                # Чат давно не получал постов — освобождаем воркер и его состояние
+                if queue.empty():
+                    self._workers.pop(chat_id, None)
+                    self._queues.pop(chat_id, None)
+                    self._chat_buckets.pop(chat_id, None)
+                    return
+                continue
+
+            try:
+                await self._deliver(bot, job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:  # noqa: BLE001
+                self.failed_count += 1
+                CHANNEL_COMMENTS_TOTAL.inc(result="failed")
+                logger.error(
+                    "Unexpected error while sending comment to chat %s: %s", chat_id, exc
+                )
+            finally:
+                CHANNEL_COMMENT_QUEUE_DEPTH.dec()
+                queue.task_done()
+
+    async def _deliver(self, bot: Bot, job: CommentJob) -> None:
+        chat_bucket = self._chat_bucket(job.chat_id)
+
+        while True:
+            await chat_bucket.acquire()
+            await self._global_bucket.acquire()
+            job.attempts += 1
+
+            try:
+                await bot.send_message(
+                    chat_id=job.chat_id,
+                    text=job.text,
+                    message_thread_id=job.message_thread_id,
+                    reply_parameters=ReplyParameters(message_id=job.reply_to_message_id),
+                )
+            except TelegramRetryAfter as exc:
+                if job.attempts > self.max_retries:
+                    break
+                logger.warning(
+                    "RetryAfter %ss for chat %s (attempt %d), waiting",
+                    exc.retry_after,
+                    job.chat_id,
+                    job.attempts,
+                )
+                chat_bucket.pause(exc.retry_after)
+                continue
+            except (TelegramNetworkError, TelegramServerError) as exc:
+                if job.attempts > self.max_retries:
+                    break
+                backoff = min(2 ** (job.attempts - 1), 30)
+                logger.warning(
+                    "Temporary error for chat %s (attempt %d): %s. Retry in %ss",
+                    job.chat_id,
+                    job.attempts,
+                    exc,
+                    backoff,
+                )
+                await asyncio.sleep(backoff)
+                continue
+            except (TelegramBadRequest, TelegramForbiddenError) as exc:
+                # Пост удалён, бот потерял права и т.п. — повтор не поможет
+                self.failed_count += 1
+                CHANNEL_COMMENTS_TOTAL.inc(result="failed")
+                logger.error(
+                    "Failed to send reply-comment in discussion chat %s (channel %s): %s",
+                    job.chat_id,
+                    job.channel_id,
+                    exc,
+                )
+                return
+
+            delay = max(0.0, time.time() - job.posted_at)
+            self.delays.append(delay)
+            self.sent_count += 1
+            CHANNEL_COMMENT_DELAY_SECONDS.observe(delay)
+            CHANNEL_COMMENTS_TOTAL.inc(result="sent")
+            logger.info(
+                "Reply-comment sent to discussion chat %s (channel %s) in %.2fs after post, attempts=%d",
+                job.chat_id,
+                job.channel_id,
+                delay,
+                job.attempts,
+            )
+            return
+
+        self.failed_count += 1
+        CHANNEL_COMMENTS_TOTAL.inc(result="failed")
+        logger.error(
+            "Giving up on reply-comment in discussion chat %s (channel %s) after %d attempts",
+            job.chat_id,
+            job.channel_id,
+            job.attempts,
+        )
+
+    async def close(self, timeout: float = 10) -> None:
+        """Дожидается отправки поставленных комментариев и останавливает воркеры."""
+        self._closed = True
+        queues = list(self._queues.values())
+        if queues:
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(*(q.join() for q in queues)), timeout=timeout
+                )
+            except asyncio.TimeoutError:
+                logger.warning("Comment dispatcher shutdown timed out, pending comments dropped")
+
+        workers = list(self._workers.values())
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        self._workers.clear()
+        self._queues.clear()
+
+
+comment_dispatcher = CommentDispatcher()
@@ -1,7 +1,18 @@
 import asyncio
+import logging
 from pathlib import Path
+from typing import Any, Awaitable, Callable, Optional
 
-from playwright.async_api import async_playwright
+from utils.browser_pool import browser_pool
+from utils.metrics import RENDER_PHASE_SECONDS
+from utils.render_jobs import RenderJob
+from utils.single_flight import RENDER_SINGLE_FLIGHT, SingleFlight, render_key
+from utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Одинаковые одновременные скриншоты (тот же HTML и параметры) делаются один раз
+image_flights = SingleFlight("image")
 
 
 async def html_to_image(
@@ -12,6 +23,8 @@ async def html_to_image(
     height: int = None,
     device_scale_factor: float = 6,
     scale: str = "device",
+    job: Optional[RenderJob] = None,
+    before_screenshot: Optional[Callable[[Any], Awaitable[None]]] = None,
 ) -> str:
     """
     Конвертирует HTML файл в изображение высокого качества.
@@ -25,12 +38,18 @@ async def html_to_image(
         height (int, optional): Высота viewport браузера. Если не указана, подстраивается под контент
         device_scale_factor (float): Масштаб для устройства (DPI)
         scale (str): Режим масштаба скриншота ('css' или 'device')
+        job (RenderJob, optional): Задание с дедлайном и отменой; по умолчанию —
+                                   RenderJob("image") с RENDER_TIMEOUT
+        before_screenshot (callable, optional): Корутина, которой передаётся страница
+                                   непосредственно перед скриншотом (снятие геометрии
+                                   для utils.card_compositor)
 
     Returns:
         str: Путь к сохраненному изображению
 
     Raises:
         FileNotFoundError: Если HTML файл не найден
+        RenderTimeout / RenderCancelled: Если истёк дедлайн задания или оно отменено
         Exception: При ошибках рендеринга
     """
 
@@ -51,102 +70,105 @@ async def html_to_image(
     # Получаем абсолютный путь к HTML файлу
     html_absolute_path = html_path.resolve()
 
-    async with async_playwright() as p:
-        # Запускаем браузер с теми же настройками, что и в render_pdf.py
-        browser = await p.chromium.launch(
-            headless=True,
-            args=[
-                "--disable-web-security",
-                "--disable-features=VizDisplayCompositor",
-                "--no-sandbox",
-                "--disable-setuid-sandbox",
-            ],
-        )
-        context = await browser.new_context(
+    if job is None:
+        job = RenderJob("image")
+
+    if RENDER_SINGLE_FLIGHT and before_screenshot is None:
+        key = render_key(html_absolute_path, selector, width, height, device_scale_factor)
+
+        async def render(path: Path, shared_job: RenderJob) -> str:
+            return await _screenshot(html_absolute_path, path, selector, width, height, device_scale_factor, shared_job)
+
+        await image_flights.run(key, output_path, render, job)
+        return str(output_path)
+
+    return await _screenshot(
+        html_absolute_path, output_path, selector, width, height, device_scale_factor, job, before_screenshot
+    )
+
+
+async def _screenshot(
+    html_absolute_path: Path,
+    output_path: Path,
+    selector: str,
+    width: int,
+    height: Optional[int],
+    device_scale_factor: float,
+    job: RenderJob,
+    before_screenshot: Optional[Callable[[Any], Awaitable[None]]] = None,
+) -> str:
+    """Скриншот элемента selector страницы в output_path под заданием job."""
+    # Дедлайн и отмена покрывают и ожидание браузера; при срабатывании контекст со страницей закрывается
+    async with job.guard():
+        # Браузер общий на процесс, на каждый рендер — свой контекст
+        async with browser_pool.context(
+            "image",
             viewport={"width": width, "height": height or 800},
             device_scale_factor=device_scale_factor,  # Увеличиваем DPI для лучшего качества
-        )
-
-        try:
-            # Создаем новую страницу
-            page = await context.new_page()
-
-            # Загружаем HTML файл
-            await page.goto(f"file://{html_absolute_path}")
-
-            # Ждем загрузки всех ресурсов
-            await page.wait_for_load_state("networkidle")
-
-            # Ждем больше времени для полной загрузки шрифтов и стилей
-            await asyncio.sleep(3)
-
-            # Дополнительно ждем загрузки шрифтов
-            await page.evaluate("document.fonts.ready")
-
-            # Находим элемент по селектору
-            element = await page.query_selector(selector)
-            if not element:
-                raise Exception(f"Элемент с селектором '{selector}' не найден")
-
-            # Делаем скриншот именно элемента (без ручного clip, чтобы избежать артефактов от округления)
-            loc = page.locator(selector)
-            await loc.wait_for(state="visible")
-            bbox = await loc.bounding_box()
-
-            # Уберём внешние отступы и принудительно сделаем фон прозрачным, чтобы не было подложки
-            await page.add_style_tag(
-                content="""
-                html,body{margin:0;padding:0;background:transparent !important;overflow:hidden !important;}
-                #dept_img_trade{
-                    margin:0 !important;
-                    padding:0 !important;
-                    border:0 !important;
-                    outline:1px solid transparent !important;
-                    box-sizing:border-box !important;
-                    background:transparent !important;
-                    box-shadow:none !important;
-                    border-radius:0 !important;
-                    overflow:hidden !important;
-                    transform:translateZ(0);
-                    image-rendering:-webkit-optimize-contrast;
-                }
-                ::-webkit-scrollbar{width:0;height:0}
-            """
-            )
-
-            await loc.screenshot(
-                path=str(output_path),
-                scale="device",
-                type="png",
-                omit_background=True,
-            )
-
-            print(f"Изображение успешно сохранено: {output_path}")
-            return str(output_path)
-
-        except Exception as e:
-            print(f"Ошибка при создании скриншота: {e}")
-            raise
-        finally:
-            await browser.close()
-
-
-# Пример использования
-if __name__ == "__main__":
-    # Пример асинхронного использования
-    async def main():
-        html_file = "/Users/apple/VSCodeProjects/pdf_sender_bot/tradehtml/positive.html"
-        output_file = (
-            "/Users/apple/VSCodeProjects/pdf_sender_bot/output/positive_screenshot.png"
-        )
-
-        try:
-            result = await html_to_image(
-                html_file_path=html_file, output_path=output_file, width=1200
-            )
-            print(f"Скриншот создан: {result}")
-        except Exception as e:
-            print(f"Ошибка: {e}")
-
-    # Запуск примера
-    asyncio.run(main())
+        ) as context:
+            try:
+                # Создаем новую страницу
+                page = await context.new_page()
+
+                with span("page.navigate"), RENDER_PHASE_SECONDS.time(renderer="image", phase="navigate"):
+                    # Загружаем HTML файл
+                    await page.goto(f"file://{html_absolute_path}")
+
+                    # Ждем загрузки всех ресурсов
+                    await page.wait_for_load_state("networkidle")
+
+                with span("page.settle"), RENDER_PHASE_SECONDS.time(renderer="image", phase="settle"):
+                    # Ждем больше времени для полной загрузки шрифтов и стилей
+                    await asyncio.sleep(3)
+
+                    # Дополнительно ждем загрузки шрифтов
+                    await page.evaluate("document.fonts.ready")
+
+                # Находим элемент по селектору
+                element = await page.query_selector(selector)
+                if not element:
+                    raise Exception(f"Элемент с селектором '{selector}' не найден")
+
+                # Делаем скриншот именно элемента (без ручного clip, чтобы избежать артефактов от округления)
+                loc = page.locator(selector)
+                await loc.wait_for(state="visible")
+                bbox = await loc.bounding_box()
+
+                # Уберём внешние отступы и принудительно сделаем фон прозрачным, чтобы не было подложки
+                await page.add_style_tag(
+                    content="""
+                    html,body{margin:0;padding:0;background:transparent !important;overflow:hidden !important;}
+                    #dept_img_trade{
+                        margin:0 !important;
+                        padding:0 !important;
+                        border:0 !important;
+                        outline:1px solid transparent !important;
+                        box-sizing:border-box !important;
+                        background:transparent !important;
+                        box-shadow:none !important;
+                        border-radius:0 !important;
+                        overflow:hidden !important;
+                        transform:translateZ(0);
+                        image-rendering:-webkit-optimize-contrast;
+                    }
+                    ::-webkit-scrollbar{width:0;height:0}
+                """
+                )
+
+                if before_screenshot is not None:
+                    await before_screenshot(page)
+
+                with span("page.screenshot"), RENDER_PHASE_SECONDS.time(renderer="image", phase="screenshot"):
+                    await loc.screenshot(
+                        path=str(output_path),
+                        scale="device",
+                        type="png",
+                        omit_background=True,
+                    )
+
+                logger.info(f"Изображение успешно сохранено: {output_path}")
+                return str(output_path)
+
+            except Exception as e:
+                logger.error(f"Ошибка при создании скриншота: {e}")
+                raise
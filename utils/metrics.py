@@ -0,0 +1,414 @@
+"""
+Метрики бота в формате Prometheus (text exposition 0.0.4) без внешних зависимостей.
+
+Метрики объявлены на уровне модуля и обновляются прямо из кода хендлеров
+и утилит рендеринга. Эндпоинт /metrics поднимается встроенным aiohttp-сервером
+(aiohttp уже приходит вместе с aiogram), если задана переменная METRICS_PORT.
+
+Пример:
+    from utils.metrics import RENDER_PHASE_SECONDS
+    with RENDER_PHASE_SECONDS.time(renderer="image", phase="screenshot"):
+        ...
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+
+# Бакеты по умолчанию покрывают и быстрые вызовы API, и многосекундный рендер
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: ожидаются метки {self.labelnames}, получены {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def collect(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def collect(self) -> List[str]:
+        lines = self._header()
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Gauge; вместо set() можно передать callback, который вызывается при каждом сборе."""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        callback: Optional[Callable[[], float]] = None,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self.callback = callback
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def collect(self) -> List[str]:
+        lines = self._header()
+        if self.callback is not None:
+            try:
+                lines.append(f"{self.name} {_format_value(self.callback())}")
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Metric callback %s failed: %s", self.name, exc)
+            return lines
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # key -> [counts по бакетам..., sum, count]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = [0.0] * (len(self.buckets) + 2)
+                self._values[key] = state
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Замеряет длительность блока (в том числе при исключении)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def collect(self) -> List[str]:
+        lines = self._header()
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        for key, state in items:
+            cumulative = 0.0
+            for i, bound in enumerate(self.buckets):
+                cumulative += state[i]
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {_format_value(cumulative)}"
+                )
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(state[-1])}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> None:
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def _dir_size(path: str) -> float:
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                continue
+    return float(total)
+
+
+# --- Метрики бота ---
+
+COMMAND_DURATION_SECONDS = Histogram(
+    "bot_command_duration_seconds",
+    "Время обработки команды от получения апдейта до ответа (для FSM-команд — шага с документом)",
+    ["command"],
+)
+RENDER_PHASE_SECONDS = Histogram(
+    "render_phase_seconds",
+    "Длительность фаз рендеринга (launch, connect, context, navigate, settle, screenshot, pdf)",
+    ["renderer", "phase"],
+)
+BROWSER_LAUNCHES_TOTAL = Counter(
+    "browser_launches_total",
+    "Количество запусков Chromium",
+    ["renderer"],
+)
+BROWSER_CDP_CONNECTS_TOTAL = Counter(
+    "browser_cdp_connects_total",
+    "Попытки подключения к Chromium-сайдкару по CDP",
+    ["result"],
+)
+BROWSER_RSS_BYTES = Gauge(
+    "browser_rss_bytes",
+    "RSS процессов Chromium по типу процесса (browser, renderer, gpu, utility)",
+    ["process_type"],
+)
+BROWSER_RENDERS_TOTAL = Counter(
+    "browser_renders_total",
+    "Рендеры (контексты), обслуженные Chromium",
+)
+BROWSER_GENERATION_RENDERS = Gauge(
+    "browser_generation_renders",
+    "Рендеры, обслуженные текущим экземпляром Chromium с момента запуска",
+)
+BROWSER_IN_FLIGHT = Gauge(
+    "browser_in_flight_renders",
+    "Открытые контексты рендеринга",
+)
+BROWSER_EVENTS_TOTAL = Counter(
+    "browser_events_total",
+    "События Chromium: crash, page_crash, hang, recycle_timeout",
+    ["event"],
+)
+BROWSER_RECYCLES_TOTAL = Counter(
+    "browser_recycles_total",
+    "Плановые перезапуски Chromium по причине (renders, rss, hang)",
+    ["reason"],
+)
+RENDER_TIMEOUTS_TOTAL = Counter(
+    "render_timeouts_total",
+    "Рендеры, прерванные по дедлайну",
+    ["template"],
+)
+RENDER_CANCELLED_TOTAL = Counter(
+    "render_cancelled_total",
+    "Рендеры, отменённые пользователем",
+    ["template"],
+)
+RENDER_COALESCED_TOTAL = Counter(
+    "render_coalesced_total",
+    "Запросы рендера, присоединённые к уже идущему рендеру с тем же ключом",
+    ["renderer"],
+)
+SPECULATIVE_RENDERS_TOTAL = Counter(
+    "speculative_renders_total",
+    "Спекулятивные рендеры по исходу: hit — пригодился, miss — данные изменились, discarded — отменён или истёк",
+    ["kind", "outcome"],
+)
+INVOICE_CONFIRM_SECONDS = Histogram(
+    "invoice_confirm_to_document_seconds",
+    "Время от нажатия «Подтвердить» до отправки PDF инвойса",
+    ["speculative"],
+)
+PDF_MERGE_SECONDS = Histogram(
+    "pdf_merge_seconds",
+    "Время объединения титульной страницы с основным PDF",
+)
+PDF_OPTIMIZE_SECONDS = Histogram(
+    "pdf_optimize_seconds",
+    "Время оптимизации готового PDF по профилю",
+    ["profile"],
+)
+PDF_OPTIMIZE_SAVED_BYTES = Counter(
+    "pdf_optimize_saved_bytes_total",
+    "Байты, сэкономленные оптимизацией PDF, по профилю",
+    ["profile"],
+)
+RENDER_SERVICE_REQUESTS_TOTAL = Counter(
+    "render_service_requests_total",
+    "Запросы к сервису рендеринга по операции и HTTP-статусу ответа",
+    ["op", "status"],
+)
+RENDER_SERVICE_SECONDS = Histogram(
+    "render_service_seconds",
+    "Время обработки запроса сервисом рендеринга, включая ожидание в очереди",
+    ["op"],
+)
+RENDER_SERVICE_QUEUE_DEPTH = Gauge(
+    "render_service_queue_depth",
+    "Запросы рендера, ожидающие свободного слота сервиса",
+)
+SMTP_SEND_SECONDS = Histogram(
+    "smtp_send_seconds",
+    "Время отправки письма через SMTP",
+    ["result"],
+)
+TELEGRAM_API_SECONDS = Histogram(
+    "telegram_api_request_seconds",
+    "Длительность запросов к Telegram Bot API",
+    ["method"],
+)
+TELEGRAM_API_ERRORS_TOTAL = Counter(
+    "telegram_api_errors_total",
+    "Ошибки запросов к Telegram Bot API",
+    ["method", "error"],
+)
+CHANNEL_COMMENT_DELAY_SECONDS = Histogram(
+    "channel_comment_delay_seconds",
+    "Задержка между публикацией поста и отправкой нашего комментария",
+    buckets=(0.25, 0.5, 1, 2, 3, 5, 10, 30, 60, 300),
+)
+CHANNEL_COMMENTS_TOTAL = Counter(
+    "channel_comments_total",
+    "Комментарии к постам каналов по результату отправки",
+    ["result"],
+)
+CHANNEL_COMMENT_QUEUE_DEPTH = Gauge(
+    "channel_comment_queue_depth",
+    "Комментарии, ожидающие отправки во всех чатах",
+)
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    "event_loop_lag_seconds",
+    "Опоздание пробуждения таймера event loop",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+STARTUP_SECONDS = Gauge(
+    "startup_seconds",
+    "Время от старта процесса до этапа запуска (imports, polling, first_update, ...)",
+    ["stage"],
+)
+RENDERER_READY = Gauge(
+    "renderer_ready",
+    "1, если Chromium запущен и шаблоны прогреты",
+)
+TEMP_DIR_BYTES = Gauge(
+    "temp_dir_bytes",
+    "Суммарный размер файлов во временной директории temp/",
+    callback=lambda: _dir_size("temp"),
+)
+
+
+async def monitor_event_loop_lag(interval: float = 0.5) -> None:
+    """Фоновая задача: измеряет, насколько event loop опаздывает с пробуждением."""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG_SECONDS.observe(max(0.0, loop.time() - started - interval))
+
+
+async def start_metrics_server(host: str, port: int):
+    """Поднимает HTTP-сервер с эндпоинтами /metrics и /ready. Возвращает AppRunner для остановки."""
+    from aiohttp import web
+
+    async def handle_metrics(_request: "web.Request") -> "web.Response":
+        body = await asyncio.get_running_loop().run_in_executor(None, REGISTRY.render)
+        return web.Response(
+            body=body.encode("utf-8"),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    async def handle_ready(_request: "web.Request") -> "web.Response":
+        # Проба готовности: 200, когда рендерер прогрет и первый /okx не ждёт запуска Chromium
+        if RENDERER_READY.value() >= 1:
+            return web.Response(text="ready\n")
+        return web.Response(status=503, text="warming up\n")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    app.router.add_get("/ready", handle_ready)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Metrics endpoint listening on http://%s:%s/metrics", host, port)
+    return runner
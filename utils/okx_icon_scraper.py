@@ -1,23 +1,27 @@
 from __future__ import annotations
 
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
 import os
 import time
-import logging
-from dataclasses import dataclass
-from typing import Iterable, List, Optional, Tuple
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urljoin
+
+import aiohttp
 
-import requests
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options as ChromeOptions
-from selenium.webdriver.chrome.service import Service as ChromeService
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.common.exceptions import TimeoutException, WebDriverException
+from utils.browser_pool import browser_pool
 
 
-OKX_SWAP_BASE = "https://www.okx.com/ru/trade-swap/"
+# Base of the OKX swap pages; override to point the sync at a local stand-in
+OKX_SWAP_BASE = os.getenv("OKX_ICON_BASE_URL", "https://www.okx.com/ru/trade-swap/")
+ICON_SELECTOR = "picture.okui-picture.okui-picture-font img[src]"
+MANIFEST_NAME = "icons_manifest.json"
+# Resource types the scraper never needs: the icon URL is read from the DOM, not loaded
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font", "stylesheet"}
 
 
 def format_pair_for_url(pair: str) -> str:
@@ -28,9 +32,11 @@ def format_pair_for_url(pair: str) -> str:
     return pair
 
 
-def build_okx_swap_url(formatted_pair: str) -> str:
+def build_okx_swap_url(formatted_pair: str, base_url: str = OKX_SWAP_BASE) -> str:
     # OKX swap URLs are lowercase and end with '-swap', e.g. eth-usdt-swap
-    return f"{OKX_SWAP_BASE}{formatted_pair.lower()}-swap"
+    if not base_url.endswith("/"):
+        base_url += "/"
+    return f"{base_url}{formatted_pair.lower()}-swap"
 
 
 def ensure_dir(path: str) -> None:
@@ -38,93 +44,248 @@ def ensure_dir(path: str) -> None:
         os.makedirs(path, exist_ok=True)
 
 
-def download_file(url: str, dest_path: str, timeout: int = 20) -> None:
-    resp = requests.get(url, timeout=timeout)
-    resp.raise_for_status()
-    with open(dest_path, "wb") as f:
-        f.write(resp.content)
+ICON_EXTENSIONS = (".png", ".svg", ".webp", ".jpg", ".jpeg")
 
 
-def create_webdriver(headless: bool = True) -> webdriver.Chrome:
-    options = ChromeOptions()
-    if headless:
-        options.add_argument("--headless=new")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--window-size=1280,1200")
-    # Reduce automation flags to avoid potential anti-bot friction
-    options.add_experimental_option("excludeSwitches", ["enable-automation"]) 
-    options.add_experimental_option("useAutomationExtension", False)
-    service = ChromeService(ChromeDriverManager().install())
-    driver = webdriver.Chrome(service=service, options=options)
-    return driver
+def icon_extension(icon_src: str) -> str:
+    """Choose the file extension from the icon URL; default to .png."""
+    for candidate in ICON_EXTENSIONS:
+        if candidate in icon_src.lower():
+            return candidate
+    return ".png"
 
 
-def find_icon_src_for_pair(driver: webdriver.Chrome, url: str, wait_seconds: int = 20) -> Optional[str]:
+def file_sha256(path: str) -> Optional[str]:
     try:
-        driver.get(url)
-
-        wait = WebDriverWait(driver, wait_seconds)
-        # Wait for the <picture class="okui-picture okui-picture-font"> to appear
-        picture = wait.until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "picture.okui-picture okui-picture-font".replace(" ", ".")))
-        )
-
-        # Within picture, find nested img and get src
-        try:
-            img = picture.find_element(By.CSS_SELECTOR, "img[src]")
-            src = img.get_attribute("src")
-            return src
-        except Exception:
-            return None
-    except TimeoutException:
-        return None
-    except WebDriverException:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
         return None
 
 
-def scrape_and_download_icons(pairs: Iterable[str], output_dir: str) -> Tuple[List[str], List[str]]:
-    ensure_dir(output_dir)
+async def _block_heavy_resources(route) -> None:
+    if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+        await route.abort()
+    else:
+        await route.continue_()
+
 
-    driver = create_webdriver(headless=True)
-    saved: List[str] = []
-    failed: List[str] = []
+def load_manifest(path: str) -> Dict[str, dict]:
     try:
-        for pair in pairs:
-            original_pair = pair.strip().upper()
-            formatted = format_pair_for_url(original_pair)
-            url = build_okx_swap_url(formatted)
-
-            logging.info("Processing %s -> %s", original_pair, url)
-            icon_src = find_icon_src_for_pair(driver, url)
-            if not icon_src:
-                logging.warning("Icon not found for %s", original_pair)
-                failed.append(original_pair)
-                continue
-
-            # Choose extension from URL; default to .png
-            ext = ".png"
-            for candidate in (".png", ".svg", ".webp", ".jpg", ".jpeg"):
-                if candidate in icon_src.lower():
-                    ext = candidate
-                    break
-
-            dest_path = os.path.join(output_dir, f"{original_pair}{ext}")
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def seed_manifest(output_dir: str) -> Dict[str, dict]:
+    """Manifest entries for icons already on disk, used when there is no manifest yet.
+
+    Seeded entries have no icon URL, so their pages are still scraped once,
+    but a downloaded icon with the same sha256 is not rewritten.
+    """
+    manifest: Dict[str, dict] = {}
+    if not os.path.isdir(output_dir):
+        return manifest
+    for file_name in sorted(os.listdir(output_dir)):
+        pair, ext = os.path.splitext(file_name)
+        if ext.lower() in ICON_EXTENSIONS:
+            manifest[pair.upper()] = {"file": file_name, "sha256": file_sha256(os.path.join(output_dir, file_name))}
+    return manifest
+
+
+def save_manifest(path: str, manifest: Dict[str, dict]) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write("\n")
+    os.replace(tmp_path, path)
+
+
+@dataclass
+class SyncResult:
+    saved: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+    failed: List[str] = field(default_factory=list)
+    pages_loaded: int = 0
+    seconds: float = 0.0
+
+
+class IconSync:
+    """Incremental icon sync: conditional re-download of known icons, page scraping for the rest.
+
+    Pairs already in the manifest are checked with If-None-Match / If-Modified-Since
+    against the recorded icon URL, so unchanged icons cost one 304 and no page load.
+    Only new pairs, pairs whose icon URL stopped working and pairs whose local file
+    was modified or removed are looked up on the swap page, using a bounded pool of
+    Playwright pages. Downloads run in parallel with their own limit.
+    If OKX moves an icon to a new URL while the old one keeps answering, the
+    change is only picked up with force=True (--force).
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        base_url: str = OKX_SWAP_BASE,
+        pages: int = 4,
+        downloads: int = 8,
+        wait_seconds: float = 20,
+        force: bool = False,
+    ) -> None:
+        self.output_dir = output_dir
+        self.base_url = base_url
+        self.pages = pages
+        self.wait_seconds = wait_seconds
+        self.force = force
+        self.manifest_path = os.path.join(os.path.dirname(output_dir.rstrip(os.sep)), MANIFEST_NAME)
+        if os.path.exists(self.manifest_path):
+            self.manifest = load_manifest(self.manifest_path)
+        else:
+            # First run over icons committed without a manifest: do not rewrite unchanged files
+            self.manifest = seed_manifest(output_dir)
+        self.result = SyncResult()
+        self._download_slots = asyncio.Semaphore(downloads)
+
+    def _local_icon_intact(self, pair: str) -> bool:
+        entry = self.manifest.get(pair)
+        if not entry:
+            return False
+        return file_sha256(os.path.join(self.output_dir, entry["file"])) == entry.get("sha256")
+
+    async def _download(self, session: aiohttp.ClientSession, pair: str, icon_src: str) -> Optional[bool]:
+        """Download icon_src for pair. Returns True if saved, False if unchanged, None on failure."""
+        entry = self.manifest.get(pair, {})
+        headers = {}
+        conditional = not self.force and entry.get("src") == icon_src and self._local_icon_intact(pair)
+        if conditional:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        async with self._download_slots:
             try:
-                download_file(icon_src, dest_path)
-                saved.append(dest_path)
-                logging.info("Saved %s", dest_path)
-            except Exception as e:
-                logging.exception("Failed to download %s: %s", icon_src, e)
-                failed.append(original_pair)
-                continue
-    finally:
+                async with session.get(icon_src, headers=headers) as resp:
+                    if resp.status == 304 and conditional:
+                        return False
+                    resp.raise_for_status()
+                    content = await resp.read()
+                    etag = resp.headers.get("ETag")
+                    last_modified = resp.headers.get("Last-Modified")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logging.warning("Failed to download %s for %s: %s", icon_src, pair, e)
+                return None
+
+        sha256 = hashlib.sha256(content).hexdigest()
+        file_name = f"{pair}{icon_extension(icon_src)}"
+        dest_path = os.path.join(self.output_dir, file_name)
+        changed = sha256 != entry.get("sha256") or not self._local_icon_intact(pair) or entry.get("file") != file_name
+        if changed:
+            tmp_path = f"{dest_path}.part"
+            with open(tmp_path, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, dest_path)
+            old_file = entry.get("file")
+            if old_file and old_file != file_name:
+                try:
+                    os.remove(os.path.join(self.output_dir, old_file))
+                except OSError:
+                    pass
+
+        self.manifest[pair] = {
+            "file": file_name,
+            "src": icon_src,
+            "sha256": sha256,
+            "etag": etag,
+            "last_modified": last_modified,
+        }
+        return changed
+
+    def _record(self, pair: str, outcome: Optional[bool]) -> None:
+        if outcome is None:
+            self.result.failed.append(pair)
+        elif outcome:
+            self.result.saved.append(os.path.join(self.output_dir, self.manifest[pair]["file"]))
+            logging.info("Saved %s", self.manifest[pair]["file"])
+        else:
+            self.result.unchanged.append(pair)
+
+    async def _find_icon_src(self, page, pair: str) -> Optional[str]:
+        url = build_okx_swap_url(format_pair_for_url(pair), self.base_url)
+        logging.info("Processing %s -> %s", pair, url)
+        try:
+            await page.goto(url, wait_until="domcontentloaded", timeout=self.wait_seconds * 1000)
+            self.result.pages_loaded += 1
+            locator = page.locator(ICON_SELECTOR).first
+            await locator.wait_for(state="attached", timeout=self.wait_seconds * 1000)
+            src = await locator.get_attribute("src")
+        except Exception as e:  # noqa: BLE001 - Playwright raises its own Error/TimeoutError
+            logging.warning("Icon not found for %s: %s", pair, e)
+            return None
+        return urljoin(page.url, src) if src else None
+
+    async def _page_worker(self, context, queue: asyncio.Queue, session: aiohttp.ClientSession) -> None:
+        page = await context.new_page()
         try:
-            driver.quit()
-        except Exception:
-            pass
+            while True:
+                try:
+                    pair = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                icon_src = await self._find_icon_src(page, pair)
+                if not icon_src:
+                    self.result.failed.append(pair)
+                    continue
+                self._record(pair, await self._download(session, pair, icon_src))
+        finally:
+            await page.close()
+
+    async def _revalidate(self, session: aiohttp.ClientSession, pair: str) -> bool:
+        """Check a known icon without loading its page. Returns False if the page must be scraped."""
+        outcome = await self._download(session, pair, self.manifest[pair]["src"])
+        if outcome is None:
+            return False
+        self._record(pair, outcome)
+        return True
+
+    async def run(self, pairs: Iterable[str]) -> SyncResult:
+        ensure_dir(self.output_dir)
+        started = time.perf_counter()
+        # Keep order, drop duplicates
+        pairs = list(dict.fromkeys(pair.strip().upper() for pair in pairs if pair.strip()))
+
+        timeout = aiohttp.ClientTimeout(total=self.wait_seconds)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            # Seeded entries have no URL to revalidate: their pages are scraped
+            known = [pair for pair in pairs if not self.force and self.manifest.get(pair, {}).get("src")]
+            revalidated = await asyncio.gather(*(self._revalidate(session, pair) for pair in known))
+            to_scrape = [pair for pair in pairs if pair not in known]
+            to_scrape += [pair for pair, ok in zip(known, revalidated) if not ok]
+
+            if to_scrape:
+                queue: asyncio.Queue = asyncio.Queue()
+                for pair in to_scrape:
+                    queue.put_nowait(pair)
+                async with browser_pool.context("icons", viewport={"width": 1280, "height": 1200}) as context:
+                    await context.route("**/*", _block_heavy_resources)
+                    workers = min(self.pages, len(to_scrape))
+                    await asyncio.gather(*(self._page_worker(context, queue, session) for _ in range(workers)))
+
+        save_manifest(self.manifest_path, self.manifest)
+        self.result.seconds = time.perf_counter() - started
+        return self.result
+
+
+async def sync_icons(pairs: Iterable[str], output_dir: str, **options) -> SyncResult:
+    try:
+        return await IconSync(output_dir, **options).run(pairs)
+    finally:
+        await browser_pool.close()
 
-    return saved, failed
+
+def scrape_and_download_icons(pairs: Iterable[str], output_dir: str, **options) -> Tuple[List[str], List[str]]:
+    result = asyncio.run(sync_icons(pairs, output_dir, **options))
+    return result.saved, result.failed
 
 
 DEFAULT_PAIRS = [
@@ -149,7 +310,6 @@ DEFAULT_PAIRS = [
     "JTOUSDT",
     "LDOUSDT",
     "LINKUSDT",
-    "BERAUSDT",
     "PNUTUSDT",
     "ORDIUSDT",
     "ICPUSDT",
@@ -187,16 +347,36 @@ DEFAULT_PAIRS = [
 def main() -> None:
     logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
     project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    output_dir = os.path.join(project_root, "tradehtml", "icons")
-    saved, failed = scrape_and_download_icons(DEFAULT_PAIRS, output_dir)
-    logging.info("Total saved: %d", len(saved))
-    if failed:
-        logging.warning("Failed to download for pairs: %s", ", ".join(failed))
+    parser = argparse.ArgumentParser(description="Sync OKX coin icons into tradehtml/icons")
+    parser.add_argument("pairs", nargs="*", default=DEFAULT_PAIRS)
+    parser.add_argument("--output-dir", default=os.path.join(project_root, "tradehtml", "icons"))
+    parser.add_argument("--base-url", default=OKX_SWAP_BASE, help="base of the swap pages (OKX_ICON_BASE_URL)")
+    parser.add_argument("--pages", type=int, default=4, help="concurrent browser pages")
+    parser.add_argument("--downloads", type=int, default=8, help="concurrent icon downloads")
+    parser.add_argument("--wait", type=float, default=20, help="per-page and per-download timeout, seconds")
+    parser.add_argument("--force", action="store_true", help="ignore the manifest and re-download everything")
+    args = parser.parse_args()
+
+    result = asyncio.run(
+        sync_icons(
+            args.pairs,
+            args.output_dir,
+            base_url=args.base_url,
+            pages=args.pages,
+            downloads=args.downloads,
+            wait_seconds=args.wait,
+            force=args.force,
+        )
+    )
+    logging.info(
+        "Saved: %d, unchanged: %d, pages loaded: %d, %.1fs",
+        len(result.saved), len(result.unchanged), result.pages_loaded, result.seconds,
+    )
+    if result.failed:
+        logging.warning("Failed to download for pairs: %s", ", ".join(result.failed))
     else:
         logging.info("All pairs processed successfully; no failures.")
 
 
 if __name__ == "__main__":
     main()
-
-
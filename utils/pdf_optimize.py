@@ -0,0 +1,396 @@
+"""
+Оптимизация готовых PDF перед отправкой: меньше файл — быстрее загрузка в
+Telegram и меньше письмо.
+
+PDF из Chromium и результат объединения /create_user_pdf содержат много
+повторов: одинаковые ICC-профили и маски картинок у каждого изображения,
+одинаковые глифы Type3-шрифтов, копии шрифтов и картинок титула и
+документа. Часть потоков (глифы, формы) записана вовсе без сжатия.
+
+Профили (PDF_OPTIMIZE_PROFILE):
+
+- off — файл не трогается;
+- dedup — одинаковые объекты (потоки, шрифты, цветовые пространства,
+  ExtGState…) записываются один раз, ссылки ведут на единственную копию;
+- lossless — dedup + сжатие несжатых потоков и пересжатие FlateDecode
+  (zlib 6; результат остаётся, только если стал меньше);
+- compact — то же с zlib 9 (в разы дольше на крупных масках картинок, на
+  несколько процентов меньше), картинки больше PDF_OPTIMIZE_MAX_IMAGE_PX
+  по длинной стороне уменьшаются, JPEG пережимаются с качеством
+  PDF_OPTIMIZE_JPEG_QUALITY (картинки без потерь и маски остаются без
+  потерь).
+
+Документ переписывается потоково (utils/pdf_stream.StreamingPdfWriter),
+поэтому память не растёт с его размером; как и при объединении,
+переносятся только страницы со всем, на что они ссылаются.
+
+PDF_LINEARIZE=1 дополнительно линеаризует файл через qpdf (первая страница
+показывается до загрузки всего файла); без установленного qpdf шаг
+пропускается.
+"""
+
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import shutil
+import subprocess
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Set, Union
+
+from PIL import Image
+from PyPDF2 import PdfReader
+from PyPDF2.generic import (
+    ArrayObject,
+    DictionaryObject,
+    EncodedStreamObject,
+    IndirectObject,
+    NameObject,
+    NumberObject,
+    PdfObject,
+    StreamObject,
+)
+
+from utils.metrics import PDF_OPTIMIZE_SAVED_BYTES, PDF_OPTIMIZE_SECONDS
+from utils.pdf_stream import DOWNLOAD_CHUNK, StreamingPdfWriter, release_mapped, open_pdf
+from utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+PDF_OPTIMIZE_PROFILE = os.getenv("PDF_OPTIMIZE_PROFILE", "off")
+PDF_LINEARIZE = os.getenv("PDF_LINEARIZE", "0") == "1"
+PDF_OPTIMIZE_MAX_IMAGE_PX = int(os.getenv("PDF_OPTIMIZE_MAX_IMAGE_PX", "1600"))
+PDF_OPTIMIZE_JPEG_QUALITY = int(os.getenv("PDF_OPTIMIZE_JPEG_QUALITY", "80"))
+
+# Словари с этими /Type можно делить между страницами; страницы, аннотации
+# и прочие объекты с собственной идентичностью не объединяются
+_SHARED_TYPES = {"/Font", "/FontDescriptor", "/Encoding", "/ExtGState", "/XObject", "/Pattern", "/Shading"}
+
+
+class OptimizeProfile(NamedTuple):
+    dedup: bool
+    # Уровень zlib для пересжатия потоков; 0 — потоки не пересжимаются
+    zlib_level: int = 0
+    # 0 — картинки не трогаются
+    max_image_px: int = 0
+    jpeg_quality: int = 0
+
+
+PROFILES: Dict[str, OptimizeProfile] = {
+    "dedup": OptimizeProfile(dedup=True),
+    "lossless": OptimizeProfile(dedup=True, zlib_level=6),
+    "compact": OptimizeProfile(
+        dedup=True,
+        zlib_level=9,
+        max_image_px=PDF_OPTIMIZE_MAX_IMAGE_PX,
+        jpeg_quality=PDF_OPTIMIZE_JPEG_QUALITY,
+    ),
+}
+
+
+class OptimizeReport(NamedTuple):
+    profile: str
+    bytes_before: int
+    bytes_after: int
+    seconds: float
+    deduplicated: int
+    recompressed: int
+    images: int
+    linearized: bool
+
+
+class _Deduplicator:
+    """Находит одинаковые объекты: ключ — хеш содержимого, где ссылки заменены ключами целей."""
+
+    def __init__(self, reader: PdfReader) -> None:
+        self._reader = reader
+        # Ключи объектов, которые можно делить; у остальных ключ — их номер
+        self._keys: Dict[int, bytes] = {}
+        self._visited: Set[int] = set()
+
+    def aliases(self) -> Dict[int, int]:
+        """Номер объекта-повтора -> номер первой такой же копии."""
+        first: Dict[bytes, int] = {}
+        aliases: Dict[int, int] = {}
+        for idnum in sorted(_object_ids(self._reader)):
+            key = self._key(idnum)
+            if idnum in self._keys:
+                canonical = first.setdefault(key, idnum)
+                if canonical != idnum:
+                    aliases[idnum] = canonical
+            # Объект уже учтён: кэш PyPDF2 и прочитанные страницы mmap не копятся
+            self._reader.resolved_objects.clear()
+            release_mapped(self._reader)
+        return aliases
+
+    def _key(self, idnum: int) -> bytes:
+        if idnum in self._keys:
+            return self._keys[idnum]
+        unique = b"#%d" % idnum
+        if idnum in self._visited:
+            # Уже обойдён и уникален — или это цикл ссылок
+            return unique
+        self._visited.add(idnum)
+        try:
+            obj = self._reader.get_object(idnum)
+        except Exception:  # noqa: BLE001
+            return unique
+        if not _shareable(obj):
+            return unique
+        digest = hashlib.sha256()
+        self._feed(digest, obj)
+        key = self._keys[idnum] = digest.digest()
+        return key
+
+    def _feed(self, digest: "hashlib._Hash", obj: PdfObject) -> None:
+        if isinstance(obj, IndirectObject):
+            digest.update(b"R" + self._key(obj.idnum))
+        elif isinstance(obj, DictionaryObject):
+            is_stream = isinstance(obj, StreamObject)
+            if is_stream:
+                digest.update(b"S%d:" % len(obj._data))
+                digest.update(obj._data)
+            digest.update(b"<<")
+            for name in sorted(obj):
+                # /Length у одинаковых потоков совпадает, но бывает ссылкой на отдельный объект
+                if is_stream and name == "/Length":
+                    continue
+                digest.update(name.encode())
+                self._feed(digest, obj[name])
+            digest.update(b">>")
+        elif isinstance(obj, ArrayObject):
+            digest.update(b"[")
+            for value in obj:
+                self._feed(digest, value)
+            digest.update(b"]")
+        else:
+            buffer = io.BytesIO()
+            obj.write_to_stream(buffer, None)
+            digest.update(type(obj).__name__.encode() + buffer.getvalue() + b";")
+
+
+class _OptimizingWriter(StreamingPdfWriter):
+    """StreamingPdfWriter, который подменяет ссылки на повторы и пересжимает потоки."""
+
+    def __init__(self, out, profile: OptimizeProfile, aliases: Dict[int, int]) -> None:
+        super().__init__(out)
+        self._profile = profile
+        self._aliases = aliases
+        self.recompressed = 0
+        self.images = 0
+
+    def _convert(self, obj, ids, pending):
+        if isinstance(obj, IndirectObject) and obj.idnum in self._aliases:
+            obj = IndirectObject(self._aliases[obj.idnum], 0, obj.pdf)
+        elif isinstance(obj, StreamObject):
+            obj = self._optimize_stream(obj)
+        return super()._convert(obj, ids, pending)
+
+    def _optimize_stream(self, obj: StreamObject) -> StreamObject:
+        if self._profile.max_image_px and obj.get("/Subtype") == "/Image":
+            try:
+                image = _downsample(obj, self._profile.max_image_px, self._profile.jpeg_quality)
+            except Exception as exc:  # noqa: BLE001
+                logger.debug("Image left as is: %s", exc)
+                image = None
+            if image is not None:
+                self.images += 1
+                return image
+        if not self._profile.zlib_level or "/DecodeParms" in obj:
+            return obj
+        filters = _filters(obj)
+        if filters == []:
+            data = obj._data
+        elif filters == ["/FlateDecode"]:
+            try:
+                data = zlib.decompress(obj._data)
+            except zlib.error:
+                return obj
+        else:
+            return obj
+        compressed = zlib.compress(data, self._profile.zlib_level)
+        # Заголовок /Filter /FlateDecode — ещё ~20 байт
+        if len(compressed) + 20 >= len(obj._data):
+            return obj
+        self.recompressed += 1
+        return _with_data(obj, compressed, "/FlateDecode")
+
+
+def optimize_pdf(
+    path: Union[str, Path],
+    profile: str = PDF_OPTIMIZE_PROFILE,
+    linearize: bool = PDF_LINEARIZE,
+) -> OptimizeReport:
+    """Оптимизирует PDF на месте; при ошибке исходный файл остаётся нетронутым."""
+    path = Path(path)
+    started = time.perf_counter()
+    before = path.stat().st_size
+    deduplicated = recompressed = images = 0
+    settings = PROFILES.get(profile)
+    if settings is not None:
+        temp_path = path.with_name(f".optimize-{path.name}")
+        try:
+            with open_pdf(path) as reader:
+                aliases = _Deduplicator(reader).aliases() if settings.dedup else {}
+                with open(temp_path, "wb", buffering=DOWNLOAD_CHUNK) as out:
+                    writer = _OptimizingWriter(out, settings, aliases)
+                    writer.add_pages(reader)
+                    writer.finish()
+            deduplicated, recompressed, images = len(aliases), writer.recompressed, writer.images
+            os.replace(temp_path, path)
+        finally:
+            temp_path.unlink(missing_ok=True)
+    elif profile != "off":
+        raise ValueError(f"Unknown PDF optimize profile: {profile}")
+
+    linearized = linearize and _linearize(path)
+    return OptimizeReport(
+        profile=profile,
+        bytes_before=before,
+        bytes_after=path.stat().st_size,
+        seconds=time.perf_counter() - started,
+        deduplicated=deduplicated,
+        recompressed=recompressed,
+        images=images,
+        linearized=linearized,
+    )
+
+
+async def optimize_output(path: Union[str, Path]) -> Optional[OptimizeReport]:
+    """Оптимизация готового документа в хендлере: профиль из окружения, в отдельном потоке.
+
+    Ошибка только логируется — отправляется неоптимизированный файл.
+    """
+    if PDF_OPTIMIZE_PROFILE == "off" and not PDF_LINEARIZE:
+        return None
+    try:
+        with span("pdf.optimize", profile=PDF_OPTIMIZE_PROFILE):
+            report = await asyncio.to_thread(optimize_pdf, path)
+    except Exception as exc:  # noqa: BLE001
+        logger.warning("PDF optimization of %s failed: %s", path, exc)
+        return None
+    PDF_OPTIMIZE_SECONDS.observe(report.seconds, profile=report.profile)
+    PDF_OPTIMIZE_SAVED_BYTES.inc(max(0, report.bytes_before - report.bytes_after), profile=report.profile)
+    logger.info(
+        "Optimized %s (%s): %d -> %d bytes in %.2fs",
+        path, report.profile, report.bytes_before, report.bytes_after, report.seconds,
+    )
+    return report
+
+
+def _object_ids(reader: PdfReader) -> List[int]:
+    ids = set(reader.xref_objStm)
+    for objects in reader.xref.values():
+        ids.update(objects)
+    ids.discard(0)
+    return list(ids)
+
+
+def _shareable(obj: Optional[PdfObject]) -> bool:
+    if isinstance(obj, (StreamObject, ArrayObject)):
+        return True
+    return isinstance(obj, DictionaryObject) and obj.get("/Type") in _SHARED_TYPES
+
+
+def _filters(obj: StreamObject) -> List[str]:
+    value = obj.get("/Filter")
+    if value is None:
+        return []
+    value = value.get_object()
+    return [str(name) for name in value] if isinstance(value, ArrayObject) else [str(value)]
+
+
+def _with_data(obj: StreamObject, data: bytes, filter_name: str) -> StreamObject:
+    copy = EncodedStreamObject()
+    for key, value in obj.items():
+        if key not in ("/Length", "/Filter", "/DecodeParms"):
+            copy[key] = value
+    copy[NameObject("/Filter")] = NameObject(filter_name)
+    copy._data = data
+    return copy
+
+
+def _components(colorspace: Optional[PdfObject]) -> Optional[int]:
+    """Число компонент для DeviceGray / DeviceRGB / ICCBased с N=1 или 3; иначе None."""
+    if colorspace is None:
+        return None
+    colorspace = colorspace.get_object()
+    if colorspace == "/DeviceGray":
+        return 1
+    if colorspace == "/DeviceRGB":
+        return 3
+    if isinstance(colorspace, ArrayObject) and len(colorspace) == 2 and colorspace[0] == "/ICCBased":
+        components = int(colorspace[1].get_object().get("/N", 0))
+        return components if components in (1, 3) else None
+    return None
+
+
+def _downsample(obj: StreamObject, max_px: int, jpeg_quality: int) -> Optional[StreamObject]:
+    """Уменьшенная и/или пережатая копия картинки; None — оставить как есть."""
+    if obj.get("/BitsPerComponent") != 8 or obj.get("/ImageMask") or "/Decode" in obj or "/DecodeParms" in obj:
+        return None
+    components = _components(obj.get("/ColorSpace"))
+    filters = _filters(obj)
+    if components is None or filters not in ([], ["/FlateDecode"], ["/DCTDecode"]):
+        return None
+    width, height = int(obj["/Width"]), int(obj["/Height"])
+    scale = min(1.0, max_px / max(width, height))
+    is_jpeg = filters == ["/DCTDecode"]
+    if scale == 1.0 and not is_jpeg:
+        # Картинка без потерь и не больше лимита — её пересожмёт общий путь
+        return None
+
+    mode = "L" if components == 1 else "RGB"
+    if is_jpeg:
+        image = Image.open(io.BytesIO(obj._data))
+        image.load()
+        if image.mode != mode:
+            return None
+    else:
+        raw = zlib.decompress(obj._data) if filters else obj._data
+        size = width * height * components
+        if len(raw) < size:
+            return None
+        image = Image.frombytes(mode, (width, height), raw[:size])
+    if scale < 1.0:
+        image = image.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.LANCZOS)
+
+    if is_jpeg:
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=jpeg_quality, optimize=True)
+        data, filter_name = buffer.getvalue(), "/DCTDecode"
+    else:
+        data, filter_name = zlib.compress(image.tobytes(), 9), "/FlateDecode"
+    if scale == 1.0 and len(data) >= len(obj._data):
+        return None
+    copy = _with_data(obj, data, filter_name)
+    copy[NameObject("/Width")] = NumberObject(image.width)
+    copy[NameObject("/Height")] = NumberObject(image.height)
+    return copy
+
+
+_qpdf_missing_logged = False
+
+
+def _linearize(path: Path) -> bool:
+    global _qpdf_missing_logged
+    qpdf = shutil.which("qpdf")
+    if qpdf is None:
+        if not _qpdf_missing_logged:
+            logger.warning("PDF_LINEARIZE=1 but qpdf is not installed; linearization skipped")
+            _qpdf_missing_logged = True
+        return False
+    temp_path = path.with_name(f".linearize-{path.name}")
+    try:
+        result = subprocess.run([qpdf, "--linearize", str(path), str(temp_path)], capture_output=True, text=True)
+        # Код 3 — предупреждения, файл записан
+        if result.returncode not in (0, 3):
+            logger.warning("qpdf --linearize failed for %s: %s", path, result.stderr.strip())
+            return False
+        os.replace(temp_path, path)
+        return True
+    finally:
+        temp_path.unlink(missing_ok=True)
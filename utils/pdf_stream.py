@@ -0,0 +1,261 @@
+"""
+Большие PDF без загрузки целиком в память.
+
+- download_limited — скачивание файла из Telegram на диск кусками с
+  ограничением размера: превышение обрывает загрузку сразу, а не после неё;
+- open_pdf — чтение PDF через mmap: PyPDF2 разбирает объекты по запросу,
+  страницы файла подгружает ОС и может вытеснить их без свопа;
+- StreamingPdfWriter — запись PDF по мере копирования страниц: каждый
+  объект (страница, контент, шрифт, картинка) пишется в файл сразу после
+  разбора и не держится в памяти; в памяти только таблица смещений и карта
+  перенумерации объектов.
+
+Объединение титульной страницы с документом (merge_streaming) поэтому
+занимает память порядка одного самого крупного объекта (обычно картинки),
+а не всего документа, как у PyPDF2.PdfWriter.
+"""
+
+import asyncio
+import mmap
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+
+from aiogram import Bot
+from PyPDF2 import PdfReader
+from PyPDF2.generic import (
+    ArrayObject,
+    DictionaryObject,
+    IndirectObject,
+    NameObject,
+    NumberObject,
+    PdfObject,
+    StreamObject,
+)
+
+# Размер куска при скачивании и копировании, байты
+DOWNLOAD_CHUNK = 1 << 20
+# Таймаут скачивания: большой файл с обычным 30-секундным не успевает
+DOWNLOAD_TIMEOUT = int(os.getenv("UPLOAD_DOWNLOAD_TIMEOUT", "600"))
+
+_PAGES_ID = 1
+_CATALOG_ID = 2
+
+
+class PdfRejected(ValueError):
+    """Файл не принят: превышен лимит или это не читаемый PDF (текст — для пользователя)."""
+
+
+async def download_limited(
+    bot: Bot,
+    file_path: str,
+    destination: Union[str, Path],
+    max_bytes: int,
+    chunk_size: int = DOWNLOAD_CHUNK,
+    timeout: int = DOWNLOAD_TIMEOUT,
+) -> int:
+    """Скачивает файл Telegram на диск кусками; возвращает размер.
+
+    Если файл оказался больше max_bytes, загрузка обрывается, частичный
+    файл удаляется и выбрасывается PdfRejected.
+    """
+    written = 0
+    try:
+        with open(destination, "wb") as out:
+            if bot.session.api.is_local:
+                # Локальный Bot API отдаёт путь к файлу на диске
+                source = bot.session.api.wrap_local_file.to_local(file_path)
+                written = await asyncio.to_thread(_copy_limited, source, out, max_bytes, chunk_size)
+            else:
+                stream = bot.session.stream_content(
+                    url=bot.session.api.file_url(bot.token, file_path),
+                    timeout=timeout,
+                    chunk_size=chunk_size,
+                    raise_for_status=True,
+                )
+                try:
+                    async for chunk in stream:
+                        written += len(chunk)
+                        if written > max_bytes:
+                            raise _too_large(max_bytes)
+                        out.write(chunk)
+                finally:
+                    await stream.aclose()
+    except BaseException:
+        Path(destination).unlink(missing_ok=True)
+        raise
+    return written
+
+
+def _copy_limited(source: Union[str, Path], out: BinaryIO, max_bytes: int, chunk_size: int) -> int:
+    written = 0
+    with open(source, "rb") as src:
+        while chunk := src.read(chunk_size):
+            written += len(chunk)
+            if written > max_bytes:
+                raise _too_large(max_bytes)
+            out.write(chunk)
+    return written
+
+
+def _too_large(max_bytes: int) -> PdfRejected:
+    return PdfRejected(f"Файл больше {max_bytes / 2**20:g} МБ.")
+
+
+@contextmanager
+def open_pdf(path: Union[str, Path]) -> Iterator[PdfReader]:
+    """PdfReader поверх mmap файла; зашифрованный без пароля PDF — PdfRejected."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise PdfRejected("Файл пустой.")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            try:
+                reader = PdfReader(data)
+                if reader.is_encrypted and not reader.decrypt(""):
+                    raise PdfRejected("PDF защищён паролем.")
+            except PdfRejected:
+                raise
+            except Exception as exc:  # noqa: BLE001
+                raise PdfRejected("Не удалось прочитать PDF.") from exc
+            yield reader
+
+
+def count_pages(path: Union[str, Path]) -> int:
+    """Число страниц: читается только дерево страниц, без содержимого."""
+    with open_pdf(path) as reader:
+        try:
+            return len(reader.pages)
+        except Exception as exc:  # noqa: BLE001
+            raise PdfRejected("Не удалось прочитать PDF.") from exc
+
+
+class StreamingPdfWriter:
+    """Пишет PDF в поток по мере добавления страниц.
+
+    Объекты страницы и всё, на что она ссылается, перенумеровываются и
+    записываются сразу; общие объекты (шрифты, картинки) в пределах одного
+    источника пишутся один раз. Дерево страниц и каталог — в finish().
+    """
+
+    def __init__(self, out: BinaryIO) -> None:
+        self._out = out
+        # Смещение объекта по его номеру (индекс 0 — служебная запись xref)
+        self._offsets: List[Optional[int]] = [None, None, None]
+        self._kids: List[int] = []
+        out.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+
+    @property
+    def page_count(self) -> int:
+        return len(self._kids)
+
+    def add_pages(self, reader: PdfReader, indices: Optional[range] = None) -> int:
+        """Копирует страницы reader (все или indices); возвращает число скопированных."""
+        pages = reader.pages
+        indices = indices if indices is not None else range(len(pages))
+        # Номер объекта источника -> номер в результате
+        ids: Dict[int, int] = {}
+        new_ids = []
+        # Страницы нумеруются заранее: ссылки на них (аннотации, /Dest) ведут на копии
+        for index in indices:
+            page = pages[index]
+            new_id = self._allocate()
+            if page.indirect_reference is not None:
+                ids[page.indirect_reference.idnum] = new_id
+            new_ids.append(new_id)
+
+        for index, new_id in zip(indices, new_ids):
+            page = pages[index]
+            pending: List[Tuple[IndirectObject, int]] = []
+            copy = DictionaryObject(
+                {key: self._convert(value, ids, pending) for key, value in page.items() if key != "/Parent"}
+            )
+            copy[NameObject("/Parent")] = IndirectObject(_PAGES_ID, 0, None)
+            self._write_object(new_id, copy)
+            while pending:
+                reference, object_id = pending.pop()
+                obj = reference.get_object()
+                if isinstance(obj, DictionaryObject) and obj.get("/Type") in ("/Pages", "/Catalog"):
+                    # Узлы чужого дерева страниц не копируем (ссылка с нескопированной страницы)
+                    obj = None
+                self._write_object(object_id, self._convert(obj, ids, pending) if obj is not None else None)
+            self._kids.append(new_id)
+            # Разобранные объекты уже в файле: кэш PyPDF2 не должен расти с числом страниц
+            reader.resolved_objects.clear()
+            release_mapped(reader)
+        return len(new_ids)
+
+    def finish(self) -> None:
+        kids = ArrayObject(IndirectObject(kid, 0, None) for kid in self._kids)
+        self._write_object(_PAGES_ID, DictionaryObject({
+            NameObject("/Type"): NameObject("/Pages"),
+            NameObject("/Kids"): kids,
+            NameObject("/Count"): NumberObject(len(self._kids)),
+        }))
+        self._write_object(_CATALOG_ID, DictionaryObject({
+            NameObject("/Type"): NameObject("/Catalog"),
+            NameObject("/Pages"): IndirectObject(_PAGES_ID, 0, None),
+        }))
+        out = self._out
+        xref_offset = out.tell()
+        out.write(f"xref\n0 {len(self._offsets)}\n".encode())
+        out.write(b"0000000000 65535 f \n")
+        for offset in self._offsets[1:]:
+            out.write(b"0000000000 65535 f \n" if offset is None else b"%010d 00000 n \n" % offset)
+        out.write(
+            f"trailer\n<< /Size {len(self._offsets)} /Root {_CATALOG_ID} 0 R >>\n"
+            f"startxref\n{xref_offset}\n%%EOF\n".encode()
+        )
+
+    def _allocate(self) -> int:
+        self._offsets.append(None)
+        return len(self._offsets) - 1
+
+    def _convert(self, obj: PdfObject, ids: Dict[int, int], pending: List[Tuple[IndirectObject, int]]) -> PdfObject:
+        """Копия объекта со ссылками на новые номера; новые ссылки — в pending."""
+        if isinstance(obj, IndirectObject):
+            new_id = ids.get(obj.idnum)
+            if new_id is None:
+                new_id = ids[obj.idnum] = self._allocate()
+                pending.append((obj, new_id))
+            return IndirectObject(new_id, 0, None)
+        if isinstance(obj, StreamObject):
+            copy = obj.__class__()
+            # Данные потока не перекодируются и не копируются
+            copy._data = obj._data
+            for key, value in obj.items():
+                copy[key] = self._convert(value, ids, pending)
+            return copy
+        if isinstance(obj, DictionaryObject):
+            return DictionaryObject({key: self._convert(value, ids, pending) for key, value in obj.items()})
+        if isinstance(obj, ArrayObject):
+            return ArrayObject(self._convert(value, ids, pending) for value in obj)
+        return obj
+
+    def _write_object(self, object_id: int, obj: Optional[PdfObject]) -> None:
+        out = self._out
+        self._offsets[object_id] = out.tell()
+        out.write(b"%d 0 obj\n" % object_id)
+        if obj is None:
+            out.write(b"null")
+        else:
+            obj.write_to_stream(out, None)
+        out.write(b"\nendobj\n")
+
+
+def release_mapped(reader: PdfReader) -> None:
+    """Отпускает прочитанные страницы mmap: они остаются в кэше ОС, но не в RSS процесса."""
+    if isinstance(reader.stream, mmap.mmap) and hasattr(mmap, "MADV_DONTNEED"):
+        reader.stream.madvise(mmap.MADV_DONTNEED)
+
+
+def merge_streaming(title_pdf_path: Union[str, Path], main_pdf_path: Union[str, Path], output_path: Union[str, Path]) -> int:
+    """Первая страница титула + все страницы документа; возвращает число страниц результата."""
+    with open_pdf(title_pdf_path) as title, open_pdf(main_pdf_path) as main:
+        with open(output_path, "wb", buffering=DOWNLOAD_CHUNK) as out:
+            writer = StreamingPdfWriter(out)
+            if title.pages:
+                writer.add_pages(title, range(1))
+            writer.add_pages(main)
+            writer.finish()
+            return writer.page_count
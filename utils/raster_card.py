@@ -0,0 +1,396 @@
+"""
+Рендер карточек без браузера: декларативная раскладка + Pillow.
+
+Шаблон описывается деревом узлов — упрощённой моделью того, что делает с
+ним Chromium:
+
+- Box — flex-контейнер (direction row/column, justify-content start или
+  space-between, align-items stretch или center, gap, padding, фон,
+  flex-grow, margin-bottom);
+- Grid — сетка из равных колонок (grid-template-columns: 1fr ...) с gap;
+- Text — строка текста без переносов, с inline-кусками другого цвета или
+  шрифта (Span); высота строки — как у line-height: normal в Blink;
+- Svg — иконка из значения плейсхолдера (разметка <svg> с путём из M/L),
+  обводка с miter-соединениями, как в браузере;
+- Card — корень: размер, скругление углов, фон.
+
+Раскладка считается в CSS-пикселях (как в Blink), рисуется с масштабом
+scale (device_scale_factor). В текстах и цветах допускаются плейсхолдеры
+{key}; цвет, который после подстановки не является #hex, ищется в palette
+спецификации — так переключаются CSS-классы вроде {profit_class}.
+
+Чего модель не умеет (переносы строк, проценты, вложенный абсолют), в
+спецификации просто не используется; если значение не удаётся нарисовать
+(неизвестный цвет, svg с кривыми), выбрасывается RasterUnsupported и
+вызывающий код рендерит карточку в Chromium.
+"""
+
+import asyncio
+import logging
+import math
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from utils.raster_text import FontSet, RasterUnsupported, TextRun, draw_runs, line_metrics, parse_color, split_families
+from utils.render_jobs import RenderJob
+from utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+_PLACEHOLDER_RE = re.compile(r"{(\w+)}")
+_SVG_ATTR_RE = re.compile(r'([\w-]+)="([^"]*)"')
+_PATH_CMD_RE = re.compile(r"([MLml])\s*([-\d.]+)[\s,]*([-\d.]+)")
+# Суперсэмплинг масок (скругление углов, обводка svg) для сглаживания краёв
+_SUPERSAMPLE = 4
+
+
+@dataclass
+class Span:
+    """Inline-элемент внутри Text; незаданные family/weight наследуются."""
+
+    text: str
+    color: str
+    family: Optional[str] = None
+    weight: Optional[int] = None
+
+
+@dataclass
+class Text:
+    text: str
+    family: str
+    size: float
+    color: str
+    weight: int = 400
+    spans: Sequence[Span] = ()
+    margin_bottom: float = 0
+
+
+@dataclass
+class Svg:
+    """Иконка из разметки <svg> в values[key]; обводка цветом color."""
+
+    key: str
+    color: str
+    margin_bottom: float = 0
+
+
+@dataclass
+class Box:
+    children: Sequence["Node"]
+    direction: str = "row"
+    justify: str = "start"
+    align: str = "stretch"
+    gap: float = 0
+    padding: Tuple[float, float, float, float] = (0, 0, 0, 0)  # top, right, bottom, left
+    background: Optional[str] = None
+    grow: bool = False
+    margin_bottom: float = 0
+
+
+@dataclass
+class Grid:
+    children: Sequence["Node"]
+    columns: int = 2
+    gap: float = 0
+    margin_bottom: float = 0
+
+
+Node = Union[Text, Svg, Box, Grid]
+
+
+@dataclass
+class Card:
+    width: float
+    height: float
+    body: Box
+    radius: float = 0
+    background: Optional[str] = None
+    palette: Dict[str, str] = field(default_factory=dict)
+
+
+class _Context:
+    def __init__(self, card: Card, fonts: FontSet, values: Dict[str, str], scale: float) -> None:
+        self.card = card
+        self.fonts = fonts
+        self.values = values
+        self.scale = scale
+        self.draw = None
+        self.image = None
+        # Разбор текста на шрифты и размеры считаются один раз на узел
+        self._text: Dict[int, Any] = {}
+        self._svg: Dict[int, Any] = {}
+
+    def fill(self, text: str) -> str:
+        return _PLACEHOLDER_RE.sub(lambda m: self.values.get(m.group(1), m.group(0)), text)
+
+    def color(self, value: str) -> Tuple[int, int, int, int]:
+        value = self.fill(value).strip()
+        if not value.startswith(("#", "rgb")):
+            if value not in self.card.palette:
+                raise RasterUnsupported(f"unknown color {value!r}")
+            value = self.card.palette[value]
+        return parse_color(value)
+
+    def text(self, node: Text) -> Tuple[List[Tuple[List[TextRun], Tuple[int, int, int, int]]], float, float, float]:
+        """(куски с цветом, ширина, ascent, descent) строки в CSS-пикселях."""
+        cached = self._text.get(id(node))
+        if cached is not None:
+            return cached
+        parts = [(self.fill(node.text), node.color, node.family, node.weight)]
+        parts += [(self.fill(s.text), s.color, s.family or node.family, s.weight or node.weight) for s in node.spans]
+        pieces, width = [], 0.0
+        # Строку открывает strut — основной шрифт самого элемента
+        paths = {self.fonts.primary(split_families(node.family), node.weight)}
+        for text, color, family, weight in parts:
+            runs = self.fonts.runs(text, split_families(family), weight, node.size * self.scale)
+            pieces.append((runs, self.color(color)))
+            width += sum(run.font.getlength(run.text) for run in runs) / self.scale
+            paths.update(run.font.path for run in runs)
+        metrics = [line_metrics(path, node.size) for path in paths]
+        result = self._text[id(node)] = (
+            pieces, width, max(m[0] for m in metrics), max(m[1] for m in metrics),
+        )
+        return result
+
+    def svg(self, node: Svg) -> Tuple[float, float, float, List[Tuple[float, float]], Tuple[float, float, float, float]]:
+        """(ширина, высота, stroke-width, точки пути, viewBox) иконки."""
+        cached = self._svg.get(id(node))
+        if cached is None:
+            cached = self._svg[id(node)] = _parse_svg(self.values.get(node.key, ""))
+        return cached
+
+
+def _parse_svg(markup: str):
+    svg_tag = re.search(r"<svg\b[^>]*>", markup)
+    path_tag = re.search(r"<path\b[^>]*>", markup)
+    if not svg_tag or not path_tag:
+        raise RasterUnsupported("svg without <path>")
+    svg_attrs = dict(_SVG_ATTR_RE.findall(svg_tag.group(0)))
+    path_attrs = dict(_SVG_ATTR_RE.findall(path_tag.group(0)))
+    d = path_attrs.get("d", "")
+    commands = _PATH_CMD_RE.findall(d)
+    # Только ломаные из абсолютных M/L: всё остальное проще отдать браузеру
+    if not commands or any(cmd not in "ML" for cmd, _, _ in commands) or re.sub(r"[MLml\s\d.,-]", "", d):
+        raise RasterUnsupported(f"unsupported svg path {d!r}")
+    width, height = float(svg_attrs["width"]), float(svg_attrs["height"])
+    view_box = tuple(float(v) for v in svg_attrs.get("viewBox", f"0 0 {width} {height}").split())
+    points = [(float(x), float(y)) for _, x, y in commands]
+    return width, height, float(path_attrs.get("stroke-width", "1")), points, view_box
+
+
+def _margin(node: Node) -> float:
+    return node.margin_bottom
+
+
+def _measure(node: Node, ctx: _Context) -> Tuple[float, float]:
+    """Собственный (max-content) размер узла без margin, CSS-пиксели."""
+    if isinstance(node, Text):
+        _, width, ascent, descent = ctx.text(node)
+        return width, ascent + descent
+    if isinstance(node, Svg):
+        width, height = ctx.svg(node)[:2]
+        return width, height
+    if isinstance(node, Grid):
+        sizes = [_measure(child, ctx) for child in node.children]
+        rows = [sizes[i:i + node.columns] for i in range(0, len(sizes), node.columns)]
+        width = node.columns * max(w for w, _ in sizes) + node.gap * (node.columns - 1)
+        height = sum(max(h for _, h in row) for row in rows) + node.gap * (len(rows) - 1)
+        return width, height
+    top, right, bottom, left = node.padding
+    sizes = [_measure(child, ctx) for child in node.children]
+    gaps = node.gap * max(0, len(sizes) - 1)
+    if node.direction == "row":
+        width = sum(w for w, _ in sizes) + gaps
+        height = max((h + _margin(c) for (_, h), c in zip(sizes, node.children)), default=0)
+    else:
+        width = max((w for w, _ in sizes), default=0)
+        height = sum(h + _margin(c) for (_, h), c in zip(sizes, node.children)) + gaps
+    return width + left + right, height + top + bottom
+
+
+def _free_space(justify: str, free: float, count: int) -> Tuple[float, float]:
+    """(отступ перед первым элементом, добавка к промежуткам) для justify-content."""
+    if justify == "space-between" and count > 1:
+        return 0.0, max(0.0, free) / (count - 1)
+    if justify == "center":
+        return free / 2, 0.0
+    if justify == "end":
+        return free, 0.0
+    return 0.0, 0.0
+
+
+def _layout(node: Node, x: float, y: float, width: float, height: float, ctx: _Context) -> None:
+    """Рисует узел в прямоугольнике (x, y, width, height) CSS-пикселей."""
+    s = ctx.scale
+    if isinstance(node, Text):
+        pieces, _, ascent, _ = ctx.text(node)
+        pen = x * s
+        for runs, color in pieces:
+            pen = draw_runs(ctx.draw, pen, (y + ascent) * s, runs, color)
+        return
+    if isinstance(node, Svg):
+        _draw_svg(node, x, y, ctx)
+        return
+    if isinstance(node, Grid):
+        column = (width - node.gap * (node.columns - 1)) / node.columns
+        children = list(node.children)
+        for start in range(0, len(children), node.columns):
+            row = children[start:start + node.columns]
+            row_height = max(_measure(child, ctx)[1] for child in row)
+            for i, child in enumerate(row):
+                _layout(child, x + i * (column + node.gap), y, column, row_height, ctx)
+            y += row_height + node.gap
+        return
+
+    if node.background:
+        ctx.draw.rectangle(
+            (round(x * s), round(y * s), round((x + width) * s) - 1, round((y + height) * s) - 1),
+            fill=ctx.color(node.background),
+        )
+    top, right, bottom, left = node.padding
+    x, y = x + left, y + top
+    inner_w, inner_h = width - left - right, height - top - bottom
+    children = list(node.children)
+    sizes = [_measure(child, ctx) for child in children]
+
+    if node.direction == "row":
+        free = inner_w - sum(w for w, _ in sizes) - node.gap * (len(children) - 1)
+        offset, extra = _free_space(node.justify, free, len(children))
+        x += offset
+        for child, (w, h) in zip(children, sizes):
+            if node.align == "center":
+                _layout(child, x, y + (inner_h - h - _margin(child)) / 2, w, h, ctx)
+            else:
+                _layout(child, x, y, w, inner_h - _margin(child), ctx)
+            x += w + node.gap + extra
+        return
+
+    heights = [h for _, h in sizes]
+    free = inner_h - sum(h + _margin(c) for h, c in zip(heights, children)) - node.gap * (len(children) - 1)
+    growing = [i for i, child in enumerate(children) if isinstance(child, Box) and child.grow]
+    if growing and free > 0:
+        for i in growing:
+            heights[i] += free / len(growing)
+        free = 0
+    offset, extra = _free_space(node.justify, free, len(children))
+    y += offset
+    for child, h in zip(children, heights):
+        _layout(child, x, y, inner_w, h, ctx)
+        y += h + _margin(child) + node.gap + extra
+
+
+def _stroke_polygons(points: List[Tuple[float, float]], half: float) -> List[List[Tuple[float, float]]]:
+    """Контур обводки ломаной: сегменты с butt-концами и miter-соединения."""
+    polygons = []
+    normals = []
+    for (x0, y0), (x1, y1) in zip(points, points[1:]):
+        length = math.hypot(x1 - x0, y1 - y0) or 1.0
+        nx, ny = -(y1 - y0) / length * half, (x1 - x0) / length * half
+        normals.append((nx, ny))
+        polygons.append([(x0 + nx, y0 + ny), (x1 + nx, y1 + ny), (x1 - nx, y1 - ny), (x0 - nx, y0 - ny)])
+    for (px, py), (n1x, n1y), (n2x, n2y) in zip(points[1:], normals, normals[1:]):
+        for sign in (1, -1):
+            a = (px + sign * n1x, py + sign * n1y)
+            b = (px + sign * n2x, py + sign * n2y)
+            # Вершина miter: пересечение внешних краёв соседних сегментов
+            bx, by = n1x + n2x, n1y + n2y
+            norm = math.hypot(bx, by)
+            if norm < 1e-9:
+                continue
+            reach = half * half / ((bx * n1x + by * n1y) / norm)
+            # miter-limit 4, как в SVG по умолчанию; дальше — срез (bevel)
+            tip = [(px + sign * bx / norm * reach, py + sign * by / norm * reach)] if reach <= 4 * half else []
+            polygons.append([(px, py), a] + tip + [b])
+    return polygons
+
+
+def _draw_svg(node: Svg, x: float, y: float, ctx: _Context) -> None:
+    from PIL import Image, ImageDraw
+
+    width, height, stroke, points, (vx, vy, vw, vh) = ctx.svg(node)
+    s = ctx.scale
+    k = _SUPERSAMPLE
+    box = (round(x * s), round(y * s))
+    size = (max(1, round(width * s)), max(1, round(height * s)))
+    # Маска в k раз крупнее с последующим уменьшением — сглаживание, как у Skia
+    sx, sy = size[0] * k / vw, size[1] * k / vh
+    mask = Image.new("L", (size[0] * k, size[1] * k))
+    mask_draw = ImageDraw.Draw(mask)
+    for polygon in _stroke_polygons(points, stroke / 2):
+        mask_draw.polygon([((px - vx) * sx, (py - vy) * sy) for px, py in polygon], fill=255)
+    mask = mask.reduce(k)  # overflow: hidden у svg — всё за viewBox обрезано
+    ctx.image.paste(ctx.color(node.color)[:3], box + (box[0] + size[0], box[1] + size[1]), mask)
+
+
+@lru_cache(maxsize=8)
+def _corner_mask(size: Tuple[int, int], radius: int):
+    """Альфа-маска карточки со сглаженными скруглёнными углами."""
+    from PIL import Image, ImageDraw
+
+    mask = Image.new("L", size, 255)
+    if radius <= 0:
+        return mask
+    k = _SUPERSAMPLE
+    corner = Image.new("L", (radius * k, radius * k), 0)
+    ImageDraw.Draw(corner).pieslice((0, 0, 2 * radius * k - 1, 2 * radius * k - 1), 180, 270, fill=255)
+    corner = corner.reduce(k)
+    width, height = size
+    mask.paste(corner, (0, 0))
+    mask.paste(corner.transpose(Image.FLIP_LEFT_RIGHT), (width - radius, 0))
+    mask.paste(corner.transpose(Image.FLIP_TOP_BOTTOM), (0, height - radius))
+    mask.paste(corner.transpose(Image.ROTATE_180), (width - radius, height - radius))
+    return mask
+
+
+def draw_card(card: Card, fonts: FontSet, values: Dict[str, str], scale: float):
+    """Рисует карточку по спецификации (синхронно); возвращает RGBA-изображение."""
+    from PIL import Image, ImageDraw
+
+    ctx = _Context(card, fonts, values, scale)
+    size = (round(card.width * scale), round(card.height * scale))
+    background = ctx.color(card.background)[:3] if card.background else (255, 255, 255)
+    ctx.image = Image.new("RGB", size, background)
+    ctx.draw = ImageDraw.Draw(ctx.image)
+    _layout(card.body, 0, 0, card.width, card.height, ctx)
+
+    image = ctx.image.convert("RGBA")
+    # overflow: hidden + border-radius: вне скругления карточка прозрачна
+    image.putalpha(_corner_mask(size, round(card.radius * scale)))
+    return image
+
+
+def render_card(card: Card, fonts: FontSet, values: Dict[str, str], scale: float, output_path: Path) -> str:
+    image = draw_card(card, fonts, values, scale)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    image.save(output_path, format="PNG", compress_level=1)
+    return str(output_path)
+
+
+class RasterRenderer:
+    """Рендер карточек по спецификациям {имя шаблона: Card} в пуле потоков."""
+
+    def __init__(self, layouts: Dict[str, Card], fonts: FontSet, scale: float) -> None:
+        self.layouts = layouts
+        self.fonts = fonts
+        self.scale = scale
+
+    def supports(self, template_name: str) -> bool:
+        return template_name in self.layouts
+
+    async def render(
+        self,
+        template_name: str,
+        values: Dict[str, str],
+        output_path: Path,
+        job: Optional[RenderJob] = None,
+    ) -> str:
+        card = self.layouts.get(template_name)
+        if card is None:
+            raise RasterUnsupported(f"no raster layout for {template_name}")
+        job = job or RenderJob(template_name)
+        async with job.guard():
+            with span("raster.draw", template=template_name):
+                return await asyncio.to_thread(render_card, card, self.fonts, values, self.scale, Path(output_path))
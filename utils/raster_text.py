@@ -0,0 +1,233 @@
+"""
+Текст для рендеров карточек без браузера (Pillow).
+
+Общая часть utils/card_compositor.py и utils/raster_card.py: шрифты из
+@font-face шаблона, подбор веса как в CSS (с синтетическим полужирным, если
+нужного начертания нет), fallback по символам (символ, которого нет в
+шрифте, рисуется следующим семейством из font-family, затем тем, что
+предложит fontconfig, — как делает Chromium) и отрисовка строки с
+letter-spacing. Символ, которого нет ни в одном из этих шрифтов,
+даёт RasterUnsupported: карточку рендерит Chromium.
+
+Кусок текста с одним шрифтом — TextRun(font, text, stroke): stroke — ширина
+обводки синтетического полужирного в пикселях (0 — обычное начертание).
+"""
+
+import re
+import shutil
+import subprocess
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+_FONT_FACE_RE = re.compile(r"@font-face\s*{([^}]*)}", re.S)
+_CSS_PROP_RE = re.compile(r"([\w-]+)\s*:\s*([^;]+);?")
+_CSS_URL_RE = re.compile(r"url\(\s*['\"]?([^'\")]+)['\"]?\s*\)")
+_COLOR_RE = re.compile(r"rgba?\(([^)]*)\)")
+# Имя начертания fontconfig по CSS font-weight
+_FC_WEIGHTS = ((350, "light"), (450, "regular"), (550, "medium"), (650, "semibold"), (1000, "bold"))
+# Синтетический полужирный Skia: обводка шириной size/24 (мелкий кегль) … size/32 (от 36px)
+_FAKE_BOLD_KEYS = ((9, 1 / 24), (36, 1 / 32))
+
+
+class RasterUnsupported(Exception):
+    """Карточку нельзя нарисовать без браузера — нужен полный рендер в Chromium."""
+
+
+class TextRun(NamedTuple):
+    font: Any  # PIL.ImageFont.FreeTypeFont
+    text: str
+    stroke: float
+
+
+def parse_color(value: str) -> Tuple[int, int, int, int]:
+    """#rrggbb, rgb() или rgba() (как в CSS и getComputedStyle) в RGBA 0–255."""
+    value = (value or "").strip()
+    if value.startswith("#"):
+        digits = value[1:]
+        if len(digits) in (3, 4):
+            digits = "".join(ch * 2 for ch in digits)
+        channels = [int(digits[i:i + 2], 16) for i in range(0, len(digits), 2)]
+        return tuple(channels + [255] * (4 - len(channels)))[:4]
+    match = _COLOR_RE.search(value)
+    if not match:
+        return (0, 0, 0, 0)
+    parts = [p.strip() for p in match.group(1).replace("/", ",").split(",") if p.strip()]
+    r, g, b = (int(round(float(p))) for p in parts[:3])
+    alpha = float(parts[3]) if len(parts) > 3 else 1.0
+    return (r, g, b, int(round(alpha * 255)))
+
+
+def parse_font_faces(css_path: Path) -> Dict[Tuple[str, int], Path]:
+    """@font-face из CSS шаблона: (семейство в нижнем регистре, вес) -> файл шрифта.
+
+    Из src берётся первый существующий файл: если ни одного нет, браузер
+    правило тоже не применит, и семейство ищется среди системных шрифтов.
+    """
+    faces: Dict[Tuple[str, int], Path] = {}
+    if not css_path.exists():
+        return faces
+    for block in _FONT_FACE_RE.findall(css_path.read_text(encoding="utf-8")):
+        props = {k.lower(): v.strip() for k, v in _CSS_PROP_RE.findall(block)}
+        family = props.get("font-family", "").strip("'\" ").lower()
+        paths = [(css_path.parent / url).resolve() for url in _CSS_URL_RE.findall(props.get("src", ""))]
+        path = next((p for p in paths if p.exists()), None)
+        if not family or path is None:
+            continue
+        weight = {"normal": 400, "bold": 700}.get(props.get("font-weight", "400"), None)
+        if weight is None:
+            weight = int(props.get("font-weight", "400").split()[0])
+        faces[(family, weight)] = path
+    return faces
+
+
+def split_families(value: str) -> List[str]:
+    """Значение font-family в список семейств без кавычек."""
+    return [f.strip().strip("'\"") for f in value.split(",") if f.strip()]
+
+
+@lru_cache(maxsize=256)
+def _fc_match(pattern: str) -> Optional[Tuple[str, str]]:
+    """(семейство, файл), которые fontconfig подставит для шаблона; None без fontconfig."""
+    if shutil.which("fc-match") is None:
+        return None
+    try:
+        out = subprocess.run(
+            ["fc-match", "-f", "%{family}|%{file}", pattern],
+            capture_output=True, text=True, timeout=5, check=True,
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    family, _, path = out.partition("|")
+    return (family.split(",")[0], path) if path else None
+
+
+def _fc_style(weight: int) -> str:
+    return next(name for limit, name in _FC_WEIGHTS if weight < limit)
+
+
+def _fake_bold_stroke(size: float) -> float:
+    (small, small_ratio), (large, large_ratio) = _FAKE_BOLD_KEYS
+    t = min(1.0, max(0.0, (size - small) / (large - small)))
+    # Ширина обводки Skia; Pillow обводит на stroke_width с каждой стороны
+    return size * (small_ratio + (large_ratio - small_ratio) * t) / 2
+
+
+class FontSet:
+    """Шрифты Pillow по семейству/весу/кеглю с fallback по символам, как в Chromium."""
+
+    def __init__(self, faces: Dict[Tuple[str, int], Path]) -> None:
+        self.faces = faces
+        # FreeTypeFont не рассчитан на одновременное использование из нескольких потоков
+        self._local = threading.local()
+
+    def font(self, path: str, size: float):
+        from PIL import ImageFont
+
+        cache = self._local.__dict__.setdefault("fonts", {})
+        key = (path, round(size, 3))
+        font = cache.get(key)
+        if font is None:
+            font = cache[key] = ImageFont.truetype(path, size)
+        return font
+
+    def match(self, family: str, weight: int) -> Optional[Tuple[str, bool]]:
+        """(файл, нужен ли синтетический полужирный) или None, если семейства нет."""
+        family_key = family.lower()
+        weights = [w for (f, w) in self.faces if f == family_key]
+        if weights:
+            # Ближайший объявленный вес (упрощённый алгоритм подбора CSS)
+            best = min(weights, key=lambda w: (abs(w - weight), w < weight))
+            return str(self.faces[(family_key, best)]), weight >= 600 and best < 600
+        match = _fc_match(f"{family}:{_fc_style(weight)}")
+        if match and match[0].lower() == family_key:
+            return match[1], False
+        return None
+
+    def _matches(self, families: List[str], weight: int) -> List[Tuple[str, bool]]:
+        matches = [m for m in (self.match(f, weight) for f in families) if m]
+        if not matches:
+            raise RasterUnsupported(f"no font for {families[:1]} {weight}")
+        return matches
+
+    def primary(self, families: List[str], weight: int) -> str:
+        """Файл основного шрифта: первого найденного семейства из font-family."""
+        return self._matches(families, weight)[0][0]
+
+    def runs(self, text: str, families: List[str], weight: int, size: float) -> List[TextRun]:
+        """Разбивает текст на куски с одним шрифтом."""
+        matches = self._matches(families, weight)
+        runs: List[TextRun] = []
+        for char in text:
+            path, bold = next(((p, b) for p, b in matches if has_glyph(p, char)), (None, False))
+            if path is None:
+                fallback = _fc_match(f"sans-serif:{_fc_style(weight)}:charset={ord(char):x}")
+                if not fallback or not has_glyph(fallback[1], char):
+                    # Иначе вместо символа был бы нарисован .notdef — пусть рисует Chromium
+                    raise RasterUnsupported(f"no font has glyph U+{ord(char):04X}")
+                path, bold = fallback[1], False
+            font = self.font(path, size)
+            stroke = _fake_bold_stroke(size) if bold else 0.0
+            if runs and runs[-1].font is font and runs[-1].stroke == stroke:
+                runs[-1] = runs[-1]._replace(text=runs[-1].text + char)
+            else:
+                runs.append(TextRun(font, char, stroke))
+        return runs
+
+
+@lru_cache(maxsize=4096)
+def has_glyph(path: str, char: str) -> bool:
+    """Есть ли символ в шрифте: отсутствующий рисуется тем же .notdef, что и U+10FFFD."""
+    if char.isspace():
+        return True
+    return _glyph_bitmap(path, char) != _glyph_bitmap(path, "\U0010fffd")
+
+
+@lru_cache(maxsize=4096)
+def _glyph_bitmap(path: str, char: str) -> bytes:
+    from PIL import Image, ImageDraw, ImageFont
+
+    image = Image.new("L", (64, 64))
+    ImageDraw.Draw(image).text((8, 8), char, font=ImageFont.truetype(path, 32), fill=255)
+    return image.tobytes()
+
+
+@lru_cache(maxsize=64)
+def _metric_ratios(path: str) -> Tuple[float, float, float]:
+    from PIL import ImageFont
+
+    # FreeType округляет метрики до пикселя вверх: на большом кегле ошибка пренебрежима
+    size = 4096
+    font = ImageFont.truetype(path, size).font
+    return font.ascent / size, font.descent / size, (font.height - font.ascent - font.descent) / size
+
+
+def line_metrics(path: str, size: float) -> Tuple[float, float]:
+    """(ascent, descent) строки с line-height: normal, как их считает Blink.
+
+    Ascent, descent и межстрочный интервал шрифта округляются по отдельности,
+    интервал делится пополам между верхом и низом с точностью LayoutUnit (1/64).
+    """
+    ascent, descent, gap = (round(ratio * size) for ratio in _metric_ratios(path))
+    top = ascent + int(gap / 2 * 64) / 64
+    return top, ascent + descent + gap - top
+
+
+def text_width(runs: List[TextRun], letter_spacing: float = 0.0) -> float:
+    return sum(run.font.getlength(run.text) for run in runs) + letter_spacing * sum(len(run.text) for run in runs)
+
+
+def draw_runs(draw, x: float, baseline: float, runs: List[TextRun], fill, letter_spacing: float = 0.0) -> float:
+    """Рисует куски от x по базовой линии; возвращает x конца строки."""
+    for run in runs:
+        options = {"stroke_width": run.stroke, "stroke_fill": fill} if run.stroke else {}
+        if letter_spacing:
+            # Pillow не умеет letter-spacing: по символу, с шагом как в Chromium
+            for char in run.text:
+                draw.text((x, baseline), char, font=run.font, fill=fill, anchor="ls", **options)
+                x += run.font.getlength(char) + letter_spacing
+        else:
+            draw.text((x, baseline), run.text, font=run.font, fill=fill, anchor="ls", **options)
+            x += run.font.getlength(run.text)
+    return x
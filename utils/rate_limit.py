@@ -0,0 +1,61 @@
+"""
+Token bucket для ограничения частоты исходящих запросов к Telegram.
+
+Ведро пополняется со скоростью ``rate`` токенов в секунду и вмещает не больше
+``capacity`` токенов. Пока в ведре есть токен, запрос проходит сразу; когда
+токены закончились — ждём, пока ведро пополнится.
+"""
+
+import asyncio
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """Простой token bucket на монотонных часах (не потокобезопасен, для asyncio)."""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        if rate <= 0 or capacity <= 0:
+            raise ValueError("rate и capacity должны быть больше нуля")
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._updated_at = time.monotonic()
+        # Момент, до которого ведро принудительно «заморожено» (например, после RetryAfter)
+        self._paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated_at
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated_at = now
+
+    def try_acquire(self, tokens: float = 1.0, now: Optional[float] = None) -> float:
+        """Пробует забрать токены.
+
+        Возвращает 0.0, если токены выданы, иначе — сколько секунд нужно подождать.
+        """
+        now = time.monotonic() if now is None else now
+        if now < self._paused_until:
+            return self._paused_until - now
+
+        self._refill(now)
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return 0.0
+        return (tokens - self._tokens) / self.rate
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        """Ждёт, пока в ведре не появится нужное количество токенов."""
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """Блокирует ведро на ``seconds`` секунд и обнуляет накопленные токены."""
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + seconds)
+        self._tokens = 0.0
+        self._updated_at = self._paused_until
@@ -0,0 +1,133 @@
+"""
+Клиент сервиса рендеринга (render_service.py).
+
+RENDER_SERVICE_URL — адрес сервиса: unix:/path/to/render.sock или
+http://127.0.0.1:8090. Если он задан, бот не рендерит сам, а отправляет
+операции сервису (см. misc.render_backend); пусто — всё рендерится в
+процессе бота, как раньше.
+
+Запрос выполняется под RenderJob вызывающего: дедлайн задания передаётся
+сервису (там рендер прерывается так же), а отмена или истечение дедлайна
+на стороне бота обрывают соединение — сервис отменяет рендер. Ответ
+сервиса «timeout» превращается в RenderTimeout, «busy» (очередь
+заполнена) и прочие ошибки — в RenderServiceError.
+
+Файлы передаются путями: сервис и бот должны видеть один и тот же temp/.
+
+Командная строка (тонкий клиент для других инструментов):
+    python -m utils.render_client okx_card '{"fields": {...}, "output_path": "temp/card.png"}'
+    python -m utils.render_client health
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+from typing import Any, Dict, Optional
+
+import aiohttp
+
+from utils.render_jobs import RenderAborted, RenderJob, RenderTimeout
+
+logger = logging.getLogger(__name__)
+
+RENDER_SERVICE_URL = os.getenv("RENDER_SERVICE_URL", "").strip()
+# Запас к дедлайну задания на HTTP-ответ, секунды
+_RESPONSE_MARGIN = 5.0
+
+
+class RenderServiceError(RenderAborted):
+    """Сервис не выполнил операцию: очередь заполнена, неверный запрос или сбой рендера."""
+
+    def __init__(self, template: str, message: str, status: int = 0) -> None:
+        super().__init__(template, message)
+        self.status = status
+
+
+class RenderServiceClient:
+    def __init__(self, url: str) -> None:
+        self.url = url
+        if url.startswith("unix:"):
+            self._socket_path: Optional[str] = url[len("unix:"):]
+            # Хост для Unix-сокета не важен, но нужен в URL
+            self._base_url = "http://render-service"
+        else:
+            self._socket_path = None
+            self._base_url = url.rstrip("/")
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.UnixConnector(path=self._socket_path) if self._socket_path else None
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def call(self, op: str, params: Dict[str, Any], job: RenderJob) -> Dict[str, Any]:
+        """Выполняет операцию op на сервисе под дедлайном и отменой job."""
+        payload = {**params, "timeout": job.timeout}
+        client_timeout = aiohttp.ClientTimeout(total=job.timeout + _RESPONSE_MARGIN if job.timeout else None)
+        async with job.guard():
+            try:
+                async with self._get_session().post(
+                    f"{self._base_url}/v1/{op}", json=payload, timeout=client_timeout
+                ) as response:
+                    status = response.status
+                    body = await response.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as exc:
+                raise RenderServiceError(job.template, f"render service unavailable: {exc!r}") from exc
+        if status == 200:
+            return body
+        error, message = body.get("error", "failed"), body.get("message", "")
+        if error == "timeout":
+            raise RenderTimeout(job.template, message or "timed out in render service")
+        raise RenderServiceError(job.template, f"{error}: {message}", status)
+
+    async def health(self) -> Dict[str, Any]:
+        async with self._get_session().get(f"{self._base_url}/health") as response:
+            return await response.json()
+
+    async def wait_ready(self, interval: float = 1.0) -> None:
+        """Ждёт, пока сервис прогреется (health.ready); для пробы готовности бота."""
+        while True:
+            try:
+                if (await self.health()).get("ready"):
+                    return
+            except (aiohttp.ClientError, ValueError) as exc:
+                logger.debug("Render service is not reachable yet: %s", exc)
+            await asyncio.sleep(interval)
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+render_service: Optional[RenderServiceClient] = RenderServiceClient(RENDER_SERVICE_URL) if RENDER_SERVICE_URL else None
+
+
+async def _cli(args: argparse.Namespace) -> int:
+    client = RenderServiceClient(args.url)
+    try:
+        if args.op == "health":
+            result = await client.health()
+        else:
+            params = json.loads(args.params) if args.params else {}
+            result = await client.call(args.op, params, RenderJob(args.op, args.timeout))
+    except RenderAborted as exc:
+        print(json.dumps({"error": str(exc)}, ensure_ascii=False), file=sys.stderr)
+        return 1
+    finally:
+        await client.close()
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("op", help="операция сервиса (см. render_service.py) или health")
+    parser.add_argument("params", nargs="?", help="параметры операции, JSON")
+    parser.add_argument("--url", default=RENDER_SERVICE_URL or "http://127.0.0.1:8090")
+    parser.add_argument("--timeout", type=float, default=60.0, help="дедлайн операции, с")
+    sys.exit(asyncio.run(_cli(parser.parse_args())))
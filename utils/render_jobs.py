@@ -0,0 +1,135 @@
+"""
+Задания рендеринга: дедлайн и отмена.
+
+Каждый рендер (html_to_image, html_to_pdf_playwright) выполняется под
+RenderJob.guard(): по истечении дедлайна или при job.cancel() работа со
+страницей прерывается в ближайшей точке ожидания, контекст браузера вместе
+со страницей закрывается, а наружу выходит RenderTimeout или RenderCancelled.
+Таймауты и отмены считаются по шаблонам (render_timeouts_total{template},
+render_cancelled_total{template}).
+
+Отмену пользователем связывает с заданием реестр render_jobs: хендлер
+регистрирует задание под ключом (id пользователя), кнопка «Отменить»
+вызывает render_jobs.cancel(key).
+
+Пример:
+    job = render_jobs.start(user_id, "invoice")
+    try:
+        await html_to_pdf_playwright(..., job=job)
+    finally:
+        render_jobs.finish(user_id, job)
+"""
+
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Hashable, List, Optional
+
+from utils.metrics import RENDER_CANCELLED_TOTAL, RENDER_TIMEOUTS_TOTAL
+
+logger = logging.getLogger(__name__)
+
+# Общий дедлайн рендера по умолчанию, секунды (включает ожидание запуска браузера)
+RENDER_TIMEOUT = float(os.getenv("RENDER_TIMEOUT", "60"))
+
+
+class RenderAborted(Exception):
+    """Рендер прерван до завершения."""
+
+    def __init__(self, template: str, message: str) -> None:
+        super().__init__(f"{template}: {message}")
+        self.template = template
+
+
+class RenderTimeout(RenderAborted):
+    pass
+
+
+class RenderCancelled(RenderAborted):
+    pass
+
+
+class RenderJob:
+    def __init__(self, template: str, timeout: Optional[float] = RENDER_TIMEOUT) -> None:
+        self.template = template
+        self.timeout = timeout
+        self.cancelled = False
+        self._deadline: Optional[float] = None
+        self._scopes: List[asyncio.Timeout] = []
+
+    def _loop_deadline(self) -> Optional[float]:
+        # Дедлайн отсчитывается от первого guard(): задание можно создать заранее
+        if self._deadline is None and self.timeout:
+            self._deadline = asyncio.get_running_loop().time() + self.timeout
+        return self._deadline
+
+    def cancel(self) -> None:
+        """Отменяет задание: активный рендер прерывается немедленно."""
+        if self.cancelled:
+            return
+        self.cancelled = True
+        now = asyncio.get_running_loop().time()
+        for scope in self._scopes:
+            scope.reschedule(now)
+
+    @asynccontextmanager
+    async def guard(self) -> AsyncIterator["RenderJob"]:
+        """Выполняет блок под дедлайном задания с возможностью отмены."""
+        if self.cancelled:
+            RENDER_CANCELLED_TOTAL.inc(template=self.template)
+            raise RenderCancelled(self.template, "cancelled before start")
+        scope = asyncio.timeout_at(self._loop_deadline())
+        try:
+            async with scope:
+                self._scopes.append(scope)
+                try:
+                    yield self
+                finally:
+                    self._scopes.remove(scope)
+        except TimeoutError:
+            if not scope.expired():
+                raise
+            if self.cancelled:
+                RENDER_CANCELLED_TOTAL.inc(template=self.template)
+                logger.info("Render of %s cancelled", self.template)
+                raise RenderCancelled(self.template, "cancelled") from None
+            RENDER_TIMEOUTS_TOTAL.inc(template=self.template)
+            logger.error("Render of %s timed out after %gs", self.template, self.timeout)
+            raise RenderTimeout(self.template, f"timed out after {self.timeout:g}s") from None
+
+
+class RenderJobRegistry:
+    """Активные задания по ключу (обычно id пользователя) для отмены из другого апдейта."""
+
+    def __init__(self) -> None:
+        self._jobs: Dict[Hashable, RenderJob] = {}
+
+    def start(self, key: Hashable, template: str, timeout: Optional[float] = RENDER_TIMEOUT) -> RenderJob:
+        previous = self._jobs.get(key)
+        if previous is not None:
+            # Новое задание того же пользователя заменяет старое
+            previous.cancel()
+        job = self._jobs[key] = RenderJob(template, timeout)
+        return job
+
+    def adopt(self, key: Hashable, job: RenderJob) -> None:
+        """Регистрирует уже запущенное задание (например, спекулятивный рендер) под ключом."""
+        previous = self._jobs.get(key)
+        if previous is not None and previous is not job:
+            previous.cancel()
+        self._jobs[key] = job
+
+    def cancel(self, key: Hashable) -> bool:
+        job = self._jobs.pop(key, None)
+        if job is None:
+            return False
+        job.cancel()
+        return True
+
+    def finish(self, key: Hashable, job: RenderJob) -> None:
+        if self._jobs.get(key) is job:
+            del self._jobs[key]
+
+
+render_jobs = RenderJobRegistry()
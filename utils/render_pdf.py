@@ -1,16 +1,23 @@
-#!/usr/bin/env python3
 """
-Пример Playwright с идеальными настройками для полного использования A4.
+Рендер HTML в PDF через Playwright с настройками для полного использования A4.
 Убирает все возможные отступы и использует полную площадь страницы.
 """
 
-import asyncio
-from playwright.async_api import async_playwright
-import os
 from pathlib import Path
 import logging
+from typing import Optional
 
-async def html_to_pdf_playwright(html_file_path: str, output_pdf_path: str, css_file_path: str = None, landscape: bool = False) -> bool:
+from utils.browser_pool import browser_pool
+from utils.metrics import RENDER_PHASE_SECONDS
+from utils.render_jobs import RenderAborted, RenderJob
+from utils.single_flight import RENDER_SINGLE_FLIGHT, SingleFlight, render_key
+from utils.tracing import span
+
+# Одинаковые одновременные PDF (тот же HTML и ориентация) рендерятся один раз
+pdf_flights = SingleFlight("pdf")
+
+
+async def html_to_pdf_playwright(html_file_path: str, output_pdf_path: str, css_file_path: str = None, landscape: bool = False, job: Optional[RenderJob] = None) -> bool:
     """Преобразовать HTML файл в PDF с максимальным использованием A4.
     
     Аргументы:
@@ -18,16 +25,18 @@ async def html_to_pdf_playwright(html_file_path: str, output_pdf_path: str, css_
         output_pdf_path: Путь для сохранения результирующего PDF файла.
         css_file_path: Опциональный путь к CSS файлу для стилизации.
         landscape: Если True, использует альбомную ориентацию.
+        job: Задание с дедлайном и отменой; по умолчанию RenderJob("pdf") с RENDER_TIMEOUT.
     
     Возвращает:
-        True, если PDF успешно создан; False, если произошла ошибка.
+        True, если PDF успешно создан; False, если произошла ошибка,
+        истёк дедлайн или задание отменено (см. job.cancelled).
     """
     
     try:
         # Валидация входных параметров
         html_path = Path(html_file_path).expanduser().resolve()
         if not html_path.exists() or not html_path.is_file():
-            print(f"❌ HTML файл не найден: {html_path}")
+            logging.error(f"❌ HTML файл не найден: {html_path}")
             return False
 
         output_path = Path(output_pdf_path).expanduser().resolve()
@@ -39,7 +48,7 @@ async def html_to_pdf_playwright(html_file_path: str, output_pdf_path: str, css_
         if css_file_path:
             css_path = Path(css_file_path).expanduser().resolve()
             if not css_path.exists() or not css_path.is_file():
-                print(f"⚠️ CSS файл не найден: {css_path}. Будет использован HTML без внешних стилей.")
+                logging.warning(f"⚠️ CSS файл не найден: {css_path}. Будет использован HTML без внешних стилей.")
                 css_file_path = None
 
         logging.info(f"🔄 Начинаю конвертацию HTML в PDF с максимальным использованием A4...")
@@ -48,27 +57,46 @@ async def html_to_pdf_playwright(html_file_path: str, output_pdf_path: str, css_
             logging.info(f"🎨 CSS файл: {css_path}")
         logging.info(f"📋 Выходной PDF: {output_path}")
         
-        async with async_playwright() as p:
-            # Запускаем браузер в headless режиме с отключенной веб-безопасностью для CORS
-            browser = await p.chromium.launch(
-                headless=True,
-                args=[
-                    '--disable-web-security',
-                    '--disable-features=VizDisplayCompositor',
-                    '--no-sandbox',
-                    '--disable-setuid-sandbox'
-                ]
-            )
-            # Используем контекст с повышенной плотностью рендеринга
-            context = await browser.new_context(device_scale_factor=2)
+        if job is None:
+            job = RenderJob("pdf")
+
+        if RENDER_SINGLE_FLIGHT:
+            key = render_key(html_path, landscape)
+
+            async def render(path: Path, shared_job: RenderJob) -> bool:
+                await _render_pdf(html_path, path, landscape, shared_job)
+                return True
+
+            await pdf_flights.run(key, output_path, render, job)
+        else:
+            await _render_pdf(html_path, output_path, landscape, job)
+
+        logging.info(f"✅ PDF успешно создан: {output_path}")
+        return True
+
+    except RenderAborted as e:
+        logging.warning(f"⏹ Конвертация HTML в PDF прервана: {e}")
+        return False
+    except Exception as e:
+        logging.error(f"❌ Ошибка при конвертации HTML в PDF: {str(e)}")
+        return False
+
+
+async def _render_pdf(html_path: Path, output_path: Path, landscape: bool, job: RenderJob) -> None:
+    """Печать страницы html_path в PDF под заданием job; ошибки пробрасываются."""
+    # Дедлайн и отмена покрывают весь рендер; при срабатывании контекст со страницей закрывается
+    async with job.guard():
+        # Браузер общий на процесс, на каждый рендер — свой контекст с повышенной плотностью
+        async with browser_pool.context("pdf", device_scale_factor=2) as context:
             page = await context.new_page()
+
+            with span("page.navigate"), RENDER_PHASE_SECONDS.time(renderer="pdf", phase="navigate"):
+                # Загружаем HTML файл
+                await page.goto(f"file://{html_path}")
             
-            # Загружаем HTML файл
-            await page.goto(f"file://{html_path}")
-            
-            # Ждем загрузки всех ресурсов
-            await page.wait_for_load_state('networkidle')
-            
+                # Ждем загрузки всех ресурсов
+                await page.wait_for_load_state('networkidle')
+        
             # Настройки для максимального использования A4 с улучшенным качеством
             pdf_options = {
                 'path': str(output_path),
@@ -87,59 +115,7 @@ async def html_to_pdf_playwright(html_file_path: str, output_pdf_path: str, css_
                 'header_template': '',  # Пустой заголовок
                 'footer_template': '',  # Пустой футер
             }
-            
-            # Генерируем PDF
-            await page.pdf(**pdf_options)
-            
-            await context.close()
-            await browser.close()
         
-        logging.info(f"✅ PDF успешно создан: {output_path}")
-        return True
-
-    except Exception as e:
-        logging.error(f"❌ Ошибка при конвертации HTML в PDF: {str(e)}")
-        return False
-
-
-async def main():
-    """Основная функция для демонстрации."""
-    
-    # Пути к файлам
-    html_file = "invoice_html/pdf.html"
-    css_file = "invoice_html/styles.css"
-    output_pdf = "invoice_html/invoice.pdf"
-    
-    # Получаем абсолютные пути
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    html_path = os.path.join(current_dir, html_file)
-    css_path = os.path.join(current_dir, css_file)
-    pdf_path = os.path.join(current_dir, output_pdf)
-    
-    print("🚀 Демонстрация Playwright с максимальным использованием A4")
-    print("=" * 60)
-    
-    # Вызываем функцию конвертации
-    success = await html_to_pdf_playwright(
-        html_file_path=html_path,
-        output_pdf_path=pdf_path,
-        css_file_path=css_path
-    )
-    
-    if success:
-        print("\n🎉 Конвертация завершена успешно!")
-        print(f"📁 Проверьте файл: {pdf_path}")
-        print("\n💡 Настройки для максимального использования A4:")
-        print("   - format: 'A4'")
-        print("   - margin: 0 (без отступов)")
-        print("   - prefer_css_page_size: False")
-        print("   - scale: 1.3348 (100%)")
-        print("   - display_header_footer: False")
-        print("   - CSS: .container { width: 100%; height: 100%; padding: 42px 33px; }")
-        print("   - CSS: .page { width: 210mm; height: 297mm; }")
-    else:
-        print("\n❌ Конвертация не удалась")
-
-
-if __name__ == "__main__":
-    asyncio.run(main())
+            # Генерируем PDF
+            with span("page.pdf"), RENDER_PHASE_SECONDS.time(renderer="pdf", phase="pdf"):
+                await page.pdf(**pdf_options)
@@ -0,0 +1,216 @@
+"""
+Журнал сигналов /soft_signal в SQLite (только добавление).
+
+Каждый отправленный сигнал пишется строкой в таблицу signals: время, пара,
+таймфрейм, сторона, Price/TP/SL, RR и плечо. Индексы — по времени и по
+(pair, ts): выборки за период и по паре не сканируют весь журнал.
+
+Для агрегатов админ-команды (/signal_stats) в той же транзакции ведутся
+дневные своды (день UTC): signals_daily_pair — количество, сумма RR и сумма
+плеч по паре, signals_daily_leverage — количество по таймфрейму и корзине
+плеча. Запрос «за последние N дней» читает не больше N × (число пар) строк
+свода вместо миллионов строк журнала; окно при этом считается целыми днями
+(сегодня и N-1 предыдущих). Точный запрос по журналу — exact=True.
+
+Доступ к базе идёт из одного потока (свой executor): запись и чтение не
+блокируют event loop и не конкурируют за соединение.
+
+Путь задаётся SIGNAL_JOURNAL_PATH (по умолчанию data/signals.sqlite3),
+пустое значение отключает журнал.
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SIGNAL_JOURNAL_PATH = os.getenv("SIGNAL_JOURNAL_PATH", "data/signals.sqlite3")
+
+# Верхние границы корзин плеча для распределения (плечо целое, от 1 до 100)
+LEVERAGE_BUCKETS = (5, 10, 20, 50, 99, 100)
+LEVERAGE_BUCKET_LABELS = ("1–5", "6–10", "11–20", "21–50", "51–99", "100")
+
+_DAY = 86400
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS signals (
+    id INTEGER PRIMARY KEY,
+    ts INTEGER NOT NULL,
+    pair TEXT NOT NULL,
+    timeframe TEXT NOT NULL,
+    side TEXT NOT NULL,
+    price REAL NOT NULL,
+    tp REAL NOT NULL,
+    sl REAL NOT NULL,
+    rr REAL NOT NULL,
+    leverage INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_signals_ts ON signals (ts);
+CREATE INDEX IF NOT EXISTS idx_signals_pair_ts ON signals (pair, ts);
+CREATE TABLE IF NOT EXISTS signals_daily_pair (
+    day INTEGER NOT NULL,
+    pair TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    rr_sum REAL NOT NULL,
+    leverage_sum INTEGER NOT NULL,
+    PRIMARY KEY (day, pair)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS signals_daily_leverage (
+    day INTEGER NOT NULL,
+    timeframe TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (day, timeframe, bucket)
+) WITHOUT ROWID;
+"""
+
+_UPSERT_DAILY_PAIR = """
+INSERT INTO signals_daily_pair (day, pair, count, rr_sum, leverage_sum) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (day, pair) DO UPDATE SET
+    count = count + excluded.count,
+    rr_sum = rr_sum + excluded.rr_sum,
+    leverage_sum = leverage_sum + excluded.leverage_sum
+"""
+
+_UPSERT_DAILY_LEVERAGE = """
+INSERT INTO signals_daily_leverage (day, timeframe, bucket, count) VALUES (?, ?, ?, ?)
+ON CONFLICT (day, timeframe, bucket) DO UPDATE SET count = count + excluded.count
+"""
+
+
+class JournalRow(NamedTuple):
+    ts: int  # Unix-время, секунды
+    pair: str
+    timeframe: str
+    side: str  # long / short
+    price: float
+    tp: float
+    sl: float
+    rr: float
+    leverage: int
+
+
+class PairStats(NamedTuple):
+    pair: str
+    count: int
+    avg_rr: float
+    avg_leverage: float
+
+
+def leverage_bucket(leverage: int) -> int:
+    return next((i for i, upper in enumerate(LEVERAGE_BUCKETS) if leverage <= upper), len(LEVERAGE_BUCKETS) - 1)
+
+
+class SignalJournal:
+    def __init__(self, path: Optional[str]) -> None:
+        self.path = Path(path) if path else None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            # WAL: чтение не ждёт записи; NORMAL — fsync на чекпойнте, а не на каждую вставку
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def append(self, rows: Iterable[JournalRow]) -> int:
+        """Добавляет строки в журнал и дневные своды одной транзакцией."""
+        rows = list(rows)
+        if not rows:
+            return 0
+        by_pair: Dict[Tuple[int, str], List[float]] = defaultdict(lambda: [0, 0.0, 0])
+        by_leverage: Dict[Tuple[int, str, int], int] = defaultdict(int)
+        for row in rows:
+            day = row.ts // _DAY
+            totals = by_pair[(day, row.pair)]
+            totals[0] += 1
+            totals[1] += row.rr
+            totals[2] += row.leverage
+            by_leverage[(day, row.timeframe, leverage_bucket(row.leverage))] += 1
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                "INSERT INTO signals (ts, pair, timeframe, side, price, tp, sl, rr, leverage) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.executemany(_UPSERT_DAILY_PAIR, [key + tuple(totals) for key, totals in by_pair.items()])
+            conn.executemany(_UPSERT_DAILY_LEVERAGE, [key + (count,) for key, count in by_leverage.items()])
+        return len(rows)
+
+    def count(self) -> int:
+        return self._connection().execute("SELECT count(*) FROM signals").fetchone()[0]
+
+    def rr_by_pair(self, days: int, exact: bool = False, now: Optional[float] = None) -> List[PairStats]:
+        """Средние RR и плечо по парам за последние days дней, по убыванию числа сигналов."""
+        now = time.time() if now is None else now
+        if exact:
+            query = (
+                "SELECT pair, count(*), avg(rr), avg(leverage) FROM signals "
+                "WHERE ts >= ? GROUP BY pair ORDER BY count(*) DESC, pair"
+            )
+            since = int(now) - days * _DAY
+        else:
+            query = (
+                "SELECT pair, sum(count), sum(rr_sum) / sum(count), 1.0 * sum(leverage_sum) / sum(count) "
+                "FROM signals_daily_pair WHERE day >= ? GROUP BY pair ORDER BY sum(count) DESC, pair"
+            )
+            since = int(now) // _DAY - days + 1
+        return [PairStats(*row) for row in self._connection().execute(query, (since,))]
+
+    def leverage_by_timeframe(self, days: int, exact: bool = False, now: Optional[float] = None) -> Dict[str, List[int]]:
+        """Число сигналов по корзинам LEVERAGE_BUCKETS для каждого таймфрейма."""
+        now = time.time() if now is None else now
+        if exact:
+            # Та же разбивка, что в leverage_bucket, но внутри SQLite
+            bucket_sql = "CASE " + " ".join(
+                f"WHEN leverage <= {upper} THEN {i}" for i, upper in enumerate(LEVERAGE_BUCKETS)
+            ) + f" ELSE {len(LEVERAGE_BUCKETS) - 1} END"
+            query = f"SELECT timeframe, {bucket_sql} AS b, count(*) FROM signals WHERE ts >= ? GROUP BY timeframe, b"
+            since = int(now) - days * _DAY
+        else:
+            query = (
+                "SELECT timeframe, bucket, sum(count) FROM signals_daily_leverage "
+                "WHERE day >= ? GROUP BY timeframe, bucket"
+            )
+            since = int(now) // _DAY - days + 1
+        result: Dict[str, List[int]] = {}
+        for timeframe, bucket, count in self._connection().execute(query, (since,)):
+            result.setdefault(timeframe, [0] * len(LEVERAGE_BUCKETS))[bucket] += count
+        return dict(sorted(result.items()))
+
+    async def run(self, method: Callable[..., Any], *args: Any) -> Any:
+        """Выполняет метод журнала в его потоке."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="signal-journal")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, method, *args)
+
+    async def close(self) -> None:
+        if self._executor is not None:
+            await self.run(self._close_connection)
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _close_connection(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+signal_journal = SignalJournal(SIGNAL_JOURNAL_PATH)
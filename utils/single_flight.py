@@ -0,0 +1,142 @@
+"""
+Single-flight для рендеров: одинаковые одновременные запросы — один рендер.
+
+Если два администратора (или один двойным нажатием) почти одновременно
+запрашивают одну и ту же карточку или PDF, второй запрос не запускает
+Chromium, а присоединяется к идущему рендеру. Рендер пишет во временный
+файл рядом с результатом, затем файл копируется по output_path каждого
+ожидающего. Присоединения считаются в render_coalesced_total{renderer}.
+
+Ключ — хеш итогового HTML и параметров рендера (render_key). Ресурсы рядом
+с HTML — копии шаблона и у одинаковых запросов совпадают, поэтому в ключ
+не входят.
+
+Общий рендер идёт под своим RenderJob (шаблон и таймаут первого запроса),
+а каждый запрос ждёт его под своим: отмена или дедлайн одного запроса
+прерывают только его ожидание. Когда не осталось ни одного ожидающего,
+общий рендер отменяется.
+
+Общий рендер читает HTML и ресурсы первого запроса и пишет рядом с его
+output_path. Если первый запрос ушёл (отменён, истёк дедлайн) и его
+хендлер удалил свои файлы, общий рендер падает; тогда каждый оставшийся
+запрос рендерит заново сам, по своему HTML, без объединения.
+
+RENDER_SINGLE_FLIGHT=0 отключает объединение.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from utils.metrics import RENDER_COALESCED_TOTAL
+from utils.render_jobs import RenderJob
+
+logger = logging.getLogger(__name__)
+
+RENDER_SINGLE_FLIGHT = os.getenv("RENDER_SINGLE_FLIGHT", "1") != "0"
+
+T = TypeVar("T")
+
+
+def render_key(html_path: Path, *params: Any) -> str:
+    """Ключ рендера: содержимое HTML и параметры (размер, масштаб, ориентация…)."""
+    digest = hashlib.sha256(html_path.read_bytes())
+    digest.update(repr(params).encode())
+    return digest.hexdigest()
+
+
+class _Flight:
+    def __init__(self) -> None:
+        self.task: Optional[asyncio.Task] = None
+        # Куда скопировать результат: output_path всех, кто ещё ждёт
+        self.outputs: List[Path] = []
+        # Первый запрос (чьи HTML и каталог использует рендер) перестал ждать
+        self.orphaned = False
+
+
+class SingleFlight:
+    """Реестр идущих рендеров одного рендерера (image / pdf) по ключу."""
+
+    def __init__(self, renderer: str) -> None:
+        self.renderer = renderer
+        self._flights: Dict[str, _Flight] = {}
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    async def run(
+        self,
+        key: str,
+        output_path: Path,
+        render: Callable[[Path, RenderJob], Awaitable[T]],
+        job: RenderJob,
+    ) -> T:
+        """Выполняет render(path, job) один раз на ключ; результат копируется в output_path.
+
+        Файл копируется, только если render вернул истинное значение.
+        Ошибка общего рендера выходит у всех ожидающих (если первый запрос к
+        тому времени ушёл — вместо неё отдельный рендер); RenderTimeout /
+        RenderCancelled — только у того, чьё задание истекло или отменено.
+        """
+        flight = self._flights.get(key)
+        joined = flight is not None
+        if flight is None:
+            flight = self._flights[key] = _Flight()
+            shared_job = RenderJob(job.template, job.timeout)
+            flight.task = asyncio.create_task(self._render(key, flight, output_path, render, shared_job))
+        else:
+            RENDER_COALESCED_TOTAL.inc(renderer=self.renderer)
+            logger.info("Render of %s joined an identical render in flight", job.template)
+
+        flight.outputs.append(output_path)
+        try:
+            async with job.guard():
+                try:
+                    return await asyncio.shield(flight.task)
+                except Exception as exc:
+                    if not (joined and flight.orphaned):
+                        raise
+                    logger.warning(
+                        "Shared render of %s failed after its originator left, rendering again: %s",
+                        job.template, exc,
+                    )
+        finally:
+            flight.outputs.remove(output_path)
+            if not joined and not flight.task.done():
+                flight.orphaned = True
+            if not flight.outputs and not flight.task.done():
+                # Ждать результата больше некому
+                flight.task.cancel()
+        # Файлы первого запроса могли быть удалены — рендерим по своим, без объединения
+        return await render(output_path, job)
+
+    async def _render(
+        self,
+        key: str,
+        flight: _Flight,
+        output_path: Path,
+        render: Callable[[Path, RenderJob], Awaitable[T]],
+        job: RenderJob,
+    ) -> T:
+        temp_path = output_path.with_name(f".render-{uuid.uuid4().hex}{output_path.suffix}")
+        try:
+            result = await render(temp_path, job)
+            # Снимаем ключ до копирования: новые запросы уже не успеют получить копию
+            self._flights.pop(key, None)
+            if result and flight.outputs:
+                # Всем, кроме последнего, — копия; последнему достаётся сам файл
+                *copies, last = flight.outputs
+                for path in copies:
+                    shutil.copyfile(temp_path, path)
+                os.replace(temp_path, last)
+            return result
+        finally:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            temp_path.unlink(missing_ok=True)
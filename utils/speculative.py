@@ -0,0 +1,123 @@
+"""
+Спекулятивные рендеры: документ готовится, пока пользователь ещё думает.
+
+Хендлер запускает рендер, как только известны все данные (например, на
+экране подтверждения), и кладёт его в реестр под ключом пользователя
+вместе с отпечатком данных. На следующем шаге take() отдаёт рендер, если
+данные не изменились; иначе рендер отменяется, а хендлер рендерит заново.
+Отмена, новый сценарий или истечение SPECULATIVE_RENDER_TTL вызывают
+discard(): задание прерывается, а после завершения рендера вызывается
+cleanup с его результатом (удаление временных файлов).
+
+Исходы считаются в speculative_renders_total{kind, outcome}: hit — рендер
+пригодился, miss — данные изменились, discarded — отменён или истёк.
+
+Пример:
+    speculative.start(user_id, fingerprint, lambda job: render(data, job), cleanup)
+    ...
+    entry = speculative.take(user_id, fingerprint)
+    result = await entry.task if entry else await render(data, RenderJob("invoice"))
+"""
+
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, Generic, Hashable, Optional, TypeVar
+
+from utils.metrics import SPECULATIVE_RENDERS_TOTAL
+from utils.render_jobs import RENDER_TIMEOUT, RenderJob
+
+logger = logging.getLogger(__name__)
+
+# Сколько хранить невостребованный спекулятивный рендер, секунды
+SPECULATIVE_RENDER_TTL = float(os.getenv("SPECULATIVE_RENDER_TTL", "900"))
+
+T = TypeVar("T")
+
+
+class Speculation(Generic[T]):
+    def __init__(self, fingerprint: Hashable, job: RenderJob, task: "asyncio.Task[T]") -> None:
+        self.fingerprint = fingerprint
+        self.job = job
+        self.task = task
+        self.expiry: Optional[asyncio.TimerHandle] = None
+
+
+class SpeculativeRenders(Generic[T]):
+    """Спекулятивные рендеры одного вида (kind) по ключу пользователя."""
+
+    def __init__(self, kind: str, ttl: float = SPECULATIVE_RENDER_TTL) -> None:
+        self.kind = kind
+        self.ttl = ttl
+        self._entries: Dict[Hashable, Speculation[T]] = {}
+        self._cleanups: Dict[Hashable, Callable[[T], Any]] = {}
+
+    def start(
+        self,
+        key: Hashable,
+        fingerprint: Hashable,
+        render: Callable[[RenderJob], Awaitable[T]],
+        cleanup: Callable[[T], Any],
+        timeout: Optional[float] = RENDER_TIMEOUT,
+    ) -> Speculation[T]:
+        """Запускает рендер в фоне; прежний рендер этого ключа отбрасывается."""
+        self.discard(key)
+        job = RenderJob(self.kind, timeout)
+        task = asyncio.create_task(render(job))
+        entry = self._entries[key] = Speculation(fingerprint, job, task)
+        self._cleanups[key] = cleanup
+        entry.expiry = asyncio.get_running_loop().call_later(self.ttl, self._expire, key, entry)
+        task.add_done_callback(_log_failure)
+        return entry
+
+    def take(self, key: Hashable, fingerprint: Hashable) -> Optional[Speculation[T]]:
+        """Забирает рендер, если он запущен на тех же данных; иначе отбрасывает его.
+
+        После take() за результат (и его удаление) отвечает вызывающий.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.fingerprint != fingerprint:
+            SPECULATIVE_RENDERS_TOTAL.inc(kind=self.kind, outcome="miss")
+            self._drop(key)
+            return None
+        del self._entries[key]
+        self._cleanups.pop(key, None)
+        entry.expiry.cancel()
+        SPECULATIVE_RENDERS_TOTAL.inc(kind=self.kind, outcome="hit")
+        return entry
+
+    def discard(self, key: Hashable) -> bool:
+        """Отменяет невостребованный рендер ключа и удаляет его результат."""
+        if key not in self._entries:
+            return False
+        SPECULATIVE_RENDERS_TOTAL.inc(kind=self.kind, outcome="discarded")
+        self._drop(key)
+        return True
+
+    def _drop(self, key: Hashable) -> None:
+        entry = self._entries.pop(key)
+        cleanup = self._cleanups.pop(key)
+        entry.expiry.cancel()
+        entry.job.cancel()
+
+        def on_done(task: "asyncio.Task[T]") -> None:
+            if task.cancelled() or task.exception() is not None:
+                return
+            try:
+                cleanup(task.result())
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Cleanup of discarded %s render failed: %s", self.kind, exc)
+
+        entry.task.add_done_callback(on_done)
+
+    def _expire(self, key: Hashable, entry: Speculation[T]) -> None:
+        if self._entries.get(key) is entry:
+            logger.info("Speculative %s render for %s expired", self.kind, key)
+            self.discard(key)
+
+
+def _log_failure(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Speculative render failed: %s", task.exception())
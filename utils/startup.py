@@ -0,0 +1,43 @@
+"""
+Замер этапов старта бота.
+
+Отсчёт идёт от импорта этого модуля — bot.py импортирует его первым, до
+aiogram и роутеров (время запуска самого интерпретатора не учитывается).
+Каждый этап фиксируется один раз: в лог и в gauge startup_seconds{stage}.
+
+Этапы:
+- imports — импорт модулей бота завершён;
+- polling — начинается long polling;
+- first_update — обработан первый апдейт;
+- renderer_ready — Chromium запущен и шаблоны прогреты;
+- first_fast_render — первый пользовательский рендер на прогретом браузере.
+"""
+
+import logging
+import time
+from typing import Dict
+
+from utils.metrics import STARTUP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+_STARTED = time.perf_counter()
+_marks: Dict[str, float] = {}
+
+
+def mark(stage: str) -> None:
+    """Фиксирует момент этапа старта (повторные вызовы игнорируются)."""
+    if stage in _marks:
+        return
+    elapsed = time.perf_counter() - _STARTED
+    _marks[stage] = elapsed
+    STARTUP_SECONDS.set(elapsed, stage=stage)
+    logger.info("Startup: %s at %.3fs", stage, elapsed)
+
+
+def is_marked(stage: str) -> bool:
+    return stage in _marks
+
+
+def marks() -> Dict[str, float]:
+    return dict(_marks)
@@ -0,0 +1,200 @@
+"""
+Лёгкая трассировка обработки апдейта: span на апдейт и дочерние span'ы
+для заполнения шаблона, копирования ресурсов, запуска браузера, навигации,
+скриншота/PDF, объединения PDF и запросов к Telegram API.
+
+Текущий span хранится в contextvars, поэтому вложенность сохраняется
+через await без явной передачи контекста. Завершённые span'ы копятся в буфере
+и фоновой задачей выгружаются:
+- в JSON Lines файл (TRACE_FILE);
+- опционально в локальный OTLP/HTTP коллектор (OTLP_ENDPOINT, JSON-кодировка).
+
+Пример:
+    from utils.tracing import span
+    with span("template.fill", template="long.html"):
+        ...
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import secrets
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "helper-bot"
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict[str, Any]) -> None:
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "name": self.name,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "status": "error" if self.error else "ok",
+            "error": self.error,
+        }
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+class Tracer:
+    """Собирает завершённые span'ы и выгружает их пачками."""
+
+    def __init__(self, max_pending: int = 10_000) -> None:
+        self.trace_file: Optional[str] = None
+        self.otlp_endpoint: Optional[str] = None
+        self._pending: Deque[Dict[str, Any]] = deque(maxlen=max_pending)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.trace_file or self.otlp_endpoint)
+
+    def configure(self, trace_file: Optional[str] = None, otlp_endpoint: Optional[str] = None) -> None:
+        self.trace_file = trace_file or None
+        self.otlp_endpoint = otlp_endpoint or None
+        if self.trace_file:
+            os.makedirs(os.path.dirname(os.path.abspath(self.trace_file)), exist_ok=True)
+
+    def finish(self, span: Span) -> None:
+        if self.enabled:
+            self._pending.append(span.to_dict())
+
+    def _drain(self) -> List[Dict[str, Any]]:
+        batch = list(self._pending)
+        self._pending.clear()
+        return batch
+
+    def flush_to_file(self, batch: List[Dict[str, Any]]) -> None:
+        if not self.trace_file or not batch:
+            return
+        with open(self.trace_file, "a", encoding="utf-8") as f:
+            for item in batch:
+                f.write(json.dumps(item, ensure_ascii=False, default=str) + "\n")
+
+    def flush(self) -> None:
+        """Синхронно пишет накопленные span'ы в файл (для скриптов без event loop)."""
+        self.flush_to_file(self._drain())
+
+    async def _export_otlp(self, session, batch: List[Dict[str, Any]]) -> None:
+        try:
+            async with session.post(self.otlp_endpoint, json=to_otlp_json(batch)) as resp:
+                if resp.status >= 400:
+                    logger.warning("OTLP collector responded with %s", resp.status)
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("OTLP export failed: %s", exc)
+
+    async def run_exporter(self, interval: float = 1.0) -> None:
+        """Фоновая задача выгрузки span'ов (файл + OTLP)."""
+        import aiohttp
+
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=5)) as session:
+            try:
+                while True:
+                    await asyncio.sleep(interval)
+                    await self._export(session)
+            finally:
+                await self._export(session)
+
+    async def _export(self, session) -> None:
+        batch = self._drain()
+        if not batch:
+            return
+        try:
+            self.flush_to_file(batch)
+        except OSError as exc:
+            logger.warning("Failed to write traces to %s: %s", self.trace_file, exc)
+        if self.otlp_endpoint:
+            await self._export_otlp(session, batch)
+
+
+tracer = Tracer()
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    """Открывает дочерний span текущего (или корневой, если текущего нет)."""
+    current = Span(name, _current_span.get(), attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as exc:
+        current.error = f"{type(exc).__name__}: {exc}"
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _current_span.reset(token)
+        tracer.finish(current)
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp_json(batch: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Преобразует span'ы в тело запроса OTLP/HTTP (JSON) для /v1/traces."""
+    spans = []
+    for item in batch:
+        otlp_span = {
+            "traceId": item["trace_id"],
+            "spanId": item["span_id"],
+            "name": item["name"],
+            "kind": 1,
+            "startTimeUnixNano": str(item["start_time_unix_nano"]),
+            "endTimeUnixNano": str(item["end_time_unix_nano"]),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)} for key, value in item["attributes"].items()
+            ],
+            "status": {"code": 2, "message": item["error"]} if item["error"] else {"code": 1},
+        }
+        if item["parent_span_id"]:
+            otlp_span["parentSpanId"] = item["parent_span_id"]
+        spans.append(otlp_span)
+
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+                "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": spans}],
+            }
+        ]
+    }
@@ -30,15 +30,13 @@ import os
 """
 
 import logging
-import mimetypes
 import os
-import smtplib
-import ssl
-import certifi
-from email.message import EmailMessage
+import time
 from pathlib import Path
 from typing import Optional
 
+from utils.metrics import SMTP_SEND_SECONDS
+
 
 # Базовая настройка логгера: выводим время, уровень и сообщение.
 logging.basicConfig(
@@ -66,6 +64,14 @@ def send_email_with_attachment(file_path: str, body_text: str, recipient_email:
         - Перехват и логирование исключений при подключении/аутентификации/отправке.
     """
 
+    # SMTP, SSL и certifi нужны только при отправке: не тянем их при старте бота
+    import mimetypes
+    import smtplib
+    import ssl
+    from email.message import EmailMessage
+
+    import certifi
+
     # Валидация входных параметров на базовом уровне
     try:
         if not recipient_email or "@" not in recipient_email:
@@ -134,10 +140,13 @@ def send_email_with_attachment(file_path: str, body_text: str, recipient_email:
         # Настроим защищённое SSL‑подключение и отправим письмо.
         # Явно используем сертификаты из certifi для надёжной валидации на macOS/Python.
         ssl_context = ssl.create_default_context(cafile=certifi.where())
+        send_started = time.perf_counter()
+        send_result = "error"
         try:
             with smtplib.SMTP_SSL(host=smtp_host, port=smtp_port, context=ssl_context) as smtp:
                 smtp.login(gmail_user, gmail_app_password)
                 smtp.send_message(message)
+            send_result = "ok"
             logging.info("Письмо успешно отправлено на %s", recipient_email)
             return True
         except smtplib.SMTPAuthenticationError:
@@ -154,6 +163,8 @@ def send_email_with_attachment(file_path: str, body_text: str, recipient_email:
         except smtplib.SMTPException:
             logging.exception("Ошибка при отправке письма через SMTP")
             return False
+        finally:
+            SMTP_SEND_SECONDS.observe(time.perf_counter() - send_started, result=send_result)
 
     except Exception:
         # Любая непредвиденная ошибка: логируем стек для диагностики и возвращаем False